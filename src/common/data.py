@@ -1,5 +1,7 @@
 STORED_FILENAME = "stored_filename"
 ORIGINAL_FILENAME = "original_filename"
+ARCHIVE_INDEX_FORMAT = "tar-gzip-members"
+UNCOMPRESSED_ARCHIVE_INDEX_FORMAT = "tar-members"
 
 
 class ExposureSummary(dict):
@@ -4,9 +4,7 @@ import os
 
 from datetime import timedelta
 
-from chainmap import ChainMap
-
-from configparser import ConfigParser
+from configparser import ConfigParser, NoOptionError, NoSectionError
 
 
 def read_log_config(config_parser):
@@ -31,38 +29,269 @@ def read_log_config(config_parser):
     handler.setFormatter(formatter)
 
 
+# Type of each known option by section, options of the default section apply
+# to every section. Used by `Settings.validate`
+SETTINGS_TYPES = {
+    'default': {
+        'LOG_LEVEL': str,
+        'LOG_MAX_SIZE_IN_BYTES': int,
+        'LOG_BACKUP_COUNT': int,
+        'LOG_DIRECTORY': str,
+        'LOG_FILENAME': str,
+    },
+    'server': {
+        'ALLOWED_HOSTS': str,
+        'ANALYSIS_DISPATCH_MODEL_CONCURRENCY': int,
+        'ANALYSIS_DISPATCH_USER_CONCURRENCY': int,
+        'ANALYSIS_STATUS_FLUSH_INTERVAL': float,
+        'API_BULK_MAX_SIZE': int,
+        'API_MAX_PAGE_SIZE': int,
+        'API_PAGE_SIZE': int,
+        'API_PAGINATE_BY_DEFAULT': bool,
+        'AUTH_BACKENDS': str,
+        'AWS_ACCESS_KEY_ID': str,
+        'AWS_BUCKET_NAME': str,
+        'AWS_DEFAULT_ACL': str,
+        'AWS_LOCATION': str,
+        'AWS_LOG_LEVEL': str,
+        'AWS_PRESIGNED_UPLOAD_EXPIRE': int,
+        'AWS_PRESIGNED_UPLOAD_MAX_SIZE': int,
+        'AWS_QUERYSTRING_AUTH': bool,
+        'AWS_QUERYSTRING_EXPIRE': int,
+        'AWS_S3_CUSTOM_DOMAIN': str,
+        'AWS_S3_ENDPOINT_URL': str,
+        'AWS_S3_REGION_NAME': str,
+        'AWS_SECRET_ACCESS_KEY': str,
+        'AWS_SHARED_BUCKET': bool,
+        'CACHE_BACKEND': str,
+        'CACHE_LOCATION': str,
+        'CHANNEL_LAYER_BACKEND': str,
+        'CHANNEL_LAYER_HOSTS': str,
+        'COMPRESS_CONTENT_TYPES': str,
+        'COMPRESS_ENCODINGS': str,
+        'COMPRESS_MIN_SIZE': int,
+        'DB_ENGINE': str,
+        'DB_HOST': str,
+        'DB_NAME': str,
+        'DB_PASS': str,
+        'DB_PORT': int,
+        'DB_REPLICA_HOSTS': str,
+        'DB_REPLICA_STICKY_SECONDS': int,
+        'DB_USER': str,
+        'DEBUG': bool,
+        'DO_GZIP_RESPONSE': bool,
+        'FILE_DELETE_BATCH_SIZE': int,
+        'FILE_DELETE_RETRY_DELAY': int,
+        'FILE_DELETE_THREADS': int,
+        'FILE_STREAM_CHUNK_SIZE': int,
+        'JWT_TOKEN_USER_SAFE_METHODS': bool,
+        'JWT_USER_CACHE_SIZE': int,
+        'JWT_USER_CACHE_TTL': int,
+        'MEDIA_ROOT': str,
+        'OUTPUT_QUERY_DEFAULT_LIMIT': int,
+        'OUTPUT_QUERY_MAX_LIMIT': int,
+        'PORTFOLIO_UPLOAD_VALIDATION': bool,
+        'SECRET_KEY': str,
+        'STORAGE_TYPE': str,
+        'TOKEN_ACCESS_LIFETIME': timedelta,
+        'TOKEN_REFRESH_LIFETIME': timedelta,
+        'TOKEN_REFRESH_ROTATE': bool,
+        'TOKEN_SIGINING_KEY': str,
+    },
+    'worker': {
+        'AWS_ACCESS_KEY_ID': str,
+        'AWS_AUTO_CREATE_BUCKET': bool,
+        'AWS_BUCKET_ACL': str,
+        'AWS_BUCKET_NAME': str,
+        'AWS_DEFAULT_ACL': str,
+        'AWS_IS_GZIPPED': bool,
+        'AWS_LOCATION': str,
+        'AWS_LOG_LEVEL': str,
+        'AWS_PRELOAD_METADATA': bool,
+        'AWS_QUERYSTRING_AUTH': bool,
+        'AWS_QUERYSTRING_EXPIRE': int,
+        'AWS_REDUCED_REDUNDANCY': bool,
+        'AWS_S3_ENCRYPTION': bool,
+        'AWS_S3_ENDPOINT_URL': str,
+        'AWS_S3_FILE_NAME_CHARSET': str,
+        'AWS_S3_FILE_OVERWRITE': bool,
+        'AWS_S3_MAX_MEMORY_SIZE': int,
+        'AWS_S3_OBJECT_PARAMETERS': str,
+        'AWS_S3_REGION_NAME': str,
+        'AWS_S3_SECURE_URLS': bool,
+        'AWS_S3_URL_PROTOCOL': str,
+        'AWS_S3_USE_SSL': bool,
+        'AWS_S3_VERIFY': str,
+        'AWS_SECRET_ACCESS_KEY': str,
+        'AWS_SECURITY_TOKEN': str,
+        'AWS_SHARED_BUCKET': bool,
+        'BASE_RUN_DIR': str,
+        'COLUMNAR_OUTPUTS': bool,
+        'COLUMNAR_ROW_GROUP_SIZE': int,
+        'DISABLE_WORKER_REG': bool,
+        'GZIP_CONTENT_TYPES': str,
+        'KEEP_RUN_DIR': bool,
+        'LOCK_FILE': str,
+        'LOCK_RETRY_COUNTDOWN_IN_SECS': int,
+        'LOCK_TIMEOUT_IN_SECS': float,
+        'MEDIA_ROOT': str,
+        'METRICS_MAX_SUMMARY_IDS': int,
+        'METRICS_RETURN_PERIODS': str,
+        'MODEL_DATA_DIRECTORY': str,
+        'MODEL_SETTINGS_FILE': str,
+        'OASISLMF_CONFIG': str,
+        'STORAGE_TYPE': str,
+    },
+    'celery': {
+        'DB_ENGINE': str,
+        'DB_HOST': str,
+        'DB_NAME': str,
+        'DB_PASS': str,
+        'DB_PORT': int,
+        'DB_USER': str,
+        'RABBIT_HOST': str,
+        'RABBIT_PASS': str,
+        'RABBIT_PORT': int,
+        'RABBIT_USER': str,
+    },
+}
+
+# `fallback` was not given
+_UNSET = object()
+# Memoised lookup of an option that is not set
+_MISSING = object()
+
+
+def parse_timedelta(value):
+    """ Parses a timedelta argument string such as `hours=1, minutes=30`
+    """
+    return timedelta(**{k.split('=')[0].strip(): int(k.split('=')[1]) for k in value.split(',')})
+
+
 class Settings(ConfigParser):
+    """ The ini files overridden by the `OASIS_[<SECTION>_]<OPTION>` environment
+    variables.
+
+    The environment is read when the settings are created, and each option is
+    looked up once and then served from memory, so later changes to the
+    environment or the ini files are only seen after `reload`. Writes to the
+    settings (e.g. `read_dict` or `SettingsPatcher`) are seen at once.
+    """
     def __init__(self, *args, **kwargs):
         kwargs.setdefault('default_section', 'default')
 
+        self._values = {}
+        self._section_env_vars = {}
+        self._environ = {}
         super(Settings, self).__init__(*args, **kwargs)
 
+        self.reload()
+
+    def _ini_files(self):
         ini_files = [os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'conf.ini')]
 
         specified_ini = os.environ.get('OASIS_INI_PATH', None)
         if specified_ini and os.path.exists(specified_ini):
             ini_files.append(specified_ini)
+        return ini_files
 
-        self.read(ini_files)
+    def reload(self):
+        """ Reads the ini files and the environment again, options set since
+        they were last read are dropped
+        """
+        for section in self.sections():
+            self.remove_section(section)
+        self[self.default_section].clear()
 
-    def _get_section_env_vars(self, section):
-        section_env_prefix = 'OASIS_{}_'.format(section.upper())
-        global_env_prefix = 'OASIS_'
+        self._environ = {k: v for k, v in os.environ.items() if k.startswith('OASIS_')}
+        self._section_env_vars = {}
+        self.read(self._ini_files())
+
+    def _clear_values(self):
+        self._values.clear()
+
+    def set(self, section, option, value=None):
+        super(Settings, self).set(section, option, value)
+        self._clear_values()
+
+    def remove_option(self, section, option):
+        removed = super(Settings, self).remove_option(section, option)
+        self._clear_values()
+        return removed
 
-        return ChainMap(
-            {k.replace(section_env_prefix, ''):
-                v for k, v in os.environ.items() if k.startswith(section_env_prefix)},
-            {k.replace(global_env_prefix, ''):
-                v for k, v in os.environ.items() if k.startswith(global_env_prefix)},
-        )
+    def remove_section(self, section):
+        removed = super(Settings, self).remove_section(section)
+        self._clear_values()
+        return removed
 
-    def get(self, section, option, **kwargs):
-        kwargs.setdefault('vars', self._get_section_env_vars(section))
-        return super(Settings, self).get(section, option, **kwargs)
+    def read_dict(self, dictionary, source='<dict>'):
+        super(Settings, self).read_dict(dictionary, source=source)
+        self._clear_values()
 
-    def getint(self, section, option, **kwargs):
-        kwargs.setdefault('vars', self._get_section_env_vars(section))
-        return super(Settings, self).getint(section, option, **kwargs)
+    def _read(self, fp, fpname):
+        super(Settings, self)._read(fp, fpname)
+        self._clear_values()
+
+    def _get_section_env_vars(self, section):
+        env_vars = self._section_env_vars.get(section)
+        if env_vars is None:
+            section_env_prefix = 'OASIS_{}_'.format(section.upper())
+            global_env_prefix = 'OASIS_'
+
+            env_vars = {k.replace(global_env_prefix, ''): v for k, v in self._environ.items()}
+            env_vars.update(
+                {k.replace(section_env_prefix, ''): v for k, v in self._environ.items() if k.startswith(section_env_prefix)}
+            )
+            self._section_env_vars[section] = env_vars
+        return env_vars
+
+    def _lookup(self, section, option):
+        """ The value of the option, looked up once, `_MISSING` when it is not set
+        """
+        key = (section, self.optionxform(option))
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+
+        try:
+            value = super(Settings, self).get(section, option, vars=self._get_section_env_vars(section))
+        except (NoSectionError, NoOptionError):
+            value = _MISSING
+        self._values[key] = value
+        return value
+
+    def get(self, section, option, *, raw=False, vars=None, fallback=_UNSET):
+        if raw or vars is not None:
+            kwargs = {} if fallback is _UNSET else {'fallback': fallback}
+            return super(Settings, self).get(section, option, raw=raw, vars=vars, **kwargs)
+
+        value = self._lookup(section, option)
+        if value is not _MISSING:
+            return value
+        if fallback is not _UNSET:
+            return fallback
+        if section != self.default_section and not self.has_section(section):
+            raise NoSectionError(section)
+        raise NoOptionError(option, section)
+
+    def _get_converted(self, getter, section, option, raw, vars, fallback, **kwargs):
+        # `ConfigParser` does not pass the fallback on to `get`, a missing option
+        # would be looked up and raise on every call
+        if fallback is not _UNSET:
+            if not raw and vars is None and self._lookup(section, option) is _MISSING:
+                return fallback
+            kwargs['fallback'] = fallback
+        return getter(section, option, raw=raw, vars=vars, **kwargs)
+
+    def getint(self, section, option, *, raw=False, vars=None, fallback=_UNSET, **kwargs):
+        return self._get_converted(super(Settings, self).getint, section, option, raw, vars, fallback, **kwargs)
+
+    def getfloat(self, section, option, *, raw=False, vars=None, fallback=_UNSET, **kwargs):
+        return self._get_converted(super(Settings, self).getfloat, section, option, raw, vars, fallback, **kwargs)
+
+    def getboolean(self, section, option, *, raw=False, vars=None, fallback=_UNSET, **kwargs):
+        return self._get_converted(super(Settings, self).getboolean, section, option, raw, vars, fallback, **kwargs)
 
     def get_timedelta(self, section, option, **kwargs):
         ''' Use for reading timedelta argument strings and returns a timedelta
@@ -73,20 +302,63 @@ class Settings(ConfigParser):
             in: settings.get_timedelta('server', 'TOKEN_ACCESS_LIFETIME', fallback='days=5')
             out: datetime.timedelta(days=5)
         '''
-        kwargs.setdefault('vars', self._get_section_env_vars(section))
-        kwargs_string = super(Settings, self).get(section, option, **kwargs)
+        kwargs_string = self.get(section, option, **kwargs)
         try:
-            kwargs = {k.split('=')[0].strip():int(k.split('=')[1])
-                      for k in kwargs_string.split(',')}
-        except (TypeError, IndexError):
-            kwargs = {k.split('=')[0].strip():int(k.split('=')[1])
-                      for k in kwargs['fallback'].split(',')}
-        return timedelta(**kwargs)
-
-
-    def getboolean(self, section, option, **kwargs):
-        kwargs.setdefault('vars', self._get_section_env_vars(section))
-        return super(Settings, self).getboolean(section, option, **kwargs)
+            return parse_timedelta(kwargs_string)
+        except (TypeError, IndexError, AttributeError):
+            return parse_timedelta(kwargs['fallback'])
+
+    def _check_type(self, option_type, value):
+        if option_type is int:
+            int(value)
+        elif option_type is float:
+            float(value)
+        elif option_type is bool:
+            if value.lower() not in self.BOOLEAN_STATES:
+                raise ValueError()
+        elif option_type is timedelta:
+            parse_timedelta(value)
+
+    def validate(self):
+        """ Checks the options of the ini files and of the `OASIS_<SECTION>_<OPTION>`
+        environment variables against `SETTINGS_TYPES`
+
+        :return: A message for each unknown or mis-typed option
+        """
+        default_types = {k.lower(): t for k, t in SETTINGS_TYPES['default'].items()}
+        # The default section holds the options shared by the sections
+        any_types = {k.lower(): t for options in SETTINGS_TYPES.values() for k, t in options.items()}
+        errors = []
+
+        for section in [self.default_section] + self.sections():
+            if section == self.default_section:
+                section_types = any_types
+            else:
+                section_types = dict(default_types, **{k.lower(): t for k, t in SETTINGS_TYPES.get(section, {}).items()})
+
+            options = {option: 'ini' for option in self._sections.get(section, {})}
+            if section == self.default_section:
+                options.update({option: 'ini' for option in self._defaults})
+            else:
+                section_env_prefix = 'OASIS_{}_'.format(section.upper())
+                options.update({
+                    self.optionxform(k[len(section_env_prefix):]): k for k in self._environ if k.startswith(section_env_prefix)
+                })
+
+            for option, source in sorted(options.items()):
+                where = '[{}] {}'.format(section, option.upper()) if source == 'ini' else source
+                if option not in section_types:
+                    errors.append('{}: unknown option'.format(where))
+                    continue
+
+                option_type = section_types.get(option)
+                if option_type is None or option_type is str:
+                    continue
+                try:
+                    self._check_type(option_type, self.get(section, option))
+                except (TypeError, ValueError, IndexError):
+                    errors.append('{}: {!r} is not a valid {}'.format(where, self.get(section, option), option_type.__name__))
+        return errors
 
     def setup_logging(self, section):
         """
@@ -123,3 +395,12 @@ class SettingsPatcher(object):
 
     def revert(self):
         settings.read_dict(self._initial)
+
+
+if __name__ == '__main__':
+    import sys
+
+    problems = settings.validate()
+    for problem in problems:
+        print(problem)
+    sys.exit(1 if problems else 0)
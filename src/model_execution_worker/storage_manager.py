@@ -1,5 +1,8 @@
 import boto3
+import gzip
+import hashlib
 import io
+import json
 import logging
 import os
 import shutil
@@ -7,16 +10,19 @@ import tarfile
 import tempfile
 import uuid
 
+from contextlib import contextmanager
 from urllib.parse import urlparse, urlsplit, parse_qsl
 from urllib.request import urlopen
 
 from oasislmf.utils.exceptions import OasisException
 from botocore.exceptions import ClientError as S3_ClientError
 
+from ..common.data import ARCHIVE_INDEX_FORMAT, UNCOMPRESSED_ARCHIVE_INDEX_FORMAT
 from ..common.shared import set_aws_log_level
 
 LOG_FILE_SUFFIX = 'txt'
 ARCHIVE_FILE_SUFFIX = 'tar.gz'
+ARCHIVE_INDEX_SUFFIX = 'json'
 
 
 def StorageSelector(settings_conf):
@@ -182,7 +188,7 @@ class BaseStorageConnector(object):
         with tarfile.open(archive_fp) as f:
             f.extractall(directory)
 
-    def compress(self, archive_fp, directory, arcname=None):
+    def compress(self, archive_fp, directory, arcname=None, index_fp=None, gzip_members=True):
         """ Compress a directory
 
         Parameters
@@ -196,11 +202,114 @@ class BaseStorageConnector(object):
         :param arcname: If given, `arcname' set an alternative
                         name for the file in the archive.
         :type arcname: str
+
+        :param index_fp: If given, write a seekable archive and store
+                         its member index at this path.
+        :type index_fp: str
+
+        :param gzip_members: Compress each member of a seekable archive, set to `False`
+                             for already compressed members which are read with seeks
+        :type gzip_members: boolean
         """
         arcname = arcname if arcname else '/'
+        if index_fp:
+            return self._compress_indexed(archive_fp, directory, arcname, index_fp, gzip_members)
+
         with tarfile.open(archive_fp, 'w:gz') as tar:
             tar.add(directory, arcname=arcname)
 
+    def _walk_archive(self, path, arcname):
+        """ Yield `(path, arcname)` pairs in the same order as `TarFile.add`
+        """
+        yield path, arcname
+        if os.path.isdir(path) and not os.path.islink(path):
+            for f in sorted(os.listdir(path)):
+                yield from self._walk_archive(os.path.join(path, f), os.path.join(arcname, f))
+
+    @contextmanager
+    def _open_archive_member(self, archive, gzip_member):
+        """ Write a single archive member, either as its own gzip stream or as is
+        """
+        if gzip_member:
+            with gzip.GzipFile(fileobj=archive, mode='wb', mtime=0) as member:
+                yield member
+        else:
+            yield archive
+
+    def _compress_indexed(self, archive_fp, directory, arcname, index_fp, gzip_members=True, chunk_size=1024 * 1024):
+        """ Compress a directory as a seekable tar.gz
+
+        Each tar member (header, data and padding) is written as its own gzip
+        stream, so the archive is still a valid `.tar.gz` while any single
+        member can be read back by decompressing only its byte range.
+        The offsets, lengths, sizes and md5 checksums of all regular files
+        are written to `index_fp` as JSON.
+
+        With `gzip_members=False` a plain tar is written instead, the data of
+        each member is then stored contiguously and can be read with seeks.
+
+        Parameters
+        ----------
+        :param archive_fp: Path to archive file
+        :type  archive_fp: str
+
+        :param directory: Path to the directory to compress
+        :type  directory: str
+
+        :param arcname: Name of `directory` in the archive
+        :type arcname: str
+
+        :param index_fp: Path to write the JSON member index to
+        :type index_fp: str
+
+        :param gzip_members: Write each member as a gzip stream
+        :type gzip_members: boolean
+
+        :return: The member index
+        :rtype dict
+        """
+        members = []
+        with open(archive_fp, 'wb') as archive, tarfile.open(fileobj=io.BytesIO(), mode='w') as tar:
+            # `tar` only builds the member headers, the data is written to `archive`
+            for path, name in self._walk_archive(directory, arcname):
+                tarinfo = tar.gettarinfo(path, arcname=name)
+                header = tarinfo.tobuf(tar.format, tar.encoding, tar.errors)
+                hasher_md5 = hashlib.md5()
+                offset = archive.tell()
+
+                with self._open_archive_member(archive, gzip_members) as member:
+                    member.write(header)
+                    if tarinfo.isreg():
+                        with open(path, 'rb') as f:
+                            for chunk in iter(lambda: f.read(chunk_size), b''):
+                                hasher_md5.update(chunk)
+                                member.write(chunk)
+                        remainder = tarinfo.size % tarfile.BLOCKSIZE
+                        if remainder:
+                            member.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+
+                if tarinfo.isreg():
+                    members.append({
+                        'name': tarinfo.name,
+                        'size': tarinfo.size,
+                        'md5': hasher_md5.hexdigest(),
+                        'offset': offset,
+                        'length': archive.tell() - offset,
+                        'data_offset': len(header),
+                    })
+
+            # End of archive marker
+            with self._open_archive_member(archive, gzip_members) as member:
+                member.write(tarfile.NUL * tarfile.BLOCKSIZE * 2)
+
+        index = {
+            'format': ARCHIVE_INDEX_FORMAT if gzip_members else UNCOMPRESSED_ARCHIVE_INDEX_FORMAT,
+            'members': members,
+        }
+        with open(index_fp, 'w') as f:
+            json.dump(index, f)
+        return index
+
     def get(self, reference, output_dir="", required=False):
         """ Retrieve stored object
 
@@ -276,6 +385,45 @@ class BaseStorageConnector(object):
         else:
             return None
 
+    def put_indexed(self, directory_path, suffix=None, arcname=None, gzip_members=True):
+        """ Place a directory in storage as a seekable archive with a member index
+
+        The archive is written by `compress( .. , index_fp)` so the server can
+        read single members with range requests, the JSON index is stored
+        as a separate object.
+
+        Parameters
+        ----------
+        :param directory_path: Path to a directory for upload
+        :type  directory_path: str
+
+        :param suffix: Set the archive filename extension defaults to `tar.gz`
+        :type suffix: str
+
+        :param arcname: If given, `arcname' set an alternative
+                        name for the directory in the archive.
+        :type arcname: str
+
+        :param gzip_members: Set to `False` to store the members uncompressed
+        :type gzip_members: boolean
+
+        :return: storage references for the archive and its index, (None, None)
+                 if `directory_path` is not a directory
+        :rtype (str, str)
+        """
+        if not directory_path or not os.path.isdir(directory_path):
+            return None, None
+
+        ext = ARCHIVE_FILE_SUFFIX if not suffix else suffix
+        with tempfile.TemporaryDirectory() as tmpdir:
+            archive_fp = os.path.join(tmpdir, self._get_unique_filename(ext))
+            index_fp = os.path.join(tmpdir, self._get_unique_filename(ARCHIVE_INDEX_SUFFIX))
+            self.compress(archive_fp, directory_path, arcname, index_fp=index_fp, gzip_members=gzip_members)
+            return (
+                self.put(archive_fp, suffix=ext),
+                self.put(index_fp, suffix=ARCHIVE_INDEX_SUFFIX),
+            )
+
 
     def create_traceback(self, stdout, stderr, output_dir=""):
         traceback_file = self._get_unique_filename(LOG_FILE_SUFFIX)
@@ -1,11 +1,13 @@
 from __future__ import absolute_import
 
+import csv
 import glob
 import json
 import logging
 import os
 import sys
 import shutil
+import re
 import subprocess
 import time
 
@@ -13,6 +15,9 @@ import fasteners
 import tempfile
 import tarfile
 
+import pyarrow.csv
+import pyarrow.parquet
+
 from contextlib import contextmanager, suppress
 
 from celery import Celery, signature
@@ -38,6 +43,7 @@ Celery task wrapper for Oasis ktools calculation.
 LOG_FILE_SUFFIX = 'txt'
 ARCHIVE_FILE_SUFFIX = 'tar.gz'
 RUNNING_TASK_STATUS = OASIS_TASK_STATUS["running"]["id"]
+METRICS_RESULT_TYPES = {'1': 'analytical', '2': 'sample'}
 app = Celery()
 app.config_from_object(celery_conf)
 logging.info("Started worker")
@@ -217,6 +223,10 @@ def register_worker(sender, **k):
     # Log All Env variables
     logging.info('OASIS_ENV_VARS:' + json.dumps({k: v for (k, v) in os.environ.items() if k.startswith('OASIS_')}, indent=4))
 
+    # Report unknown or mis-typed options, see `iniconf.SETTINGS_TYPES`
+    for problem in settings.validate():
+        logging.warning('Invalid setting {}'.format(problem))
+
     # Clean up multiprocess tmp dirs on startup
     for tmpdir in glob.glob("/tmp/pymp-*"):
         os.rmdir(tmpdir)
@@ -288,7 +298,7 @@ def start_analysis_task(self, analysis_pk, input_location, analysis_settings, co
 
             notify_api_status(analysis_pk, 'RUN_STARTED')
             self.update_state(state=RUNNING_TASK_STATUS)
-            output_location, traceback_location, log_location, return_code = start_analysis(
+            result = start_analysis(
                 analysis_settings,
                 input_location,
                 complex_data_files=complex_data_files
@@ -300,7 +310,7 @@ def start_analysis_task(self, analysis_pk, input_location, analysis_settings, co
             logging.exception("Model execution task failed.")
             raise
 
-        return output_location, traceback_location, log_location, return_code
+        return result
 
 
 @oasis_log()
@@ -314,7 +324,9 @@ def start_analysis(analysis_settings, input_location, complex_data_files=None):
             on-disk and original filenames for required complex model data files.
 
     Returns:
-        (string) The location of the outputs.
+        (tuple) The locations of the outputs, traceback and logs, the return code,
+        the location of the output archive member index, the locations of the
+        columnar (Parquet) outputs archive and its index and the output metrics.
 
     """
     # Check that the input archive exists and is valid
@@ -407,11 +419,38 @@ def start_analysis(analysis_settings, input_location, complex_data_files=None):
         log_directory = os.path.join(run_dir, "log")
         log_location = filestore.put(log_directory, suffix=ARCHIVE_FILE_SUFFIX)
 
-        # Results dir & analysis-settings
+        # Results dir & analysis-settings, stored with a member index for random access
         output_directory = os.path.join(run_dir, "output")
-        output_location = filestore.put(output_directory, suffix=ARCHIVE_FILE_SUFFIX, arcname='output')
+        output_location, output_index_location = filestore.put_indexed(output_directory, suffix=ARCHIVE_FILE_SUFFIX, arcname='output')
+
+        # Parquet copy of the ktools outputs for server side queries, (uncompressed tar so members can be read with seeks)
+        columnar_location, columnar_index_location = None, None
+        if settings.getboolean('worker', 'COLUMNAR_OUTPUTS', fallback=True):
+            try:
+                columnar_directory = os.path.join(run_dir, "output_columnar")
+                if write_columnar_outputs(output_directory, columnar_directory):
+                    columnar_location, columnar_index_location = filestore.put_indexed(
+                        columnar_directory, suffix='tar', arcname='output', gzip_members=False)
+            except Exception:
+                logging.exception("Failed to store columnar outputs")
+
+        # Headline metrics, returned to the API with the result
+        metrics = None
+        try:
+            metrics = compute_output_metrics(output_directory)
+        except Exception:
+            logging.exception("Failed to compute output metrics")
 
-    return output_location, traceback_location, log_location, proc.returncode
+    return (
+        output_location,
+        traceback_location,
+        log_location,
+        proc.returncode,
+        output_index_location,
+        columnar_location,
+        columnar_index_location,
+        metrics,
+    )
 
 
 @app.task(name='generate_input', bind=True, acks_late=True, throws=(Terminated,))
@@ -572,6 +611,117 @@ def on_error(request, ex, traceback, record_task_name, analysis_pk, initiator_pk
         ).delay()
 
 
+def write_columnar_outputs(output_directory, columnar_directory):
+    """Converts the ktools CSV outputs to Parquet.
+
+    Files are written with row group statistics, so queries on the server only
+    read the row groups and columns they need.
+
+    Args:
+        output_directory (str): The analysis output directory.
+        columnar_directory (str): Directory to write the `.parquet` files to,
+            CSV files are placed at the same relative paths.
+
+    Returns:
+        (int) The number of files converted.
+
+    """
+    row_group_size = settings.getint('worker', 'COLUMNAR_ROW_GROUP_SIZE', fallback=65536)
+    converted = 0
+    for csv_path in sorted(Path(output_directory).glob('**/*.csv')):
+        parquet_path = Path(columnar_directory, csv_path.relative_to(output_directory)).with_suffix('.parquet')
+        parquet_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            table = pyarrow.csv.read_csv(str(csv_path))
+        except pyarrow.ArrowInvalid as e:
+            # Empty or malformed output files are left out of the columnar store
+            logging.info('Skipped columnar output for {}: {}'.format(csv_path, e))
+            continue
+
+        pyarrow.parquet.write_table(table, str(parquet_path), row_group_size=row_group_size)
+        converted += 1
+    return converted
+
+
+def _read_output_csv(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def _get_metrics_return_periods():
+    return_periods = settings.get('worker', 'METRICS_RETURN_PERIODS', fallback='10,25,50,100,200,250,500,1000')
+    return [float(rp) for rp in return_periods.split(',') if rp.strip()]
+
+
+def compute_output_metrics(output_directory):
+    """Computes a compact summary of the ktools outputs.
+
+    For each summary level (e.g. `gul_S1`) the AAL is totalled over the summary
+    ids for each result type, and the losses of the EP curves (`leccalc` outputs)
+    are picked at the standard return periods (worker option `METRICS_RETURN_PERIODS`).
+    The total exposure is the sum of the `tiv` column of the summary info files.
+
+    Args:
+        output_directory (str): The analysis output directory.
+
+    Returns:
+        (dict) The metrics document, or None if there are no ktools outputs.
+
+    """
+    return_periods = _get_metrics_return_periods()
+    max_summary_ids = settings.getint('worker', 'METRICS_MAX_SUMMARY_IDS', fallback=100)
+    levels = {}
+
+    def get_level(name):
+        return levels.setdefault(name, {'tiv': None, 'aal': {}, 'ep': {}})
+
+    for path in sorted(Path(output_directory).glob('*.csv')):
+        match = re.match(r'^(?P<level>[a-z]+_S\d+)_(?P<output>.+)\.csv$', path.name)
+        if not match:
+            continue
+        level, output = match.group('level', 'output')
+
+        if output == 'summary-info':
+            rows = _read_output_csv(path)
+            if rows and 'tiv' in rows[0]:
+                get_level(level)['tiv'] = sum(float(row['tiv'] or 0) for row in rows)
+
+        elif output == 'aalcalc':
+            aal = get_level(level)['aal']
+            for row in _read_output_csv(path):
+                result_type = METRICS_RESULT_TYPES.get(row.get('type'), row.get('type'))
+                aal[result_type] = aal.get(result_type, 0.0) + float(row['mean'])
+
+        elif output.startswith('leccalc_'):
+            rows = _read_output_csv(path)
+            curve = output[len('leccalc_'):]
+            summary_ids = sorted({row['summary_id'] for row in rows}, key=int)
+            if len(summary_ids) > max_summary_ids:
+                # Fine grained summary levels are left to the output files
+                get_level(level)['ep'][curve] = None
+                continue
+
+            ep = get_level(level)['ep'].setdefault(curve, {})
+            for row in rows:
+                return_period = float(row['return_period'])
+                if return_period not in return_periods:
+                    continue
+                points = ep.setdefault(row['summary_id'], {})
+                if 'type' in row:
+                    points = points.setdefault(METRICS_RESULT_TYPES.get(row['type'], row['type']), {})
+                points['{:g}'.format(return_period)] = float(row['loss'])
+
+    if not levels:
+        return None
+
+    total_tiv = next((levels[name]['tiv'] for name in sorted(levels) if levels[name]['tiv'] is not None), None)
+    return {
+        'total_tiv': total_tiv,
+        'return_periods': [int(rp) if rp.is_integer() else rp for rp in return_periods],
+        'summary_levels': levels,
+    }
+
+
 def prepare_complex_model_file_inputs(complex_model_files, run_directory):
     """Places the specified complex model files in the run_directory.
 
@@ -1,7 +1,17 @@
 from django.contrib import admin
-from .models import Analysis
+from .models import Analysis, AnalysisRuntimeStatistics, AnalysisQueueShare
 
 
 @admin.register(Analysis)
 class AnalysisAdmin(admin.ModelAdmin):
     list_display = ['name', 'model']
+
+
+@admin.register(AnalysisRuntimeStatistics)
+class AnalysisRuntimeStatisticsAdmin(admin.ModelAdmin):
+    list_display = ['model', 'phase', 'count']
+
+
+@admin.register(AnalysisQueueShare)
+class AnalysisQueueShareAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'weight', 'max_concurrency']
@@ -0,0 +1,198 @@
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.status import HTTP_201_CREATED
+
+from ..celery import celery_app
+from ..files.models import RelatedFile
+from .consumers import push_status_on_commit
+from .dispatch import dispatch_on_commit, dispatch_pending
+from .estimates import GENERATE_INPUTS, RUN
+from .models import Analysis
+from .serializers import AnalysisSerializer, BulkAnalysisCreateSerializer, BulkAnalysisSerializer
+
+STATUS = Analysis.status_choices
+INPUTS_GENERATION_STATES = [STATUS.INPUTS_GENERATION_QUEUED, STATUS.INPUTS_GENERATION_STARTED]
+RUN_ANALYSIS_STATES = [STATUS.RUN_QUEUED, STATUS.RUN_STARTED]
+
+# Set by `Analysis.set_task_queued`
+TASK_QUEUED_FIELDS = ['task_initiator', 'task_queued', 'task_dispatched', 'task_started', 'task_finished', 'task_work']
+
+
+def _bulk_create(model, objs):
+    """ Insert `objs` with a single `bulk_create` when the database returns the
+    new primary keys, otherwise one insert per row
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objs), True
+
+    for obj in objs:
+        obj.save(force_insert=True)
+    return objs, False
+
+
+def _bulk_update(analyses, fields):
+    """ Write `fields` of all the analyses in one query and push their new status
+    """
+    now = timezone.now()
+    for analysis in analyses:
+        analysis.modified = now
+
+    with transaction.atomic():
+        Analysis.objects.bulk_update(analyses, fields + ['modified'])
+        for analysis in analyses:
+            push_status_on_commit(analysis)
+
+
+def _get_analyses(request):
+    """ Load the analyses listed in the request with everything needed to
+    validate and dispatch them
+    """
+    serializer = BulkAnalysisSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    pks = serializer.validated_data['analyses']
+
+    analyses = Analysis.objects.filter(pk__in=pks).select_related(
+        'model',
+        'settings_file',
+        'input_file',
+        'portfolio__location_file',
+        'portfolio__accounts_file',
+        'portfolio__reinsurance_info_file',
+        'portfolio__reinsurance_scope_file',
+    ).prefetch_related('complex_model_data_files__file').in_bulk()
+
+    missing = {pk: {'pk': ['Invalid pk "{}" - object does not exist.'.format(pk)]} for pk in pks if pk not in analyses}
+    if missing:
+        raise ValidationError({'analyses': missing})
+    return [analyses[pk] for pk in pks]
+
+
+def _validate(analyses, get_errors):
+    """ Collect the errors of every analysis, nothing is changed if any analysis is invalid
+    """
+    errors = {}
+    for analysis in analyses:
+        analysis_errors = get_errors(analysis)
+        if analysis_errors:
+            errors[analysis.pk] = analysis_errors
+    if errors:
+        raise ValidationError({'analyses': errors})
+
+
+def _queue(analyses, status, phase, initiator):
+    """ Queue the tasks of all the analyses, then release them to the model queues
+    as one group (see `dispatch`)
+    """
+    # The dispatcher releases the tasks of a share oldest first, keep them in the request order
+    now = timezone.now()
+    for i, analysis in enumerate(analyses):
+        analysis.status = status
+        analysis.set_task_queued(phase, initiator, queued=now + timedelta(microseconds=i))
+    _bulk_update(analyses, ['status', 'run_task_id', 'generate_inputs_task_id'] + TASK_QUEUED_FIELDS)
+
+    released = {a.pk: a for a in dispatch_pending([a.model_id for a in analyses])}
+    for analysis in analyses:
+        if analysis.pk in released:
+            analysis.run_task_id = released[analysis.pk].run_task_id
+            analysis.generate_inputs_task_id = released[analysis.pk].generate_inputs_task_id
+            analysis.task_dispatched = released[analysis.pk].task_dispatched
+
+
+def _serialize(analyses, request, **kwargs):
+    return Response(AnalysisSerializer(analyses, many=True, context={'request': request}).data, **kwargs)
+
+
+def handle_bulk_create(request):
+    """ Create many analyses (and their settings files) in one transaction
+    """
+    serializer = BulkAnalysisCreateSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    items = serializer.validated_data['analyses']
+
+    with transaction.atomic():
+        settings_files = [
+            RelatedFile(
+                file=ContentFile(item['settings'].encode('utf-8'), name='analysis_settings.json'),
+                filename='analysis_settings.json',
+                content_type='application/json',
+                creator=request.user,
+            )
+            for item in items if item.get('settings')
+        ]
+        settings_files = iter(_bulk_create(RelatedFile, settings_files)[0])
+
+        analyses = [
+            Analysis(
+                name=item['name'],
+                portfolio=item['portfolio'],
+                model=item['model'],
+                creator=request.user,
+                settings_file=next(settings_files) if item.get('settings') else None,
+            )
+            for item in items
+        ]
+        analyses, bulk_inserted = _bulk_create(Analysis, analyses)
+        if bulk_inserted:
+            for analysis in analyses:
+                push_status_on_commit(analysis)
+
+        Analysis.complex_model_data_files.through.objects.bulk_create([
+            Analysis.complex_model_data_files.through(analysis_id=analysis.pk, datafile_id=pk)
+            for analysis, item in zip(analyses, items)
+            for pk in dict.fromkeys(item['complex_model_data_files'])
+        ])
+
+    analyses = Analysis.objects.filter(pk__in=[a.pk for a in analyses]).prefetch_related('complex_model_data_files').order_by('pk')
+    return _serialize(analyses, request, status=HTTP_201_CREATED)
+
+
+def handle_bulk_generate_inputs(request):
+    """ Queue input generation for many analyses, all or none are queued
+    """
+    analyses = _get_analyses(request)
+    _validate(analyses, lambda a: a.get_generate_inputs_errors())
+
+    _queue(analyses, STATUS.INPUTS_GENERATION_QUEUED, GENERATE_INPUTS, request.user)
+    return _serialize(analyses, request)
+
+
+def handle_bulk_run(request):
+    """ Queue runs for many analyses, all or none are queued
+    """
+    analyses = _get_analyses(request)
+    _validate(analyses, lambda a: a.get_run_errors())
+
+    _queue(analyses, STATUS.RUN_QUEUED, RUN, request.user)
+    return _serialize(analyses, request)
+
+
+def handle_bulk_cancel(request):
+    """ Cancel the queued or running input generation or run of many analyses,
+    all tasks are revoked with a single broadcast
+    """
+    analyses = _get_analyses(request)
+    _validate(analyses, lambda a: {} if a.status in INPUTS_GENERATION_STATES + RUN_ANALYSIS_STATES else {
+        'status': ['Analysis is not running or queued']
+    })
+
+    task_ids = []
+    now = timezone.now()
+    for analysis in analyses:
+        if analysis.status in INPUTS_GENERATION_STATES:
+            task_ids.append(analysis.generate_inputs_task_id)
+            analysis.status = STATUS.INPUTS_GENERATION_CANCELLED
+        else:
+            task_ids.append(analysis.run_task_id)
+            analysis.status = STATUS.RUN_CANCELLED
+        analysis.task_finished = now
+
+    celery_app.control.revoke([task_id for task_id in task_ids if task_id], signal='SIGTERM', terminate=True)
+
+    _bulk_update(analyses, ['status', 'task_finished'])
+    dispatch_on_commit({a.model_id for a in analyses})
+    return _serialize(analyses, request)
@@ -0,0 +1,127 @@
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.generic.websocket import JsonWebsocketConsumer
+from channels.layers import get_channel_layer
+from django.db import transaction
+from rest_framework.fields import DateTimeField
+
+from ..portfolios.models import Portfolio
+
+logger = logging.getLogger(__name__)
+
+
+def analysis_status_group(pk):
+    return 'analysis-status-{}'.format(pk)
+
+
+def portfolio_status_group(pk):
+    return 'portfolio-status-{}'.format(pk)
+
+
+def user_status_group(pk):
+    return 'user-status-{}'.format(pk)
+
+
+def get_status_message(analysis):
+    """ The status fields of an analysis as pushed to subscribers
+    """
+    datetime_field = DateTimeField()
+    return {
+        'id': analysis.pk,
+        'portfolio': analysis.portfolio_id,
+        'status': analysis.status,
+        'task_started': datetime_field.to_representation(analysis.task_started) if analysis.task_started else None,
+        'task_finished': datetime_field.to_representation(analysis.task_finished) if analysis.task_finished else None,
+        'modified': datetime_field.to_representation(analysis.modified) if analysis.modified else None,
+    }
+
+
+def push_status_update(message, creator_pk):
+    """ Send a status message to the analysis, portfolio and user subscriptions
+
+    Failing to reach the channel layer is logged, it never fails the status update
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    groups = [
+        analysis_status_group(message['id']),
+        portfolio_status_group(message['portfolio']),
+        user_status_group(creator_pk),
+    ]
+    try:
+        for group in groups:
+            async_to_sync(channel_layer.group_send)(group, {'type': 'status.update', 'message': message})
+    except Exception:
+        logger.exception('Failed to push status update for analysis {}'.format(message['id']))
+
+
+def push_status_on_commit(analysis):
+    """ Push the current status of `analysis` once the transaction commits,
+    for writes that skip the `post_save` handler such as `bulk_update`
+    """
+    message = get_status_message(analysis)
+    creator_pk = analysis.creator_id
+    transaction.on_commit(lambda: push_status_update(message, creator_pk))
+
+
+class AnalysisStatusConsumer(JsonWebsocketConsumer):
+    """ Pushes the status of analyses to WebSocket clients as it is written
+
+    The subscription is picked by the route:
+
+    * `ws/<version>/analyses/<pk>/status/` a single analysis, its current status
+      is sent on connect
+    * `ws/<version>/portfolios/<pk>/status/` all analyses of a portfolio
+    * `ws/<version>/analyses/status/` all analyses created by the user
+
+    Connections without an authenticated user or for unknown objects are rejected.
+    """
+
+    def connect(self):
+        # Imported here as the analysis models import this module
+        from .models import Analysis
+
+        self.subscriptions = []
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            self.close()
+            return
+
+        kwargs = self.scope['url_route']['kwargs']
+        analysis_pk = kwargs.get('analysis_pk')
+        if analysis_pk is not None:
+            if not Analysis.objects.filter(pk=analysis_pk).exists():
+                self.close()
+                return
+            self.subscriptions = [analysis_status_group(analysis_pk)]
+        elif 'portfolio_pk' in kwargs:
+            if not Portfolio.objects.filter(pk=kwargs['portfolio_pk']).exists():
+                self.close()
+                return
+            self.subscriptions = [portfolio_status_group(kwargs['portfolio_pk'])]
+        else:
+            self.subscriptions = [user_status_group(user.pk)]
+
+        for group in self.subscriptions:
+            async_to_sync(self.channel_layer.group_add)(group, self.channel_name)
+        self.accept()
+
+        # Read after subscribing so no update is missed in between
+        if analysis_pk is not None:
+            analysis = Analysis.objects.filter(pk=analysis_pk).first()
+            if analysis is not None:
+                self.send_json(get_status_message(analysis))
+
+    def disconnect(self, code):
+        for group in getattr(self, 'subscriptions', []):
+            async_to_sync(self.channel_layer.group_discard)(group, self.channel_name)
+
+    def receive_json(self, content, **kwargs):
+        # Subscriptions are read only
+        pass
+
+    def status_update(self, event):
+        self.send_json(event['message'])
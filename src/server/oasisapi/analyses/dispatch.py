@@ -0,0 +1,246 @@
+""" Fair-share dispatch of the analysis tasks to the model queues
+
+A queued analysis is held by the server until the dispatcher releases its task
+to the broker. Each model queue has at most `ANALYSIS_DISPATCH_MODEL_CONCURRENCY`
+tasks released at a time. A free slot goes to the share with the fewest released
+tasks for its weight, and within a share to its oldest task. A share is a user,
+or the users of a group given an `AnalysisQueueShare`. A share never has more
+than its `max_concurrency` tasks released to a model queue.
+
+The dispatcher runs when tasks are queued and when a released task leaves the
+queued and started states. With the default (unlimited) concurrency every task
+is released as soon as it is queued. The ids of the released tasks are stored
+first and the tasks are published once that is committed, so a task on the
+broker always has its id recorded and can be cancelled.
+"""
+import heapq
+import logging
+from collections import Counter, OrderedDict, deque, namedtuple
+
+from celery import group
+from celery.utils import uuid
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+QUEUED_STATES = ['INPUTS_GENERATION_QUEUED', 'RUN_QUEUED']
+STARTED_STATES = ['INPUTS_GENERATION_STARTED', 'RUN_STARTED']
+
+Share = namedtuple('Share', ['key', 'weight', 'max_concurrency'])
+
+
+def is_held(analysis):
+    """ Whether the analysis is queued but not yet released to the broker
+    """
+    return analysis.status in QUEUED_STATES and analysis.task_dispatched is None
+
+
+def get_shares(initiator_ids):
+    """ The share of each initiator, their own `AnalysisQueueShare`, else the
+    highest weighted share of their groups, else a share of their own with the
+    default weight and concurrency
+    """
+    from .models import AnalysisQueueShare
+
+    default_concurrency = settings.ANALYSIS_DISPATCH_USER_CONCURRENCY or None
+    initiator_ids = set(initiator_ids)
+
+    def to_share(key, queue_share):
+        max_concurrency = queue_share.max_concurrency if queue_share.max_concurrency is not None else default_concurrency
+        return Share(key, queue_share.weight, max_concurrency)
+
+    shares = {
+        s.user_id: to_share(('user', s.user_id), s)
+        for s in AnalysisQueueShare.objects.filter(user_id__in=initiator_ids)
+    }
+
+    memberships = get_user_model().groups.through.objects.filter(
+        user_id__in=initiator_ids - set(shares),
+    ).values_list('user_id', 'group_id')
+    user_groups = {}
+    for user_id, group_id in memberships:
+        user_groups.setdefault(user_id, set()).add(group_id)
+
+    group_shares = AnalysisQueueShare.objects.filter(
+        group_id__in={g for groups in user_groups.values() for g in groups},
+    ).order_by('-weight', 'pk')
+    for s in group_shares:
+        for user_id, groups in user_groups.items():
+            if s.group_id in groups and user_id not in shares:
+                shares[user_id] = to_share(('group', s.group_id), s)
+
+    for initiator_id in initiator_ids - set(shares):
+        shares[initiator_id] = Share(('user', initiator_id), 1.0, default_concurrency)
+    return shares
+
+
+def iter_fair_share(held, released, shares, capacity=None, respect_limits=True):
+    """ Yields the held analyses in the order they are released
+
+    :param held: The held analyses of a model, oldest first
+    :param released: The count of released tasks of each share on the model
+    :param shares: The share of each initiator (see `get_shares`)
+    :param capacity: The most analyses released, `None` for no limit
+    :param respect_limits: Whether the `max_concurrency` of the shares stops their release
+    """
+    queues = OrderedDict()
+    for analysis in held:
+        queues.setdefault(shares[analysis.task_initiator_id], deque()).append(analysis)
+    released = Counter(released)
+
+    while queues and (capacity is None or capacity > 0):
+        eligible = [
+            share for share in queues
+            if not respect_limits or share.max_concurrency is None or released[share] < share.max_concurrency
+        ]
+        if not eligible:
+            return
+
+        share = min(eligible, key=lambda s: (released[s] / s.weight, queues[s][0].task_queued, queues[s][0].pk))
+        analysis = queues[share].popleft()
+        if not queues[share]:
+            del queues[share]
+        released[share] += 1
+        if capacity is not None:
+            capacity -= 1
+        yield analysis
+
+
+def _load_queues(model_ids):
+    """ The held analyses and the count of released tasks of each share, by model
+    """
+    from .models import Analysis
+
+    active = Analysis.objects.filter(model_id__in=model_ids, status__in=QUEUED_STATES + STARTED_STATES)
+    held = list(active.filter(status__in=QUEUED_STATES, task_dispatched__isnull=True).order_by('task_queued', 'pk'))
+    released = list(active.exclude(status__in=QUEUED_STATES, task_dispatched__isnull=True).values_list('model_id', 'task_initiator_id'))
+
+    shares = get_shares([a.task_initiator_id for a in held] + [initiator_id for _, initiator_id in released])
+    queues = {model_id: ([], Counter()) for model_id in model_ids}
+    for analysis in held:
+        queues[analysis.model_id][0].append(analysis)
+    for model_id, initiator_id in released:
+        queues[model_id][1][shares[initiator_id]] += 1
+    return queues, shares
+
+
+def get_queue_positions(model_id):
+    """ The position of each held analysis of the model in the order it would be
+    released, counting from 1, ignoring the concurrency limits of the shares
+    """
+    queues, shares = _load_queues([model_id])
+    held, released = queues[model_id]
+    return {a.pk: i for i, a in enumerate(iter_fair_share(held, released, shares, respect_limits=False), 1)}
+
+
+def publish(signatures):
+    """ Publish the signatures, several at once as a group over a single broker connection
+    """
+    if len(signatures) == 1:
+        signatures[0].delay()
+    else:
+        group(signatures).apply_async()
+
+
+def publish_on_commit(analyses, signatures):
+    """ Publish the signatures of the released analyses once the transaction storing
+    their task ids commits. When publishing fails the analyses still queued are held
+    again, to be released by the next dispatch
+    """
+    from .models import Analysis
+
+    def send():
+        try:
+            publish(signatures)
+        except Exception:
+            logger.exception('Failed to publish the tasks of analyses {}'.format([a.pk for a in analyses]))
+            held_again = [
+                (Analysis.status_choices.RUN_QUEUED, 'run_task_id'),
+                (Analysis.status_choices.INPUTS_GENERATION_QUEUED, 'generate_inputs_task_id'),
+            ]
+            for status, field in held_again:
+                Analysis.objects.filter(
+                    pk__in=[a.pk for a in analyses],
+                    status=status,
+                    **{field + '__in': [getattr(a, field) for a in analyses]}
+                ).update(**{field: '', 'task_dispatched': None})
+
+    transaction.on_commit(send)
+
+
+def dispatch_pending(model_ids):
+    """ Release the held analyses of the models into the free slots of their queues
+
+    :return: The released analyses
+    """
+    from ..analysis_models.models import AnalysisModel
+    from .models import Analysis
+
+    model_ids = sorted(set(model_ids))
+    model_concurrency = settings.ANALYSIS_DISPATCH_MODEL_CONCURRENCY or None
+
+    with transaction.atomic():
+        # Serialises the dispatchers of a model so its free slots are only given out once
+        list(AnalysisModel.objects.select_for_update().filter(pk__in=model_ids).order_by('pk').values_list('pk', flat=True))
+
+        queues, shares = _load_queues(model_ids)
+        releases = []
+        for model_id in model_ids:
+            held, released = queues[model_id]
+            capacity = max(model_concurrency - sum(released.values()), 0) if model_concurrency else None
+            releases.append(list(iter_fair_share(held, released, shares, capacity)))
+
+        # Each model queue gets its tasks in the release order, the queues are interleaved oldest first
+        to_release = list(heapq.merge(*releases, key=lambda a: (a.task_queued, a.pk)))
+        if not to_release:
+            return []
+
+        # Reload the released analyses with everything needed to build their signatures
+        with_relations = Analysis.objects.filter(pk__in=[a.pk for a in to_release]).select_related(
+            'model',
+            'task_initiator',
+            'creator',
+            'settings_file',
+            'input_file',
+            'portfolio__location_file',
+            'portfolio__accounts_file',
+            'portfolio__reinsurance_info_file',
+            'portfolio__reinsurance_scope_file',
+        ).prefetch_related('complex_model_data_files__file').in_bulk()
+        to_release = [with_relations[a.pk] for a in to_release]
+
+        now = timezone.now()
+        signatures = []
+        for analysis in to_release:
+            task_id = uuid()
+            signature = analysis.get_linked_signature()
+            signature.set(task_id=task_id)
+            signatures.append(signature)
+
+            if analysis.status == Analysis.status_choices.RUN_QUEUED:
+                analysis.run_task_id = task_id
+            else:
+                analysis.generate_inputs_task_id = task_id
+            analysis.task_dispatched = now
+            analysis.modified = now
+        Analysis.objects.bulk_update(to_release, ['run_task_id', 'generate_inputs_task_id', 'task_dispatched', 'modified'])
+
+        publish_on_commit(to_release, signatures)
+
+    return to_release
+
+
+def dispatch_on_commit(model_ids):
+    """ Release the held tasks of the models once the transaction commits, a failure
+    is logged and the tasks stay held until the next dispatch
+    """
+    def dispatch():
+        try:
+            dispatch_pending(model_ids)
+        except Exception:
+            logger.exception('Failed to dispatch the held tasks of models {}'.format(model_ids))
+
+    transaction.on_commit(dispatch)
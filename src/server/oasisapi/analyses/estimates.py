@@ -0,0 +1,213 @@
+""" Runtime estimates of the analysis tasks
+
+The duration of a task is fitted against its size (`task_work`), the
+location count of the portfolio for input generation, times the number of
+samples and outputs for a run. Each model keeps running sums of its
+completed tasks (`AnalysisRuntimeStatistics`) so recording a task is a single
+row update and the least squares fit is refreshed from the sums on demand.
+
+The queue wait of a task is the remaining time of the tasks ahead of it on
+the model queue, shared by the workers currently running tasks of the model.
+"""
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from ..files.views import _get_json_data
+
+GENERATE_INPUTS = 'GENERATE_INPUTS'
+RUN = 'RUN'
+
+# Output flags of a summary counted as an output of the run
+OUTPUT_FLAGS = ['summarycalc', 'eltcalc', 'aalcalc', 'pltcalc', 'lec_output']
+
+
+def get_phase(status):
+    """ The task an analysis in `status` is running, or would run next
+    """
+    return RUN if status.startswith('RUN_') or status == 'READY' else GENERATE_INPUTS
+
+
+def _get_analysis_settings(analysis):
+    if not analysis.settings_file:
+        return {}
+    try:
+        data = _get_json_data(analysis.settings_file)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    # Older settings files are nested under `analysis_settings`
+    return data.get('analysis_settings', data)
+
+
+def _count_outputs(analysis_settings):
+    count = 0
+    for prefix in ['gul', 'il', 'ri']:
+        if not analysis_settings.get('{}_output'.format(prefix)):
+            continue
+        for summary in analysis_settings.get('{}_summaries'.format(prefix)) or []:
+            count += sum(1 for flag in OUTPUT_FLAGS if summary.get(flag))
+            count += sum(1 for value in (summary.get('ord_output') or {}).values() if value is True)
+    return count
+
+
+def get_task_work(analysis, phase):
+    """ The size of the `phase` task of the analysis
+
+    :return: The location count (input generation) or the location count times
+        the samples and outputs (run), `None` when the location count is unknown
+    """
+    location_statistics = (analysis.portfolio.exposure_statistics or {}).get('location_file')
+    if not location_statistics:
+        return None
+
+    work = float(location_statistics['rows'])
+    if phase == RUN:
+        analysis_settings = _get_analysis_settings(analysis)
+        samples = analysis_settings.get('number_of_samples') or 1
+        work *= max(samples, 1) * max(_count_outputs(analysis_settings), 1)
+    return work
+
+
+def record_task_runtime(analysis, phase):
+    """ Adds a completed task to the running sums of its model
+    """
+    from .models import AnalysisRuntimeStatistics
+
+    if analysis.task_started is None or analysis.task_finished is None:
+        return
+    duration = (analysis.task_finished - analysis.task_started).total_seconds()
+    if duration < 0:
+        return
+
+    updates = {
+        'count': F('count') + 1,
+        'duration_sum': F('duration_sum') + duration,
+    }
+    work = analysis.task_work
+    if work is not None:
+        updates.update({
+            'sized_count': F('sized_count') + 1,
+            'sized_duration_sum': F('sized_duration_sum') + duration,
+            'work_sum': F('work_sum') + work,
+            'work_squared_sum': F('work_squared_sum') + work * work,
+            'work_duration_sum': F('work_duration_sum') + work * duration,
+        })
+
+    AnalysisRuntimeStatistics.objects.get_or_create(model_id=analysis.model_id, phase=phase)
+    AnalysisRuntimeStatistics.objects.filter(model_id=analysis.model_id, phase=phase).update(**updates)
+
+
+def get_runtime_statistics(model_id, phase):
+    """ The running sums of the model, or of all the models until it has completed a task
+    """
+    from .models import AnalysisRuntimeStatistics
+
+    statistics = AnalysisRuntimeStatistics.objects.filter(model_id=model_id, phase=phase, count__gt=0).first()
+    if statistics is not None:
+        return statistics
+
+    fields = ['count', 'duration_sum', 'sized_count', 'sized_duration_sum', 'work_sum', 'work_squared_sum', 'work_duration_sum']
+    pooled = AnalysisRuntimeStatistics.objects.filter(phase=phase).aggregate(**{f: Sum(f) for f in fields})
+    if not pooled['count']:
+        return None
+    return SimpleNamespace(**pooled)
+
+
+def predict_duration(statistics, work):
+    """ The expected duration in seconds of a task of size `work`
+
+    A least squares line through the sized tasks when their sizes vary, their
+    mean rate when they do not, the mean duration for tasks of unknown size.
+    """
+    if statistics is None or not statistics.count:
+        return None
+
+    n = statistics.sized_count
+    if work is not None and n:
+        mean_work = statistics.work_sum / n
+        mean_duration = statistics.sized_duration_sum / n
+        variance = statistics.work_squared_sum / n - mean_work ** 2
+        if n > 1 and variance > 1e-9 * mean_work ** 2:
+            slope = (statistics.work_duration_sum / n - mean_work * mean_duration) / variance
+            if slope >= 0:
+                return max(mean_duration + slope * (work - mean_work), 0.0)
+        if mean_work > 0:
+            return mean_duration * work / mean_work
+
+    return statistics.duration_sum / statistics.count
+
+
+def get_runtime_estimate(analysis, now=None):
+    """ The predicted queue wait, duration and completion time of the current
+    task of the analysis, or of its next task if it were queued now
+    """
+    from .models import Analysis
+
+    STATUS = Analysis.status_choices
+    queued_states = [STATUS.INPUTS_GENERATION_QUEUED, STATUS.RUN_QUEUED]
+    started_states = [STATUS.INPUTS_GENERATION_STARTED, STATUS.RUN_STARTED]
+
+    now = now or timezone.now()
+    statistics = {}
+
+    def predict(phase, work):
+        if phase not in statistics:
+            statistics[phase] = get_runtime_statistics(analysis.model_id, phase)
+        return predict_duration(statistics[phase], work)
+
+    def elapsed(started):
+        return (now - started).total_seconds() if started else 0.0
+
+    phase = get_phase(analysis.status)
+    queued = analysis.status in queued_states
+    started = analysis.status in started_states
+    work = analysis.task_work if queued or started else get_task_work(analysis, phase)
+    duration = predict(phase, work)
+
+    estimate = {
+        'phase': phase,
+        'duration': duration,
+        'queue_wait': None,
+        'remaining': None,
+        'eta': None,
+        'samples': statistics[phase].count if statistics[phase] is not None else 0,
+    }
+
+    if started:
+        estimate['queue_wait'] = 0.0
+        if duration is not None:
+            estimate['remaining'] = max(duration - elapsed(analysis.task_started), 0.0)
+            estimate['eta'] = now + timedelta(seconds=estimate['remaining'])
+        return estimate
+
+    # The tasks of the model ahead on its queue (all of them for an analysis that is not queued)
+    active = Analysis.objects.filter(
+        model_id=analysis.model_id,
+        status__in=queued_states + started_states,
+    ).exclude(pk=analysis.pk).values_list('status', 'task_queued', 'task_started', 'task_work')
+
+    workers = 0
+    ahead = 0.0
+    for status, task_queued, task_started, task_work in active:
+        if status in queued_states and queued and task_queued and analysis.task_queued and task_queued > analysis.task_queued:
+            continue
+
+        task_duration = predict(get_phase(status), task_work)
+        if task_duration is None:
+            return estimate
+
+        if status in started_states:
+            workers += 1
+            ahead += max(task_duration - elapsed(task_started), 0.0)
+        else:
+            ahead += task_duration
+
+    estimate['queue_wait'] = ahead / max(workers, 1)
+    if duration is not None:
+        estimate['remaining'] = estimate['queue_wait'] + duration
+        estimate['eta'] = now + timedelta(seconds=estimate['remaining'])
+    return estimate
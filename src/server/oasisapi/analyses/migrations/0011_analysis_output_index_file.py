@@ -0,0 +1,20 @@
+# Generated by Django 3.1.7 on 2026-10-19 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0004_remove_relatedfile_aws_location'),
+        ('analyses', '0010_auto_20200224_1213'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysis',
+            name='output_index_file',
+            field=models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='output_index_file_analyses', to='files.RelatedFile'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-19 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyses', '0012_analysis_output_columnar_files'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysis',
+            name='metrics',
+            field=models.JSONField(blank=True, default=None, editable=False, help_text='Headline metrics of the analysis outputs', null=True),
+        ),
+    ]
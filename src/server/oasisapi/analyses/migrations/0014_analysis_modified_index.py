@@ -0,0 +1,17 @@
+# Generated by Django 3.1.7 on 2026-10-19 13:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyses', '0013_analysis_metrics'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='analysis',
+            index=models.Index(fields=['modified'], name='analyses_an_modifie_99090b_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.1.7 on 2026-10-19 14:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis_models', '0004_analysismodel_deleted'),
+        ('analyses', '0014_analysis_modified_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysis',
+            name='task_queued',
+            field=models.DateTimeField(default=None, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='analysis',
+            name='task_work',
+            field=models.FloatField(default=None, editable=False, help_text='Size of the queued task, the input of the runtime estimate', null=True),
+        ),
+        migrations.CreateModel(
+            name='AnalysisRuntimeStatistics',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phase', models.CharField(choices=[('GENERATE_INPUTS', 'Generate inputs'), ('RUN', 'Run')], max_length=15)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('duration_sum', models.FloatField(default=0)),
+                ('sized_count', models.PositiveIntegerField(default=0, help_text='Completed tasks of known size')),
+                ('sized_duration_sum', models.FloatField(default=0)),
+                ('work_sum', models.FloatField(default=0)),
+                ('work_squared_sum', models.FloatField(default=0)),
+                ('work_duration_sum', models.FloatField(default=0)),
+                ('model', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='runtime_statistics', to='analysis_models.analysismodel')),
+            ],
+            options={
+                'verbose_name_plural': 'analysis runtime statistics',
+                'unique_together': {('model', 'phase')},
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 3.1.7 on 2026-10-19 14:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def mark_queued_tasks_dispatched(apps, schema_editor):
+    """ Tasks queued before the dispatcher were published as they were queued
+    """
+    Analysis = apps.get_model('analyses', 'Analysis')
+    Analysis.objects.filter(
+        status__in=['INPUTS_GENERATION_QUEUED', 'RUN_QUEUED'],
+    ).update(task_dispatched=django.utils.timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('analyses', '0015_analysis_runtime_estimates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysis',
+            name='task_dispatched',
+            field=models.DateTimeField(default=None, editable=False, help_text='When the queued task was released to the model queue', null=True),
+        ),
+        migrations.AddField(
+            model_name='analysis',
+            name='task_initiator',
+            field=models.ForeignKey(default=None, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='initiated_analyses', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(mark_queued_tasks_dispatched, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='AnalysisQueueShare',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weight', models.FloatField(default=1.0, help_text='Share of the model queues relative to the other users and groups')),
+                ('max_concurrency', models.PositiveIntegerField(blank=True, default=None, help_text='Most tasks released to a model queue at a time, defaults to ANALYSIS_DISPATCH_USER_CONCURRENCY', null=True)),
+                ('group', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='analysis_queue_share', to='auth.group')),
+                ('user', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='analysis_queue_share', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='analysisqueueshare',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('group__isnull', True), ('user__isnull', False)), models.Q(('group__isnull', False), ('user__isnull', True)), _connector='OR'), name='analysis_queue_share_user_or_group'),
+        ),
+        migrations.AddConstraint(
+            model_name='analysisqueueshare',
+            constraint=models.CheckConstraint(check=models.Q(weight__gt=0), name='analysis_queue_share_weight_positive'),
+        ),
+    ]
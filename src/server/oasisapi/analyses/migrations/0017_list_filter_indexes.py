@@ -0,0 +1,34 @@
+# Generated by Django 3.1.7 on 2026-10-19 15:11
+
+from django.db import migrations, models
+
+import src.server.oasisapi.indexes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('analyses', '0016_analysis_fair_share_dispatch'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='analysis',
+            index=models.Index(fields=['status', 'modified'], name='analyses_an_status_e021ca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='analysis',
+            index=models.Index(fields=['created'], name='analyses_an_created_02d7e6_idx'),
+        ),
+        src.server.oasisapi.indexes.CaseInsensitiveIndex(
+            model_name='analysis',
+            field_name='name',
+        ),
+        src.server.oasisapi.indexes.CaseInsensitiveIndex(
+            model_name='user',
+            field_name='username',
+            trigram=False,
+            app_label='auth',
+        ),
+    ]
@@ -3,21 +3,26 @@ from __future__ import absolute_import, print_function
 from celery import signature
 from celery.result import AsyncResult
 from django.conf import settings
+from django.contrib.auth.models import Group
 from django.core.files.base import File
 from django.db import models
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from model_utils.models import TimeStampedModel
+from model_utils.tracker import FieldTracker
 from model_utils.choices import Choices
 from rest_framework.exceptions import ValidationError
-from rest_framework.reverse import reverse
 
-from ..files.models import RelatedFile, file_storage_link
+from ..files.models import RelatedFile, delete_related_files, file_storage_link
+from ..reverse import reverse
 from ..analysis_models.models import AnalysisModel
 from ..data_files.models import DataFile
 from ..portfolios.models import Portfolio
+from .consumers import push_status_on_commit
+from .dispatch import QUEUED_STATES, STARTED_STATES, dispatch_on_commit, dispatch_pending
+from .estimates import GENERATE_INPUTS, RUN, get_task_work
 from .tasks import record_generate_input_result, record_run_analysis_result
 from ....common.data import STORED_FILENAME, ORIGINAL_FILENAME
 
@@ -46,6 +51,10 @@ class Analysis(TimeStampedModel):
     status = models.CharField(max_length=max(len(c) for c in status_choices._db_values), choices=status_choices, default=status_choices.NEW, editable=False)
     task_started = models.DateTimeField(editable=False, null=True, default=None)
     task_finished = models.DateTimeField(editable=False, null=True, default=None)
+    task_queued = models.DateTimeField(editable=False, null=True, default=None)
+    task_work = models.FloatField(editable=False, null=True, default=None, help_text=_('Size of the queued task, the input of the runtime estimate'))
+    task_dispatched = models.DateTimeField(editable=False, null=True, default=None, help_text=_('When the queued task was released to the model queue'))
+    task_initiator = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, default=None, editable=False, related_name='initiated_analyses')
     run_task_id = models.CharField(max_length=255, editable=False, default='', blank=True)
     generate_inputs_task_id = models.CharField(max_length=255, editable=False, default='', blank=True)
     complex_model_data_files = models.ManyToManyField(DataFile, blank=True, related_name='complex_model_files_analyses')
@@ -54,18 +63,30 @@ class Analysis(TimeStampedModel):
     input_file = models.ForeignKey(RelatedFile, on_delete=models.CASCADE, blank=True, null=True, default=None, related_name='input_file_analyses')
     input_generation_traceback_file = models.ForeignKey(RelatedFile, on_delete=models.SET_NULL, blank=True, null=True, default=None, related_name='input_generation_traceback_analyses')
     output_file = models.ForeignKey(RelatedFile, on_delete=models.CASCADE, blank=True, null=True, default=None, related_name='output_file_analyses')
+    output_index_file = models.ForeignKey(RelatedFile, on_delete=models.SET_NULL, blank=True, null=True, default=None, related_name='output_index_file_analyses')
+    output_columnar_file = models.ForeignKey(RelatedFile, on_delete=models.SET_NULL, blank=True, null=True, default=None, related_name='output_columnar_file_analyses')
+    output_columnar_index_file = models.ForeignKey(RelatedFile, on_delete=models.SET_NULL, blank=True, null=True, default=None, related_name='output_columnar_index_file_analyses')
     run_traceback_file = models.ForeignKey(RelatedFile, on_delete=models.SET_NULL, blank=True, null=True, default=None, related_name='run_traceback_file_analyses')
     run_log_file = models.ForeignKey(RelatedFile, on_delete=models.SET_NULL, blank=True, null=True, default=None, related_name='run_log_file_analyses')
+    metrics = models.JSONField(blank=True, null=True, default=None, editable=False, help_text=_('Headline metrics of the analysis outputs'))
 
     lookup_errors_file = models.ForeignKey(RelatedFile, on_delete=models.CASCADE, blank=True, null=True, default=None, related_name='lookup_errors_file_analyses')
     lookup_success_file = models.ForeignKey(RelatedFile, on_delete=models.CASCADE, blank=True, null=True, default=None, related_name='lookup_success_file_analyses')
     lookup_validation_file = models.ForeignKey(RelatedFile, on_delete=models.CASCADE, blank=True, null=True, default=None, related_name='lookup_validation_file_analyses')
     summary_levels_file = models.ForeignKey(RelatedFile, on_delete=models.CASCADE, blank=True, null=True, default=None, related_name='summary_levels_file_analyses')
 
+    status_tracker = FieldTracker(fields=['status', 'task_started', 'task_finished'])
+
 
 
     class Meta:
         verbose_name_plural = 'analyses'
+        indexes = [
+            # Status polling filters and orders by the modified time
+            models.Index(fields=['modified']),
+            models.Index(fields=['status', 'modified']),
+            models.Index(fields=['created']),
+        ]
 
     def __str__(self):
         return self.name
@@ -94,6 +115,12 @@ class Analysis(TimeStampedModel):
     def get_absolute_settings_file_url(self, request=None):
         return reverse('analysis-settings-file', kwargs={'version': 'v1', 'pk': self.pk}, request=request)
 
+    def get_absolute_presigned_upload_url(self, request=None):
+        return reverse('analysis-presigned-upload', kwargs={'version': 'v1', 'pk': self.pk}, request=request)
+
+    def get_absolute_presigned_upload_confirm_url(self, request=None):
+        return reverse('analysis-presigned-upload-confirm', kwargs={'version': 'v1', 'pk': self.pk}, request=request)
+
     def get_absolute_settings_url(self, request=None):
         return reverse('analysis-settings', kwargs={'version': 'v1', 'pk': self.pk}, request=request)
 
@@ -118,6 +145,24 @@ class Analysis(TimeStampedModel):
     def get_absolute_output_file_url(self, request=None):
         return reverse('analysis-output-file', kwargs={'version': 'v1', 'pk': self.pk}, request=request)
 
+    def get_absolute_output_file_index_url(self, request=None):
+        return reverse('analysis-output-file-index', kwargs={'version': 'v1', 'pk': self.pk}, request=request)
+
+    def get_absolute_output_file_member_url(self, request=None):
+        return reverse('analysis-output-file-member', kwargs={'version': 'v1', 'pk': self.pk}, request=request)
+
+    def get_absolute_output_tables_url(self, request=None):
+        return reverse('analysis-output-tables', kwargs={'version': 'v1', 'pk': self.pk}, request=request)
+
+    def get_absolute_output_query_url(self, request=None):
+        return reverse('analysis-output-query', kwargs={'version': 'v1', 'pk': self.pk}, request=request)
+
+    def get_absolute_metrics_url(self, request=None):
+        return reverse('analysis-metrics', kwargs={'version': 'v1', 'pk': self.pk}, request=request)
+
+    def get_absolute_runtime_estimate_url(self, request=None):
+        return reverse('analysis-runtime-estimate', kwargs={'version': 'v1', 'pk': self.pk}, request=request)
+
     def get_absolute_run_traceback_file_url(self, request=None):
         return reverse('analysis-run-traceback-file', kwargs={'version': 'v1', 'pk': self.pk}, request=request)
 
@@ -128,7 +173,9 @@ class Analysis(TimeStampedModel):
         return reverse('analysis-storage-links', kwargs={'version': 'v1', 'pk': self.pk}, request=request)
 
 
-    def validate_run(self):
+    def get_run_errors(self):
+        """ The reasons the analysis can not be run, empty if it can
+        """
         valid_choices = [
             self.status_choices.READY,
             self.status_choices.RUN_COMPLETED,
@@ -136,9 +183,7 @@ class Analysis(TimeStampedModel):
             self.status_choices.RUN_CANCELLED,
         ]
         if self.status not in valid_choices:
-            raise ValidationError(
-                {'status': ['Analysis must be in one of the following states [{}]'.format(', '.join(valid_choices))]}
-            )
+            return {'status': ['Analysis must be in one of the following states [{}]'.format(', '.join(valid_choices))]}
 
         errors = {}
         if self.model.deleted:
@@ -149,6 +194,12 @@ class Analysis(TimeStampedModel):
 
         if not self.input_file:
             errors['input_file'] = ['Must not be null']
+        return errors
+
+    def validate_run(self):
+        errors = self.get_run_errors()
+        if 'status' in errors:
+            raise ValidationError(errors)
 
         if errors:
             self.status = self.status_choices.RUN_ERROR
@@ -164,17 +215,48 @@ class Analysis(TimeStampedModel):
         self.validate_run()
 
         self.status = self.status_choices.RUN_QUEUED
+        self.set_task_queued(RUN, initiator)
+        self.save()
+        self.dispatch()
+
+    def set_task_queued(self, phase, initiator, queued=None):
+        """ Reset the task times and record the size of the queued task, it is
+        held until the dispatcher releases it (see `dispatch`)
+        """
+        if phase == RUN:
+            self.run_task_id = ''
+        else:
+            self.generate_inputs_task_id = ''
+        self.task_initiator = initiator
+        self.task_queued = queued or timezone.now()
+        self.task_dispatched = None
+        self.task_started = None
+        self.task_finished = None
+        self.task_work = get_task_work(self, phase)
+
+    def dispatch(self):
+        """ Release the held tasks of the model queue into its free slots
+        """
+        dispatch_pending([self.model_id])
+        self.refresh_from_db(fields=['run_task_id', 'generate_inputs_task_id', 'task_dispatched', 'modified'])
+
+    def get_linked_signature(self):
+        """ The linked signature of the queued task
+        """
+        initiator = self.task_initiator or self.creator
+        if self.status == self.status_choices.RUN_QUEUED:
+            return self.get_linked_run_signature(initiator)
+        return self.get_linked_generate_input_signature(initiator)
 
+    def get_linked_run_signature(self, initiator):
+        """ The run signature with the callbacks recording its result
+        """
         run_analysis_signature = self.run_analysis_signature
         run_analysis_signature.link(record_run_analysis_result.s(self.pk, initiator.pk))
         run_analysis_signature.link_error(
             signature('on_error', args=('record_run_analysis_failure', self.pk, initiator.pk), queue=self.model.queue_name)
         )
-        dispatched_task = run_analysis_signature.delay()
-        self.run_task_id = dispatched_task.id
-        self.task_started = None
-        self.task_finished = None
-        self.save()
+        return run_analysis_signature
 
     @property
     def run_analysis_signature(self):
@@ -188,7 +270,9 @@ class Analysis(TimeStampedModel):
             queue=self.model.queue_name,
         )
 
-    def generate_inputs(self, initiator):
+    def get_generate_inputs_errors(self):
+        """ The reasons inputs can not be generated for the analysis, empty if they can
+        """
         valid_choices = [
             self.status_choices.NEW,
             self.status_choices.INPUTS_GENERATION_ERROR,
@@ -208,20 +292,27 @@ class Analysis(TimeStampedModel):
 
         if not self.portfolio.location_file:
             errors['portfolio'] = ['"location_file" must not be null']
+        return errors
 
+    def generate_inputs(self, initiator):
+        errors = self.get_generate_inputs_errors()
         if errors:
             raise ValidationError(errors)
 
         self.status = self.status_choices.INPUTS_GENERATION_QUEUED
+        self.set_task_queued(GENERATE_INPUTS, initiator)
+        self.save()
+        self.dispatch()
+
+    def get_linked_generate_input_signature(self, initiator):
+        """ The input generation signature with the callbacks recording its result
+        """
         generate_input_signature = self.generate_input_signature
         generate_input_signature.link(record_generate_input_result.s(self.pk, initiator.pk))
         generate_input_signature.link_error(
             signature('on_error', args=('record_generate_input_failure', self.pk, initiator.pk), queue=self.model.queue_name)
         )
-        self.generate_inputs_task_id = generate_input_signature.delay().id
-        self.task_started = None
-        self.task_finished = None
-        self.save()
+        return generate_input_signature
 
     def cancel_any(self):
         INPUTS_GENERATION_STATES = [
@@ -251,10 +342,12 @@ class Analysis(TimeStampedModel):
         if self.status not in valid_choices:
             raise ValidationError({'status': ['Analysis execution is not running or queued']})
 
-        AsyncResult(self.run_task_id).revoke(
-            signal='SIGTERM',
-            terminate=True,
-        )
+        # Held tasks have not been published
+        if self.run_task_id:
+            AsyncResult(self.run_task_id).revoke(
+                signal='SIGTERM',
+                terminate=True,
+            )
 
         self.status = self.status_choices.RUN_CANCELLED
         self.task_finished = timezone.now()
@@ -269,10 +362,11 @@ class Analysis(TimeStampedModel):
             raise ValidationError({'status': ['Analysis input generation is not running or queued']})
 
         self.status = self.status_choices.INPUTS_GENERATION_CANCELLED
-        AsyncResult(self.generate_inputs_task_id).revoke(
-            signal='SIGTERM',
-            terminate=True,
-        )
+        if self.generate_inputs_task_id:
+            AsyncResult(self.generate_inputs_task_id).revoke(
+                signal='SIGTERM',
+                terminate=True,
+            )
         self.task_finished = timezone.now()
         self.save()
 
@@ -320,27 +414,158 @@ class Analysis(TimeStampedModel):
             creator=obj.creator,
         )
 
-    def copy(self):
+    def share_file(self, obj):
+        """ A new DB object referencing the stored file of `obj`, nothing is copied
+        in the storage. Stored files are never written in place and are only deleted
+        once no DB object references them (see `files.deletion`)
+        """
+        if obj is None:
+            return None
+        return RelatedFile.objects.create(
+            file=obj.file.name,
+            filename=obj.filename,
+            content_type=obj.content_type,
+            creator=obj.creator,
+            store_as_filename=obj.store_as_filename,
+        )
+
+    def has_shareable_inputs(self):
+        """ Whether the generated inputs of the analysis are complete, so a copy
+        with the same portfolio and model can reuse them
+        """
+        inputs_ready_states = [
+            self.status_choices.READY,
+            self.status_choices.RUN_QUEUED,
+            self.status_choices.RUN_STARTED,
+            self.status_choices.RUN_COMPLETED,
+            self.status_choices.RUN_CANCELLED,
+            self.status_choices.RUN_ERROR,
+        ]
+        return self.status in inputs_ready_states and self.input_file_id is not None
+
+    def copy(self, share_settings=False, share_inputs=False):
+        """ An unsaved copy of the analysis, reset to `NEW` with a copy of the settings file
+
+        With `share_settings` the settings file is shared with the copy instead of
+        copied. With `share_inputs` the generated inputs are shared too when they are
+        complete, and the copy starts `READY`. The caller must keep the portfolio,
+        model and complex model data files of such a copy unchanged.
+        """
+        input_fields = [
+            'input_file',
+            'lookup_errors_file',
+            'lookup_success_file',
+            'lookup_validation_file',
+            'summary_levels_file',
+        ]
+        input_files = {}
+        if share_inputs and self.has_shareable_inputs():
+            # Fetched in one query
+            files = RelatedFile.objects.in_bulk([getattr(self, '{}_id'.format(field)) for field in input_fields])
+            input_files = {field: files.get(getattr(self, '{}_id'.format(field))) for field in input_fields}
+
         new_instance = self
         new_instance.pk = None
         new_instance.name = '{} - Copy'.format(new_instance.name)
         new_instance.run_task_id = ''
         new_instance.generate_inputs_task_id = ''
-        new_instance.status = self.status_choices.NEW
-        new_instance.settings_file = self.copy_file(new_instance.settings_file)
+        new_instance.status = self.status_choices.READY if input_files else self.status_choices.NEW
+        new_instance.task_queued = None
+        new_instance.task_work = None
+        new_instance.task_dispatched = None
+        new_instance.task_initiator = None
+        new_instance.settings_file = (self.share_file if share_settings else self.copy_file)(new_instance.settings_file)
 
         new_instance.input_file = None
         new_instance.input_generation_traceback_file = None
         new_instance.output_file = None
+        new_instance.output_index_file = None
+        new_instance.output_columnar_file = None
+        new_instance.output_columnar_index_file = None
         new_instance.run_traceback_file = None
         new_instance.run_log_file = None
+        new_instance.metrics = None
 
         new_instance.lookup_errors_file = None
         new_instance.lookup_success_file = None
         new_instance.lookup_validation_file = None
         new_instance.summary_levels_file = None
+
+        for field, f in input_files.items():
+            setattr(new_instance, field, self.share_file(f))
         return new_instance
 
+class AnalysisRuntimeStatistics(models.Model):
+    """ Running sums of the completed tasks of a model, the runtime estimates
+    are fitted from them (see `estimates`)
+    """
+    phase_choices = Choices(
+        (GENERATE_INPUTS, 'Generate inputs'),
+        (RUN, 'Run'),
+    )
+
+    model = models.ForeignKey(AnalysisModel, on_delete=models.CASCADE, related_name='runtime_statistics')
+    phase = models.CharField(max_length=max(len(c) for c in phase_choices._db_values), choices=phase_choices)
+    count = models.PositiveIntegerField(default=0)
+    duration_sum = models.FloatField(default=0)
+    sized_count = models.PositiveIntegerField(default=0, help_text=_('Completed tasks of known size'))
+    sized_duration_sum = models.FloatField(default=0)
+    work_sum = models.FloatField(default=0)
+    work_squared_sum = models.FloatField(default=0)
+    work_duration_sum = models.FloatField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'analysis runtime statistics'
+        unique_together = ('model', 'phase')
+
+    def __str__(self):
+        return '{} {}'.format(self.model, self.phase)
+
+
+class AnalysisQueueShare(models.Model):
+    """ The fair-share weight and concurrency limit of a user, or of the users
+    of a group, on the model queues (see `dispatch`)
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='analysis_queue_share')
+    group = models.OneToOneField(Group, on_delete=models.CASCADE, null=True, blank=True, related_name='analysis_queue_share')
+    weight = models.FloatField(default=1.0, help_text=_('Share of the model queues relative to the other users and groups'))
+    max_concurrency = models.PositiveIntegerField(
+        null=True, blank=True, default=None,
+        help_text=_('Most tasks released to a model queue at a time, defaults to ANALYSIS_DISPATCH_USER_CONCURRENCY'),
+    )
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(user__isnull=False, group__isnull=True) | models.Q(user__isnull=True, group__isnull=False),
+                name='analysis_queue_share_user_or_group',
+            ),
+            models.CheckConstraint(check=models.Q(weight__gt=0), name='analysis_queue_share_weight_positive'),
+        ]
+
+    def __str__(self):
+        return str(self.user or self.group)
+
+
+@receiver(post_save, sender=Analysis)
+def push_status_changes(sender, instance, created, **kwargs):
+    """ Post save handler pushing status transitions to the WebSocket subscribers,
+    sent once the transaction commits
+    """
+    if created or instance.status_tracker.changed():
+        push_status_on_commit(instance)
+
+
+@receiver(post_save, sender=Analysis)
+def dispatch_on_slot_freed(sender, instance, created, **kwargs):
+    """ Post save handler releasing the held tasks of the model queue when a task
+    leaves it, once the transaction commits
+    """
+    active_states = QUEUED_STATES + STARTED_STATES
+    if not created and instance.status_tracker.previous('status') in active_states and instance.status not in active_states:
+        dispatch_on_commit([instance.model_id])
+
+
 @receiver(post_delete, sender=Analysis)
 def delete_connected_files(sender, instance, **kwargs):
     """ Post delete handler to clear out any dangaling analyses files
@@ -350,14 +575,14 @@ def delete_connected_files(sender, instance, **kwargs):
          'input_file',
          'input_generation_traceback_file',
          'output_file',
+         'output_index_file',
+         'output_columnar_file',
+         'output_columnar_index_file',
          'run_traceback_file',
          'run_log_file',
          'lookup_errors_file',
          'lookup_success_file',
          'lookup_validation_file',
          'summary_levels_file',
-    ]   
-    for ref in files_for_removal:
-        file_ref = getattr(instance, ref)
-        if file_ref:
-            file_ref.delete()
+    ]
+    delete_related_files(instance, files_for_removal)
@@ -0,0 +1,262 @@
+import csv
+import io
+import json
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from django.http import StreamingHttpResponse, Http404
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from ..files.archive import ArchiveMemberFile, get_archive_index, find_archive_member
+from .serializers import OutputQuerySerializer
+
+COLUMNAR_SUFFIX = '.parquet'
+
+COMPARISONS = {
+    'eq': pc.equal,
+    'ne': pc.not_equal,
+    'gt': pc.greater,
+    'gte': pc.greater_equal,
+    'lt': pc.less,
+    'lte': pc.less_equal,
+}
+
+
+def _get_columnar_index(analysis):
+    index = get_archive_index(analysis.output_columnar_index_file)
+    if not analysis.output_columnar_file or index is None:
+        raise Http404()
+    return index
+
+
+def _open_table(analysis, index, table):
+    member = find_archive_member(index['members'], '{}{}'.format(table, COLUMNAR_SUFFIX))
+    if not member:
+        raise Http404()
+    return pq.ParquetFile(ArchiveMemberFile(analysis.output_columnar_file, member))
+
+
+def _cast_values(column, values, arrow_type):
+    try:
+        return pa.array(values).cast(arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        raise ValidationError({'filter': ['Invalid value for column "{}" of type {}'.format(column, arrow_type)]})
+
+
+def _row_group_may_match(statistics, op, values):
+    """ Use the row group min / max statistics to skip row groups no row could match
+    """
+    if statistics is None or not statistics.has_min_max:
+        return True
+
+    low, high = statistics.min, statistics.max
+    try:
+        if op == 'in':
+            return any(low <= v <= high for v in values)
+        value = values[0]
+        return {
+            'eq': low <= value <= high,
+            'ne': not (low == high == value),
+            'gt': high > value,
+            'gte': high >= value,
+            'lt': low < value,
+            'lte': low <= value,
+        }[op]
+    except TypeError:
+        return True
+
+
+def _aggregate(table, group_by, aggregations):
+    """ Group `table` by the `group_by` columns and apply the `(column, func)` aggregations
+    """
+    num_rows = table.num_rows
+    if group_by:
+        # Combine the per column group codes into a single code per row
+        codes = np.zeros(num_rows, dtype=np.int64)
+        for column in group_by:
+            uniques, inverse = np.unique(table.column(column).to_numpy(), return_inverse=True)
+            codes = codes * len(uniques) + inverse
+        _, first_rows, groups = np.unique(codes, return_index=True, return_inverse=True)
+        num_groups = len(first_rows)
+    else:
+        first_rows = np.array([], dtype=np.int64)
+        groups = np.zeros(num_rows, dtype=np.int64)
+        num_groups = 1
+
+    result = {column: table.column(column).take(pa.array(first_rows)) for column in group_by}
+    counts = np.bincount(groups, minlength=num_groups)
+    for column, func in aggregations or [(None, 'count')]:
+        name = '{}_{}'.format(column, func) if column else func
+        if func == 'count':
+            result[name] = counts
+            continue
+
+        arrow_type = table.column(column).type
+        values = table.column(column).to_numpy().astype(np.float64)
+        if func in ['sum', 'mean']:
+            sums = np.bincount(groups, weights=values, minlength=num_groups)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                aggregated = sums if func == 'sum' else sums / counts
+        else:
+            aggregated = np.full(num_groups, np.inf if func == 'min' else -np.inf)
+            (np.minimum if func == 'min' else np.maximum).at(aggregated, groups, values)
+            aggregated = np.where(counts > 0, aggregated, np.nan)
+
+        # Empty groups are returned as nulls, integer columns keep their type
+        aggregated = pa.array(aggregated, from_pandas=True)
+        if pa.types.is_integer(arrow_type) and func != 'mean':
+            aggregated = aggregated.cast(pa.int64())
+        result[name] = aggregated
+    return pa.table(result)
+
+
+def run_query(parquet_file, query):
+    """ Run a parsed `OutputQuerySerializer` query against a Parquet file
+
+    Only the columns referenced by the query are read, and row groups are
+    skipped when their statistics show none of their rows match the filters.
+
+    :return: The full (unpaginated) result table
+    :rtype pyarrow.Table
+    """
+    schema = parquet_file.schema_arrow
+    columns = query.get('columns') or []
+    filters = query.get('filter') or []
+    group_by = query.get('group_by') or []
+    aggregations = query.get('agg') or []
+    order_by = query.get('order_by') or []
+    aggregate = bool(group_by or aggregations)
+
+    referenced = columns + [f[0] for f in filters] + group_by + [a[0] for a in aggregations]
+    unknown = [c for c in referenced if c not in schema.names]
+    if aggregate:
+        unknown += [c for c, _ in order_by if c not in group_by and c not in ['{}_{}'.format(*a) for a in aggregations] + ['count']]
+    else:
+        unknown += [c for c, _ in order_by if c not in schema.names]
+    if unknown:
+        raise ValidationError({'columns': ['Unknown columns [{}], available columns are [{}]'.format(
+            ', '.join(sorted(set(unknown))), ', '.join(schema.names))]})
+
+    filters = [(column, op, _cast_values(column, values, schema.field(column).type)) for column, op, values in filters]
+    if not aggregate:
+        columns = columns or schema.names
+        referenced = columns + [f[0] for f in filters] + [o[0] for o in order_by]
+    read_columns = [c for c in schema.names if c in referenced]
+
+    # Predicate pushdown on row group statistics
+    row_groups = []
+    for i in range(parquet_file.num_row_groups):
+        row_group = parquet_file.metadata.row_group(i)
+        if all(_row_group_may_match(row_group.column(schema.get_field_index(column)).statistics, op, values.to_pylist())
+               for column, op, values in filters):
+            row_groups.append(i)
+
+    if row_groups:
+        table = parquet_file.read_row_groups(row_groups, columns=read_columns)
+    else:
+        table = schema.empty_table().select(read_columns)
+
+    mask = None
+    for column, op, values in filters:
+        if op == 'in':
+            matches = pc.is_in(table.column(column), value_set=values)
+        else:
+            matches = COMPARISONS[op](table.column(column), values[0])
+        mask = matches if mask is None else pc.and_(mask, matches)
+    if mask is not None:
+        table = table.filter(mask)
+
+    if aggregate:
+        table = _aggregate(table, group_by, aggregations)
+    if order_by:
+        table = table.take(pc.sort_indices(table, sort_keys=order_by))
+    if not aggregate:
+        table = table.select(columns)
+    return table
+
+
+def _iter_rows(table, chunk_size=1000):
+    for batch in table.to_batches(max_chunksize=chunk_size):
+        yield list(zip(*(column.to_pylist() for column in batch.columns)))
+
+
+def _iter_json(table, meta):
+    names = table.schema.names
+    yield json.dumps(meta)[:-1] + ', "results": ['
+    separator = ''
+    for rows in _iter_rows(table):
+        if rows:
+            yield separator + ', '.join(json.dumps(dict(zip(names, row))) for row in rows)
+            separator = ', '
+    yield ']}'
+
+
+def _iter_csv(table):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(table.schema.names)
+    for rows in _iter_rows(table):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def handle_output_tables(analysis):
+    """ List the columnar output tables with their columns and row counts
+    """
+    index = _get_columnar_index(analysis)
+    tables = []
+    for member in index['members']:
+        if not member['name'].endswith(COLUMNAR_SUFFIX):
+            continue
+        parquet_file = pq.ParquetFile(ArchiveMemberFile(analysis.output_columnar_file, member))
+        tables.append({
+            'table': os.path.basename(member['name'])[:-len(COLUMNAR_SUFFIX)],
+            'num_rows': parquet_file.metadata.num_rows,
+            'columns': [{'name': f.name, 'type': str(f.type)} for f in parquet_file.schema_arrow],
+        })
+    return Response(tables)
+
+
+def handle_output_query(analysis, request):
+    """ Run a filtered, projected or aggregated query on one columnar output table
+
+    The result is paginated with `limit` / `offset` and streamed as JSON or CSV
+    """
+    serializer = OutputQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    query = serializer.validated_data
+
+    index = _get_columnar_index(analysis)
+    result = run_query(_open_table(analysis, index, query['table']), query)
+
+    count = result.num_rows
+    offset, limit = query['offset'], query['limit']
+    page = result.slice(offset, limit)
+    next_url = None
+    if offset + limit < count:
+        next_url = replace_query_param(request.build_absolute_uri(), 'offset', offset + limit)
+
+    if query['result_format'] == 'csv':
+        response = StreamingHttpResponse(_iter_csv(page), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="{}.csv"'.format(query['table'])
+        if next_url:
+            response['Link'] = '<{}>; rel="next"'.format(next_url)
+    else:
+        response = StreamingHttpResponse(_iter_json(page, {
+            'table': query['table'],
+            'count': count,
+            'offset': offset,
+            'limit': limit,
+            'next': next_url,
+            'columns': page.schema.names,
+        }), content_type='application/json')
+    response['X-Total-Count'] = count
+    return response
@@ -1,12 +1,19 @@
+from django.conf import settings
 from drf_yasg.utils import swagger_serializer_method
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
+from .dispatch import get_queue_positions, is_held
 from .models import Analysis
+from ..analysis_models.models import AnalysisModel
+from ..data_files.models import DataFile
 from ..files.models import file_storage_link
+from ..portfolios.models import Portfolio
+from ..schemas.serializers import AnalysisSettingsSerializer
+from ..serializers import SparseFieldsMixin
 
 
-class AnalysisSerializer(serializers.ModelSerializer):
+class AnalysisSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     input_file = serializers.SerializerMethodField()
     settings_file = serializers.SerializerMethodField()
     settings = serializers.SerializerMethodField()
@@ -19,6 +26,7 @@ class AnalysisSerializer(serializers.ModelSerializer):
     run_traceback_file = serializers.SerializerMethodField()
     run_log_file = serializers.SerializerMethodField()
     storage_links = serializers.SerializerMethodField()
+    queue_position = serializers.SerializerMethodField()
 
     class Meta:
         model = Analysis
@@ -30,6 +38,7 @@ class AnalysisSerializer(serializers.ModelSerializer):
             'portfolio',
             'model',
             'status',
+            'queue_position',
             'task_started',
             'task_finished',
             'complex_model_data_files',
@@ -46,67 +55,92 @@ class AnalysisSerializer(serializers.ModelSerializer):
             'run_log_file',
             'storage_links',
         )
+        slim_fields = (
+            'created',
+            'modified',
+            'name',
+            'id',
+            'portfolio',
+            'model',
+            'status',
+            'task_started',
+            'task_finished',
+        )
 
     @swagger_serializer_method(serializer_or_field=serializers.URLField)
     def get_input_file(self, instance):
         request = self.context.get('request')
-        return instance.get_absolute_input_file_url(request=request) if instance.input_file else None
+        return instance.get_absolute_input_file_url(request=request) if instance.input_file_id else None
 
     @swagger_serializer_method(serializer_or_field=serializers.URLField)
     def get_settings_file(self, instance):
         request = self.context.get('request')
-        return instance.get_absolute_settings_file_url(request=request) if instance.settings_file else None
+        return instance.get_absolute_settings_file_url(request=request) if instance.settings_file_id else None
 
     @swagger_serializer_method(serializer_or_field=serializers.URLField)
     def get_settings(self, instance):
         request = self.context.get('request')
-        return instance.get_absolute_settings_url(request=request) if instance.settings_file else None
+        return instance.get_absolute_settings_url(request=request) if instance.settings_file_id else None
 
     @swagger_serializer_method(serializer_or_field=serializers.URLField)
     def get_lookup_errors_file(self, instance):
         request = self.context.get('request')
-        return instance.get_absolute_lookup_errors_file_url(request=request) if instance.lookup_errors_file else None
+        return instance.get_absolute_lookup_errors_file_url(request=request) if instance.lookup_errors_file_id else None
 
     @swagger_serializer_method(serializer_or_field=serializers.URLField)
     def get_lookup_success_file(self, instance):
         request = self.context.get('request')
-        return instance.get_absolute_lookup_success_file_url(request=request) if instance.lookup_success_file else None
+        return instance.get_absolute_lookup_success_file_url(request=request) if instance.lookup_success_file_id else None
 
     @swagger_serializer_method(serializer_or_field=serializers.URLField)
     def get_lookup_validation_file(self, instance):
         request = self.context.get('request')
-        return instance.get_absolute_lookup_validation_file_url(request=request) if instance.lookup_validation_file else None
+        return instance.get_absolute_lookup_validation_file_url(request=request) if instance.lookup_validation_file_id else None
 
     @swagger_serializer_method(serializer_or_field=serializers.URLField)
     def get_summary_levels_file(self, instance):
         request = self.context.get('request')
-        return instance.get_absolute_summary_levels_file_url(request=request) if instance.summary_levels_file else None
+        return instance.get_absolute_summary_levels_file_url(request=request) if instance.summary_levels_file_id else None
 
     @swagger_serializer_method(serializer_or_field=serializers.URLField)
     def get_input_generation_traceback_file(self, instance):
         request = self.context.get('request')
-        return instance.get_absolute_input_generation_traceback_file_url(request=request) if instance.input_generation_traceback_file else None
+        return instance.get_absolute_input_generation_traceback_file_url(request=request) if instance.input_generation_traceback_file_id else None
 
     @swagger_serializer_method(serializer_or_field=serializers.URLField)
     def get_output_file(self, instance):
         request = self.context.get('request')
-        return instance.get_absolute_output_file_url(request=request) if instance.output_file else None
+        return instance.get_absolute_output_file_url(request=request) if instance.output_file_id else None
 
     @swagger_serializer_method(serializer_or_field=serializers.URLField)
     def get_run_traceback_file(self, instance):
         request = self.context.get('request')
-        return instance.get_absolute_run_traceback_file_url(request=request) if instance.run_traceback_file else None
+        return instance.get_absolute_run_traceback_file_url(request=request) if instance.run_traceback_file_id else None
 
     @swagger_serializer_method(serializer_or_field=serializers.URLField)
     def get_run_log_file(self, instance):
         request = self.context.get('request')
-        return instance.get_absolute_run_log_file_url(request=request) if instance.run_log_file else None
+        return instance.get_absolute_run_log_file_url(request=request) if instance.run_log_file_id else None
 
     @swagger_serializer_method(serializer_or_field=serializers.URLField)
     def get_storage_links(self, instance):
         request = self.context.get('request')
         return instance.get_absolute_storage_url(request=request)
 
+    @swagger_serializer_method(serializer_or_field=serializers.IntegerField(allow_null=True))
+    def get_queue_position(self, instance):
+        """ The position of a queued analysis held by the server before it is released
+        to the model queue, `null` once released
+        """
+        if not is_held(instance):
+            return None
+
+        # Computed once per model for a list of analyses
+        positions = self.context.setdefault('queue_positions', {})
+        if instance.model_id not in positions:
+            positions[instance.model_id] = get_queue_positions(instance.model_id)
+        return positions[instance.model_id].get(instance.pk)
+
 
     def validate(self, attrs):
         if not attrs.get('creator') and 'request' in self.context:
@@ -194,9 +228,171 @@ class AnalysisStorageSerializer(serializers.ModelSerializer):
 
 
 class AnalysisCopySerializer(AnalysisSerializer):
+    share_inputs = serializers.BooleanField(
+        write_only=True, required=False, default=False,
+        help_text='Share the settings file and generated inputs with the copy instead of copying them, '
+                  'the copy starts `READY` when the portfolio, model and complex model data files are unchanged',
+    )
+
+    class Meta(AnalysisSerializer.Meta):
+        fields = AnalysisSerializer.Meta.fields + ('share_inputs',)
+
     def __init__(self, *args, **kwargs):
         super(AnalysisCopySerializer, self).__init__(*args, **kwargs)
 
         self.fields['portfolio'].required = False
         self.fields['model'].required = False
         self.fields['name'].required = False
+
+    def changes_inputs(self, analysis):
+        """ Whether the validated data changes the inputs generated for `analysis`
+        """
+        data = self.validated_data
+        if 'portfolio' in data and data['portfolio'].pk != analysis.portfolio_id:
+            return True
+        if 'model' in data and data['model'].pk != analysis.model_id:
+            return True
+        if 'complex_model_data_files' in data:
+            current = set(analysis.complex_model_data_files.values_list('pk', flat=True))
+            return {f.pk for f in data['complex_model_data_files']} != current
+        return False
+
+
+class OutputQuerySerializer(serializers.Serializer):
+    """ Query parameters for `AnalysisViewSet.output_query`, parsed into lists for the query engine
+    """
+    operators = ['eq', 'ne', 'gt', 'gte', 'lt', 'lte', 'in']
+    aggregations = ['sum', 'mean', 'min', 'max', 'count']
+
+    table = serializers.CharField(help_text='Name of the output table, e.g. `gul_S1_eltcalc`')
+    columns = serializers.CharField(required=False, help_text='Comma separated list of columns to return')
+    filter = serializers.ListField(
+        child=serializers.CharField(), required=False,
+        help_text='Repeatable row filter `<column>__<op>:<value>`, op is one of [{}] (default `eq`), '
+                  '`in` takes a comma separated list of values'.format(', '.join(operators)),
+    )
+    group_by = serializers.CharField(required=False, help_text='Comma separated list of columns to group by')
+    agg = serializers.CharField(
+        required=False,
+        help_text='Comma separated list of `<column>:<func>` aggregations, func is one of [{}]'.format(', '.join(aggregations)),
+    )
+    order_by = serializers.CharField(required=False, help_text='Comma separated list of columns, prefix with `-` for descending order')
+    limit = serializers.IntegerField(min_value=1, max_value=settings.OUTPUT_QUERY_MAX_LIMIT, default=settings.OUTPUT_QUERY_DEFAULT_LIMIT)
+    offset = serializers.IntegerField(min_value=0, default=0)
+    result_format = serializers.ChoiceField(choices=['json', 'csv'], default='json')
+
+    def _split(self, value):
+        return [v.strip() for v in value.split(',') if v.strip()]
+
+    def validate_columns(self, value):
+        return self._split(value)
+
+    def validate_group_by(self, value):
+        return self._split(value)
+
+    def validate_filter(self, value):
+        filters = []
+        for expression in value:
+            column, sep, values = expression.partition(':')
+            column, _, op = column.partition('__')
+            op = op or 'eq'
+            if not sep or not column or op not in self.operators:
+                raise ValidationError('Invalid filter "{}", expected `<column>__<op>:<value>`'.format(expression))
+            filters.append((column, op, self._split(values) if op == 'in' else [values]))
+        return filters
+
+    def validate_agg(self, value):
+        aggregations = []
+        for expression in self._split(value):
+            column, _, func = expression.partition(':')
+            if func not in self.aggregations:
+                raise ValidationError('Invalid aggregation "{}", expected `<column>:<func>`'.format(expression))
+            aggregations.append((column, func))
+        return aggregations
+
+    def validate_order_by(self, value):
+        return [(c[1:], 'descending') if c.startswith('-') else (c, 'ascending') for c in self._split(value)]
+
+    def create(self, validated_data):
+        raise NotImplementedError()
+
+    def update(self, instance, validated_data):
+        raise NotImplementedError()
+
+
+class BulkAnalysisCreateItemSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=255)
+    portfolio = serializers.IntegerField(help_text='The portfolio to link the analysis to')
+    model = serializers.IntegerField(help_text='The model to link the analysis to')
+    complex_model_data_files = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    settings = serializers.JSONField(required=False, help_text='Analysis settings, stored as the `settings_file` of the analysis')
+
+    def validate_settings(self, value):
+        return AnalysisSettingsSerializer().validate(value)
+
+
+class BulkAnalysisCreateSerializer(serializers.Serializer):
+    """ Creates many analyses, the portfolios, models and data files of all
+    the analyses are checked with one query each
+    """
+    analyses = BulkAnalysisCreateItemSerializer(many=True, allow_empty=False)
+
+    def validate_analyses(self, value):
+        if len(value) > settings.API_BULK_MAX_SIZE:
+            raise ValidationError('Ensure this field has no more than {} elements.'.format(settings.API_BULK_MAX_SIZE))
+
+        portfolios = Portfolio.objects.in_bulk({item['portfolio'] for item in value})
+        models = AnalysisModel.objects.in_bulk({item['model'] for item in value})
+        data_files = DataFile.objects.in_bulk({pk for item in value for pk in item['complex_model_data_files']})
+
+        errors = {}
+        for i, item in enumerate(value):
+            item_errors = {}
+            portfolio = portfolios.get(item['portfolio'])
+            if portfolio is None:
+                item_errors['portfolio'] = ['Invalid pk "{}" - object does not exist.'.format(item['portfolio'])]
+            elif not portfolio.location_file_id:
+                item_errors['portfolio'] = ['"location_file" must not be null']
+
+            if item['model'] not in models:
+                item_errors['model'] = ['Invalid pk "{}" - object does not exist.'.format(item['model'])]
+
+            missing = [pk for pk in item['complex_model_data_files'] if pk not in data_files]
+            if missing:
+                item_errors['complex_model_data_files'] = ['Invalid pk "{}" - object does not exist.'.format(pk) for pk in missing]
+
+            if item_errors:
+                errors[i] = item_errors
+            else:
+                item['portfolio'] = portfolio
+                item['model'] = models[item['model']]
+
+        if errors:
+            raise ValidationError(errors)
+        return value
+
+    def create(self, validated_data):
+        raise NotImplementedError()
+
+    def update(self, instance, validated_data):
+        raise NotImplementedError()
+
+
+class BulkAnalysisSerializer(serializers.Serializer):
+    analyses = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        help_text='The pks of the analyses',
+    )
+
+    def validate_analyses(self, value):
+        if len(value) > settings.API_BULK_MAX_SIZE:
+            raise ValidationError('Ensure this field has no more than {} elements.'.format(settings.API_BULK_MAX_SIZE))
+        # Keep the order of the request without repeating an analysis
+        return list(dict.fromkeys(value))
+
+    def create(self, validated_data):
+        raise NotImplementedError()
+
+    def update(self, instance, validated_data):
+        raise NotImplementedError()
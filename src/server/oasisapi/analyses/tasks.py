@@ -29,6 +29,9 @@ from src.server.oasisapi.files.views import handle_json_data
 from src.server.oasisapi.schemas.serializers import ModelParametersSerializer
 
 from ..celery import celery_app
+from ..routers import use_primary
+from .estimates import GENERATE_INPUTS, RUN, record_task_runtime
+from .transitions import TRANSITIONS, can_transition, status_events, transition
 logger = get_task_logger(__name__)
 
 
@@ -130,23 +133,36 @@ def store_file(reference, content_type, creator, required=True, filename=None):
             raise e
 
 
-def delete_prev_output(object_model, field_list=[]):
-    files_for_removal = list()
+def replace_outputs(analysis, status, outputs, **fields):
+    """ Moves the analysis to `status` replacing its file fields with `outputs`, in a
+    single conditional update. The replaced files are deleted, or the new files when
+    the transition is rejected.
 
-    # collect prev attached files
-    for field in field_list:
-        current_file = getattr(object_model, field)
-        if current_file:
-            logger.info('delete {}: {}'.format(field, current_file))
-            setattr(object_model, field, None)
-            files_for_removal.append(current_file)
+    :return: The moved analysis, `None` when the transition is rejected
+    """
+    previous = [getattr(analysis, '{}_id'.format(field)) for field in outputs]
+    moved = transition([analysis.pk], status, **outputs, **fields)
+
+    if moved:
+        removed = [pk for pk in previous if pk is not None]
+    else:
+        logger.warning('Analysis {}: {} rejected from {}'.format(analysis.pk, status, analysis.status))
+        removed = [f.pk for f in outputs.values() if f is not None]
+    RelatedFile.objects.filter(pk__in=removed).delete()
 
-    # Clear fields
-    object_model.save(update_fields=field_list)
+    return moved[0] if moved else None
 
-    # delete old files
-    for f in files_for_removal:
-        f.delete()
+
+def store_traceback(traceback, filename, initiator):
+    random_filename = '{}.txt'.format(uuid.uuid4().hex)
+    with TemporaryFile() as tmp_file:
+        tmp_file.write(traceback.encode('utf-8'))
+        return RelatedFile.objects.create(
+            file=File(tmp_file, name=random_filename),
+            filename=filename,
+            content_type='text/plain',
+            creator=initiator,
+        )
 
 
 class LogTaskError(Task):
@@ -175,44 +191,34 @@ class LogTaskError(Task):
             analysis = Analysis.objects.get(pk=analysis_pk)
             random_filename = '{}.txt'.format(uuid.uuid4().hex)
             traceback_msg = "worker-monitor error:\n {}".format(traceback)
-            analysis.task_finished = timezone.now()
 
-            # Store status first, incase issue is in file storage
             if self.name == 'record_generate_input_result':
-                analysis.status = Analysis.status_choices.INPUTS_GENERATION_ERROR
-            if self.name == 'record_run_analysis_result':
-                analysis.status = Analysis.status_choices.RUN_ERROR
+                status = Analysis.status_choices.INPUTS_GENERATION_ERROR
+                traceback_field = 'input_generation_traceback_file'
+            else:
+                status = Analysis.status_choices.RUN_ERROR
+                traceback_field = 'run_traceback_file'
+            if not can_transition(analysis, status):
+                return
 
             # Store Error to traceback file
             try:
-                if self.name == 'record_generate_input_result':
-                    with TemporaryFile() as tmp_file:
-                        tmp_file.write(traceback_msg.encode('utf-8'))
-                        analysis.input_generation_traceback_file = RelatedFile.objects.create(
-                            file=File(tmp_file, name=random_filename),
-                            filename=random_filename,
-                            content_type='text/plain',
-                            creator=initiator,
-                        )
-
+                outputs = {traceback_field: store_traceback(traceback_msg, random_filename, initiator)}
                 if self.name == 'record_run_analysis_result':
-                    with TemporaryFile() as tmp_file:
-                        tmp_file.write(traceback_msg.encode('utf-8'))
-                        analysis.run_traceback_file = RelatedFile.objects.create(
-                            file=File(tmp_file, name=random_filename),
-                            filename=random_filename,
-                            content_type='text/plain',
-                            creator=initiator,
-                        )
-                    delete_prev_output(analysis, ['run_log_file'])
-                analysis.save()
+                    outputs['run_log_file'] = None
+                replace_outputs(analysis, status, outputs, task_finished=timezone.now())
 
             except Exception as e:
                 # ensure error status is stored (if storage fails)
-                analysis.save()
+                transition([analysis_pk], status, task_finished=timezone.now())
                 raise e
 
 
+@signals.worker_process_shutdown.connect
+def flush_status_events(**kwargs):
+    status_events.flush()
+
+
 @signals.worker_ready.connect
 def log_worker_monitor(sender, **k):
     logger.info('DEBUG: {}'.format(settings.DEBUG))
@@ -286,46 +292,79 @@ def run_register_worker(m_supplier, m_name, m_id, m_settings, m_version):
         logger.exception(model)
 
 @celery_app.task(name='set_task_status')
+@use_primary()
 def set_task_status(analysis_pk, task_status):
     try:
-        from .models import Analysis
-        analysis = Analysis.objects.get(pk=analysis_pk)
-        analysis.status = task_status
-        analysis.task_started = timezone.now()
-        analysis.save(update_fields=["status", "task_started"])
-        logger.info('Task Status Update: analysis_pk: {}, status: {}, time: {}'.format(analysis_pk, task_status, analysis.task_started))
+        if task_status not in TRANSITIONS:
+            raise ValueError('Unknown task status: {}'.format(task_status))
+        task_started = timezone.now()
+        status_events.add(analysis_pk, task_status, task_started)
+        logger.info('Task Status Update: analysis_pk: {}, status: {}, time: {}'.format(analysis_pk, task_status, task_started))
     except Exception as e:
         logger.error('Task Status Update: Failed')
         logger.exception(str(e))
 
 
 @celery_app.task(name='record_run_analysis_result', base=LogTaskError)
+@use_primary()
 def record_run_analysis_result(res, analysis_pk, initiator_pk):
-    output_location, traceback_location, log_location, return_code = res
+    output_location, traceback_location, log_location, return_code = res[:4]
+    # Workers which write an indexed output archive, columnar outputs and metrics append them to the result
+    output_index_location = res[4] if len(res) > 4 else None
+    columnar_location = res[5] if len(res) > 5 else None
+    columnar_index_location = res[6] if len(res) > 6 else None
+    metrics = res[7] if len(res) > 7 else None
     logger.info('output_location: {}, log_location: {}, traceback_location: {}, status: {}, analysis_pk: {}, initiator_pk: {}'.format(
         output_location, traceback_location, log_location, return_code, analysis_pk, initiator_pk))
 
     from .models import Analysis
+    # Apply the buffered started events first, the result follows them
+    status_events.flush()
     initiator = get_user_model().objects.get(pk=initiator_pk)
     analysis = Analysis.objects.get(pk=analysis_pk)
-    analysis.status = Analysis.status_choices.RUN_COMPLETED if return_code == 0 else Analysis.status_choices.RUN_ERROR
-    analysis.task_finished = timezone.now()
+    status = Analysis.status_choices.RUN_COMPLETED if return_code == 0 else Analysis.status_choices.RUN_ERROR
+    if not can_transition(analysis, status):
+        logger.warning('Analysis {}: {} rejected from {}'.format(analysis_pk, status, analysis.status))
+        return
 
-    delete_prev_output(analysis, ['output_file', 'run_log_file', 'run_traceback_file'])
+    outputs = dict.fromkeys([
+        'output_file',
+        'output_index_file',
+        'output_columnar_file',
+        'output_columnar_index_file',
+        'run_log_file',
+        'run_traceback_file',
+    ])
 
     # Store results
     if return_code == 0:
-        analysis.output_file = store_file(output_location, 'application/gzip', initiator, filename=f'analysis_{analysis_pk}_output.tar.gz')
+        outputs['output_file'] = store_file(output_location, 'application/gzip', initiator, filename=f'analysis_{analysis_pk}_output.tar.gz')
+        if output_index_location:
+            outputs['output_index_file'] = store_file(output_index_location, 'application/json', initiator, required=False, filename=f'analysis_{analysis_pk}_output_index.json')
+        if columnar_location and columnar_index_location:
+            outputs['output_columnar_file'] = store_file(columnar_location, 'application/x-tar', initiator, required=False, filename=f'analysis_{analysis_pk}_output_columnar.tar')
+            outputs['output_columnar_index_file'] = store_file(columnar_index_location, 'application/json', initiator, required=False, filename=f'analysis_{analysis_pk}_output_columnar_index.json')
     # Store Ktools logs
     if log_location:
-        analysis.run_log_file = store_file(log_location, 'application/gzip', initiator, filename=f'analysis_{analysis_pk}_logs.tar.gz')
+        outputs['run_log_file'] = store_file(log_location, 'application/gzip', initiator, filename=f'analysis_{analysis_pk}_logs.tar.gz')
     # record the error file
     if traceback_location:
-        analysis.run_traceback_file = store_file(traceback_location, 'text/plain', initiator, filename=f'analysis_{analysis_pk}_run_traceback.txt')
-    analysis.save()
+        outputs['run_traceback_file'] = store_file(traceback_location, 'text/plain', initiator, filename=f'analysis_{analysis_pk}_run_traceback.txt')
+
+    analysis = replace_outputs(
+        analysis,
+        status,
+        outputs,
+        metrics=metrics if return_code == 0 else None,
+        task_finished=timezone.now(),
+    )
+
+    if analysis and return_code == 0:
+        record_task_runtime(analysis, RUN)
 
 
 @celery_app.task(name='record_generate_input_result', base=LogTaskError)
+@use_primary()
 def record_generate_input_result(result, analysis_pk, initiator_pk):
     logger.info('result: {}, analysis_pk: {}, initiator_pk: {}'.format(
         result, analysis_pk, initiator_pk))
@@ -341,12 +380,27 @@ def record_generate_input_result(result, analysis_pk, initiator_pk):
         return_code,
     ) = result
 
+    # Apply the buffered started events first, the result follows them
+    status_events.flush()
     analysis = Analysis.objects.get(pk=analysis_pk)
     initiator = get_user_model().objects.get(pk=initiator_pk)
 
-    # Remove previous output
-    delete_prev_output(analysis, [
+    # SUCCESS
+    if return_code == 0:
+        status = Analysis.status_choices.READY
+    # FAILED
+    else:
+        status = Analysis.status_choices.INPUTS_GENERATION_ERROR
+    if not can_transition(analysis, status):
+        logger.warning('Analysis {}: {} rejected from {}'.format(analysis_pk, status, analysis.status))
+        return
+
+    # Previous output is replaced
+    outputs = dict.fromkeys([
         'output_file',
+        'output_index_file',
+        'output_columnar_file',
+        'output_columnar_index_file',
         'input_file',
         'lookup_errors_file',
         'lookup_success_file',
@@ -357,28 +411,25 @@ def record_generate_input_result(result, analysis_pk, initiator_pk):
         'run_log_file',
     ])
 
-    # SUCCESS
-    if return_code == 0:
-        analysis.status = Analysis.status_choices.READY
-    # FAILED
-    else:
-        analysis.status = Analysis.status_choices.INPUTS_GENERATION_ERROR
-
     # Add current Output
-    analysis.input_file = store_file(input_location, 'application/gzip', initiator, filename=f'analysis_{analysis_pk}_inputs.tar.gz') if input_location else None
-    analysis.lookup_success_file = store_file(lookup_success_fp, 'text/csv', initiator, filename=f'analysis_{analysis_pk}_gul_summary_map.csv') if lookup_success_fp else None
-    analysis.lookup_errors_file = store_file(lookup_error_fp, 'text/csv', initiator, required=False, filename=f'analysis_{analysis_pk}_keys-errors.csv') if lookup_error_fp else None
-    analysis.lookup_validation_file = store_file(lookup_validation_fp, 'application/json', initiator, required=False, filename=f'analysis_{analysis_pk}_exposure_summary_report.json') if lookup_validation_fp else None
-    analysis.summary_levels_file = store_file(summary_levels_fp, 'application/json', initiator, required=False, filename=f'analysis_{analysis_pk}_exposure_summary_levels.json') if summary_levels_fp else None
-    analysis.task_finished = timezone.now()
+    outputs['input_file'] = store_file(input_location, 'application/gzip', initiator, filename=f'analysis_{analysis_pk}_inputs.tar.gz') if input_location else None
+    outputs['lookup_success_file'] = store_file(lookup_success_fp, 'text/csv', initiator, filename=f'analysis_{analysis_pk}_gul_summary_map.csv') if lookup_success_fp else None
+    outputs['lookup_errors_file'] = store_file(lookup_error_fp, 'text/csv', initiator, required=False, filename=f'analysis_{analysis_pk}_keys-errors.csv') if lookup_error_fp else None
+    outputs['lookup_validation_file'] = store_file(lookup_validation_fp, 'application/json', initiator, required=False, filename=f'analysis_{analysis_pk}_exposure_summary_report.json') if lookup_validation_fp else None
+    outputs['summary_levels_file'] = store_file(summary_levels_fp, 'application/json', initiator, required=False, filename=f'analysis_{analysis_pk}_exposure_summary_levels.json') if summary_levels_fp else None
 
     # always store traceback
     if traceback_fp:
-        analysis.input_generation_traceback_file = store_file(traceback_fp, 'text/plain', initiator, filename=f'analysis_{analysis_pk}_generation_traceback.txt')
-        logger.info(analysis.input_generation_traceback_file)
-    analysis.save()
+        outputs['input_generation_traceback_file'] = store_file(traceback_fp, 'text/plain', initiator, filename=f'analysis_{analysis_pk}_generation_traceback.txt')
+        logger.info(outputs['input_generation_traceback_file'])
+
+    analysis = replace_outputs(analysis, status, outputs, metrics=None, task_finished=timezone.now())
+
+    if analysis and return_code == 0:
+        record_task_runtime(analysis, GENERATE_INPUTS)
 
 @celery_app.task(name='record_run_analysis_failure')
+@use_primary()
 def record_run_analysis_failure(analysis_pk, initiator_pk, traceback):
     logger.warning('"run_analysis_success" is deprecated and should only be used to process tasks already on the queue.')
     logger.info('analysis_pk: {}, initiator_pk: {}, traceback: {}'.format(
@@ -387,54 +438,57 @@ def record_run_analysis_failure(analysis_pk, initiator_pk, traceback):
     try:
         from .models import Analysis
 
+        status_events.flush()
         analysis = Analysis.objects.get(pk=analysis_pk)
-        analysis.status = Analysis.status_choices.RUN_ERROR
-        analysis.task_finished = timezone.now()
-        analysis.save()
-
-        random_filename = '{}.txt'.format(uuid.uuid4().hex)
-        with TemporaryFile() as tmp_file:
-            tmp_file.write(traceback.encode('utf-8'))
-            analysis.run_traceback_file = RelatedFile.objects.create(
-                file=File(tmp_file, name=random_filename),
-                filename=f'analysis_{analysis_pk}_run_traceback.txt',
-                content_type='text/plain',
-                creator=get_user_model().objects.get(pk=initiator_pk),
-            )
+        status = Analysis.status_choices.RUN_ERROR
+        if not can_transition(analysis, status):
+            logger.warning('Analysis {}: {} rejected from {}'.format(analysis_pk, status, analysis.status))
+            return
+
+        run_traceback_file = store_traceback(
+            traceback,
+            f'analysis_{analysis_pk}_run_traceback.txt',
+            get_user_model().objects.get(pk=initiator_pk),
+        )
 
         # remove the current command log file
-        if analysis.run_log_file:
-            analysis.run_log_file.delete()
-            analysis.run_log_file = None
-
-        analysis.save()
+        replace_outputs(
+            analysis,
+            status,
+            {'run_traceback_file': run_traceback_file, 'run_log_file': None},
+            task_finished=timezone.now(),
+        )
     except Exception as e:
         logger.exception(str(e))
 
 
 @celery_app.task(name='record_generate_input_failure')
+@use_primary()
 def record_generate_input_failure(analysis_pk, initiator_pk, traceback):
     logger.info('analysis_pk: {}, initiator_pk: {}, traceback: {}'.format(
         analysis_pk, initiator_pk, traceback))
     try:
         from .models import Analysis
 
+        status_events.flush()
         analysis = Analysis.objects.get(pk=analysis_pk)
-        analysis.status = Analysis.status_choices.INPUTS_GENERATION_ERROR
-        analysis.task_finished = timezone.now()
-        analysis.save()
-
-        random_filename = '{}.txt'.format(uuid.uuid4().hex)
-        with TemporaryFile() as tmp_file:
-            tmp_file.write(traceback.encode('utf-8'))
-            analysis.input_generation_traceback_file = RelatedFile.objects.create(
-                file=File(tmp_file, name=random_filename),
-                filename=f'analysis_{analysis_pk}_generation_traceback.txt',
-                content_type='text/plain',
-                creator=get_user_model().objects.get(pk=initiator_pk),
-            )
+        status = Analysis.status_choices.INPUTS_GENERATION_ERROR
+        if not can_transition(analysis, status):
+            logger.warning('Analysis {}: {} rejected from {}'.format(analysis_pk, status, analysis.status))
+            return
+
+        input_generation_traceback_file = store_traceback(
+            traceback,
+            f'analysis_{analysis_pk}_generation_traceback.txt',
+            get_user_model().objects.get(pk=initiator_pk),
+        )
 
-        analysis.save()
+        replace_outputs(
+            analysis,
+            status,
+            {'input_generation_traceback_file': input_generation_traceback_file},
+            task_finished=timezone.now(),
+        )
     except Exception as e:
         logger.exception(str(e))
 
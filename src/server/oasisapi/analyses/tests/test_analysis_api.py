@@ -1,9 +1,12 @@
+import hashlib
 import json
+import os
 import string
 
 # from tempfile import NamedTemporaryFile
 # from django.conf import settings
 from backports.tempfile import TemporaryDirectory
+from django.core.files.storage import default_storage
 from django.test import override_settings
 from django.urls import reverse
 from django_webtest import WebTestMixin
@@ -11,13 +14,21 @@ from hypothesis import given, settings
 from hypothesis.extra.django import TestCase
 from hypothesis.strategies import text, binary, sampled_from
 from mock import patch
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pathlib2 import Path
 from rest_framework_simplejwt.tokens import AccessToken
 
+from ...files.deletion import delete_queued_files
 from ...files.tests.fakes import fake_related_file
 from ...analysis_models.tests.fakes import fake_analysis_model
 from ...portfolios.tests.fakes import fake_portfolio
+from ...portfolios.tests.test_portfolio import S3_STORAGE_SETTINGS
 from ...auth.tests.fakes import fake_user
 from ...data_files.tests.fakes import fake_data_file
+from ...tests.queries import ListQueriesMixin
+from .....conf import iniconf
+from .....model_execution_worker.storage_manager import BaseStorageConnector
 from ..models import Analysis
 from .fakes import fake_analysis
 
@@ -137,6 +148,7 @@ class AnalysisApi(WebTestMixin, TestCase):
                     'run_log_file': response.request.application_url + analysis.get_absolute_run_log_file_url(),
                     'run_traceback_file': response.request.application_url + analysis.get_absolute_run_traceback_file_url(),
                     'status': Analysis.status_choices.NEW,
+                    'queue_position': None,
                     'storage_links': response.request.application_url + analysis.get_absolute_storage_url(),
                     'summary_levels_file': response.request.application_url + analysis.get_absolute_summary_levels_file_url(),
                     'task_started': None,
@@ -195,6 +207,7 @@ class AnalysisApi(WebTestMixin, TestCase):
                     'run_log_file': None,
                     'run_traceback_file': None,
                     'status': Analysis.status_choices.NEW,
+                    'queue_position': None,
                     'storage_links': response.request.application_url + analysis.get_absolute_storage_url(),
                     'summary_levels_file': None,
                     'task_started': None,
@@ -239,6 +252,129 @@ class AnalysisApi(WebTestMixin, TestCase):
         self.assertEqual(analysis.model, model)
 
 
+class AnalysisList(WebTestMixin, TestCase):
+    def list(self, user, expect_errors=False, **params):
+        return self.app.get(
+            reverse('analysis-list', kwargs={'version': 'v1'}),
+            params=params,
+            headers={
+                'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+            },
+            expect_errors=expect_errors,
+        )
+
+    def test_pagination_is_not_requested___all_analyses_are_returned(self):
+        user = fake_user()
+        analyses = [fake_analysis() for _ in range(3)]
+
+        response = self.list(user)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(sorted(a.pk for a in analyses), sorted(a['id'] for a in response.json))
+
+    def test_page_size_is_set___pages_cover_all_analyses_newest_first(self):
+        user = fake_user()
+        analyses = [fake_analysis() for _ in range(5)]
+
+        response = self.list(user, page_size='2')
+        self.assertEqual(200, response.status_code)
+        self.assertIsNone(response.json['previous'])
+
+        ids = [a['id'] for a in response.json['results']]
+        while response.json['next']:
+            response = self.app.get(
+                response.json['next'],
+                headers={
+                    'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                },
+            )
+            self.assertLessEqual(len(response.json['results']), 2)
+            ids += [a['id'] for a in response.json['results']]
+
+        self.assertEqual([a.pk for a in reversed(analyses)], ids)
+
+    def test_paginate_by_default_is_set___first_page_is_returned(self):
+        user = fake_user()
+        [fake_analysis() for _ in range(3)]
+
+        with override_settings(API_PAGINATE_BY_DEFAULT=True, API_PAGE_SIZE=2):
+            response = self.list(user)
+
+        self.assertEqual(2, len(response.json['results']))
+        self.assertIsNotNone(response.json['next'])
+
+    def test_slim_is_set___only_slim_fields_are_returned(self):
+        user = fake_user()
+        analysis = fake_analysis(output_file=fake_related_file())
+
+        response = self.list(user, slim='')
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([{
+            'created': analysis.created.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            'modified': analysis.modified.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            'name': analysis.name,
+            'id': analysis.pk,
+            'portfolio': analysis.portfolio.pk,
+            'model': analysis.model.pk,
+            'status': analysis.status,
+            'task_started': None,
+            'task_finished': None,
+        }], response.json)
+
+    def test_fields_are_set___only_requested_fields_are_returned(self):
+        user = fake_user()
+        analysis = fake_analysis()
+
+        response = self.app.get(
+            analysis.get_absolute_url(),
+            params={'fields': 'id,status'},
+            headers={
+                'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+            },
+        )
+
+        self.assertEqual({'id': analysis.pk, 'status': analysis.status}, response.json)
+
+    def test_fields_are_unknown___response_is_400(self):
+        user = fake_user()
+        fake_analysis()
+
+        response = self.list(user, expect_errors=True, fields='id,foo')
+
+        self.assertEqual(400, response.status_code)
+        self.assertIn('foo', response.json['fields'])
+
+
+class AnalysisListQueries(ListQueriesMixin, WebTestMixin, TestCase):
+    def fake_full_analysis(self):
+        analysis = fake_analysis(**{
+            field: fake_related_file() for field in [
+                'settings_file',
+                'input_file',
+                'lookup_errors_file',
+                'lookup_success_file',
+                'lookup_validation_file',
+                'summary_levels_file',
+                'input_generation_traceback_file',
+                'output_file',
+                'run_traceback_file',
+                'run_log_file',
+            ]
+        })
+        analysis.complex_model_data_files.add(fake_data_file())
+
+    def test_number_of_analyses_grows___number_of_queries_is_constant(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                self.assert_list_queries_are_constant(
+                    reverse('analysis-list', kwargs={'version': 'v1'}),
+                    self.fake_full_analysis,
+                    {},
+                    {'page_size': '10'},
+                )
+
+
 class AnalysisRun(WebTestMixin, TestCase):
     def test_user_is_not_authenticated___response_is_forbidden(self):
         analysis = fake_analysis()
@@ -383,6 +519,247 @@ class AnalysisCancelInputsGeneration(WebTestMixin, TestCase):
             cancel_generate_inputs.assert_called_once_with(analysis)
 
 
+class AnalysisBulk(WebTestMixin, TestCase):
+    def post(self, action, user, data):
+        return self.app.post_json(
+            reverse('analysis-{}'.format(action), kwargs={'version': 'v1'}),
+            data,
+            expect_errors=True,
+            headers={
+                'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+            }
+        )
+
+    def valid_settings(self):
+        return {
+            "module_supplier_id": "OasisIM",
+            "model_version_id": "1",
+            "number_of_samples": 10,
+            "model_settings": {},
+            "gul_output": True,
+            "gul_summaries": [{"id": 1, "eltcalc": True}],
+        }
+
+    def published_task_ids(self, group_mock):
+        return [s.options['task_id'] for s in group_mock.call_args[0][0]]
+
+    def test_user_is_not_authenticated___response_is_forbidden(self):
+        response = self.app.post_json(reverse('analysis-bulk-run', kwargs={'version': 'v1'}), {'analyses': []}, expect_errors=True)
+        self.assertIn(response.status_code, [401, 403])
+
+    def test_bulk_create___analyses_settings_and_data_files_are_created(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio(location_file=fake_related_file())
+                model = fake_analysis_model()
+                data_file = fake_data_file()
+
+                response = self.post('bulk-create', user, {'analyses': [
+                    {'name': 'first', 'portfolio': portfolio.pk, 'model': model.pk, 'settings': self.valid_settings()},
+                    {'name': 'second', 'portfolio': portfolio.pk, 'model': model.pk, 'complex_model_data_files': [data_file.pk]},
+                ]})
+
+                self.assertEqual(201, response.status_code)
+                self.assertEqual(['first', 'second'], [a['name'] for a in response.json])
+
+                first, second = Analysis.objects.order_by('pk')
+                self.assertEqual(user, first.creator)
+                self.assertEqual(portfolio, first.portfolio)
+                self.assertEqual(self.valid_settings()['number_of_samples'], json.loads(first.settings_file.read())['number_of_samples'])
+                self.assertEqual([], list(first.complex_model_data_files.all()))
+                self.assertIsNone(second.settings_file)
+                self.assertEqual([data_file], list(second.complex_model_data_files.all()))
+
+    def test_bulk_create_references_are_invalid___nothing_is_created(self):
+        user = fake_user()
+        portfolio = fake_portfolio(location_file=fake_related_file())
+        model = fake_analysis_model()
+
+        response = self.post('bulk-create', user, {'analyses': [
+            {'name': 'first', 'portfolio': portfolio.pk, 'model': model.pk},
+            {'name': 'second', 'portfolio': portfolio.pk + 1, 'model': model.pk},
+        ]})
+
+        self.assertEqual(400, response.status_code)
+        self.assertIn('1', response.json['analyses'])
+        self.assertIn('portfolio', response.json['analyses']['1'])
+        self.assertFalse(Analysis.objects.exists())
+
+    def test_bulk_request_is_larger_than_the_max_size___response_is_400(self):
+        user = fake_user()
+
+        with override_settings(API_BULK_MAX_SIZE=2):
+            response = self.post('bulk-run', user, {'analyses': [1, 2, 3]})
+
+        self.assertEqual(400, response.status_code)
+
+    def test_bulk_generate_inputs___tasks_are_published_as_one_group(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analyses = [
+                    fake_analysis(status=Analysis.status_choices.NEW, portfolio=fake_portfolio(location_file=fake_related_file()))
+                    for _ in range(3)
+                ]
+
+                with patch('django.db.transaction.on_commit', lambda f: f()), \
+                        patch('src.server.oasisapi.analyses.dispatch.group') as group_mock:
+                    response = self.post('bulk-generate-inputs', user, {'analyses': [a.pk for a in analyses]})
+
+                self.assertEqual(200, response.status_code)
+                group_mock.assert_called_once()
+                self.assertEqual(3, len(group_mock.call_args[0][0]))
+                for analysis, task_id in zip(analyses, self.published_task_ids(group_mock)):
+                    analysis.refresh_from_db()
+                    self.assertEqual(Analysis.status_choices.INPUTS_GENERATION_QUEUED, analysis.status)
+                    self.assertEqual(task_id, analysis.generate_inputs_task_id)
+
+    def test_bulk_run___tasks_are_published_as_one_group(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analyses = [
+                    fake_analysis(status=Analysis.status_choices.READY, input_file=fake_related_file(), settings_file=fake_related_file())
+                    for _ in range(2)
+                ]
+
+                with patch('django.db.transaction.on_commit', lambda f: f()), \
+                        patch('src.server.oasisapi.analyses.dispatch.group') as group_mock:
+                    response = self.post('bulk-run', user, {'analyses': [a.pk for a in reversed(analyses)]})
+
+                self.assertEqual(200, response.status_code)
+                self.assertEqual([a.pk for a in reversed(analyses)], [a['id'] for a in response.json])
+                group_mock.assert_called_once()
+                for analysis, task_id in zip(reversed(analyses), self.published_task_ids(group_mock)):
+                    analysis.refresh_from_db()
+                    self.assertEqual(Analysis.status_choices.RUN_QUEUED, analysis.status)
+                    self.assertEqual(task_id, analysis.run_task_id)
+
+    def test_bulk_run_one_analysis_is_invalid___nothing_is_published_or_changed(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                valid = fake_analysis(status=Analysis.status_choices.READY, input_file=fake_related_file(), settings_file=fake_related_file())
+                invalid = fake_analysis(status=Analysis.status_choices.READY, input_file=fake_related_file())
+
+                with patch('src.server.oasisapi.analyses.dispatch.group') as group_mock:
+                    response = self.post('bulk-run', user, {'analyses': [valid.pk, invalid.pk]})
+
+                self.assertEqual(400, response.status_code)
+                self.assertEqual(['settings_file'], list(response.json['analyses'][str(invalid.pk)]))
+                group_mock.assert_not_called()
+                for analysis in [valid, invalid]:
+                    analysis.refresh_from_db()
+                    self.assertEqual(Analysis.status_choices.READY, analysis.status)
+
+    def test_bulk_run_analysis_does_not_exist___response_is_400(self):
+        user = fake_user()
+        analysis = fake_analysis()
+
+        response = self.post('bulk-run', user, {'analyses': [analysis.pk, analysis.pk + 1]})
+
+        self.assertEqual(400, response.status_code)
+        self.assertEqual([str(analysis.pk + 1)], list(response.json['analyses']))
+
+    def test_bulk_cancel___tasks_are_revoked_with_one_call(self):
+        user = fake_user()
+        generating = fake_analysis(status=Analysis.status_choices.INPUTS_GENERATION_STARTED, generate_inputs_task_id='a')
+        running = fake_analysis(status=Analysis.status_choices.RUN_QUEUED, run_task_id='b')
+
+        with patch('src.server.oasisapi.analyses.bulk.celery_app') as celery_mock:
+            response = self.post('bulk-cancel', user, {'analyses': [generating.pk, running.pk]})
+
+        self.assertEqual(200, response.status_code)
+        celery_mock.control.revoke.assert_called_once_with(['a', 'b'], signal='SIGTERM', terminate=True)
+
+        generating.refresh_from_db()
+        running.refresh_from_db()
+        self.assertEqual(Analysis.status_choices.INPUTS_GENERATION_CANCELLED, generating.status)
+        self.assertEqual(Analysis.status_choices.RUN_CANCELLED, running.status)
+        self.assertIsNotNone(running.task_finished)
+
+
+class AnalysisStatusBatch(WebTestMixin, TestCase):
+    def get(self, user, **params):
+        return self.app.get(
+            reverse('analysis-statuses', kwargs={'version': 'v1'}),
+            params=params,
+            expect_errors=True,
+            headers={
+                'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+            }
+        )
+
+    def test_user_is_not_authenticated___response_is_forbidden(self):
+        response = self.app.get(reverse('analysis-statuses', kwargs={'version': 'v1'}), expect_errors=True)
+        self.assertIn(response.status_code, [401, 403])
+
+    def test_ids_are_given___columns_of_those_analyses_are_returned(self):
+        user = fake_user()
+        first = fake_analysis(status=Analysis.status_choices.RUN_STARTED)
+        second = fake_analysis(status=Analysis.status_choices.READY)
+        fake_analysis()
+
+        response = self.get(user, id__in='{},{}'.format(second.pk, first.pk))
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([first.pk, second.pk], response.json['id'])
+        self.assertEqual([first.status, second.status], response.json['status'])
+        self.assertEqual([None, None], response.json['task_finished'])
+        self.assertEqual(response.json['modified'][-1], response.json['cursor'])
+
+    def test_no_analyses_match___columns_are_empty(self):
+        user = fake_user()
+
+        response = self.get(user, status=Analysis.status_choices.RUN_STARTED)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({
+            'cursor': None,
+            'id': [],
+            'status': [],
+            'task_started': [],
+            'task_finished': [],
+            'modified': [],
+        }, response.json)
+
+    def test_since_is_the_previous_cursor___only_changed_analyses_are_returned(self):
+        user = fake_user()
+        fake_analysis(status=Analysis.status_choices.READY)
+        changed = fake_analysis(status=Analysis.status_choices.READY)
+        cursor = self.get(user).json['cursor']
+
+        changed.status = Analysis.status_choices.RUN_QUEUED
+        changed.save()
+
+        response = self.get(user, since=cursor)
+        self.assertEqual([changed.pk], response.json['id'])
+        self.assertEqual([Analysis.status_choices.RUN_QUEUED], response.json['status'])
+
+        response = self.get(user, since=response.json['cursor'])
+        self.assertEqual([], response.json['id'])
+
+    def test_since_is_invalid___response_is_400(self):
+        user = fake_user()
+
+        response = self.get(user, since='yesterday')
+
+        self.assertEqual(400, response.status_code)
+        self.assertIn('since', response.json)
+
+    def test_many_analyses___number_of_queries_is_constant(self):
+        user = fake_user()
+        for _ in range(10):
+            fake_analysis()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(user)
+
+        self.assertEqual(10, len(response.json['id']))
+        self.assertLessEqual(len([q for q in queries.captured_queries if 'analyses_analysis' in q['sql']]), 1)
+
+
 class AnalysisCopy(WebTestMixin, TestCase):
     def test_user_is_not_authenticated___response_is_forbidden(self):
         analysis = fake_analysis()
@@ -686,6 +1063,100 @@ class AnalysisCopy(WebTestMixin, TestCase):
 
                 self.assertIsNone(Analysis.objects.get(pk=response.json['id']).output_file)
 
+    def test_share_inputs_portfolio_and_model_are_unchanged___inputs_are_shared_and_copy_is_ready(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = fake_analysis(
+                    status=Analysis.status_choices.RUN_COMPLETED,
+                    settings_file=fake_related_file(file='{}'),
+                    input_file=fake_related_file(),
+                    summary_levels_file=fake_related_file(),
+                    output_file=fake_related_file(),
+                )
+                stored_files = set(os.listdir(d))
+
+                response = self.app.post(
+                    analysis.get_absolute_copy_url(),
+                    headers={
+                        'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                    },
+                    params=json.dumps({'share_inputs': True, 'portfolio': analysis.portfolio.pk}),
+                    content_type='application/json',
+                )
+
+                copy = Analysis.objects.get(pk=response.json['id'])
+                self.assertEqual(Analysis.status_choices.READY, copy.status)
+                for field in ['settings_file', 'input_file', 'summary_levels_file']:
+                    self.assertNotEqual(getattr(analysis, field).pk, getattr(copy, field).pk)
+                    self.assertEqual(getattr(analysis, field).file.name, getattr(copy, field).file.name)
+                self.assertIsNone(copy.output_file)
+                self.assertEqual(stored_files, set(os.listdir(d)))
+
+    def test_share_inputs_portfolio_is_changed___settings_are_shared_and_inputs_are_cleared(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = fake_analysis(
+                    status=Analysis.status_choices.READY,
+                    settings_file=fake_related_file(file='{}'),
+                    input_file=fake_related_file(),
+                )
+                new_portfolio = fake_portfolio(location_file=fake_related_file())
+
+                response = self.app.post(
+                    analysis.get_absolute_copy_url(),
+                    headers={
+                        'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                    },
+                    params=json.dumps({'share_inputs': True, 'portfolio': new_portfolio.pk}),
+                    content_type='application/json',
+                )
+
+                copy = Analysis.objects.get(pk=response.json['id'])
+                self.assertEqual(Analysis.status_choices.NEW, copy.status)
+                self.assertIsNone(copy.input_file)
+                self.assertEqual(analysis.settings_file.file.name, copy.settings_file.file.name)
+
+    def test_share_inputs_inputs_are_not_generated___copy_is_new(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = fake_analysis(status=Analysis.status_choices.INPUTS_GENERATION_ERROR, input_file=fake_related_file())
+
+                response = self.app.post(
+                    analysis.get_absolute_copy_url(),
+                    headers={
+                        'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                    },
+                    params=json.dumps({'share_inputs': True}),
+                    content_type='application/json',
+                )
+
+                copy = Analysis.objects.get(pk=response.json['id'])
+                self.assertEqual(Analysis.status_choices.NEW, copy.status)
+                self.assertIsNone(copy.input_file)
+
+    def test_shared_input_file_is_deleted_by_the_copy___original_file_is_kept(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = fake_analysis(status=Analysis.status_choices.READY, input_file=fake_related_file())
+
+                response = self.app.post(
+                    analysis.get_absolute_copy_url(),
+                    headers={
+                        'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                    },
+                    params=json.dumps({'share_inputs': True}),
+                    content_type='application/json',
+                )
+                Analysis.objects.get(pk=response.json['id']).delete()
+                delete_queued_files()
+
+                analysis.refresh_from_db()
+                self.assertTrue(os.path.exists(os.path.join(d, analysis.input_file.file.name)))
+
 
 class AnalysisSettingsJson(WebTestMixin, TestCase):
     def test_user_is_not_authenticated___response_is_forbidden(self):
@@ -821,6 +1292,170 @@ class AnalysisSettingsJson(WebTestMixin, TestCase):
                 self.assertEqual(json.loads(response.body), json_data['analysis_settings'])
                 self.assertEqual(response.content_type, 'application/json')
 
+    def valid_settings(self, number_of_samples=10):
+        return {
+            "module_supplier_id": "OasisIM",
+            "model_version_id": "1",
+            "number_of_samples": number_of_samples,
+            "model_settings": {},
+            "gul_output": True,
+            "gul_summaries": [{"id": 1, "eltcalc": True}],
+        }
+
+    def test_settings_json_is_uploaded___is_stored_without_writing_to_the_working_directory(self):
+        with TemporaryDirectory() as d, TemporaryDirectory() as cwd:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = fake_analysis()
+                json_data = self.valid_settings()
+
+                current_dir = os.getcwd()
+                os.chdir(cwd)
+                try:
+                    self.app.post(
+                        analysis.get_absolute_settings_url(),
+                        headers={
+                            'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                        },
+                        params=json.dumps(json_data),
+                        content_type='application/json'
+                    )
+                finally:
+                    os.chdir(current_dir)
+
+                self.assertEqual([], os.listdir(cwd))
+                analysis.refresh_from_db()
+                self.assertEqual('analysis_settings.json', analysis.settings_file.filename)
+                self.assertEqual(json_data, json.loads(analysis.settings_file.read()))
+
+    def test_settings_json_is_read_twice___file_is_parsed_once_and_reparsed_after_post_and_delete(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = fake_analysis()
+                headers = {'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))}
+
+                self.app.post(
+                    analysis.get_absolute_settings_url(), headers=headers,
+                    params=json.dumps(self.valid_settings(10)), content_type='application/json',
+                )
+                with patch('src.server.oasisapi.files.views.json.load') as json_load:
+                    self.assertEqual(self.valid_settings(10), self.app.get(analysis.get_absolute_settings_url(), headers=headers).json)
+                    self.assertEqual(self.valid_settings(10), self.app.get(analysis.get_absolute_settings_url(), headers=headers).json)
+                    json_load.assert_not_called()
+
+                self.app.post(
+                    analysis.get_absolute_settings_url(), headers=headers,
+                    params=json.dumps(self.valid_settings(20)), content_type='application/json',
+                )
+                self.assertEqual(self.valid_settings(20), self.app.get(analysis.get_absolute_settings_url(), headers=headers).json)
+
+                self.app.delete(analysis.get_absolute_settings_url(), headers=headers)
+                response = self.app.get(analysis.get_absolute_settings_url(), headers=headers, expect_errors=True)
+                self.assertEqual(404, response.status_code)
+
+    def test_settings_json_is_posted_repeatedly___schema_is_not_reloaded(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = fake_analysis()
+
+                def post_settings(number_of_samples):
+                    return self.app.post(
+                        analysis.get_absolute_settings_url(),
+                        headers={
+                            'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                        },
+                        params=json.dumps(self.valid_settings(number_of_samples)),
+                        content_type='application/json',
+                        expect_errors=True,
+                    )
+
+                post_settings(10)
+                with patch('src.server.oasisapi.schemas.serializers.load_json_schema') as load_schema:
+                    self.assertEqual(200, post_settings(20).status_code)
+                    response = post_settings(-1)
+
+                load_schema.assert_not_called()
+                self.assertEqual(400, response.status_code)
+                self.assertEqual({'number_of_samples': ['-1 is less than the minimum of 0']}, response.json)
+
+    def test_settings_json_is_not_cached___file_is_parsed(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = fake_analysis(
+                    settings_file=fake_related_file(file=b'{"number_of_samples": 10}', content_type='application/json'),
+                )
+
+                response = self.app.get(
+                    analysis.get_absolute_settings_url(),
+                    headers={
+                        'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                    },
+                )
+
+                self.assertEqual({'number_of_samples': 10}, response.json)
+
+
+class AnalysisConditionalGet(WebTestMixin, TestCase):
+    def get(self, url, user, headers=None):
+        headers = dict(headers or {}, Authorization='Bearer {}'.format(AccessToken.for_user(user)))
+        return self.app.get(url, headers=headers, expect_errors=True)
+
+    def test_status_changes___analysis_etag_changes_and_settings_etag_is_kept(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = fake_analysis(
+                    status=Analysis.status_choices.RUN_STARTED,
+                    settings_file=fake_related_file(file=b'{"number_of_samples": 10}', content_type='application/json'),
+                )
+                analysis_etag = self.get(analysis.get_absolute_url(), user).headers['ETag']
+                file_etag = self.get(analysis.get_absolute_settings_file_url(), user).headers['ETag']
+                settings_etag = self.get(analysis.get_absolute_settings_url(), user).headers['ETag']
+
+                analysis.status = Analysis.status_choices.RUN_COMPLETED
+                analysis.save()
+
+                response = self.get(analysis.get_absolute_url(), user, {'If-None-Match': analysis_etag})
+                self.assertEqual(200, response.status_code)
+                self.assertEqual(Analysis.status_choices.RUN_COMPLETED, response.json['status'])
+                self.assertEqual(304, self.get(analysis.get_absolute_settings_file_url(), user, {'If-None-Match': file_etag}).status_code)
+                self.assertEqual(304, self.get(analysis.get_absolute_settings_url(), user, {'If-None-Match': settings_etag}).status_code)
+
+    def test_settings_are_posted___settings_etag_changes(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = fake_analysis(
+                    settings_file=fake_related_file(file=b'{"number_of_samples": 10}', content_type='application/json'),
+                )
+                etag = self.get(analysis.get_absolute_settings_file_url(), user).headers['ETag']
+
+                self.app.post(
+                    analysis.get_absolute_settings_file_url(),
+                    headers={
+                        'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                    },
+                    upload_files=(
+                        ('file', 'file.json', b'{"number_of_samples": 20}'),
+                    ),
+                )
+
+                response = self.get(analysis.get_absolute_settings_file_url(), user, {'If-None-Match': etag})
+                self.assertEqual(200, response.status_code)
+                self.assertEqual(b'{"number_of_samples": 20}', response.body)
+
+    def test_settings_file_is_not_present___response_is_404(self):
+        user = fake_user()
+        analysis = fake_analysis()
+
+        response = self.get(analysis.get_absolute_settings_file_url(), user, {'If-None-Match': '*'})
+
+        self.assertEqual(404, response.status_code)
+        self.assertNotIn('ETag', response.headers)
+
 
 class AnalysisSettingsFile(WebTestMixin, TestCase):
     def test_user_is_not_authenticated___response_is_forbidden(self):
@@ -904,6 +1539,56 @@ class AnalysisSettingsFile(WebTestMixin, TestCase):
                 self.assertEqual(response.content_type, 'application/json')
 
 
+class AnalysisPresignedUpload(WebTestMixin, TestCase):
+    def test_user_is_not_authenticated___response_is_forbidden(self):
+        analysis = fake_analysis()
+
+        response = self.app.post(analysis.get_absolute_presigned_upload_url(), expect_errors=True)
+        self.assertIn(response.status_code, [401,403])
+
+    def test_field_is_not_settings_file___response_is_400(self):
+        with override_settings(**S3_STORAGE_SETTINGS):
+            user = fake_user()
+            analysis = fake_analysis()
+
+            response = self.app.post_json(
+                analysis.get_absolute_presigned_upload_url(),
+                {'field': 'output_file', 'filename': 'out.tar.gz', 'content_type': 'application/gzip'},
+                headers={
+                    'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                },
+                expect_errors=True,
+            )
+
+            self.assertEqual(400, response.status_code)
+
+    def test_upload_is_confirmed___settings_file_is_attached(self):
+        with override_settings(**S3_STORAGE_SETTINGS):
+            user = fake_user()
+            analysis = fake_analysis()
+            headers = {'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))}
+
+            upload = self.app.post_json(
+                analysis.get_absolute_presigned_upload_url(),
+                {'field': 'settings_file', 'filename': 'analysis_settings.json', 'content_type': 'application/json'},
+                headers=headers,
+            ).json
+
+            with patch.object(default_storage.bucket.meta.client, 'head_object') as head_object:
+                head_object.return_value = {'ContentType': 'application/json', 'ContentLength': 2}
+
+                response = self.app.post_json(
+                    analysis.get_absolute_presigned_upload_confirm_url(),
+                    {'upload_token': upload['upload_token']},
+                    headers=headers,
+                )
+
+            analysis.refresh_from_db()
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(upload['fields']['key'], analysis.settings_file.file.name)
+            self.assertEqual('analysis_settings.json', analysis.settings_file.filename)
+
+
 class AnalysisInputFile(WebTestMixin, TestCase):
     def test_user_is_not_authenticated___response_is_forbidden(self):
         analysis = fake_analysis()
@@ -1233,6 +1918,386 @@ class AnalysisOutputFile(WebTestMixin, TestCase):
                 self.assertEqual(response.content_type, content_type)
 
 
+class AnalysisOutputFileMembers(WebTestMixin, TestCase):
+    def create_output_archive(self, files, indexed=True):
+        """ Returns the archive and index content as written by the worker
+        """
+        with TemporaryDirectory() as run_dir:
+            output_dir = Path(run_dir, 'output')
+            output_dir.mkdir()
+            for name, content in files.items():
+                Path(output_dir, name).write_bytes(content)
+
+            archive_fp = os.path.join(run_dir, 'output.tar.gz')
+            index_fp = os.path.join(run_dir, 'index.json') if indexed else None
+            BaseStorageConnector(iniconf.settings).compress(archive_fp, str(output_dir), 'output', index_fp=index_fp)
+
+            archive = Path(archive_fp).read_bytes()
+            index = Path(index_fp).read_bytes() if indexed else None
+        return archive, index
+
+    def fake_output_analysis(self, files, indexed=True):
+        archive, index = self.create_output_archive(files, indexed=indexed)
+        return fake_analysis(
+            output_file=fake_related_file(file=archive, content_type='application/gzip'),
+            output_index_file=fake_related_file(file=index, content_type='application/json') if indexed else None,
+        )
+
+    def test_user_is_not_authenticated___response_is_forbidden(self):
+        analysis = fake_analysis()
+
+        response = self.app.get(analysis.get_absolute_output_file_index_url(), expect_errors=True)
+        self.assertIn(response.status_code, [401,403])
+
+    def test_output_file_is_not_present___index_response_is_404(self):
+        user = fake_user()
+        analysis = fake_analysis()
+
+        response = self.app.get(
+            analysis.get_absolute_output_file_index_url(),
+            headers={
+                'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+            },
+            expect_errors=True,
+        )
+
+        self.assertEqual(404, response.status_code)
+
+    @given(indexed=sampled_from([True, False]))
+    def test_output_file_is_present___members_are_listed(self, indexed):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = self.fake_output_analysis({
+                    'gul_S1_aalcalc.csv': b'summary_id,type,mean,standard_deviation',
+                    'il_S1_eltcalc.csv': b'summary_id,type,event_id',
+                }, indexed=indexed)
+
+                response = self.app.get(
+                    analysis.get_absolute_output_file_index_url(),
+                    headers={
+                        'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                    },
+                )
+
+                self.assertEqual(indexed, response.json['indexed'])
+                self.assertEqual(
+                    [('output/gul_S1_aalcalc.csv', 39), ('output/il_S1_eltcalc.csv', 24)],
+                    [(m['name'], m['size']) for m in response.json['members']],
+                )
+                if indexed:
+                    self.assertEqual(
+                        hashlib.md5(b'summary_id,type,event_id').hexdigest(),
+                        response.json['members'][1]['md5'],
+                    )
+
+    @given(
+        file_content=binary(min_size=1, max_size=200 * 1024),
+        name=sampled_from(['output/gul_S1_aalcalc.csv', 'gul_S1_aalcalc.csv']),
+        indexed=sampled_from([True, False]),
+    )
+    @settings(max_examples=10)
+    def test_member_is_present___member_content_is_returned(self, file_content, name, indexed):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = self.fake_output_analysis({
+                    'analysis_settings.json': b'{}',
+                    'gul_S1_aalcalc.csv': file_content,
+                    'il_S1_eltcalc.csv': b'summary_id,type,event_id',
+                }, indexed=indexed)
+
+                response = self.app.get(
+                    analysis.get_absolute_output_file_member_url(),
+                    params={'member': name},
+                    headers={
+                        'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                    },
+                )
+
+                self.assertEqual(response.body, file_content)
+                self.assertEqual(response.content_type, 'text/csv')
+                self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename="gul_S1_aalcalc.csv"')
+
+    def test_member_is_not_present___response_is_404(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = self.fake_output_analysis({'gul_S1_aalcalc.csv': b'content'})
+
+                response = self.app.get(
+                    analysis.get_absolute_output_file_member_url(),
+                    params={'member': 'il_S1_eltcalc.csv'},
+                    headers={
+                        'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                    },
+                    expect_errors=True,
+                )
+
+                self.assertEqual(404, response.status_code)
+
+    def test_member_name_is_not_provided___response_is_400(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = self.fake_output_analysis({'gul_S1_aalcalc.csv': b'content'})
+
+                response = self.app.get(
+                    analysis.get_absolute_output_file_member_url(),
+                    headers={
+                        'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                    },
+                    expect_errors=True,
+                )
+
+                self.assertEqual(400, response.status_code)
+
+
+class AnalysisOutputQuery(WebTestMixin, TestCase):
+    TABLE = {
+        'event_id': [1, 2, 3, 4, 5, 6],
+        'summary_id': [1, 1, 2, 2, 3, 3],
+        'mean': [10.0, 20.0, 30.0, 40.0, 50.0, 60.0],
+    }
+
+    def fake_columnar_analysis(self, tables):
+        """ Returns an analysis with the columnar outputs as written by the worker
+        """
+        with TemporaryDirectory() as run_dir:
+            columnar_dir = Path(run_dir, 'output_columnar')
+            columnar_dir.mkdir()
+            for name, columns in tables.items():
+                pq.write_table(pa.table(columns), str(Path(columnar_dir, name + '.parquet')), row_group_size=2)
+
+            archive_fp = os.path.join(run_dir, 'output.tar')
+            index_fp = os.path.join(run_dir, 'index.json')
+            BaseStorageConnector(iniconf.settings).compress(
+                archive_fp, str(columnar_dir), 'output', index_fp=index_fp, gzip_members=False)
+
+            return fake_analysis(
+                output_columnar_file=fake_related_file(file=Path(archive_fp).read_bytes(), content_type='application/x-tar'),
+                output_columnar_index_file=fake_related_file(file=Path(index_fp).read_bytes(), content_type='application/json'),
+            )
+
+    def query(self, analysis, user, expect_errors=False, **params):
+        return self.app.get(
+            analysis.get_absolute_output_query_url(),
+            params=params,
+            headers={
+                'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+            },
+            expect_errors=expect_errors,
+        )
+
+    def test_user_is_not_authenticated___response_is_forbidden(self):
+        analysis = fake_analysis()
+
+        response = self.app.get(analysis.get_absolute_output_tables_url(), expect_errors=True)
+        self.assertIn(response.status_code, [401,403])
+
+    def test_columnar_outputs_are_not_present___response_is_404(self):
+        user = fake_user()
+        analysis = fake_analysis()
+
+        response = self.app.get(
+            analysis.get_absolute_output_tables_url(),
+            headers={
+                'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+            },
+            expect_errors=True,
+        )
+        self.assertEqual(404, response.status_code)
+
+        response = self.query(analysis, user, expect_errors=True, table='gul_S1_eltcalc')
+        self.assertEqual(404, response.status_code)
+
+    def test_columnar_outputs_are_present___tables_are_listed(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = self.fake_columnar_analysis({'gul_S1_eltcalc': self.TABLE})
+
+                response = self.app.get(
+                    analysis.get_absolute_output_tables_url(),
+                    headers={
+                        'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                    },
+                )
+
+                self.assertEqual(200, response.status_code)
+                self.assertEqual([{
+                    'table': 'gul_S1_eltcalc',
+                    'num_rows': 6,
+                    'columns': [
+                        {'name': 'event_id', 'type': 'int64'},
+                        {'name': 'summary_id', 'type': 'int64'},
+                        {'name': 'mean', 'type': 'double'},
+                    ],
+                }], response.json)
+
+    def test_table_is_not_present___response_is_404(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = self.fake_columnar_analysis({'gul_S1_eltcalc': self.TABLE})
+
+                response = self.query(analysis, user, expect_errors=True, table='il_S1_eltcalc')
+
+                self.assertEqual(404, response.status_code)
+
+    def test_query_has_unknown_column___response_is_400(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = self.fake_columnar_analysis({'gul_S1_eltcalc': self.TABLE})
+
+                response = self.query(analysis, user, expect_errors=True, table='gul_S1_eltcalc', columns='event_id,loss')
+
+                self.assertEqual(400, response.status_code)
+                self.assertIn('loss', response.json['columns'][0])
+
+    def test_query_has_invalid_filter___response_is_400(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = self.fake_columnar_analysis({'gul_S1_eltcalc': self.TABLE})
+
+                response = self.query(analysis, user, expect_errors=True, table='gul_S1_eltcalc', filter='summary_id__like:1')
+
+                self.assertEqual(400, response.status_code)
+                self.assertIn('filter', response.json)
+
+    def test_query_is_filtered_and_ordered___matching_rows_are_returned(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = self.fake_columnar_analysis({'gul_S1_eltcalc': self.TABLE})
+
+                response = self.query(
+                    analysis,
+                    user,
+                    table='gul_S1_eltcalc',
+                    columns='event_id,mean',
+                    filter=['summary_id__in:1,3', 'mean__gt:10'],
+                    order_by='-mean',
+                )
+
+                self.assertEqual(200, response.status_code)
+                self.assertEqual('3', response.headers['X-Total-Count'])
+                self.assertEqual(['event_id', 'mean'], response.json['columns'])
+                self.assertEqual([
+                    {'event_id': 6, 'mean': 60.0},
+                    {'event_id': 5, 'mean': 50.0},
+                    {'event_id': 2, 'mean': 20.0},
+                ], response.json['results'])
+
+    def test_query_is_grouped___aggregates_are_returned(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = self.fake_columnar_analysis({'gul_S1_eltcalc': self.TABLE})
+
+                response = self.query(
+                    analysis,
+                    user,
+                    table='gul_S1_eltcalc',
+                    filter='event_id__lte:5',
+                    group_by='summary_id',
+                    agg='mean:sum,mean:max,event_id:count',
+                    order_by='-mean_sum',
+                )
+
+                self.assertEqual(200, response.status_code)
+                self.assertEqual([
+                    {'summary_id': 2, 'mean_sum': 70.0, 'mean_max': 40.0, 'event_id_count': 2},
+                    {'summary_id': 3, 'mean_sum': 50.0, 'mean_max': 50.0, 'event_id_count': 1},
+                    {'summary_id': 1, 'mean_sum': 30.0, 'mean_max': 20.0, 'event_id_count': 2},
+                ], response.json['results'])
+
+    def test_query_is_paginated___next_link_is_returned(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = self.fake_columnar_analysis({'gul_S1_eltcalc': self.TABLE})
+
+                response = self.query(analysis, user, table='gul_S1_eltcalc', columns='event_id', limit='4')
+                self.assertEqual(6, response.json['count'])
+                self.assertEqual([1, 2, 3, 4], [r['event_id'] for r in response.json['results']])
+                self.assertIn('offset=4', response.json['next'])
+
+                response = self.query(analysis, user, table='gul_S1_eltcalc', columns='event_id', limit='4', offset='4')
+                self.assertEqual([5, 6], [r['event_id'] for r in response.json['results']])
+                self.assertIsNone(response.json['next'])
+
+    def test_result_format_is_csv___csv_is_returned(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                analysis = self.fake_columnar_analysis({'gul_S1_eltcalc': self.TABLE})
+
+                response = self.query(
+                    analysis,
+                    user,
+                    table='gul_S1_eltcalc',
+                    filter='summary_id__eq:2',
+                    result_format='csv',
+                )
+
+                self.assertEqual(200, response.status_code)
+                self.assertEqual('text/csv', response.content_type)
+                self.assertEqual(
+                    'event_id,summary_id,mean\r\n3,2,30.0\r\n4,2,40.0\r\n',
+                    response.text,
+                )
+
+
+class AnalysisMetrics(WebTestMixin, TestCase):
+    def test_user_is_not_authenticated___response_is_forbidden(self):
+        analysis = fake_analysis()
+
+        response = self.app.get(analysis.get_absolute_metrics_url(), expect_errors=True)
+        self.assertIn(response.status_code, [401,403])
+
+    def test_metrics_are_not_present___response_is_404(self):
+        user = fake_user()
+        analysis = fake_analysis()
+
+        response = self.app.get(
+            analysis.get_absolute_metrics_url(),
+            headers={
+                'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+            },
+            expect_errors=True,
+        )
+
+        self.assertEqual(404, response.status_code)
+
+    def test_metrics_are_present___metrics_are_returned(self):
+        user = fake_user()
+        metrics = {
+            'total_tiv': 3000.5,
+            'return_periods': [10, 100],
+            'summary_levels': {
+                'gul_S1': {
+                    'tiv': 3000.5,
+                    'aal': {'analytical': 30.0},
+                    'ep': {'full_uncertainty_aep': {'1': {'analytical': {'10': 100.0, '100': 200.0}}}},
+                },
+            },
+        }
+        analysis = fake_analysis(metrics=metrics)
+
+        response = self.app.get(
+            analysis.get_absolute_metrics_url(),
+            headers={
+                'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+            },
+        )
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(metrics, response.json)
+
+
 class AnalysisRunTracebackFile(WebTestMixin, TestCase):
     def test_user_is_not_authenticated___response_is_forbidden(self):
         analysis = fake_analysis()
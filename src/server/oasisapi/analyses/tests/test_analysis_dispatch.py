@@ -0,0 +1,256 @@
+from datetime import timedelta
+
+from backports.tempfile import TemporaryDirectory
+from django.contrib.auth.models import Group
+from django.test import override_settings
+from django.utils import timezone
+from django_webtest import WebTestMixin
+from hypothesis import settings
+from hypothesis.extra.django import TestCase
+from mock import patch, Mock
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ...analysis_models.tests.fakes import fake_analysis_model
+from ...auth.tests.fakes import fake_user
+from ...files.tests.fakes import fake_related_file
+from ..dispatch import dispatch_pending, get_queue_positions
+from ..models import Analysis, AnalysisQueueShare
+from .fakes import fake_analysis, FakeAsyncResultFactory
+
+# Override default deadline for all tests to 8s
+settings.register_profile("ci", deadline=800.0)
+settings.load_profile("ci")
+
+STATUS = Analysis.status_choices
+
+
+def published_task_ids(publish_mock):
+    """ The task ids set on the signatures given to the mocked `publish`
+    """
+    return [s.set.call_args[1]['task_id'] for s in publish_mock.call_args[0][0]]
+
+
+def patch_signatures():
+    return patch('src.server.oasisapi.analyses.models.Analysis.get_linked_signature', side_effect=lambda: Mock())
+
+
+class FairShareDispatch(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.model = fake_analysis_model()
+        self.first = fake_user()
+        self.second = fake_user()
+
+    def fake_queued(self, initiator, age=0, status=STATUS.RUN_QUEUED, dispatched=False, model=None):
+        return fake_analysis(
+            model=model or self.model,
+            status=status,
+            task_initiator=initiator,
+            task_queued=self.now - timedelta(seconds=age),
+            task_dispatched=self.now if dispatched else None,
+        )
+
+    def dispatch(self, model_ids=None):
+        with patch('django.db.transaction.on_commit', lambda f: f()), \
+                patch('src.server.oasisapi.analyses.dispatch.publish') as publish_mock, \
+                patch_signatures():
+            released = dispatch_pending(model_ids or [self.model.pk])
+        return released, publish_mock
+
+    def test_concurrency_is_not_limited___all_held_tasks_are_released(self):
+        held = [self.fake_queued(self.first, age=10 - i) for i in range(3)]
+
+        released, publish_mock = self.dispatch()
+
+        self.assertEqual([a.pk for a in held], [a.pk for a in released])
+        publish_mock.assert_called_once()
+        for analysis, task_id in zip(held, published_task_ids(publish_mock)):
+            analysis.refresh_from_db()
+            self.assertEqual(task_id, analysis.run_task_id)
+            self.assertIsNotNone(analysis.task_dispatched)
+
+    def test_transaction_is_not_committed___task_ids_are_stored_and_nothing_is_published(self):
+        held = self.fake_queued(self.first)
+
+        with patch('src.server.oasisapi.analyses.dispatch.publish') as publish_mock, patch_signatures():
+            dispatch_pending([self.model.pk])
+
+        publish_mock.assert_not_called()
+        held.refresh_from_db()
+        self.assertNotEqual('', held.run_task_id)
+        self.assertIsNotNone(held.task_dispatched)
+
+    def test_publish_fails___released_tasks_are_held_again(self):
+        held = [self.fake_queued(self.first, age=10 - i) for i in range(2)]
+
+        with patch('django.db.transaction.on_commit', lambda f: f()), \
+                patch('src.server.oasisapi.analyses.dispatch.publish', Mock(side_effect=ConnectionError())), \
+                patch_signatures():
+            dispatch_pending([self.model.pk])
+
+        for analysis in held:
+            analysis.refresh_from_db()
+            self.assertEqual('', analysis.run_task_id)
+            self.assertIsNone(analysis.task_dispatched)
+
+    def test_no_task_is_held___nothing_is_published(self):
+        self.fake_queued(self.first, dispatched=True)
+
+        released, publish_mock = self.dispatch()
+
+        self.assertEqual([], released)
+        publish_mock.assert_not_called()
+
+    @override_settings(ANALYSIS_DISPATCH_MODEL_CONCURRENCY=2)
+    def test_one_user_queued_first___free_slots_are_shared_between_the_users(self):
+        first_held = [self.fake_queued(self.first, age=10 - i) for i in range(3)]
+        second_held = self.fake_queued(self.second, age=1)
+
+        released, _ = self.dispatch()
+
+        self.assertEqual([first_held[0].pk, second_held.pk], [a.pk for a in released])
+
+    @override_settings(ANALYSIS_DISPATCH_MODEL_CONCURRENCY=2)
+    def test_released_tasks_use_the_slots___only_the_free_slots_are_filled(self):
+        self.fake_queued(self.first, age=20, status=STATUS.RUN_STARTED, dispatched=True)
+        self.fake_queued(self.first, age=10)
+        second_held = self.fake_queued(self.second, age=5)
+
+        released, _ = self.dispatch()
+
+        self.assertEqual([second_held.pk], [a.pk for a in released])
+
+    @override_settings(ANALYSIS_DISPATCH_MODEL_CONCURRENCY=1)
+    def test_tasks_are_released_on_other_models___slots_are_counted_by_model(self):
+        other_model = fake_analysis_model()
+        self.fake_queued(self.first, age=20, status=STATUS.RUN_STARTED, dispatched=True, model=other_model)
+        held = self.fake_queued(self.first, age=10)
+
+        released, _ = self.dispatch()
+
+        self.assertEqual([held.pk], [a.pk for a in released])
+
+    @override_settings(ANALYSIS_DISPATCH_MODEL_CONCURRENCY=4)
+    def test_share_has_double_weight___it_is_given_more_slots(self):
+        AnalysisQueueShare.objects.create(user=self.first, weight=2)
+        for i in range(4):
+            self.fake_queued(self.first, age=20 - i)
+        for i in range(4):
+            self.fake_queued(self.second, age=10 - i)
+
+        released, _ = self.dispatch()
+
+        self.assertEqual(3, len([a for a in released if a.task_initiator_id == self.first.pk]))
+
+    @override_settings(ANALYSIS_DISPATCH_MODEL_CONCURRENCY=4)
+    def test_shares_have_the_same_weight___slots_alternate(self):
+        for i in range(4):
+            self.fake_queued(self.first, age=20 - i)
+        for i in range(4):
+            self.fake_queued(self.second, age=10 - i)
+
+        released, _ = self.dispatch()
+
+        self.assertEqual(
+            [self.first.pk, self.second.pk, self.first.pk, self.second.pk],
+            [a.task_initiator_id for a in released],
+        )
+
+    @override_settings(ANALYSIS_DISPATCH_USER_CONCURRENCY=2)
+    def test_user_concurrency_is_limited___user_tasks_above_the_limit_are_held(self):
+        self.fake_queued(self.first, age=20, status=STATUS.RUN_STARTED, dispatched=True)
+        first_held = [self.fake_queued(self.first, age=10 - i) for i in range(2)]
+        second_held = self.fake_queued(self.second, age=1)
+
+        released, _ = self.dispatch()
+
+        # The second user has no released tasks so is served first
+        self.assertEqual([second_held.pk, first_held[0].pk], [a.pk for a in released])
+
+    @override_settings(ANALYSIS_DISPATCH_USER_CONCURRENCY=5)
+    def test_share_has_its_own_limit___it_overrides_the_default_limit(self):
+        AnalysisQueueShare.objects.create(user=self.first, max_concurrency=1)
+        first_held = [self.fake_queued(self.first, age=10 - i) for i in range(3)]
+
+        released, _ = self.dispatch()
+
+        self.assertEqual([first_held[0].pk], [a.pk for a in released])
+
+    def test_users_are_in_a_group_with_a_share___the_group_limit_is_shared(self):
+        group = Group.objects.create(name='underwriting')
+        self.first.groups.add(group)
+        self.second.groups.add(group)
+        AnalysisQueueShare.objects.create(group=group, max_concurrency=2)
+        self.fake_queued(self.first, age=20, status=STATUS.RUN_STARTED, dispatched=True)
+        first_held = self.fake_queued(self.first, age=10)
+        self.fake_queued(self.second, age=5)
+
+        released, _ = self.dispatch()
+
+        self.assertEqual([first_held.pk], [a.pk for a in released])
+
+    @override_settings(ANALYSIS_DISPATCH_MODEL_CONCURRENCY=1)
+    def test_tasks_are_held___queue_position_is_the_release_order(self):
+        self.fake_queued(self.second, age=30, status=STATUS.RUN_STARTED, dispatched=True)
+        first_held = [self.fake_queued(self.first, age=20 - i) for i in range(3)]
+        second_held = self.fake_queued(self.second, age=15)
+
+        # The second user already has a task released, so is behind the first until they are level
+        self.assertEqual(
+            {first_held[0].pk: 1, first_held[1].pk: 2, second_held.pk: 3, first_held[2].pk: 4},
+            get_queue_positions(self.model.pk),
+        )
+
+
+class HeldAnalysis(WebTestMixin, TestCase):
+    @override_settings(ANALYSIS_DISPATCH_MODEL_CONCURRENCY=1)
+    def test_model_queue_is_full___run_is_held_and_queue_position_is_shown(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                model = fake_analysis_model()
+                fake_analysis(model=model, status=STATUS.RUN_STARTED, task_dispatched=timezone.now())
+                analysis = fake_analysis(model=model, status=STATUS.READY, input_file=fake_related_file(), settings_file=fake_related_file())
+                sig_res = Mock()
+
+                with patch('src.server.oasisapi.analyses.models.Analysis.run_analysis_signature', sig_res):
+                    response = self.app.post(
+                        analysis.get_absolute_run_url(),
+                        headers={'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))},
+                    )
+
+                self.assertEqual(200, response.status_code)
+                self.assertEqual(STATUS.RUN_QUEUED, response.json['status'])
+                self.assertEqual(1, response.json['queue_position'])
+                sig_res.delay.assert_not_called()
+
+                analysis.refresh_from_db()
+                self.assertEqual('', analysis.run_task_id)
+                self.assertEqual(user, analysis.task_initiator)
+                self.assertIsNone(analysis.task_dispatched)
+
+    def test_analysis_is_held___cancel_does_not_revoke(self):
+        res_factory = FakeAsyncResultFactory(target_task_id='')
+        analysis = fake_analysis(status=STATUS.RUN_QUEUED, run_task_id='', task_queued=timezone.now())
+
+        with patch('src.server.oasisapi.analyses.models.AsyncResult', res_factory):
+            analysis.cancel_analysis()
+
+        self.assertEqual(STATUS.RUN_CANCELLED, analysis.status)
+        self.assertFalse(res_factory.revoke_called)
+
+    @override_settings(ANALYSIS_DISPATCH_MODEL_CONCURRENCY=1)
+    def test_released_task_completes___next_held_task_is_released(self):
+        model = fake_analysis_model()
+        running = fake_analysis(model=model, status=STATUS.RUN_STARTED, task_dispatched=timezone.now())
+        held = fake_analysis(model=model, status=STATUS.RUN_QUEUED, task_queued=timezone.now())
+
+        with patch('django.db.transaction.on_commit', lambda f: f()), \
+                patch('src.server.oasisapi.analyses.dispatch.publish') as publish_mock, \
+                patch_signatures():
+            running.status = STATUS.RUN_COMPLETED
+            running.save()
+
+        held.refresh_from_db()
+        self.assertEqual(published_task_ids(publish_mock), [held.run_task_id])
+        self.assertIsNotNone(held.task_dispatched)
@@ -0,0 +1,268 @@
+import json
+from datetime import timedelta
+
+from backports.tempfile import TemporaryDirectory
+from django.test import override_settings
+from django.utils import timezone
+from django_webtest import WebTestMixin
+from hypothesis import given, settings
+from hypothesis.extra.django import TestCase
+from hypothesis.strategies import floats, integers, lists, tuples
+from mock import patch, PropertyMock, Mock
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ...analysis_models.tests.fakes import fake_analysis_model
+from ...auth.tests.fakes import fake_user
+from ...files.tests.fakes import fake_related_file
+from ...portfolios.tests.fakes import fake_portfolio
+from ..estimates import GENERATE_INPUTS, RUN, get_runtime_estimate, get_runtime_statistics, get_task_work, \
+    predict_duration, record_task_runtime
+from ..models import Analysis, AnalysisRuntimeStatistics
+from .fakes import fake_analysis
+
+# Override default deadline for all tests to 8s
+settings.register_profile("ci", deadline=800.0)
+settings.load_profile("ci")
+
+STATUS = Analysis.status_choices
+
+
+def fake_settings_file(**analysis_settings):
+    return fake_related_file(file=json.dumps(analysis_settings), content_type='application/json')
+
+
+def fake_completed_task(model, phase, duration, work=None):
+    finished = timezone.now()
+    analysis = fake_analysis(model=model, task_started=finished - timedelta(seconds=duration), task_finished=finished, task_work=work)
+    record_task_runtime(analysis, phase)
+
+
+class TaskWork(TestCase):
+    def test_location_count_is_unknown___work_is_none(self):
+        analysis = fake_analysis(portfolio=fake_portfolio())
+
+        self.assertIsNone(get_task_work(analysis, GENERATE_INPUTS))
+        self.assertIsNone(get_task_work(analysis, RUN))
+
+    def test_input_generation___work_is_the_location_count(self):
+        analysis = fake_analysis(portfolio=fake_portfolio(exposure_statistics={'location_file': {'rows': 120}}))
+
+        self.assertEqual(120, get_task_work(analysis, GENERATE_INPUTS))
+
+    def test_run___work_is_scaled_by_the_samples_and_outputs(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                analysis = fake_analysis(
+                    portfolio=fake_portfolio(exposure_statistics={'location_file': {'rows': 120}}),
+                    settings_file=fake_settings_file(
+                        number_of_samples=10,
+                        gul_output=True,
+                        gul_summaries=[{'id': 1, 'eltcalc': True, 'aalcalc': True, 'pltcalc': False}],
+                        il_output=True,
+                        il_summaries=[{'id': 1, 'aalcalc': True, 'ord_output': {'elt_sample': True, 'plt_moment': False}}],
+                        ri_output=False,
+                        ri_summaries=[{'id': 1, 'aalcalc': True}],
+                    ),
+                )
+
+                self.assertEqual(120 * 10 * 4, get_task_work(analysis, RUN))
+
+    def test_run_settings_are_not_valid___samples_and_outputs_count_as_one(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                analysis = fake_analysis(
+                    portfolio=fake_portfolio(exposure_statistics={'location_file': {'rows': 120}}),
+                    settings_file=fake_related_file(file='not json'),
+                )
+
+                self.assertEqual(120, get_task_work(analysis, RUN))
+
+
+class PredictDuration(TestCase):
+    def test_no_task_has_completed___duration_is_unknown(self):
+        model = fake_analysis_model()
+
+        self.assertIsNone(predict_duration(get_runtime_statistics(model.pk, RUN), 100))
+
+    @given(line=tuples(floats(0.01, 10), floats(0, 100)), works=lists(integers(1, 10000), min_size=2, max_size=10, unique=True))
+    def test_durations_are_linear_in_the_work___line_is_recovered(self, line, works):
+        rate, overhead = line
+        model = fake_analysis_model()
+        for work in works:
+            fake_completed_task(model, RUN, overhead + rate * work, work)
+
+        statistics = get_runtime_statistics(model.pk, RUN)
+
+        self.assertEqual(len(works), statistics.count)
+        self.assertAlmostEqual(overhead + rate * 500, predict_duration(statistics, 500), delta=1e-3 * (overhead + rate * 500) + 1e-3)
+
+    def test_tasks_have_the_same_work___duration_scales_with_the_mean_rate(self):
+        model = fake_analysis_model()
+        fake_completed_task(model, RUN, 10, 100)
+        fake_completed_task(model, RUN, 30, 100)
+
+        self.assertEqual(40, predict_duration(get_runtime_statistics(model.pk, RUN), 200))
+
+    def test_work_is_unknown___duration_is_the_mean_duration(self):
+        model = fake_analysis_model()
+        fake_completed_task(model, RUN, 10, 100)
+        fake_completed_task(model, RUN, 50)
+
+        statistics = get_runtime_statistics(model.pk, RUN)
+
+        self.assertEqual(30, predict_duration(statistics, None))
+        self.assertEqual(10, predict_duration(statistics, 100))
+
+    def test_model_has_no_completed_tasks___tasks_of_all_models_are_used(self):
+        fake_completed_task(fake_analysis_model(), RUN, 10, 100)
+        fake_completed_task(fake_analysis_model(), RUN, 30, 300)
+
+        statistics = get_runtime_statistics(fake_analysis_model().pk, RUN)
+
+        self.assertEqual(2, statistics.count)
+        self.assertEqual(20, predict_duration(statistics, 200))
+
+    def test_phases_are_fitted_separately(self):
+        model = fake_analysis_model()
+        fake_completed_task(model, RUN, 100, 10)
+        fake_completed_task(model, GENERATE_INPUTS, 5, 10)
+
+        self.assertEqual(100, predict_duration(get_runtime_statistics(model.pk, RUN), 10))
+        self.assertEqual(5, predict_duration(get_runtime_statistics(model.pk, GENERATE_INPUTS), 10))
+
+    def test_task_has_not_started___task_is_not_recorded(self):
+        model = fake_analysis_model()
+        analysis = fake_analysis(model=model, task_started=None, task_finished=timezone.now())
+
+        record_task_runtime(analysis, RUN)
+
+        self.assertFalse(AnalysisRuntimeStatistics.objects.filter(count__gt=0).exists())
+
+
+class RuntimeEstimate(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.model = fake_analysis_model()
+        # 1 second per unit of work
+        fake_completed_task(self.model, RUN, 100, 100)
+        fake_completed_task(self.model, RUN, 200, 200)
+
+    def fake_active_analysis(self, status, queued=0, started=None, work=100):
+        return fake_analysis(
+            model=self.model,
+            status=status,
+            task_queued=self.now - timedelta(seconds=queued),
+            task_started=self.now - timedelta(seconds=started) if started is not None else None,
+            task_work=work,
+        )
+
+    def test_analysis_is_running___remaining_time_is_the_duration_less_the_elapsed_time(self):
+        analysis = self.fake_active_analysis(STATUS.RUN_STARTED, started=30, work=100)
+
+        estimate = get_runtime_estimate(analysis, now=self.now)
+
+        self.assertEqual(RUN, estimate['phase'])
+        self.assertAlmostEqual(100, estimate['duration'])
+        self.assertEqual(0, estimate['queue_wait'])
+        self.assertAlmostEqual(70, estimate['remaining'])
+        self.assertEqual(self.now + timedelta(seconds=estimate['remaining']), estimate['eta'])
+        self.assertEqual(2, estimate['samples'])
+
+    def test_analysis_is_queued___wait_is_the_work_ahead_shared_by_the_running_workers(self):
+        self.fake_active_analysis(STATUS.RUN_STARTED, queued=100, started=50, work=100)
+        self.fake_active_analysis(STATUS.RUN_STARTED, queued=100, started=10, work=100)
+        self.fake_active_analysis(STATUS.RUN_QUEUED, queued=20, work=200)
+        analysis = self.fake_active_analysis(STATUS.RUN_QUEUED, queued=10, work=50)
+        # Queued later, or on another model
+        self.fake_active_analysis(STATUS.RUN_QUEUED, queued=5, work=1000)
+        fake_analysis(status=STATUS.RUN_STARTED, task_started=self.now, task_work=1000)
+
+        estimate = get_runtime_estimate(analysis, now=self.now)
+
+        self.assertAlmostEqual((50 + 90 + 200) / 2, estimate['queue_wait'])
+        self.assertAlmostEqual(50, estimate['duration'])
+        self.assertAlmostEqual(170 + 50, estimate['remaining'])
+
+    def test_nothing_is_running___queue_is_served_by_one_worker(self):
+        self.fake_active_analysis(STATUS.RUN_QUEUED, queued=20, work=200)
+        analysis = self.fake_active_analysis(STATUS.RUN_QUEUED, queued=10, work=50)
+
+        self.assertAlmostEqual(200, get_runtime_estimate(analysis, now=self.now)['queue_wait'])
+
+    def test_analysis_is_ready___next_run_is_estimated_behind_the_whole_queue(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                self.fake_active_analysis(STATUS.RUN_QUEUED, queued=20, work=200)
+                analysis = fake_analysis(
+                    model=self.model,
+                    status=STATUS.READY,
+                    portfolio=fake_portfolio(exposure_statistics={'location_file': {'rows': 10}}),
+                    settings_file=fake_settings_file(number_of_samples=3, gul_output=True, gul_summaries=[{'id': 1, 'aalcalc': True}]),
+                )
+
+                estimate = get_runtime_estimate(analysis, now=self.now)
+
+                self.assertEqual(RUN, estimate['phase'])
+                self.assertAlmostEqual(30, estimate['duration'])
+                self.assertAlmostEqual(200, estimate['queue_wait'])
+                self.assertAlmostEqual(230, estimate['remaining'])
+
+    def test_model_has_no_completed_inputs_generation___estimate_is_unknown(self):
+        analysis = fake_analysis(status=STATUS.INPUTS_GENERATION_QUEUED, task_queued=self.now, task_work=10)
+
+        estimate = get_runtime_estimate(analysis, now=self.now)
+
+        self.assertEqual(GENERATE_INPUTS, estimate['phase'])
+        self.assertIsNone(estimate['duration'])
+        self.assertIsNone(estimate['eta'])
+        self.assertEqual(0, estimate['samples'])
+
+
+class RuntimeEstimateApi(WebTestMixin, TestCase):
+    def test_user_is_not_authenticated___response_is_forbidden(self):
+        analysis = fake_analysis()
+
+        response = self.app.get(analysis.get_absolute_runtime_estimate_url(), expect_errors=True)
+        self.assertIn(response.status_code, [401, 403])
+
+    def test_analysis_is_running___estimate_is_returned(self):
+        user = fake_user()
+        model = fake_analysis_model()
+        fake_completed_task(model, GENERATE_INPUTS, 60, 10)
+        analysis = fake_analysis(model=model, status=STATUS.INPUTS_GENERATION_STARTED, task_started=timezone.now(), task_work=10)
+
+        response = self.app.get(
+            analysis.get_absolute_runtime_estimate_url(),
+            headers={'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))},
+        )
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(GENERATE_INPUTS, response.json['phase'])
+        self.assertEqual(60, response.json['duration'])
+        self.assertEqual(0, response.json['queue_wait'])
+        self.assertLessEqual(response.json['remaining'], 60)
+        self.assertIsNotNone(response.json['eta'])
+        self.assertEqual(1, response.json['samples'])
+
+
+class RuntimeRecording(TestCase):
+    def test_run_is_queued___queue_time_and_work_are_recorded(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                analysis = fake_analysis(
+                    status=STATUS.READY,
+                    portfolio=fake_portfolio(exposure_statistics={'location_file': {'rows': 10}}),
+                    input_file=fake_related_file(),
+                    settings_file=fake_settings_file(number_of_samples=2),
+                    task_started=timezone.now(),
+                )
+                sig_res = Mock()
+                sig_res.delay.return_value.id = 'task'
+
+                with patch('src.server.oasisapi.analyses.models.Analysis.run_analysis_signature', PropertyMock(return_value=sig_res)):
+                    analysis.run(fake_user())
+
+                analysis.refresh_from_db()
+                self.assertIsNotNone(analysis.task_queued)
+                self.assertIsNone(analysis.task_started)
+                self.assertEqual(20, analysis.task_work)
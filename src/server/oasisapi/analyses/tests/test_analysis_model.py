@@ -1,14 +1,18 @@
 import string
+from urllib.parse import urlparse
 
 from backports.tempfile import TemporaryDirectory
 from celery import signature
-from django.test import override_settings
+from django.test import RequestFactory, override_settings
+from django.urls import resolve
 from django_webtest import WebTestMixin
 from hypothesis import given, settings
 from hypothesis.extra.django import TestCase
 from hypothesis.strategies import text, sampled_from
 from mock import patch, PropertyMock, Mock
 from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.reverse import reverse as drf_reverse
 
 from ...portfolios.tests.fakes import fake_portfolio
 from ...files.tests.fakes import fake_related_file
@@ -76,7 +80,8 @@ class AnalysisRun(WebTestMixin, TestCase):
                 sig_res = Mock()
                 sig_res.delay.return_value = res_factory(task_id)
 
-                with patch('src.server.oasisapi.analyses.models.Analysis.run_analysis_signature', PropertyMock(return_value=sig_res)):
+                with patch('django.db.transaction.on_commit', lambda f: f()), \
+                        patch('src.server.oasisapi.analyses.models.Analysis.run_analysis_signature', PropertyMock(return_value=sig_res)):
                     analysis.run(initiator)
 
                     sig_res.link.assert_called_once_with(record_run_analysis_result.s(analysis.pk, initiator.pk))
@@ -176,7 +181,8 @@ class AnalysisGenerateInputs(WebTestMixin, TestCase):
                 sig_res = Mock()
                 sig_res.delay.return_value = res_factory(task_id)
 
-                with patch('src.server.oasisapi.analyses.models.Analysis.generate_input_signature', PropertyMock(return_value=sig_res)):
+                with patch('django.db.transaction.on_commit', lambda f: f()), \
+                        patch('src.server.oasisapi.analyses.models.Analysis.generate_input_signature', PropertyMock(return_value=sig_res)):
                     analysis.generate_inputs(initiator)
 
                     sig_res.link.assert_called_once_with(record_generate_input_result.s(analysis.pk, initiator.pk))
@@ -240,3 +246,30 @@ class AnalysisGenerateInputs(WebTestMixin, TestCase):
                 self.assertEqual(sig.task, 'generate_input')
                 self.assertEqual(sig.args, (analysis.id, analysis.portfolio.location_file.file.name, None, None, None, None, []))
                 self.assertEqual(sig.options['queue'], analysis.model.queue_name)
+
+
+class AnalysisAbsoluteUrls(WebTestMixin, TestCase):
+    def fake_request(self, path, **extra):
+        request = Request(RequestFactory().get(path, **extra))
+        request.version = 'v1'
+        return request
+
+    @given(host=sampled_from(['testserver', 'example.com:8000']), secure=sampled_from([True, False]))
+    def test_urls_match_rest_framework_reverse(self, host, secure):
+        analysis = fake_analysis()
+        request = self.fake_request('/v1/analyses/', HTTP_HOST=host, secure=secure)
+
+        for name in dir(analysis):
+            if not name.startswith('get_absolute_') or not name.endswith('_url'):
+                continue
+            for r in [None, request]:
+                url = getattr(analysis, name)(request=r)
+                url_name = resolve(urlparse(url).path).url_name
+                self.assertEqual(drf_reverse(url_name, kwargs={'version': 'v1', 'pk': analysis.pk}, request=r), url)
+
+    def test_request_version_is_used(self):
+        analysis = fake_analysis()
+        request = self.fake_request('/v2/analyses/')
+        request.version = 'v2'
+
+        self.assertIn('/v2/analyses/{}/'.format(analysis.pk), analysis.get_absolute_url(request=request))
@@ -0,0 +1,140 @@
+import json
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.db import database_sync_to_async
+from django.test import override_settings
+from hypothesis.extra.django import TransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ...asgi import application
+from ...auth.tests.fakes import fake_user
+from ...portfolios.tests.fakes import fake_portfolio
+from ..models import Analysis
+from ..tasks import set_task_status
+from .fakes import fake_analysis
+
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+class WebsocketClient(ApplicationCommunicator):
+    """ Minimal WebSocket client for the ASGI application, `channels.testing`
+    imports daphne which the server tests do not need
+    """
+    def __init__(self, path, token=None):
+        super(WebsocketClient, self).__init__(application, {
+            'type': 'websocket',
+            'path': path,
+            'query_string': 'token={}'.format(token).encode() if token else b'',
+            'headers': [],
+            'subprotocols': [],
+        })
+
+    async def connect(self):
+        await self.send_input({'type': 'websocket.connect'})
+        return (await self.receive_output(1))['type'] == 'websocket.accept'
+
+    async def receive_json_from(self):
+        response = await self.receive_output(1)
+        assert response['type'] == 'websocket.send'
+        return json.loads(response['text'])
+
+    async def disconnect(self):
+        await self.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await self.wait(1)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, ANALYSIS_STATUS_FLUSH_INTERVAL=0)
+class AnalysisStatusSubscription(TransactionTestCase):
+    def communicator(self, path, user=None):
+        return WebsocketClient(path, AccessToken.for_user(user) if user is not None else None)
+
+    def test_user_is_not_authenticated___connection_is_rejected(self):
+        analysis = fake_analysis()
+
+        async def run():
+            communicator = self.communicator('/ws/v1/analyses/{}/status/'.format(analysis.pk))
+            connected = await communicator.connect()
+            await communicator.disconnect()
+            return connected
+
+        self.assertFalse(async_to_sync(run)())
+
+    def test_analysis_does_not_exist___connection_is_rejected(self):
+        user = fake_user()
+        analysis = fake_analysis()
+
+        async def run():
+            communicator = self.communicator('/ws/v1/analyses/{}/status/'.format(analysis.pk + 1), user)
+            connected = await communicator.connect()
+            await communicator.disconnect()
+            return connected
+
+        self.assertFalse(async_to_sync(run)())
+
+    def test_analysis_subscription___current_status_then_transitions_are_pushed(self):
+        user = fake_user()
+        analysis = fake_analysis(status=Analysis.status_choices.RUN_QUEUED)
+
+        async def run():
+            communicator = self.communicator('/ws/v1/analyses/{}/status/'.format(analysis.pk), user)
+            connected = await communicator.connect()
+            self.assertTrue(connected)
+            messages = [await communicator.receive_json_from()]
+
+            await database_sync_to_async(set_task_status)(analysis.pk, Analysis.status_choices.RUN_STARTED)
+            messages.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return messages
+
+        snapshot, update = async_to_sync(run)()
+
+        self.assertEqual(analysis.pk, snapshot['id'])
+        self.assertEqual(Analysis.status_choices.RUN_QUEUED, snapshot['status'])
+        self.assertEqual(analysis.pk, update['id'])
+        self.assertEqual(analysis.portfolio_id, update['portfolio'])
+        self.assertEqual(Analysis.status_choices.RUN_STARTED, update['status'])
+        self.assertIsNotNone(update['task_started'])
+
+    def test_portfolio_and_user_subscriptions___only_their_analyses_are_pushed(self):
+        user = fake_user()
+        portfolio = fake_portfolio()
+        analysis = fake_analysis(portfolio=portfolio, creator=user, status=Analysis.status_choices.RUN_QUEUED)
+        other = fake_analysis(status=Analysis.status_choices.RUN_QUEUED)
+
+        async def run():
+            by_portfolio = self.communicator('/ws/v1/portfolios/{}/status/'.format(portfolio.pk), user)
+            by_user = self.communicator('/ws/v1/analyses/status/', user)
+            self.assertTrue(await by_portfolio.connect())
+            self.assertTrue(await by_user.connect())
+
+            await database_sync_to_async(set_task_status)(other.pk, Analysis.status_choices.RUN_STARTED)
+            await database_sync_to_async(set_task_status)(analysis.pk, Analysis.status_choices.RUN_STARTED)
+            messages = [await by_portfolio.receive_json_from(), await by_user.receive_json_from()]
+            self.assertTrue(await by_portfolio.receive_nothing())
+            self.assertTrue(await by_user.receive_nothing())
+
+            await by_portfolio.disconnect()
+            await by_user.disconnect()
+            return messages
+
+        for message in async_to_sync(run)():
+            self.assertEqual(analysis.pk, message['id'])
+            self.assertEqual(Analysis.status_choices.RUN_STARTED, message['status'])
+
+    def test_save_does_not_change_the_status___nothing_is_pushed(self):
+        user = fake_user()
+        analysis = fake_analysis()
+
+        async def run():
+            communicator = self.communicator('/ws/v1/analyses/{}/status/'.format(analysis.pk), user)
+            await communicator.connect()
+            await communicator.receive_json_from()
+
+            analysis.name = 'renamed'
+            await database_sync_to_async(analysis.save)()
+            nothing = await communicator.receive_nothing()
+            await communicator.disconnect()
+            return nothing
+
+        self.assertTrue(async_to_sync(run)())
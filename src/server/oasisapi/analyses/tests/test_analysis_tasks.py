@@ -4,6 +4,7 @@ import datetime
 from backports.tempfile import TemporaryDirectory
 
 from django.test import override_settings
+from django.utils import timezone
 from hypothesis import given, settings
 from hypothesis.extra.django import TestCase
 from hypothesis.strategies import text
@@ -14,7 +15,8 @@ try:
 except ModuleNotFoundError:
     from hypothesis.strategies import sampled_from
 
-from ..models import Analysis
+from ..estimates import RUN
+from ..models import Analysis, AnalysisRuntimeStatistics
 from ...auth.tests.fakes import fake_user
 from ..tasks import record_run_analysis_result, record_run_analysis_failure, record_generate_input_result, record_generate_input_failure
 from .fakes import fake_analysis
@@ -37,7 +39,7 @@ class RunAnalysisSuccess(TestCase):
         with TemporaryDirectory() as d:
             with override_settings(MEDIA_ROOT=d):
                 initiator = fake_user()
-                analysis = fake_analysis()
+                analysis = fake_analysis(status=Analysis.status_choices.RUN_STARTED)
                 Path(d, output_location).touch()
                 Path(d, log_location).touch()
                 Path(d, traceback_location).touch()
@@ -72,6 +74,114 @@ class RunAnalysisSuccess(TestCase):
 
                 self.assertEqual(analysis.status, expected_status)
 
+    @given(
+        output_location=text(min_size=1, max_size=10, alphabet=string.ascii_letters),
+        output_index_location=text(min_size=1, max_size=10, alphabet=string.ascii_letters),
+    )
+    def test_output_index_location_is_returned___output_index_file_is_stored(self, output_location, output_index_location):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                initiator = fake_user()
+                analysis = fake_analysis(status=Analysis.status_choices.RUN_STARTED)
+                Path(d, output_location).touch()
+                Path(d, output_index_location).touch()
+
+                record_run_analysis_result(
+                    (
+                        os.path.join(d, output_location),
+                        None,
+                        None,
+                        0,
+                        os.path.join(d, output_index_location),
+                    ),
+                    analysis.pk,
+                    initiator.pk,
+                )
+
+                analysis.refresh_from_db()
+
+                self.assertEqual(analysis.output_file.file.name, output_location)
+                self.assertEqual(analysis.output_index_file.file.name, output_index_location)
+                self.assertEqual(analysis.output_index_file.content_type, 'application/json')
+
+    @given(
+        output_location=text(min_size=1, max_size=10, alphabet=string.ascii_letters),
+        columnar_location=text(min_size=1, max_size=10, alphabet=string.ascii_letters),
+        columnar_index_location=text(min_size=1, max_size=10, alphabet=string.ascii_letters),
+    )
+    def test_columnar_locations_are_returned___columnar_files_are_stored(self, output_location, columnar_location, columnar_index_location):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                initiator = fake_user()
+                analysis = fake_analysis(status=Analysis.status_choices.RUN_STARTED)
+                Path(d, output_location).touch()
+                Path(d, columnar_location).touch()
+                Path(d, columnar_index_location).touch()
+
+                record_run_analysis_result(
+                    (
+                        os.path.join(d, output_location),
+                        None,
+                        None,
+                        0,
+                        None,
+                        os.path.join(d, columnar_location),
+                        os.path.join(d, columnar_index_location),
+                    ),
+                    analysis.pk,
+                    initiator.pk,
+                )
+
+                analysis.refresh_from_db()
+
+                self.assertEqual(analysis.output_columnar_file.file.name, columnar_location)
+                self.assertEqual(analysis.output_columnar_file.content_type, 'application/x-tar')
+                self.assertEqual(analysis.output_columnar_index_file.file.name, columnar_index_location)
+                self.assertEqual(analysis.output_columnar_index_file.content_type, 'application/json')
+
+    @given(return_code=sampled_from([0, 1]))
+    def test_metrics_are_returned___metrics_are_stored_on_success(self, return_code):
+        metrics = {'total_tiv': 100.0, 'return_periods': [10], 'summary_levels': {}}
+
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                initiator = fake_user()
+                analysis = fake_analysis(status=Analysis.status_choices.RUN_STARTED, metrics={'total_tiv': 1.0})
+                Path(d, 'output.tar.gz').touch()
+
+                record_run_analysis_result(
+                    (os.path.join(d, 'output.tar.gz'), None, None, return_code, None, None, None, metrics),
+                    analysis.pk,
+                    initiator.pk,
+                )
+
+                analysis.refresh_from_db()
+
+                self.assertEqual(analysis.metrics, metrics if return_code == 0 else None)
+
+    @given(return_code=sampled_from([0, 1]))
+    def test_run_is_completed___runtime_is_recorded_for_the_model(self, return_code):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                initiator = fake_user()
+                analysis = fake_analysis(status=Analysis.status_choices.RUN_STARTED, task_started=timezone.now() - datetime.timedelta(seconds=60), task_work=100)
+                Path(d, 'output.tar.gz').touch()
+
+                record_run_analysis_result(
+                    (os.path.join(d, 'output.tar.gz'), None, None, return_code),
+                    analysis.pk,
+                    initiator.pk,
+                )
+
+                statistics = AnalysisRuntimeStatistics.objects.filter(model=analysis.model, phase=RUN).first()
+
+                if return_code == 0:
+                    self.assertEqual(statistics.count, 1)
+                    self.assertEqual(statistics.work_sum, 100)
+                    self.assertGreaterEqual(statistics.duration_sum, 60)
+                else:
+                    self.assertIsNone(statistics)
+
 
 class RunAnalysisFailure(TestCase):
     @given(traceback=text(min_size=1, max_size=10, alphabet=string.ascii_letters))
@@ -79,7 +189,7 @@ class RunAnalysisFailure(TestCase):
         with TemporaryDirectory() as d:
             with override_settings(MEDIA_ROOT=d):
                 initiator = fake_user()
-                analysis = fake_analysis()
+                analysis = fake_analysis(status=Analysis.status_choices.RUN_STARTED)
 
                 record_run_analysis_failure(analysis.pk, initiator.pk, traceback)
 
@@ -112,7 +222,7 @@ class GenerateInputsSuccess(TestCase):
                 Path(d, traceback_fp).touch()
 
                 initiator = fake_user()
-                analysis = fake_analysis()
+                analysis = fake_analysis(status=Analysis.status_choices.INPUTS_GENERATION_STARTED)
                 return_code = 0
 
                 record_generate_input_result((
@@ -155,7 +265,7 @@ class GenerateInputsFailure(TestCase):
         with TemporaryDirectory() as d:
             with override_settings(MEDIA_ROOT=d):
                 initiator = fake_user()
-                analysis = fake_analysis()
+                analysis = fake_analysis(status=Analysis.status_choices.INPUTS_GENERATION_STARTED)
 
                 record_generate_input_failure(analysis.pk, initiator.pk, traceback)
 
@@ -0,0 +1,212 @@
+from datetime import timedelta
+
+from backports.tempfile import TemporaryDirectory
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from hypothesis import settings
+from hypothesis.extra.django import TestCase
+from mock import patch
+
+from ...auth.tests.fakes import fake_user
+from ...files.models import RelatedFile
+from ...files.tests.fakes import fake_related_file
+from ..models import Analysis
+from ..tasks import record_run_analysis_result, replace_outputs, set_task_status
+from ..transitions import StatusEventBuffer, status_events, transition
+from .fakes import fake_analysis
+
+# Override default deadline for all tests to 8s
+settings.register_profile("ci", deadline=800.0)
+settings.load_profile("ci")
+
+STATUS = Analysis.status_choices
+
+
+@patch('src.server.oasisapi.analyses.transitions.dispatch_on_commit')
+@patch('src.server.oasisapi.analyses.transitions.push_status_on_commit')
+class Transition(TestCase):
+    def test_status_may_follow_the_current_status___analysis_is_moved_and_pushed(self, push_mock, dispatch_mock):
+        analysis = fake_analysis(status=STATUS.RUN_STARTED, name='name')
+        finished = timezone.now()
+
+        moved = transition([analysis.pk], STATUS.RUN_COMPLETED, task_finished=finished)
+
+        analysis.refresh_from_db()
+        self.assertEqual([analysis.pk], [a.pk for a in moved])
+        self.assertEqual(STATUS.RUN_COMPLETED, analysis.status)
+        self.assertEqual(finished, analysis.task_finished)
+        self.assertEqual('name', analysis.name)
+        push_mock.assert_called_once_with(moved[0])
+        dispatch_mock.assert_called_once_with({analysis.model_id})
+
+    def test_status_may_not_follow_the_current_status___nothing_is_written(self, push_mock, dispatch_mock):
+        analysis = fake_analysis(status=STATUS.RUN_CANCELLED)
+
+        moved = transition([analysis.pk], STATUS.RUN_COMPLETED, task_finished=timezone.now())
+
+        analysis.refresh_from_db()
+        self.assertEqual([], moved)
+        self.assertEqual(STATUS.RUN_CANCELLED, analysis.status)
+        self.assertIsNone(analysis.task_finished)
+        push_mock.assert_not_called()
+        dispatch_mock.assert_not_called()
+
+    def test_status_is_active___queue_is_not_dispatched(self, push_mock, dispatch_mock):
+        analysis = fake_analysis(status=STATUS.RUN_QUEUED)
+
+        transition([analysis.pk], STATUS.RUN_STARTED)
+
+        push_mock.assert_called_once()
+        dispatch_mock.assert_not_called()
+
+
+@patch('src.server.oasisapi.analyses.transitions.threading.Timer')
+@patch('src.server.oasisapi.analyses.transitions.push_status_on_commit')
+@override_settings(ANALYSIS_STATUS_FLUSH_INTERVAL=1)
+class StatusEvents(TestCase):
+    def test_events_are_buffered___they_are_written_on_flush(self, push_mock, timer_mock):
+        buffer = StatusEventBuffer()
+        analysis = fake_analysis(status=STATUS.RUN_QUEUED)
+
+        buffer.add(analysis.pk, STATUS.RUN_STARTED, timezone.now())
+
+        analysis.refresh_from_db()
+        self.assertEqual(STATUS.RUN_QUEUED, analysis.status)
+        timer_mock.assert_called_once_with(1, buffer._flush_from_timer)
+
+        buffer.flush()
+
+        analysis.refresh_from_db()
+        self.assertEqual(STATUS.RUN_STARTED, analysis.status)
+        timer_mock.return_value.cancel.assert_called_once()
+
+    def test_burst_of_events___one_update_for_each_status_with_the_time_of_each_event(self, push_mock, timer_mock):
+        buffer = StatusEventBuffer()
+        now = timezone.now()
+        runs = [fake_analysis(status=STATUS.RUN_QUEUED) for _ in range(3)]
+        inputs = [fake_analysis(status=STATUS.INPUTS_GENERATION_QUEUED) for _ in range(2)]
+        for i, analysis in enumerate(runs):
+            buffer.add(analysis.pk, STATUS.RUN_STARTED, now - timedelta(seconds=i))
+        for analysis in inputs:
+            buffer.add(analysis.pk, STATUS.INPUTS_GENERATION_STARTED, now)
+
+        with CaptureQueriesContext(connection) as queries:
+            moved = buffer.flush()
+
+        self.assertEqual(5, len(moved))
+        self.assertEqual(2, len([q for q in queries.captured_queries if q['sql'].startswith('UPDATE')]))
+        timer_mock.assert_called_once()
+        for i, analysis in enumerate(runs):
+            analysis.refresh_from_db()
+            self.assertEqual(STATUS.RUN_STARTED, analysis.status)
+            self.assertEqual(now - timedelta(seconds=i), analysis.task_started)
+
+    def test_event_is_repeated___the_last_is_kept(self, push_mock, timer_mock):
+        buffer = StatusEventBuffer()
+        now = timezone.now()
+        analysis = fake_analysis(status=STATUS.RUN_QUEUED)
+
+        buffer.add(analysis.pk, STATUS.RUN_STARTED, now - timedelta(seconds=5))
+        buffer.add(analysis.pk, STATUS.RUN_STARTED, now)
+        buffer.flush()
+
+        analysis.refresh_from_db()
+        self.assertEqual(now, analysis.task_started)
+
+    @override_settings(ANALYSIS_STATUS_FLUSH_INTERVAL=0)
+    def test_flush_interval_is_zero___task_status_is_written_immediately(self, push_mock, timer_mock):
+        analysis = fake_analysis(status=STATUS.RUN_QUEUED)
+
+        set_task_status(analysis.pk, STATUS.RUN_STARTED)
+
+        analysis.refresh_from_db()
+        self.assertEqual(STATUS.RUN_STARTED, analysis.status)
+        self.assertIsNotNone(analysis.task_started)
+        timer_mock.assert_not_called()
+
+    def test_result_is_recorded___buffered_started_event_is_written_first(self, push_mock, timer_mock):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                initiator = fake_user()
+                analysis = fake_analysis(status=STATUS.RUN_QUEUED)
+                set_task_status(analysis.pk, STATUS.RUN_STARTED)
+
+                with patch('src.server.oasisapi.analyses.transitions.dispatch_on_commit'):
+                    record_run_analysis_result((None, None, None, 1), analysis.pk, initiator.pk)
+
+                analysis.refresh_from_db()
+                self.assertEqual(STATUS.RUN_ERROR, analysis.status)
+                self.assertIsNotNone(analysis.task_started)
+                self.assertEqual({}, status_events.events)
+
+
+    def test_event_is_flushed_after_its_task_finished___start_time_is_kept_with_the_final_status(self, push_mock, timer_mock):
+        # The event was buffered by another worker-monitor process
+        buffer = StatusEventBuffer()
+        now = timezone.now()
+        finished = fake_analysis(status=STATUS.RUN_COMPLETED, task_finished=now)
+
+        buffer.add(finished.pk, STATUS.RUN_STARTED, now - timedelta(seconds=5))
+        buffer.flush()
+
+        finished.refresh_from_db()
+        self.assertEqual(STATUS.RUN_COMPLETED, finished.status)
+        self.assertEqual(now - timedelta(seconds=5), finished.task_started)
+
+    def test_event_of_an_earlier_run_is_flushed___start_time_is_not_replaced(self, push_mock, timer_mock):
+        buffer = StatusEventBuffer()
+        now = timezone.now()
+        analysis = fake_analysis(status=STATUS.RUN_COMPLETED, task_started=now - timedelta(seconds=5), task_finished=now)
+
+        buffer.add(analysis.pk, STATUS.RUN_STARTED, now - timedelta(seconds=60))
+        buffer.flush()
+
+        analysis.refresh_from_db()
+        self.assertEqual(now - timedelta(seconds=5), analysis.task_started)
+
+
+@patch('src.server.oasisapi.analyses.transitions.dispatch_on_commit')
+@patch('src.server.oasisapi.analyses.transitions.push_status_on_commit')
+class RecordResult(TestCase):
+    def test_run_was_cancelled___result_is_ignored(self, push_mock, dispatch_mock):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                initiator = fake_user()
+                analysis = fake_analysis(status=STATUS.RUN_CANCELLED)
+                files = RelatedFile.objects.count()
+
+                record_run_analysis_result(('output.tar.gz', None, 'logs.tar.gz', 0), analysis.pk, initiator.pk)
+
+                analysis.refresh_from_db()
+                self.assertEqual(STATUS.RUN_CANCELLED, analysis.status)
+                self.assertIsNone(analysis.output_file)
+                self.assertEqual(files, RelatedFile.objects.count())
+
+    def test_outputs_are_replaced___previous_files_are_deleted(self, push_mock, dispatch_mock):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                previous = fake_related_file()
+                analysis = fake_analysis(status=STATUS.RUN_STARTED, run_log_file=previous)
+                new = fake_related_file()
+
+                moved = replace_outputs(analysis, STATUS.RUN_COMPLETED, {'run_log_file': new})
+
+                self.assertEqual(new, moved.run_log_file)
+                self.assertFalse(RelatedFile.objects.filter(pk=previous.pk).exists())
+
+    def test_status_changed_before_the_update___new_files_are_deleted(self, push_mock, dispatch_mock):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                previous = fake_related_file()
+                analysis = fake_analysis(status=STATUS.RUN_STARTED, run_log_file=previous)
+                Analysis.objects.filter(pk=analysis.pk).update(status=STATUS.RUN_CANCELLED)
+                new = fake_related_file()
+
+                moved = replace_outputs(analysis, STATUS.RUN_COMPLETED, {'run_log_file': new})
+
+                analysis.refresh_from_db()
+                self.assertIsNone(moved)
+                self.assertEqual(previous, analysis.run_log_file)
+                self.assertFalse(RelatedFile.objects.filter(pk=new.pk).exists())
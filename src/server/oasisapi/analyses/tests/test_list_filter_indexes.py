@@ -0,0 +1,98 @@
+from django.apps import apps
+from django.db import DatabaseError
+from django.db.migrations.state import ProjectState
+from django.test import SimpleTestCase
+from mock import MagicMock, patch
+
+from ...indexes import CaseInsensitiveIndex
+
+
+class FakeSchemaEditor(object):
+    def __init__(self, vendor, trigram_installed=False, extension_error=None):
+        self.statements = []
+        self.extension_error = extension_error
+        self.connection = MagicMock(vendor=vendor, alias='default')
+        self.connection.cursor.return_value.__enter__.return_value.fetchone.return_value = (1, ) if trigram_installed else None
+        self.add_index = MagicMock()
+        self.remove_index = MagicMock()
+
+    def quote_name(self, name):
+        return '"{}"'.format(name)
+
+    def execute(self, sql):
+        if self.extension_error and sql.startswith('CREATE EXTENSION'):
+            raise self.extension_error
+        self.statements.append(sql)
+
+    def _create_index_name(self, table_name, column_names, suffix=''):
+        return '{}_{}_4f2ec1a9{}'.format(table_name, '_'.join(column_names), suffix)
+
+
+class CaseInsensitiveIndexOperation(SimpleTestCase):
+    def setUp(self):
+        self.state = ProjectState.from_apps(apps)
+        self.operation = CaseInsensitiveIndex('analysis', 'name')
+
+    def forwards(self, schema_editor):
+        with patch('src.server.oasisapi.indexes.transaction.atomic'):
+            self.operation.database_forwards('analyses', schema_editor, self.state, self.state)
+
+    def test_postgres_with_trigram_installed___upper_and_trigram_indexes_are_created(self):
+        schema_editor = FakeSchemaEditor('postgresql', trigram_installed=True)
+
+        self.forwards(schema_editor)
+
+        self.assertEqual(2, len(schema_editor.statements))
+        self.assertRegex(schema_editor.statements[0], r'^CREATE INDEX "analyses_analysis_name_\w+_upper" ON "analyses_analysis" \(UPPER\("name"::text\)\)$')
+        self.assertRegex(schema_editor.statements[1], r'^CREATE INDEX "analyses_analysis_name_\w+_trgm" ON "analyses_analysis" USING gin \(UPPER\("name"::text\) gin_trgm_ops\)$')
+
+    def test_postgres_without_trigram___extension_is_created(self):
+        schema_editor = FakeSchemaEditor('postgresql')
+
+        self.forwards(schema_editor)
+
+        self.assertEqual('CREATE EXTENSION IF NOT EXISTS pg_trgm', schema_editor.statements[1])
+        self.assertIn('gin_trgm_ops', schema_editor.statements[2])
+
+    def test_postgres_extension_cannot_be_created___only_upper_index_is_created(self):
+        schema_editor = FakeSchemaEditor('postgresql', extension_error=DatabaseError('permission denied'))
+
+        self.forwards(schema_editor)
+
+        self.assertEqual(1, len(schema_editor.statements))
+        self.assertIn('UPPER("name"::text)', schema_editor.statements[0])
+
+    def test_trigram_is_disabled___only_upper_index_is_created(self):
+        self.operation = CaseInsensitiveIndex('user', 'username', trigram=False, app_label='auth')
+        schema_editor = FakeSchemaEditor('postgresql', trigram_installed=True)
+
+        self.forwards(schema_editor)
+
+        self.assertEqual(1, len(schema_editor.statements))
+        self.assertRegex(schema_editor.statements[0], r'ON "auth_user" \(UPPER\("username"::text\)\)$')
+
+    def test_postgres_backwards___both_indexes_are_dropped(self):
+        schema_editor = FakeSchemaEditor('postgresql')
+
+        self.operation.database_backwards('analyses', schema_editor, self.state, self.state)
+
+        self.assertEqual(2, len(schema_editor.statements))
+        self.assertRegex(schema_editor.statements[0], r'^DROP INDEX IF EXISTS "analyses_analysis_name_\w+_upper"$')
+        self.assertRegex(schema_editor.statements[1], r'^DROP INDEX IF EXISTS "analyses_analysis_name_\w+_trgm"$')
+
+    def test_mysql___plain_index_is_added(self):
+        schema_editor = FakeSchemaEditor('mysql')
+
+        self.forwards(schema_editor)
+
+        self.assertEqual([], schema_editor.statements)
+        index = schema_editor.add_index.call_args[0][1]
+        self.assertEqual(['name'], index.fields)
+
+    def test_sqlite___nothing_is_created(self):
+        schema_editor = FakeSchemaEditor('sqlite')
+
+        self.forwards(schema_editor)
+
+        self.assertEqual([], schema_editor.statements)
+        schema_editor.add_index.assert_not_called()
@@ -0,0 +1,84 @@
+from django.db import router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from mock import Mock, patch
+
+from ...routers import PRIMARY_COOKIE, ReplicaRoutingMiddleware, use_primary
+from ..models import Analysis
+from ..tasks import record_run_analysis_failure
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'], DB_REPLICA_STICKY_SECONDS=10)
+class ReplicaRouting(SimpleTestCase):
+    def request(self, method='get', cookies=None, view=None):
+        """ Runs the view through the middleware, returns the response and the databases read by the view """
+        read = []
+
+        def get_response(request):
+            if view:
+                view()
+            read.append(router.db_for_read(Analysis))
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        return ReplicaRoutingMiddleware(get_response)(request), read
+
+    def test_outside_a_request___reads_use_the_primary(self):
+        self.assertEqual('default', router.db_for_read(Analysis))
+        self.assertEqual('default', router.db_for_write(Analysis))
+
+    def test_safe_request___reads_use_a_replica_and_client_is_not_pinned(self):
+        response, read = self.request('get')
+
+        self.assertEqual(['replica_0'], read)
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+    def test_unsafe_request___reads_use_the_primary_and_client_is_pinned(self):
+        response, read = self.request('post')
+
+        self.assertEqual(['default'], read)
+        self.assertEqual(10, response.cookies[PRIMARY_COOKIE]['max-age'])
+
+    def test_client_is_pinned___safe_request_reads_use_the_primary(self):
+        _, read = self.request('get', cookies={PRIMARY_COOKIE: '1'})
+
+        self.assertEqual(['default'], read)
+
+    def test_safe_request_writes___later_reads_use_the_primary_and_client_is_pinned(self):
+        response, read = self.request('get', view=lambda: router.db_for_write(Analysis))
+
+        self.assertEqual(['default'], read)
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+
+    def test_safe_request_reads_in_a_transaction___reads_use_the_primary(self):
+        with patch('src.server.oasisapi.routers.connections') as connections:
+            connections.__getitem__.return_value.in_atomic_block = True
+            _, read = self.request('get')
+
+        self.assertEqual(['default'], read)
+
+    def test_safe_request_uses_primary___reads_use_the_primary(self):
+        read = []
+
+        @use_primary()
+        def view():
+            read.append(router.db_for_read(Analysis))
+
+        _, after = self.request('get', view=view)
+
+        self.assertEqual(['default'], read)
+        self.assertEqual(['replica_0'], after)
+
+    def test_result_is_recorded_in_a_safe_request___it_reads_the_primary(self):
+        analysis = Mock(pk=1)
+        read = []
+
+        def get(*args, **kwargs):
+            read.append(router.db_for_read(Analysis))
+            return analysis
+
+        with patch.object(Analysis.objects, 'get', get):
+            self.request('get', view=lambda: record_run_analysis_failure(analysis.pk, 1, 'traceback'))
+
+        self.assertEqual(['default'], read)
@@ -0,0 +1,152 @@
+""" Status transitions of the analyses reported by the workers
+
+Each transition is a single conditional `UPDATE ... WHERE status IN (...)`, so a
+status is only written from the states it may follow. Late or repeated events,
+such as the result of a cancelled run, change nothing, and only the fields of
+the transition are written. The update skips the `post_save` handlers, so the
+status push and the release of the freed model queue slots are done here.
+
+The `set_task_status` events are buffered and applied every
+`ANALYSIS_STATUS_FLUSH_INTERVAL` seconds, one update for each status, keeping the
+last event of each analysis. Buffered events are lost if the worker-monitor
+process is killed before the flush.
+
+Each worker-monitor process has its own buffer, and the result tasks only flush
+the buffer of the process they run in. The worker-monitor is run with
+`--concurrency=1` so its events are applied in order. With several processes a
+`*_STARTED` event may be flushed after its task finished. It is then rejected,
+but its start time is still written to the finished analysis (`record_late_starts`).
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from .consumers import push_status_on_commit
+from .dispatch import QUEUED_STATES, STARTED_STATES, dispatch_on_commit
+
+logger = logging.getLogger(__name__)
+
+# The states each status may be written from by the worker-monitor
+TRANSITIONS = {
+    'INPUTS_GENERATION_STARTED': ['INPUTS_GENERATION_QUEUED'],
+    'READY': ['INPUTS_GENERATION_QUEUED', 'INPUTS_GENERATION_STARTED'],
+    'INPUTS_GENERATION_ERROR': ['INPUTS_GENERATION_QUEUED', 'INPUTS_GENERATION_STARTED'],
+    'RUN_STARTED': ['RUN_QUEUED'],
+    'RUN_COMPLETED': ['RUN_QUEUED', 'RUN_STARTED'],
+    'RUN_ERROR': ['RUN_QUEUED', 'RUN_STARTED'],
+}
+
+
+def can_transition(analysis, status):
+    return analysis.status in TRANSITIONS[status]
+
+
+def transition(pks, status, **fields):
+    """ Moves the analyses allowed to reach `status` to it, writing `fields` with it
+
+    :return: The moved analyses, reloaded
+    """
+    from .models import Analysis
+
+    pks = list(pks)
+    now = timezone.now()
+    with transaction.atomic():
+        updated = Analysis.objects.filter(pk__in=pks, status__in=TRANSITIONS[status]).update(status=status, modified=now, **fields)
+        if not updated:
+            return []
+
+        moved = list(Analysis.objects.filter(pk__in=pks, status=status, modified=now))
+        for analysis in moved:
+            push_status_on_commit(analysis)
+        if status not in QUEUED_STATES + STARTED_STATES:
+            dispatch_on_commit({a.model_id for a in moved})
+
+    return moved
+
+
+def record_late_starts(status, started):
+    """ Writes the start times of `status` events rejected because their task has
+    since finished, the status of the analyses is kept
+
+    :param started: The start time of each analysis pk
+    :return: The pks of the updated analyses
+    """
+    from .models import Analysis
+
+    finished_states = [s for s, sources in TRANSITIONS.items() if status in sources]
+    updated = []
+    for pk, when in started.items():
+        # A task queued again since has no finish time, so it is left alone
+        if Analysis.objects.filter(
+            pk=pk,
+            status__in=finished_states,
+            task_started__isnull=True,
+            task_finished__gte=when,
+        ).update(task_started=when):
+            updated.append(pk)
+    return updated
+
+
+class StatusEventBuffer(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = {}
+        self.timer = None
+
+    def add(self, analysis_pk, status, when):
+        """ Buffers a `*_STARTED` event, applied on the next flush
+        """
+        interval = settings.ANALYSIS_STATUS_FLUSH_INTERVAL
+        with self.lock:
+            self.events[analysis_pk] = (status, when)
+            if interval > 0 and self.timer is None:
+                self.timer = threading.Timer(interval, self._flush_from_timer)
+                self.timer.daemon = True
+                self.timer.start()
+
+        if interval <= 0:
+            self.flush()
+
+    def flush(self):
+        """ Applies the buffered events, one update for each status
+
+        :return: The moved analyses
+        """
+        with self.lock:
+            events, self.events = self.events, {}
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+        by_status = {}
+        for pk, (status, when) in events.items():
+            by_status.setdefault(status, {})[pk] = when
+
+        moved = []
+        for status, started in by_status.items():
+            moved += transition(
+                started,
+                status,
+                task_started=Case(*[When(pk=pk, then=Value(when)) for pk, when in started.items()], output_field=DateTimeField()),
+            )
+            rejected = set(started) - {a.pk for a in moved}
+            if rejected:
+                logger.info('Task Status Update: {} rejected for analyses {}'.format(status, sorted(rejected)))
+                record_late_starts(status, {pk: started[pk] for pk in rejected})
+        return moved
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Task Status Update: Failed')
+        finally:
+            # The timer thread has its own connection
+            connection.close()
+
+
+status_events = StatusEventBuffer()
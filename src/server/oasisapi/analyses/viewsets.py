@@ -1,8 +1,12 @@
 from __future__ import absolute_import
 
+from django.http import Http404
+from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import DateTimeField
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework.settings import api_settings
@@ -11,19 +15,31 @@ from drf_yasg.utils import swagger_auto_schema
 from django_filters import rest_framework as filters
 from django_filters import NumberFilter
 
+from .estimates import get_runtime_estimate
+from .bulk import handle_bulk_create, handle_bulk_generate_inputs, handle_bulk_run, handle_bulk_cancel
 from .models import Analysis
-from .serializers import AnalysisSerializer, AnalysisCopySerializer, AnalysisStorageSerializer
+from .output_query import handle_output_tables, handle_output_query
+from .serializers import AnalysisSerializer, AnalysisCopySerializer, AnalysisStorageSerializer, OutputQuerySerializer, \
+    BulkAnalysisCreateSerializer, BulkAnalysisSerializer
 
 from ..analysis_models.models import AnalysisModel
+from ..conditional import ConditionalGetMixin
 from ..data_files.serializers import DataFileSerializer
-from ..filters import TimeStampedFilter, CsvMultipleChoiceFilter, CsvModelMultipleChoiceFilter
-from ..files.views import handle_related_file, handle_json_data
-from ..files.serializers import RelatedFileSerializer
-from ..schemas.custom_swagger import FILE_RESPONSE
-from ..schemas.serializers import AnalysisSettingsSerializer 
+from ..filters import TimeStampedFilter, CsvMultipleChoiceFilter, CsvModelMultipleChoiceFilter, NumberInFilter
+from ..files.views import handle_related_file, handle_json_data, handle_presigned_upload, handle_presigned_upload_confirm, \
+    handle_archive_index, handle_archive_member
+from ..files.serializers import RelatedFileSerializer, PresignedUploadSerializer, PresignedUploadConfirmSerializer
+from ..schemas.custom_swagger import FILE_RESPONSE, ARCHIVE_MEMBER_NAME, SPARSE_FIELDS, SLIM, STATUS_SINCE
+from ..schemas.serializers import AnalysisSettingsSerializer, PresignedUploadResponseSerializer, ArchiveIndexSerializer, \
+    OutputTableSerializer, AnalysisMetricsSerializer, AnalysisStatusBatchSerializer, AnalysisRuntimeEstimateSerializer
 
 
 class AnalysisFilter(TimeStampedFilter):
+    id__in = NumberInFilter(
+        help_text=_('Filter results by the given comma separated list of ids'),
+        field_name='id',
+        label=_('Id in')
+    )
     name = filters.CharFilter(
         help_text=_('Filter results by case insensitive names equal to the given string'),
         lookup_expr='iexact'
@@ -68,6 +84,7 @@ class AnalysisFilter(TimeStampedFilter):
     class Meta:
         model = Analysis
         fields = [
+            'id__in',
             'name',
             'name__contains',
             'status',
@@ -81,7 +98,8 @@ class AnalysisFilter(TimeStampedFilter):
         super(AnalysisFilter, self).__init__(*args, **kwargs)
 
 
-class AnalysisViewSet(viewsets.ModelViewSet):
+@method_decorator(name='list', decorator=swagger_auto_schema(manual_parameters=[SPARSE_FIELDS, SLIM]))
+class AnalysisViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     list:
     Returns a list of Analysis objects.
@@ -116,6 +134,35 @@ class AnalysisViewSet(viewsets.ModelViewSet):
 
         /analyses/?model__in=2&model__in=3
 
+    To page through the analyses 100 at a time, most recently modified first
+    (follow the `next` link of the response for the following page)
+
+        /analyses/?page_size=100
+
+    To get only the `id,name,status` fields of each analysis
+
+        /analyses/?fields=id,name,status
+
+    To get the analyses without their file links
+
+        /analyses/?slim
+
+    To get the status of analyses `1`, `2` and `3` as columns
+
+        /analyses/status/?id__in=1,2,3
+
+    To get only the status of analyses modified since a previous status request
+    (its `cursor`)
+
+        /analyses/status/?since=2021-01-01T00:00:00.000000Z
+
+    To get when the queued or running task of analysis `1` is predicted to finish
+
+        /analyses/1/runtime_estimate/
+
+    Queued tasks are released to their model queue by a fair-share dispatcher, when the
+    queue is full a queued analysis is held by the server with its `queue_position` set.
+
     retrieve:
     Returns the specific analysis entry.
 
@@ -150,15 +197,52 @@ class AnalysisViewSet(viewsets.ModelViewSet):
                          'generate_inputs',
                          'cancel_generate_inputs']
 
+    presigned_upload_fields = {
+        'settings_file': ['application/json'],
+    }
+
+    conditional_detail_actions = ['retrieve', 'metrics']
+    conditional_file_actions = {
+        'settings_file': 'settings_file',
+        'input_file': 'input_file',
+        'lookup_errors_file': 'lookup_errors_file',
+        'lookup_success_file': 'lookup_success_file',
+        'lookup_validation_file': 'lookup_validation_file',
+        'summary_levels_file': 'summary_levels_file',
+        'input_generation_traceback_file': 'input_generation_traceback_file',
+        'output_file': 'output_file',
+        'output_file_index': 'output_file',
+        'output_file_member': 'output_file',
+        'output_tables': 'output_columnar_file',
+        'output_query': 'output_columnar_file',
+        'run_traceback_file': 'run_traceback_file',
+        'run_log_file': 'run_log_file',
+    }
+
+    def get_queryset(self):
+        queryset = super(AnalysisViewSet, self).get_queryset()
+        if self.action in ['list', 'retrieve']:
+            # File links only need the foreign key ids, the data files are fetched in one query
+            queryset = queryset.prefetch_related('complex_model_data_files')
+        return queryset
+
     def get_serializer_class(self):
         if self.action in ['retrieve', 'create', 'list', 'options', 'update', 'partial_update']:
             return super(AnalysisViewSet, self).get_serializer_class()
         elif self.action == 'copy':
             return AnalysisCopySerializer
+        elif self.action == 'bulk_create':
+            return BulkAnalysisCreateSerializer
+        elif self.action in ['bulk_generate_inputs', 'bulk_run', 'bulk_cancel']:
+            return BulkAnalysisSerializer
         elif self.action == 'data_files':
             return DataFileSerializer
         elif self.action == 'storage_links':
             return AnalysisStorageSerializer
+        elif self.action == 'presigned_upload':
+            return PresignedUploadSerializer
+        elif self.action == 'presigned_upload_confirm':
+            return PresignedUploadConfirmSerializer
         elif self.action in self.file_action_types:
             return RelatedFileSerializer
         else:
@@ -231,20 +315,65 @@ class AnalysisViewSet(viewsets.ModelViewSet):
     def copy(self, request, pk=None, version=None):
         """
         Copies an existing analysis, copying the associated input files and model and modifying
-        it's name (if none is provided) and resets the status, input errors and outputs
+        it's name (if none is provided) and resets the status, input errors and outputs.
+        With `share_inputs` the settings file and the generated inputs are shared by the
+        copy instead, it starts `READY` when the portfolio, model and complex model data
+        files are unchanged and the inputs of the analysis are complete
         """
         obj = self.get_object()
-        new_obj = obj.copy()
 
+        serializer = self.get_serializer(instance=obj, data=request.data, context=self.get_serializer_context(), partial=True)
+        serializer.is_valid(raise_exception=True)
+        share_inputs = serializer.validated_data.pop('share_inputs', False)
+        complex_model_data_files = list(obj.complex_model_data_files.all())
+
+        new_obj = obj.copy(share_settings=share_inputs, share_inputs=share_inputs and not serializer.changes_inputs(obj))
         new_obj.save()
         new_obj.creator = None
+        new_obj.complex_model_data_files.set(complex_model_data_files)
 
-        serializer = self.get_serializer(instance=new_obj, data=request.data, context=self.get_serializer_context(), partial=True)
-        serializer.is_valid(raise_exception=True)
+        serializer.instance = new_obj
         serializer.save()
 
         return Response(serializer.data)
 
+    @swagger_auto_schema(request_body=BulkAnalysisCreateSerializer, responses={201: AnalysisSerializer(many=True)})
+    @action(methods=['post'], detail=False)
+    def bulk_create(self, request, version=None):
+        """
+        Creates many analyses in one request, each with an optional `settings` object
+        stored as its settings file. Either all or none of the analyses are created,
+        errors are keyed by the index of the analysis in the request.
+        """
+        return handle_bulk_create(request)
+
+    @swagger_auto_schema(request_body=BulkAnalysisSerializer, responses={200: AnalysisSerializer(many=True)})
+    @action(methods=['post'], detail=False)
+    def bulk_generate_inputs(self, request, version=None):
+        """
+        Generates the inputs for many analyses, the tasks are published together.
+        Either all or none of the analyses are queued, errors are keyed by the analysis pk.
+        """
+        return handle_bulk_generate_inputs(request)
+
+    @swagger_auto_schema(request_body=BulkAnalysisSerializer, responses={200: AnalysisSerializer(many=True)})
+    @action(methods=['post'], detail=False)
+    def bulk_run(self, request, version=None):
+        """
+        Runs many analyses, the tasks are published together.
+        Either all or none of the analyses are queued, errors are keyed by the analysis pk.
+        """
+        return handle_bulk_run(request)
+
+    @swagger_auto_schema(request_body=BulkAnalysisSerializer, responses={200: AnalysisSerializer(many=True)})
+    @action(methods=['post'], detail=False)
+    def bulk_cancel(self, request, version=None):
+        """
+        Cancels the queued or running input generation or run of many analyses.
+        Either all or none of the analyses are cancelled, errors are keyed by the analysis pk.
+        """
+        return handle_bulk_cancel(request)
+
     @swagger_auto_schema(methods=['get'], responses={200: FILE_RESPONSE})
     @action(methods=['get', 'delete'], detail=True)
     def settings_file(self, request, pk=None, version=None):
@@ -265,6 +394,24 @@ class AnalysisViewSet(viewsets.ModelViewSet):
         """
         return handle_related_file(self.get_object(), 'settings_file', request, ['application/json'])
 
+    @swagger_auto_schema(request_body=PresignedUploadSerializer, responses={200: PresignedUploadResponseSerializer})
+    @action(methods=['post'], detail=True)
+    def presigned_upload(self, request, pk=None, version=None):
+        """
+        Issues a presigned S3 `post` or `put` URL for the analyses `settings_file`, so the file
+        is uploaded directly to the bucket instead of through the API server.
+        Once the upload completes send the returned `upload_token` to `presigned_upload_confirm`.
+        """
+        return handle_presigned_upload(self.get_object(), request, self.presigned_upload_fields)
+
+    @swagger_auto_schema(request_body=PresignedUploadConfirmSerializer, responses={200: RelatedFileSerializer})
+    @action(methods=['post'], detail=True)
+    def presigned_upload_confirm(self, request, pk=None, version=None):
+        """
+        Validates an object uploaded with a presigned URL and attaches it to the analysis
+        """
+        return handle_presigned_upload_confirm(self.get_object(), request, self.presigned_upload_fields)
+
     @swagger_auto_schema(methods=['get'], responses={200: FILE_RESPONSE})
     @action(methods=['get'], detail=True)
     def input_file(self, request, pk=None, version=None):
@@ -361,6 +508,118 @@ class AnalysisViewSet(viewsets.ModelViewSet):
         """
         return handle_related_file(self.get_object(), 'output_file', request, ['application/x-gzip', 'application/gzip', 'application/x-tar', 'application/tar'])
 
+    @swagger_auto_schema(responses={200: ArchiveIndexSerializer})
+    @action(methods=['get'], detail=True)
+    def output_file_index(self, request, pk=None, version=None):
+        """
+        Lists the files in the analyses `output_file` archive
+        """
+        return handle_archive_index(self.get_object(), 'output_file', 'output_index_file')
+
+    @swagger_auto_schema(manual_parameters=[ARCHIVE_MEMBER_NAME], responses={200: FILE_RESPONSE})
+    @action(methods=['get'], detail=True)
+    def output_file_member(self, request, pk=None, version=None):
+        """
+        Gets a single file from the analyses `output_file` archive without downloading the whole archive,
+        select the file with the `member` query parameter
+
+            /analyses/1/output_file_member/?member=output/gul_S1_aalcalc.csv
+        """
+        return handle_archive_member(self.get_object(), 'output_file', 'output_index_file', request)
+
+    @swagger_auto_schema(responses={200: OutputTableSerializer(many=True)})
+    @action(methods=['get'], detail=True)
+    def output_tables(self, request, pk=None, version=None):
+        """
+        Lists the output tables which can be queried with `output_query`, along with their columns and row counts
+        """
+        return handle_output_tables(self.get_object())
+
+    @swagger_auto_schema(query_serializer=OutputQuerySerializer, responses={200: FILE_RESPONSE})
+    @action(methods=['get'], detail=True)
+    def output_query(self, request, pk=None, version=None):
+        """
+        Runs a query on one of the analyses output tables, only the row groups and columns needed are read.
+        Results are paginated with `limit` and `offset`, and returned as JSON or CSV (`result_format=csv`)
+
+        ### Examples
+
+        Event losses for summary ids 1 and 2
+
+            /analyses/1/output_query/?table=gul_S1_eltcalc&filter=summary_id__in:1,2
+
+        Top 10 event losses
+
+            /analyses/1/output_query/?table=gul_S1_eltcalc&columns=event_id,mean&order_by=-mean&limit=10
+
+        Total mean loss per summary id
+
+            /analyses/1/output_query/?table=gul_S1_eltcalc&group_by=summary_id&agg=mean:sum
+        """
+        return handle_output_query(self.get_object(), request)
+
+    @swagger_auto_schema(manual_parameters=[STATUS_SINCE], responses={200: AnalysisStatusBatchSerializer})
+    @action(methods=['get'], detail=False, url_path='status')
+    def statuses(self, request, version=None):
+        """
+        Gets the `status`, `task_started`, `task_finished` and `modified` of the filtered analyses
+        as one list per field, ordered by `modified`. Pass the `cursor` of the response as `since`
+        to only get the analyses modified after it.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+
+        datetime_field = DateTimeField()
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since = datetime_field.to_internal_value(since)
+            except ValidationError as e:
+                raise ValidationError({'since': e.detail})
+            queryset = queryset.filter(modified__gt=since)
+
+        rows = list(
+            queryset.order_by('modified', 'pk')
+            .values_list('pk', 'status', 'task_started', 'task_finished', 'modified')
+        )
+        columns = list(zip(*rows)) or [()] * 5
+
+        def to_representation(values):
+            return [datetime_field.to_representation(v) if v else None for v in values]
+
+        return Response({
+            'cursor': datetime_field.to_representation(rows[-1][4]) if rows else (
+                datetime_field.to_representation(since) if since else None),
+            'id': list(columns[0]),
+            'status': list(columns[1]),
+            'task_started': to_representation(columns[2]),
+            'task_finished': to_representation(columns[3]),
+            'modified': to_representation(columns[4]),
+        })
+
+    @swagger_auto_schema(responses={200: AnalysisMetricsSerializer})
+    @action(methods=['get'], detail=True)
+    def metrics(self, request, pk=None, version=None):
+        """
+        Gets the headline metrics computed by the worker when the run completed, the AAL per summary level,
+        the EP curve losses at the standard return periods and the total insured value
+        """
+        analysis = self.get_object()
+        if analysis.metrics is None:
+            raise Http404()
+        return Response(analysis.metrics)
+
+    @swagger_auto_schema(responses={200: AnalysisRuntimeEstimateSerializer})
+    @action(methods=['get'], detail=True)
+    def runtime_estimate(self, request, pk=None, version=None):
+        """
+        Gets the predicted queue wait, duration and completion time of the queued or running task of the
+        analysis, for an idle analysis those of its next task (input generation or run) if it were queued now.
+        Predictions are fitted from the completed tasks of the model against the location count of the
+        portfolio, the number of samples and the outputs in the analysis settings.
+        """
+        estimate = get_runtime_estimate(self.get_object())
+        return Response(AnalysisRuntimeEstimateSerializer(estimate).data)
+
     @swagger_auto_schema(methods=['get'], responses={200: FILE_RESPONSE})
     @action(methods=['get', 'delete'], detail=True)
     def run_traceback_file(self, request, pk=None, version=None):
@@ -406,7 +665,7 @@ class AnalysisViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class AnalysisSettingsView(viewsets.ModelViewSet):
+class AnalysisSettingsView(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     list:
     Return the settings of an Analysis object.
@@ -414,6 +673,8 @@ class AnalysisSettingsView(viewsets.ModelViewSet):
     queryset = Analysis.objects.all()
     serializer_class = AnalysisSerializer
     filterset_class = AnalysisFilter
+    conditional_detail_actions = []
+    conditional_file_actions = {'analysis_settings': 'settings_file'}
 
     @swagger_auto_schema(methods=['get'], responses={200: AnalysisSettingsSerializer})
     @swagger_auto_schema(methods=['post'], request_body=AnalysisSettingsSerializer, responses={201: RelatedFileSerializer})
@@ -0,0 +1,35 @@
+# Generated by Django 3.1.7 on 2026-10-19 15:11
+
+from django.db import migrations, models
+
+import src.server.oasisapi.indexes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis_models', '0004_analysismodel_deleted'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='analysismodel',
+            index=models.Index(fields=['modified'], name='analysis_mo_modifie_44b12a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='analysismodel',
+            index=models.Index(fields=['created'], name='analysis_mo_created_fa19f9_idx'),
+        ),
+        src.server.oasisapi.indexes.CaseInsensitiveIndex(
+            model_name='analysismodel',
+            field_name='supplier_id',
+        ),
+        src.server.oasisapi.indexes.CaseInsensitiveIndex(
+            model_name='analysismodel',
+            field_name='model_id',
+        ),
+        src.server.oasisapi.indexes.CaseInsensitiveIndex(
+            model_name='analysismodel',
+            field_name='version_id',
+        ),
+    ]
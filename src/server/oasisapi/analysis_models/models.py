@@ -1,13 +1,12 @@
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
 from django.utils.translation import gettext_lazy as _
 from django.db import models
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
 from model_utils.models import TimeStampedModel
-from rest_framework.reverse import reverse
 
-from ..files.models import RelatedFile
+from ..files.models import RelatedFile, delete_related_files
+from ..reverse import reverse
 from ..data_files.models import DataFile
 
 
@@ -57,6 +56,10 @@ class AnalysisModel(TimeStampedModel):
 
     class Meta:
         unique_together = ('supplier_id', 'model_id', 'version_id')
+        indexes = [
+            models.Index(fields=['modified']),
+            models.Index(fields=['created']),
+        ]
 
     def __str__(self):
         return '{}-{}-{}'.format(self.supplier_id, self.model_id, self.version_id)
@@ -103,10 +106,4 @@ def delete_connected_files(sender, instance, **kwargs):
     files_for_removal = [
          'resource_file',
     ]
-    for ref in files_for_removal:
-        try:
-            file_ref = getattr(instance, ref)
-            if file_ref:
-                file_ref.delete()
-        except ObjectDoesNotExist:
-            pass
+    delete_related_files(instance, files_for_removal)
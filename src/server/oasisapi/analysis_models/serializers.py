@@ -2,9 +2,10 @@ from drf_yasg.utils import swagger_serializer_method
 from django.core.files import File
 from rest_framework import serializers
 
+from ..serializers import SparseFieldsMixin
 from .models import AnalysisModel
 
-class AnalysisModelSerializer(serializers.ModelSerializer):
+class AnalysisModelSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     resource_file = serializers.SerializerMethodField()
     settings = serializers.SerializerMethodField()
     versions = serializers.SerializerMethodField()
@@ -23,6 +24,14 @@ class AnalysisModelSerializer(serializers.ModelSerializer):
             'settings',
             'versions',
         )
+        slim_fields = (
+            'id',
+            'supplier_id',
+            'model_id',
+            'version_id',
+            'created',
+            'modified',
+        )
 
     def create(self, validated_data):
         data = validated_data.copy()
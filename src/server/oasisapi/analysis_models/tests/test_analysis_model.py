@@ -11,6 +11,8 @@ from hypothesis.strategies import text
 from rest_framework_simplejwt.tokens import AccessToken
 
 from ...auth.tests.fakes import fake_user
+from ...data_files.tests.fakes import fake_data_file
+from ...tests.queries import ListQueriesMixin
 from ..models import AnalysisModel
 
 from .fakes import fake_analysis_model
@@ -263,3 +265,14 @@ class ModelSettingsJson(WebTestMixin, TestCase):
                 self.assertDictEqual.__self__.maxDiff = None
                 self.assertDictEqual(json.loads(response.body), json_data)
                 self.assertEqual(response.content_type, 'application/json')
+
+
+class AnalysisModelListQueries(ListQueriesMixin, WebTestMixin, TestCase):
+    def fake_full_model(self):
+        fake_analysis_model().data_files.add(fake_data_file(), fake_data_file())
+
+    def test_number_of_models_grows___number_of_queries_is_constant(self):
+        self.assert_list_queries_are_constant(
+            reverse('analysis-model-list', kwargs={'version': 'v1'}),
+            self.fake_full_model,
+        )
@@ -5,6 +5,7 @@ import json
 import os
 
 from django.conf import settings
+from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
 from django_filters import rest_framework as filters
 from django.http import JsonResponse, Http404
@@ -18,11 +19,12 @@ from rest_framework.settings import api_settings
 from .models import AnalysisModel
 from .serializers import AnalysisModelSerializer, ModelVersionsSerializer
 
+from ..conditional import ConditionalGetMixin
 from ..data_files.serializers import DataFileSerializer
 from ..filters import TimeStampedFilter
 from ..files.views import handle_related_file, handle_json_data
 from ..files.serializers import RelatedFileSerializer
-from ..schemas.custom_swagger import FILE_RESPONSE
+from ..schemas.custom_swagger import FILE_RESPONSE, SPARSE_FIELDS, SLIM
 from ..schemas.serializers import ModelParametersSerializer
 
 
@@ -73,7 +75,8 @@ class AnalysisModelFilter(TimeStampedFilter):
         ]
 
 
-class AnalysisModelViewSet(viewsets.ModelViewSet):
+@method_decorator(name='list', decorator=swagger_auto_schema(manual_parameters=[SPARSE_FIELDS, SLIM]))
+class AnalysisModelViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     list:
     Returns a list of Model objects.
@@ -96,6 +99,19 @@ class AnalysisModelViewSet(viewsets.ModelViewSet):
 
         /models/?modified__lt=2000-01-01
 
+    To page through the models 100 at a time, most recently modified first
+    (follow the `next` link of the response for the following page)
+
+        /models/?page_size=100
+
+    To get only the `id,supplier_id,model_id` fields of each model
+
+        /models/?fields=id,supplier_id,model_id
+
+    To get the models without their file links
+
+        /models/?slim
+
     retrieve:
     Returns the specific model entry.
 
@@ -112,6 +128,13 @@ class AnalysisModelViewSet(viewsets.ModelViewSet):
     queryset = AnalysisModel.objects.all()
     serializer_class = AnalysisModelSerializer
     filterset_class = AnalysisModelFilter
+    conditional_file_actions = {'resource_file': 'resource_file'}
+
+    def get_queryset(self):
+        queryset = super(AnalysisModelViewSet, self).get_queryset()
+        if self.action in ['list', 'retrieve']:
+            queryset = queryset.prefetch_related('data_files')
+        return queryset
 
     def get_serializer_class(self):
         if self.action in ['resource_file', 'set_resource_file']:
@@ -192,10 +215,12 @@ class AnalysisModelViewSet(viewsets.ModelViewSet):
         return Response(df_serializer.data)
 
 
-class ModelSettingsView(viewsets.ModelViewSet):
+class ModelSettingsView(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = AnalysisModel.objects.all()
     serializer_class = AnalysisModelSerializer
     filterset_class = AnalysisModelFilter
+    conditional_detail_actions = []
+    conditional_file_actions = {'model_settings': 'resource_file'}
 
     @swagger_auto_schema(method='get', responses={200: ModelParametersSerializer})
     @swagger_auto_schema(method='post', request_body=ModelParametersSerializer, responses={201: RelatedFileSerializer})
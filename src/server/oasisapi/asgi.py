@@ -1,13 +1,27 @@
 """
 ASGI entrypoint. Configures Django and then runs the application
 defined in the ASGI_APPLICATION setting.
+
+HTTP requests are served by Django, apart from the file downloads and
+uploads in `routing.http_urlpatterns` which are streamed by async
+consumers. WebSocket connections are served by the channels consumers in
+`routing.websocket_urlpatterns`.
 """
 
 import os
 import django
-#from channels.routing import get_default_application
+from channels.auth import AuthMiddlewareStack
+from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "src.server.oasisapi.settings")
 django.setup()
-application = get_asgi_application()
+
+from .auth.middleware import JWTAuthMiddleware  # noqa: E402 (needs the apps loaded)
+from .files.streaming import StreamingFileRouter  # noqa: E402
+from .routing import http_urlpatterns, websocket_urlpatterns  # noqa: E402
+
+application = ProtocolTypeRouter({
+    'http': StreamingFileRouter(http_urlpatterns, get_asgi_application()),
+    'websocket': AuthMiddlewareStack(JWTAuthMiddleware(URLRouter(websocket_urlpatterns))),
+})
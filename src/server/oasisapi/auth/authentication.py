@@ -0,0 +1,152 @@
+""" JWT authentication resolving the token user from a per-process cache
+
+`CachedJWTAuthentication` keeps the users it loads for `JWT_USER_CACHE_TTL`
+seconds, at most `JWT_USER_CACHE_SIZE` of them (least recently used are
+dropped first), so polling clients do not load their user on every request.
+
+A user is invalidated when it is saved (e.g. deactivated) or deleted, and when
+one of its refresh tokens is blacklisted. The time of the invalidation is
+recorded in the Django cache and every process drops the entries loaded before
+it, so the cache must be shared between the server processes (`CACHE_BACKEND`).
+With the default in memory cache other processes keep the user until the TTL
+expires.
+
+With `JWT_TOKEN_USER_SAFE_METHODS` the GET, HEAD and OPTIONS requests are
+authenticated from the signed claims of the token only, as a `TokenUser`
+without any database query. A deactivated or deleted user can then read until
+its access token expires.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+
+def _invalidated_key(pk):
+    return 'oasisapi.auth.user_invalidated:{}'.format(pk)
+
+
+class UserCache(object):
+    """ Thread safe LRU cache of users with a TTL, sized from the settings
+    """
+    def __init__(self):
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, pk):
+        with self._lock:
+            entry = self._users.get(pk)
+            if entry is None:
+                return None
+
+            user, loaded, expires = entry
+            if expires <= time.monotonic():
+                del self._users[pk]
+                return None
+
+            self._users.move_to_end(pk)
+
+        # Invalidated, possibly by another process, since the user was loaded
+        invalidated = cache.get(_invalidated_key(pk))
+        if invalidated is not None and invalidated >= loaded:
+            with self._lock:
+                if self._users.get(pk) is entry:
+                    del self._users[pk]
+            return None
+
+        # Each request gets its own instance, so state cached on it is not shared
+        return copy.copy(user)
+
+    def set(self, pk, user, loaded):
+        """ Caches `user`, `loaded` is the `time.time()` before it was read
+        from the database so an invalidation while it was read is not missed
+        """
+        ttl = settings.JWT_USER_CACHE_TTL
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            self._users[pk] = (copy.copy(user), loaded, time.monotonic() + ttl)
+            self._users.move_to_end(pk)
+            while len(self._users) > settings.JWT_USER_CACHE_SIZE:
+                self._users.popitem(last=False)
+
+    def invalidate(self, pk):
+        """ Drops the user from this process and, through the shared cache,
+        from the other processes
+        """
+        if settings.JWT_USER_CACHE_TTL > 0:
+            # Entries older than the TTL have expired anyway
+            cache.set(_invalidated_key(pk), time.time(), timeout=settings.JWT_USER_CACHE_TTL)
+
+        with self._lock:
+            self._users.pop(pk, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def authenticate(self, request):
+        if not (settings.JWT_TOKEN_USER_SAFE_METHODS and request.method in SAFE_METHODS):
+            return super(CachedJWTAuthentication, self).authenticate(request)
+
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        return TokenUser(validated_token), validated_token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        user = user_cache.get(user_id)
+        if user is None:
+            loaded = time.time()
+            # Raises for unknown and inactive users, which are not cached
+            user = super(CachedJWTAuthentication, self).get_user(validated_token)
+            user_cache.set(user_id, user, loaded)
+        return user
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """ Drop a changed or deleted user from the cache
+    """
+    user_cache.invalidate(getattr(instance, api_settings.USER_ID_FIELD))
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def invalidate_blacklisted_token_user(sender, instance, **kwargs):
+    """ Drop the user of a blacklisted refresh token from the cache
+    """
+    user_id = instance.token.user_id
+    if user_id is not None:
+        user_cache.invalidate(user_id)
@@ -0,0 +1,44 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import CachedJWTAuthentication
+
+
+@database_sync_to_async
+def get_token_user(raw_token):
+    authentication = CachedJWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except AuthenticationFailed:
+        return None
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """ Authenticates WebSocket connections with an access token
+
+    Browsers can not set headers on a WebSocket handshake, so the token is read
+    from the `token` query param as well as the `Authorization: Bearer <token>`
+    header. Without a valid token the user set by the inner (session)
+    middleware is kept.
+    """
+
+    def get_raw_token(self, scope):
+        for name, value in scope.get('headers', []):
+            if name == b'authorization':
+                parts = value.split()
+                if len(parts) == 2 and parts[0].lower() == b'bearer':
+                    return parts[1]
+
+        token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+        return token[0].encode() if token else None
+
+    async def __call__(self, scope, receive, send):
+        raw_token = self.get_raw_token(scope)
+        if raw_token:
+            user = await get_token_user(raw_token)
+            if user is not None:
+                scope = dict(scope, user=user)
+        return await super().__call__(scope, receive, send)
@@ -0,0 +1,141 @@
+import time
+
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from hypothesis.extra.django import TestCase
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from ..authentication import CachedJWTAuthentication, UserCache, user_cache
+from .fakes import fake_user
+
+
+def fake_request(user, method='get'):
+    return getattr(RequestFactory(), method)('/', HTTP_AUTHORIZATION='Bearer {}'.format(AccessToken.for_user(user)))
+
+
+class CachedJWTAuthenticationUser(TestCase):
+    def setUp(self):
+        user_cache.clear()
+
+    def authenticate(self, request):
+        with CaptureQueriesContext(connection) as queries:
+            user, _ = CachedJWTAuthentication().authenticate(request)
+        return user, len(queries)
+
+    def test_user_is_authenticated_again___user_is_not_loaded(self):
+        user = fake_user()
+
+        first, first_queries = self.authenticate(fake_request(user))
+        second, second_queries = self.authenticate(fake_request(user))
+
+        self.assertEqual(user, first)
+        self.assertEqual(user, second)
+        self.assertEqual(1, first_queries)
+        self.assertEqual(0, second_queries)
+
+    def test_user_is_deactivated___authentication_fails(self):
+        user = fake_user()
+        self.authenticate(fake_request(user))
+
+        user.is_active = False
+        user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(fake_request(user))
+
+    def test_user_is_deleted___authentication_fails(self):
+        user = fake_user()
+        request = fake_request(user)
+        self.authenticate(request)
+
+        user.delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(request)
+
+    def test_refresh_token_is_blacklisted___user_is_loaded_again(self):
+        user = fake_user()
+        self.authenticate(fake_request(user))
+
+        RefreshToken.for_user(user).blacklist()
+
+        _, queries = self.authenticate(fake_request(user))
+        self.assertEqual(1, queries)
+
+    def test_cache_ttl_is_0___user_is_loaded_on_every_request(self):
+        user = fake_user()
+
+        with override_settings(JWT_USER_CACHE_TTL=0):
+            self.authenticate(fake_request(user))
+            _, queries = self.authenticate(fake_request(user))
+
+        self.assertEqual(1, queries)
+
+    def test_cache_is_full___least_recently_used_user_is_dropped(self):
+        first, second = fake_user(), fake_user()
+
+        with override_settings(JWT_USER_CACHE_SIZE=1):
+            self.authenticate(fake_request(first))
+            self.authenticate(fake_request(second))
+            _, second_queries = self.authenticate(fake_request(second))
+            _, first_queries = self.authenticate(fake_request(first))
+
+        self.assertEqual(0, second_queries)
+        self.assertEqual(1, first_queries)
+
+
+class UserCacheOtherProcess(TestCase):
+    # The cache of another server process, the processes share the django cache
+    def test_user_is_saved___user_is_dropped_from_the_other_process(self):
+        user = fake_user()
+        other = UserCache()
+        other.set(user.pk, user, time.time())
+
+        user.is_active = False
+        user.save()
+
+        self.assertIsNone(other.get(user.pk))
+
+    def test_refresh_token_is_blacklisted___user_is_dropped_from_the_other_process(self):
+        user = fake_user()
+        other = UserCache()
+        other.set(user.pk, user, time.time())
+
+        RefreshToken.for_user(user).blacklist()
+
+        self.assertIsNone(other.get(user.pk))
+
+    def test_user_is_loaded_after_the_invalidation___user_is_cached(self):
+        user = fake_user()
+        user.save()
+        other = UserCache()
+        other.set(user.pk, user, time.time())
+
+        self.assertEqual(user, other.get(user.pk))
+
+
+@override_settings(JWT_TOKEN_USER_SAFE_METHODS=True)
+class CachedJWTAuthenticationTokenUser(TestCase):
+    def setUp(self):
+        user_cache.clear()
+
+    def test_request_is_safe___token_user_is_authenticated_without_queries(self):
+        user = fake_user()
+
+        with CaptureQueriesContext(connection) as queries:
+            authenticated, _ = CachedJWTAuthentication().authenticate(fake_request(user))
+
+        self.assertIsInstance(authenticated, TokenUser)
+        self.assertEqual(user.pk, authenticated.pk)
+        self.assertEqual(0, len(queries))
+
+    def test_request_is_not_safe___user_is_loaded(self):
+        user = fake_user()
+
+        authenticated, _ = CachedJWTAuthentication().authenticate(fake_request(user, method='post'))
+
+        self.assertNotIsInstance(authenticated, TokenUser)
+        self.assertEqual(user, authenticated)
@@ -0,0 +1,154 @@
+import zlib
+
+import brotli
+import zstandard
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+
+class GzipCompressor(object):
+    def __init__(self):
+        # wbits 31 writes the gzip header and trailer
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliCompressor(object):
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=5)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class ZstdCompressor(object):
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+def get_compressors():
+    """ The compressor of each supported content coding
+    """
+    return {
+        'gzip': GzipCompressor,
+        'br': BrotliCompressor,
+        'zstd': ZstdCompressor,
+    }
+
+
+def get_accepted_encoding(accept_encoding):
+    """ The content coding to use for a request `Accept-Encoding` header, the
+    highest `q` value wins and ties go to the first of `COMPRESS_ENCODINGS`
+
+    :return: The coding or `None` to send the response uncompressed
+    """
+    if not accept_encoding:
+        return None
+
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qualities[coding.strip().lower()] = q
+
+    compressors = get_compressors()
+    candidates = []
+    for preference, coding in enumerate(settings.COMPRESS_ENCODINGS):
+        if coding not in compressors:
+            continue
+        q = qualities.get(coding, qualities.get('*', 0.0))
+        if q > 0:
+            candidates.append((-q, preference, coding))
+    return min(candidates)[2] if candidates else None
+
+
+def is_compressible(content_type, content_encoding=None, content_length=None):
+    """ Whether a response of the given type and size is worth compressing,
+    payloads that are already encoded (or archives such as `application/gzip`)
+    are left alone by the content type allow-list
+    """
+    if content_encoding:
+        return False
+    if content_length is not None and int(content_length) < settings.COMPRESS_MIN_SIZE:
+        return False
+    media_type = (content_type or '').split(';')[0].strip().lower()
+    return media_type in settings.COMPRESS_CONTENT_TYPES
+
+
+def compress_sequence(compressor, sequence):
+    """ Compress the chunks of a streaming response as they are produced
+    """
+    for item in sequence:
+        data = compressor.compress(item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def weak_etag(etag):
+    """ The compressed body is not byte for byte the same entity (RFC 7232 section 2.1)
+    """
+    return 'W/' + etag if etag and etag.startswith('"') else etag
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """ Negotiated gzip, brotli or zstd compression of the API responses
+
+    Responses are compressed when their content type is in
+    `COMPRESS_CONTENT_TYPES` and (when the size is known) they are at least
+    `COMPRESS_MIN_SIZE` bytes. Streaming responses are compressed chunk by
+    chunk and lose their `Content-Length`. Enabled by `DO_GZIP_RESPONSE`.
+    """
+
+    def process_response(self, request, response):
+        if response.status_code in (204, 304) or 'no-transform' in response.get('Cache-Control', ''):
+            return response
+
+        content_length = None if response.streaming else len(response.content)
+        if response.streaming and response.has_header('Content-Length'):
+            content_length = response['Content-Length']
+        if not is_compressible(response.get('Content-Type'), response.get('Content-Encoding'), content_length):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        coding = get_accepted_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if coding is None:
+            return response
+
+        compressor = get_compressors()[coding]()
+        if response.streaming:
+            response.streaming_content = compress_sequence(compressor, response.streaming_content)
+            del response['Content-Length']
+        else:
+            compressed_content = compressor.compress(response.content) + compressor.finish()
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response['Content-Length'] = str(len(response.content))
+
+        if response.has_header('ETag'):
+            response['ETag'] = weak_etag(response['ETag'])
+        response['Content-Encoding'] = coding
+        return response
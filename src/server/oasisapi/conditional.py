@@ -0,0 +1,117 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(model, action, version, media_type, query_string, key):
+    """ The `ETag` of a response, shared with the async file streaming views
+    so both send the same validators for the same file
+    """
+    parts = [model._meta.label_lower, action, version, media_type, query_string] + list(key)
+    return quote_etag(hashlib.md5('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest())
+
+
+class NotModified(Exception):
+    """ Raised from `ConditionalGetMixin.initial` to skip the handler
+    """
+    def __init__(self, response):
+        self.response = response
+
+
+class ConditionalGetMixin(object):
+    """ Adds `ETag` and `Last-Modified` headers to GET requests on `TimeStampedModel` viewsets
+
+    The validators are computed with a single query before the handler runs
+    (after authentication and permission checks), so a request with a matching
+    `If-None-Match` or `If-Modified-Since` header is answered with a
+    `304 Not Modified` without loading or serializing any objects.
+
+    * `list` uses the count and latest `modified` of the filtered queryset.
+      `Last-Modified` is not sent as deleting an object does not move it.
+    * `conditional_detail_actions` use the `modified` of the object.
+    * `conditional_file_actions` map an action to the `RelatedFile` field it
+      returns and use the id and `modified` of the file, so a file keeps its
+      validators while the status of its parent changes.
+
+    The query string, version and accepted media type are part of the `ETag`
+    so filters, pages and sparse fieldsets are cached separately.
+    """
+    conditional_detail_actions = ['retrieve']
+    conditional_file_actions = {}
+
+    def initial(self, request, *args, **kwargs):
+        super(ConditionalGetMixin, self).initial(request, *args, **kwargs)
+
+        self._conditional_headers = None
+        if request.method not in ('GET', 'HEAD'):
+            return
+
+        validators = self.get_conditional_validators()
+        if validators is None:
+            return
+
+        key, last_modified = validators
+        self._conditional_headers = {'ETag': self._make_etag(key)}
+        if last_modified is not None:
+            self._conditional_headers['Last-Modified'] = http_date(int(last_modified.timestamp()))
+
+        response = get_conditional_response(
+            request,
+            etag=self._conditional_headers['ETag'],
+            last_modified=int(last_modified.timestamp()) if last_modified is not None else None,
+        )
+        if response is not None:
+            raise NotModified(response)
+
+    def get_conditional_validators(self):
+        """ Returns `(key, last_modified)` for the current action, or `None` when
+        the response should not be cached (or the object does not exist)
+        """
+        action = getattr(self, 'action', None)
+        if action == 'list':
+            queryset = self.filter_queryset(self.get_queryset()).order_by()
+            stats = queryset.aggregate(last_modified=Max('modified'), count=Count('pk'))
+            return (stats['count'], stats['last_modified']), None
+
+        if action in self.conditional_detail_actions:
+            fields = ['modified']
+        elif action in self.conditional_file_actions:
+            field = self.conditional_file_actions[action]
+            fields = ['{}_id'.format(field), '{}__modified'.format(field)]
+        else:
+            return None
+
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None).select_related(None)
+        row = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]}).values_list(*fields).first()
+        if row is None or row[0] is None:
+            return None
+        return row, row[-1]
+
+    def _make_etag(self, key):
+        request = self.request
+        return make_etag(
+            self.get_queryset().model,
+            self.action,
+            request.version,
+            request.accepted_media_type,
+            request.META.get('QUERY_STRING', ''),
+            key,
+        )
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            for header, value in self._conditional_headers.items():
+                exc.response[header] = value
+            return exc.response
+        return super(ConditionalGetMixin, self).handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(ConditionalGetMixin, self).finalize_response(request, response, *args, **kwargs)
+        headers = getattr(self, '_conditional_headers', None)
+        if headers and response.status_code == 200:
+            for header, value in headers.items():
+                response.setdefault(header, value)
+        return response
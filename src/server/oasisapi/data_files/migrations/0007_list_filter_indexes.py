@@ -0,0 +1,31 @@
+# Generated by Django 3.1.7 on 2026-10-19 15:11
+
+from django.db import migrations, models
+
+import src.server.oasisapi.indexes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_files', '0006_datafile_file_category'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='datafile',
+            index=models.Index(fields=['modified'], name='data_files__modifie_5293b2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='datafile',
+            index=models.Index(fields=['created'], name='data_files__created_668ad8_idx'),
+        ),
+        src.server.oasisapi.indexes.CaseInsensitiveIndex(
+            model_name='datafile',
+            field_name='file_description',
+        ),
+        src.server.oasisapi.indexes.CaseInsensitiveIndex(
+            model_name='datafile',
+            field_name='file_category',
+        ),
+    ]
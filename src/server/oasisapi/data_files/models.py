@@ -2,9 +2,9 @@ from django.conf import settings
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from model_utils.models import TimeStampedModel
-from rest_framework.reverse import reverse
 
 from ..files.models import RelatedFile
+from ..reverse import reverse
 
 
 class DataFile(TimeStampedModel):
@@ -33,6 +33,12 @@ class DataFile(TimeStampedModel):
         related_name="content_data_file"
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['modified']),
+            models.Index(fields=['created']),
+        ]
+
     def __str__(self):
         return 'DataFile_{}'.format(self.file)
 
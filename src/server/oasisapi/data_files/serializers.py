@@ -1,10 +1,11 @@
 from drf_yasg.utils import swagger_serializer_method
 from rest_framework import serializers
 
+from ..serializers import SparseFieldsMixin
 from .models import DataFile
 
 
-class DataFileSerializer(serializers.ModelSerializer):
+class DataFileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     file = serializers.SerializerMethodField()
     filename = serializers.SerializerMethodField()
     stored = serializers.SerializerMethodField()
@@ -23,6 +24,13 @@ class DataFileSerializer(serializers.ModelSerializer):
             'stored',
             'content_type',
         )
+        slim_fields = (
+            'id',
+            'file_description',
+            'file_category',
+            'created',
+            'modified',
+        )
 
     @swagger_serializer_method(serializer_or_field=serializers.URLField)
     def get_file(self, instance):
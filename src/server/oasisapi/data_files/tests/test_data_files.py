@@ -13,6 +13,8 @@ from hypothesis.strategies import text, binary, sampled_from
 from rest_framework_simplejwt.tokens import AccessToken
 
 from ...auth.tests.fakes import fake_user
+from ...files.tests.fakes import fake_related_file
+from ...tests.queries import ListQueriesMixin
 from ..models import DataFile
 from .fakes import fake_data_file
 
@@ -125,3 +127,13 @@ class ComplexModelFileDataFile(WebTestMixin, TestCase):
 
                 self.assertEqual(response.body, file_content)
                 self.assertEqual(response.content_type, content_type)
+
+
+class DataFileListQueries(ListQueriesMixin, WebTestMixin, TestCase):
+    def test_number_of_data_files_grows___number_of_queries_is_constant(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                self.assert_list_queries_are_constant(
+                    reverse('data-file-list', kwargs={'version': 'v1'}),
+                    lambda: fake_data_file(file=fake_related_file()),
+                )
@@ -1,3 +1,4 @@
+from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
 from django_filters import rest_framework as filters
 from drf_yasg.utils import swagger_auto_schema
@@ -6,11 +7,12 @@ from rest_framework.decorators import action
 from rest_framework.parsers import MultiPartParser
 from rest_framework.settings import api_settings
 
+from ..conditional import ConditionalGetMixin
 from ..files.serializers import RelatedFileSerializer
 from ..files.views import handle_related_file
 from ..filters import TimeStampedFilter
 from .models import DataFile
-from ..schemas.custom_swagger import FILE_RESPONSE
+from ..schemas.custom_swagger import FILE_RESPONSE, SPARSE_FIELDS, SLIM
 from .serializers import DataFileSerializer
 
 
@@ -74,10 +76,54 @@ class DataFileFilter(TimeStampedFilter):
         ]
 
 
-class DataFileViewset(viewsets.ModelViewSet):
+@method_decorator(name='list', decorator=swagger_auto_schema(manual_parameters=[SPARSE_FIELDS, SLIM]))
+class DataFileViewset(ConditionalGetMixin, viewsets.ModelViewSet):
+    """
+    list:
+    Returns a list of DataFile objects.
+
+    ### Examples
+
+    To get all data files with 'foo' in their description
+
+        /data_files/?file_description__contains=foo
+
+    To page through the data files 100 at a time, most recently modified first
+    (follow the `next` link of the response for the following page)
+
+        /data_files/?page_size=100
+
+    To get only the `id,file_description` fields of each data file
+
+        /data_files/?fields=id,file_description
+
+    To get the data files without their file links
+
+        /data_files/?slim
+
+    retrieve:
+    Returns the specific data file entry.
+
+    create:
+    Creates a data file based on the input data
+
+    update:
+    Updates the specified data file
+
+    partial_update:
+    Partially updates the specified data file (only provided fields are updated)
+    """
+
     queryset = DataFile.objects.all()
     serializer_class = DataFileSerializer
     filterset_class = DataFileFilter
+    conditional_file_actions = {'content': 'file'}
+
+    def get_queryset(self):
+        queryset = super(DataFileViewset, self).get_queryset()
+        if self.action in ['list', 'retrieve']:
+            queryset = queryset.select_related('file')
+        return queryset
 
     def get_serializer_class(self):
         if self.action in ['content', 'set_content']:
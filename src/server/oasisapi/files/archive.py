@@ -0,0 +1,102 @@
+import io
+import json
+import zlib
+
+from ....common.data import ARCHIVE_INDEX_FORMAT, UNCOMPRESSED_ARCHIVE_INDEX_FORMAT
+
+
+def get_archive_index(index_file):
+    """ Load the member index written by the worker alongside an archive
+
+    :param index_file: `RelatedFile` holding the JSON index
+    :return: The index dict, or `None` if there is no index or its format is unknown
+    """
+    if not index_file:
+        return None
+
+    with index_file.file.open('rb') as f:
+        index = json.load(f)
+    if index.get('format') not in [ARCHIVE_INDEX_FORMAT, UNCOMPRESSED_ARCHIVE_INDEX_FORMAT]:
+        return None
+    return index
+
+
+def find_archive_member(members, name):
+    """ Match `name` against the full member path, or the path below the top level directory
+    """
+    for member in members:
+        if member['name'] == name:
+            return member
+    for member in members:
+        if member['name'].split('/', 1)[-1] == name:
+            return member
+    return None
+
+
+def iter_archive_member(archive_file, index, member, chunk_size=64 * 1024):
+    """ Stream a single member of an indexed archive
+
+    Only the byte range of the member is read, gzip members are
+    decompressed on the fly.
+    """
+    if index['format'] == UNCOMPRESSED_ARCHIVE_INDEX_FORMAT:
+        yield from archive_file.read_range(member['offset'] + member['data_offset'], member['size'], chunk_size)
+        return
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    skip = member['data_offset']
+    remaining = member['size']
+
+    for chunk in archive_file.read_range(member['offset'], member['length'], chunk_size):
+        content = decompressor.decompress(chunk)
+        if skip:
+            skipped = min(skip, len(content))
+            content = content[skipped:]
+            skip -= skipped
+        if content and remaining:
+            content = content[:remaining]
+            remaining -= len(content)
+            yield content
+        if not remaining:
+            break
+
+
+class ArchiveMemberFile(io.RawIOBase):
+    """ Read only, seekable file object over a member of an uncompressed indexed archive
+
+    Each read is a range read on the archive, so readers which seek (such
+    as Parquet) only fetch the parts of the member they need.
+    """
+    def __init__(self, archive_file, member):
+        super(ArchiveMemberFile, self).__init__()
+        self.archive_file = archive_file
+        self.start = member['offset'] + member['data_offset']
+        self.size = member['size']
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def readinto(self, b):
+        length = min(len(b), self.size - self.position)
+        if length <= 0:
+            return 0
+
+        data = b''.join(self.archive_file.read_range(self.start + self.position, length))
+        b[:len(data)] = data
+        self.position += len(data)
+        return len(data)
@@ -0,0 +1,183 @@
+""" Batched background deletion of the stored files
+
+Deleting a `RelatedFile` queues its stored file as a `StoredFileDeletion` in the
+same transaction. Once it commits, a single `delete_stored_files` task is sent
+for the transaction. The task deletes the queued files in batches of
+`FILE_DELETE_BATCH_SIZE`: with `DeleteObjects` requests on S3, and with
+`FILE_DELETE_THREADS` parallel unlinks on a shared filesystem.
+
+A failed deletion is retried after `FILE_DELETE_RETRY_DELAY` seconds, with the
+delay doubling on each attempt up to a day. Files still referenced by a
+`RelatedFile` are never deleted. `find_orphaned_files` lists the stored files no
+`RelatedFile` references, see the `sweep_stored_files` command.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Time a task has to delete the files it claimed before they are claimed again
+CLAIM_TIMEOUT = timedelta(minutes=10)
+MAX_RETRY_DELAY = timedelta(days=1)
+
+
+def _chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def queue_file_deletion(names, send_task=True):
+    """ Queue the stored files for deletion, the deletion task is sent once the
+    current transaction commits unless `send_task` is false
+    """
+    from .models import StoredFileDeletion
+
+    names = [name for name in names if name]
+    if not names:
+        return
+
+    StoredFileDeletion.objects.bulk_create([StoredFileDeletion(name=name) for name in names])
+    if not send_task:
+        return
+
+    # One task for all the files deleted in the transaction
+    connection = transaction.get_connection()
+    if connection.in_atomic_block and any(entry[1] is _send_task for entry in connection.run_on_commit):
+        return
+    transaction.on_commit(_send_task)
+
+
+def _send_task():
+    from .tasks import delete_stored_files
+
+    try:
+        delete_stored_files.delay()
+    except Exception:
+        logger.exception('Failed to send the stored file deletion task, the files are deleted by the next task or sweep')
+
+
+def delete_from_storage(names, storage=None):
+    """ Deletes the files from the storage
+
+    :return: The error of each file which could not be deleted
+    """
+    storage = storage or default_storage
+    names = list(names)
+    errors = {}
+
+    if hasattr(storage, 'bucket'):
+        for chunk in _chunks(names, settings.FILE_DELETE_BATCH_SIZE):
+            keys = {storage._normalize_name(storage._clean_name(name)): name for name in chunk}
+            try:
+                response = storage.bucket.delete_objects(Delete={
+                    'Objects': [{'Key': key} for key in keys],
+                    'Quiet': True,
+                })
+            except Exception as e:
+                errors.update({name: str(e) for name in chunk})
+                continue
+            for error in response.get('Errors', []):
+                errors[keys.get(error['Key'], error['Key'])] = '{}: {}'.format(error.get('Code'), error.get('Message'))
+    else:
+        def delete(name):
+            try:
+                storage.delete(name)
+            except Exception as e:
+                return name, str(e)
+
+        with ThreadPoolExecutor(max_workers=settings.FILE_DELETE_THREADS) as pool:
+            errors.update(e for e in pool.map(delete, names) if e)
+
+    return errors
+
+
+def _claim(batch_size):
+    """ Claims the due deletions for this task, so concurrent tasks skip them
+    """
+    from .models import StoredFileDeletion
+
+    now = timezone.now()
+    claimed_until = now + CLAIM_TIMEOUT
+    due = list(
+        StoredFileDeletion.objects.filter(next_attempt__lte=now).order_by('next_attempt', 'pk').values_list('pk', flat=True)[:batch_size]
+    )
+    StoredFileDeletion.objects.filter(pk__in=due, next_attempt__lte=now).update(next_attempt=claimed_until)
+    return list(StoredFileDeletion.objects.filter(pk__in=due, next_attempt=claimed_until))
+
+
+def delete_queued_files(storage=None):
+    """ Deletes the queued files which are due
+
+    :return: Seconds until the first retry of the deletions which failed, `None` when none failed
+    """
+    from .models import RelatedFile, StoredFileDeletion
+
+    retry_at = None
+    while True:
+        claimed = _claim(settings.FILE_DELETE_BATCH_SIZE)
+        if not claimed:
+            break
+
+        names = {d.name for d in claimed}
+        # The file may be shared with, or have been reused by, another `RelatedFile`
+        referenced = set(RelatedFile.objects.filter(file__in=names).values_list('file', flat=True))
+        errors = delete_from_storage(names - referenced, storage=storage)
+
+        StoredFileDeletion.objects.filter(pk__in=[d.pk for d in claimed if d.name not in errors]).delete()
+
+        failed = [d for d in claimed if d.name in errors]
+        now = timezone.now()
+        for deletion in failed:
+            deletion.attempts += 1
+            deletion.last_error = errors[deletion.name]
+            deletion.next_attempt = now + min(timedelta(seconds=settings.FILE_DELETE_RETRY_DELAY * 2 ** (deletion.attempts - 1)), MAX_RETRY_DELAY)
+            retry_at = min(retry_at or deletion.next_attempt, deletion.next_attempt)
+            logger.warning('Failed to delete stored file {} (attempt {}): {}'.format(deletion.name, deletion.attempts, deletion.last_error))
+        StoredFileDeletion.objects.bulk_update(failed, ['attempts', 'last_error', 'next_attempt'])
+
+    if retry_at is None:
+        return None
+    return max((retry_at - timezone.now()).total_seconds(), 0)
+
+
+def _list_stored_files(storage, prefix=''):
+    """ Yields the name and modified time of each stored file under `prefix`
+    """
+    if hasattr(storage, 'bucket'):
+        location = storage._normalize_name('')
+        for obj in storage.bucket.objects.filter(Prefix=location + prefix):
+            yield obj.key[len(location):], obj.last_modified
+    else:
+        root = storage.location
+        for dirpath, _, filenames in os.walk(os.path.join(root, prefix) if prefix else root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                if name.startswith(prefix):
+                    yield name, datetime.fromtimestamp(os.path.getmtime(path), tz=dt_timezone.utc)
+
+
+def find_orphaned_files(min_age, prefix='', storage=None):
+    """ The stored files not referenced by a `RelatedFile` nor already queued for
+    deletion, modified at least `min_age` ago (so uploads in progress are left alone)
+    """
+    from .models import RelatedFile, StoredFileDeletion
+
+    storage = storage or default_storage
+    modified_before = timezone.now() - min_age
+    old = (name for name, modified in _list_stored_files(storage, prefix) if modified <= modified_before)
+
+    orphaned = []
+    for chunk in _chunks(old, settings.FILE_DELETE_BATCH_SIZE):
+        known = set(RelatedFile.objects.filter(file__in=chunk).values_list('file', flat=True))
+        known.update(StoredFileDeletion.objects.filter(name__in=chunk).values_list('name', flat=True))
+        orphaned += [name for name in chunk if name not in known]
+    return orphaned
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from ...deletion import delete_queued_files, find_orphaned_files, queue_file_deletion
+
+
+class Command(BaseCommand):
+    help = 'Deletes the queued stored files which are due, and lists or deletes the stored files no longer referenced'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=24,
+                            help='Only sweep files last modified at least this many hours ago (default 24)')
+        parser.add_argument('--prefix', default='',
+                            help='Only sweep files whose name starts with the prefix')
+        parser.add_argument('--delete', action='store_true',
+                            help='Delete the orphaned files, by default they are only listed')
+
+    def handle(self, *args, **options):
+        delete_queued_files()
+
+        orphaned = find_orphaned_files(timedelta(hours=options['min_age']), prefix=options['prefix'])
+        for name in orphaned:
+            self.stdout.write(name)
+
+        if options['delete'] and orphaned:
+            queue_file_deletion(orphaned, send_task=False)
+            self.stdout.write('Queued {} orphaned files for deletion'.format(len(orphaned)))
+            delete_queued_files()
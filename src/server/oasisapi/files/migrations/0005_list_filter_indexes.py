@@ -0,0 +1,21 @@
+from django.db import migrations
+
+import src.server.oasisapi.indexes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0004_remove_relatedfile_aws_location'),
+    ]
+
+    operations = [
+        src.server.oasisapi.indexes.CaseInsensitiveIndex(
+            model_name='relatedfile',
+            field_name='filename',
+        ),
+        src.server.oasisapi.indexes.CaseInsensitiveIndex(
+            model_name='relatedfile',
+            field_name='content_type',
+        ),
+    ]
@@ -3,9 +3,15 @@ from uuid import uuid4
 
 from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from django_cleanup import cleanup
 from model_utils.models import TimeStampedModel
 
+from .deletion import queue_file_deletion
+
 
 def random_file_name(instance, filename):
     if instance.store_as_filename:
@@ -59,6 +65,8 @@ def file_storage_link(storage_obj, fullpath=False):
            return storage_obj.file.name
 
 
+# Stored files are deleted in the background by `files.deletion`
+@cleanup.ignore
 class RelatedFile(TimeStampedModel):
     creator = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True)
     file = models.FileField(help_text=_('The file to store'), upload_to=random_file_name)
@@ -72,3 +80,55 @@ class RelatedFile(TimeStampedModel):
 
     def read(self, *args, **kwargs):
         return self.file.read(*args, **kwargs)
+
+    def read_range(self, offset, length, chunk_size=64 * 1024):
+        """ Yield `length` bytes of the stored file starting at `offset`
+
+        Issues a ranged GET for S3 storage and seeks on the local filesystem,
+        so only the requested bytes are read from the backend.
+        """
+        if length <= 0:
+            return
+
+        storage = self.file.storage
+        if hasattr(storage, 'bucket'):
+            body = storage.bucket.Object(os.path.join(storage.location, self.file.name)).get(
+                Range='bytes={}-{}'.format(offset, offset + length - 1)
+            )['Body']
+            yield from body.iter_chunks(chunk_size)
+        else:
+            with storage.open(self.file.name, 'rb') as f:
+                f.seek(offset)
+                while length > 0:
+                    chunk = f.read(min(chunk_size, length))
+                    if not chunk:
+                        break
+                    length -= len(chunk)
+                    yield chunk
+
+
+def delete_related_files(instance, fields):
+    """ Deletes the `RelatedFile` objects referenced by `fields` of `instance` in
+    one query, their stored files are queued for deletion
+    """
+    pks = [getattr(instance, '{}_id'.format(field)) for field in fields]
+    RelatedFile.objects.filter(pk__in=[pk for pk in pks if pk is not None]).delete()
+
+
+class StoredFileDeletion(models.Model):
+    name = models.CharField(max_length=1024, help_text=_('The name of the file in the default storage'))
+    queued = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return self.name
+
+
+@receiver(post_delete, sender=RelatedFile)
+def queue_stored_file_deletion(sender, instance, **kwargs):
+    """ Post delete handler queueing the deletion of the stored file
+    """
+    if instance.file:
+        queue_file_deletion([instance.file.name])
@@ -49,3 +49,39 @@ class RelatedFileSerializer(serializers.ModelSerializer):
         if self.content_types and mapped_content_type not in self.content_types:
             raise ValidationError('File should be one of [{}]'.format(', '.join(self.content_types)))
         return value
+
+
+class PresignedUploadSerializer(serializers.Serializer):
+    field = serializers.ChoiceField(choices=[], help_text='The file field to upload to, e.g. `location_file`')
+    filename = serializers.CharField(max_length=255, help_text='Original name of the file being uploaded')
+    content_type = serializers.CharField(max_length=255, help_text='Mime type of the file being uploaded')
+    method = serializers.ChoiceField(choices=['post', 'put'], default='post', help_text='HTTP method the client will use for the upload')
+
+    def __init__(self, *args, field_content_types=None, **kwargs):
+        self.field_content_types = field_content_types or {}
+        super(PresignedUploadSerializer, self).__init__(*args, **kwargs)
+        self.fields['field'].choices = list(self.field_content_types.keys())
+
+    def validate(self, attrs):
+        content_types = self.field_content_types.get(attrs['field'])
+        mapped_content_type = CONTENT_TYPE_MAPPING.get(attrs['content_type'], attrs['content_type'])
+        if content_types and mapped_content_type not in content_types:
+            raise ValidationError({'content_type': 'File should be one of [{}]'.format(', '.join(content_types))})
+        attrs['content_type'] = mapped_content_type
+        return attrs
+
+    def create(self, validated_data):
+        raise NotImplementedError()
+
+    def update(self, instance, validated_data):
+        raise NotImplementedError()
+
+
+class PresignedUploadConfirmSerializer(serializers.Serializer):
+    upload_token = serializers.CharField(help_text='The `upload_token` returned when the upload URL was issued')
+
+    def create(self, validated_data):
+        raise NotImplementedError()
+
+    def update(self, instance, validated_data):
+        raise NotImplementedError()
@@ -0,0 +1,274 @@
+import json
+import tempfile
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.exceptions import StopConsumer
+from channels.generic.http import AsyncHttpConsumer
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.http import Http404
+from django.http.multipartparser import parse_header
+from django.utils.encoding import force_str
+from django.utils.http import http_date
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+
+from ..auth.middleware import get_token_user
+from ..compression import get_accepted_encoding, get_compressors, is_compressible, weak_etag
+from ..conditional import make_etag
+from .views import _save_related_file, _get_content_disposition
+
+# Media types of the `Accept` header negotiated to the JSON renderer by the REST views
+ACCEPTED_MEDIA_TYPES = {'*/*', 'application/*', 'application/json'}
+
+
+def _get_headers(scope):
+    return {name.lower(): value for name, value in scope.get('headers', [])}
+
+
+def _get_upload_filename(headers):
+    """ The filename of a raw upload, from its `Content-Disposition` header
+    as read by `rest_framework.parsers.FileUploadParser`
+    """
+    disposition = headers.get(b'content-disposition')
+    if not disposition:
+        return None
+
+    # `filename*` is decoded to `filename`
+    _, params = parse_header(disposition)
+    filename = params.get('filename')
+    return force_str(filename) if filename else None
+
+
+def _get_security_headers():
+    """ The headers set by the security and clickjacking middleware on the Django views
+    """
+    headers = []
+    if settings.SECURE_CONTENT_TYPE_NOSNIFF:
+        headers.append((b'X-Content-Type-Options', b'nosniff'))
+    if settings.SECURE_REFERRER_POLICY:
+        headers.append((b'Referrer-Policy', settings.SECURE_REFERRER_POLICY.encode()))
+    headers.append((b'X-Frame-Options', getattr(settings, 'X_FRAME_OPTIONS', 'DENY').upper().encode()))
+    return headers
+
+
+class RelatedFileConsumer(AsyncHttpConsumer):
+    """ Streams a `RelatedFile` of `model.field` without holding a worker thread
+
+    Storage backends only have blocking file objects, each chunk read or written
+    is run in the default executor instead, so a slow client only costs a
+    coroutine and the threads are shared by all the transfers in flight.
+
+    `GET` streams the file with the headers of `handle_related_file`, compressed
+    as by `CompressionMiddleware`. `POST` (when `upload` is set) takes the raw
+    file as the request body, named by the `Content-Disposition` header and
+    typed by the `Content-Type` header, spools it to a temporary file as it
+    arrives, checks it with the `validate` hook of `handle_related_file` and
+    saves it to the storage.
+    """
+
+    def __init__(self, model, field, action, upload=False, content_types=None, validate=None, *args, **kwargs):
+        super(RelatedFileConsumer, self).__init__(*args, **kwargs)
+        self.model = model
+        self.field = field
+        self.action = action
+        self.upload = upload
+        self.content_types = content_types
+        self.validate = validate
+        self.upload_file = None
+        self.upload_size = 0
+
+    @classmethod
+    def accepts(cls, scope, upload=False, **kwargs):
+        """ Whether the request is answered exactly as the REST view would, the
+        others are left to Django
+        """
+        headers = _get_headers(scope)
+        method = scope['method']
+
+        if method == 'GET':
+            if b'if-none-match' in headers or b'if-modified-since' in headers:
+                return False
+            accept = headers.get(b'accept')
+            if accept is None:
+                return True
+            return any(m.strip().decode('latin-1') in ACCEPTED_MEDIA_TYPES for m in accept.split(b','))
+
+        if method == 'POST' and upload:
+            content_type = headers.get(b'content-type', b'')
+            return not content_type.startswith(b'multipart/') and _get_upload_filename(headers) is not None
+
+        return False
+
+    async def send_json(self, status, data):
+        await self.send_response(
+            status,
+            # As rendered by `JSONRenderer`
+            json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+            headers=[(b'Content-Type', b'application/json')] + _get_security_headers(),
+        )
+
+    def get_parent(self):
+        pk = self.scope['url_route']['kwargs']['pk']
+        return self.model.objects.select_related(self.field).filter(pk=pk).first()
+
+    def open_file(self, related_file):
+        f = related_file.file
+        f.open('rb')
+        return f, f.size
+
+    def get_encoding(self, related_file, size):
+        """ Negotiates the compression of the download as `CompressionMiddleware` does
+
+        :return: `(compressible, coding)`
+        """
+        if not settings.DO_GZIP_RESPONSE or not is_compressible(related_file.content_type, content_length=size):
+            return False, None
+        accept_encoding = _get_headers(self.scope).get(b'accept-encoding', b'').decode('latin-1')
+        return True, get_accepted_encoding(accept_encoding)
+
+    def get_download_headers(self, related_file, size, compressible, coding):
+        key = (related_file.pk, related_file.modified)
+        etag = make_etag(
+            self.model,
+            self.action,
+            self.scope['url_route']['kwargs']['version'],
+            'application/json',
+            self.scope.get('query_string', b'').decode('latin-1'),
+            key,
+        )
+        headers = [
+            (b'Content-Type', related_file.content_type.encode('latin-1')),
+            (b'Content-Disposition', _get_content_disposition(related_file).encode('utf-8')),
+            (b'Last-Modified', http_date(int(related_file.modified.timestamp())).encode()),
+        ]
+        if compressible:
+            headers.append((b'Vary', b'Accept-Encoding'))
+        if coding:
+            headers += [(b'Content-Encoding', coding.encode()), (b'ETag', weak_etag(etag).encode())]
+        else:
+            headers += [(b'Content-Length', str(size).encode()), (b'ETag', etag.encode())]
+        return headers + _get_security_headers()
+
+    async def handle(self, body):
+        parent = await database_sync_to_async(self.get_parent)()
+        related_file = getattr(parent, self.field) if parent is not None else None
+        if related_file is None:
+            return await self.send_json(404, {'detail': 'Not found.'})
+
+        f, size = await sync_to_async(self.open_file, thread_sensitive=False)(related_file)
+        compressible, coding = self.get_encoding(related_file, size)
+        compressor = get_compressors()[coding]() if coding else None
+        try:
+            await self.send_headers(headers=self.get_download_headers(related_file, size, compressible, coding))
+            while True:
+                chunk = await sync_to_async(f.read, thread_sensitive=False)(settings.FILE_STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if compressor is not None:
+                    chunk = await sync_to_async(compressor.compress, thread_sensitive=False)(chunk)
+                if chunk:
+                    await self.send_body(chunk, more_body=True)
+            if compressor is not None:
+                await self.send_body(compressor.finish(), more_body=True)
+        finally:
+            await sync_to_async(f.close, thread_sensitive=False)()
+
+        # A failure raises before the body is ended, so the server drops the connection
+        # and the client does not take a truncated file for the whole of it
+        await self.send_body(b'')
+
+    def save_upload(self, user):
+        parent = self.get_parent()
+        if parent is None:
+            raise Http404()
+
+        headers = _get_headers(self.scope)
+        self.upload_file.seek(0)
+        f = UploadedFile(
+            self.upload_file,
+            name=_get_upload_filename(headers),
+            content_type=headers.get(b'content-type', b'').decode('latin-1'),
+            size=self.upload_size,
+        )
+        # The serializer only reads the user of the request
+        return _save_related_file(
+            parent, self.field, SimpleNamespace(user=user), self.content_types, {'file': f}, validate=self.validate)
+
+    async def handle_upload(self):
+        try:
+            data = await database_sync_to_async(self.save_upload, thread_sensitive=False)(self.scope['user'])
+        except Http404:
+            return await self.send_json(404, {'detail': 'Not found.'})
+        except ValidationError as e:
+            return await self.send_json(400, e.detail)
+        await self.send_json(200, data)
+
+    async def http_request(self, message):
+        if self.scope['method'] != 'POST':
+            return await super(RelatedFileConsumer, self).http_request(message)
+
+        if self.upload_file is None:
+            self.upload_file = await sync_to_async(tempfile.NamedTemporaryFile, thread_sensitive=False)(
+                dir=settings.FILE_UPLOAD_TEMP_DIR,
+            )
+
+        body = message.get('body', b'')
+        if body:
+            await sync_to_async(self.upload_file.write, thread_sensitive=False)(body)
+            self.upload_size += len(body)
+
+        if not message.get('more_body'):
+            try:
+                await self.handle_upload()
+            finally:
+                await self.disconnect()
+                raise StopConsumer()
+
+    async def disconnect(self):
+        if self.upload_file is not None:
+            await sync_to_async(self.upload_file.close, thread_sensitive=False)()
+            self.upload_file = None
+
+
+class StreamingFileRouter(object):
+    """ Serves the file endpoints in `routes` with native async consumers and
+    passes every other HTTP request to `application`, the Django ASGI handler
+
+    Only requests the consumer answers exactly like the REST view are taken,
+    the rest fall through to Django: requests without a valid
+    `Authorization: Bearer` token (session auth and the auth errors are
+    unchanged), conditional requests (answered there with a `304`), `HEAD`
+    and `DELETE` requests and multipart uploads.
+    """
+
+    def __init__(self, routes, application):
+        self.routes = routes
+        self.application = application
+
+    def resolve(self, scope):
+        path = scope['path'][len(scope.get('root_path', '')):].lstrip('/')
+        for route in self.routes:
+            match = route.resolve(path)
+            if match is not None:
+                return match
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            match = self.resolve(scope)
+            if match is not None and match.func.consumer_class.accepts(scope, **match.func.consumer_initkwargs):
+                user = await self.get_user(scope)
+                if user is not None:
+                    scope = dict(scope, user=user, url_route={'args': match.args, 'kwargs': match.kwargs})
+                    return await match.func(scope, receive, send)
+
+        return await self.application(scope, receive, send)
+
+    async def get_user(self, scope):
+        parts = _get_headers(scope).get(b'authorization', b'').split()
+        if len(parts) == 2 and parts[0].lower() == b'bearer':
+            return await get_token_user(parts[1])
+        return None
@@ -0,0 +1,19 @@
+from __future__ import absolute_import
+
+from celery.utils.log import get_task_logger
+
+from ..celery import celery_app
+from .deletion import delete_queued_files
+
+logger = get_task_logger(__name__)
+
+
+@celery_app.task(name='delete_stored_files')
+def delete_stored_files():
+    """ Deletes the queued stored files, see `files.deletion`. The task is sent
+    again for the retry of the files it failed to delete
+    """
+    retry_in = delete_queued_files()
+    if retry_in is not None:
+        logger.info('Retrying the failed stored file deletions in {:.0f}s'.format(retry_in))
+        delete_stored_files.apply_async(countdown=retry_in)
@@ -0,0 +1,162 @@
+import os
+from datetime import timedelta
+
+from backports.tempfile import TemporaryDirectory
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+from hypothesis.extra.django import TestCase
+from mock import Mock, patch
+
+from ...portfolios.tests.fakes import fake_portfolio
+from ..deletion import _send_task, delete_from_storage, delete_queued_files, find_orphaned_files, queue_file_deletion
+from ..models import RelatedFile, StoredFileDeletion
+from .fakes import fake_related_file
+
+
+def stored_path(d, name):
+    return os.path.join(d, name)
+
+
+def tasks_on_commit():
+    return [entry for entry in connection.run_on_commit if entry[1] is _send_task]
+
+
+class QueueFileDeletion(TestCase):
+    def test_related_file_is_deleted___stored_file_is_queued_not_deleted(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                f = fake_related_file()
+                name = f.file.name
+
+                f.delete()
+
+                self.assertTrue(os.path.exists(stored_path(d, name)))
+                self.assertEqual([name], list(StoredFileDeletion.objects.values_list('name', flat=True)))
+                self.assertEqual(1, len(tasks_on_commit()))
+
+    def test_portfolio_is_deleted___files_are_queued_with_one_task(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                location, accounts = fake_related_file(), fake_related_file()
+                portfolio = fake_portfolio(location_file=location, accounts_file=accounts)
+
+                portfolio.delete()
+
+                self.assertFalse(RelatedFile.objects.exists())
+                self.assertEqual(
+                    {location.file.name, accounts.file.name},
+                    set(StoredFileDeletion.objects.values_list('name', flat=True)),
+                )
+                self.assertEqual(1, len(tasks_on_commit()))
+
+    def test_send_task_is_false___no_task_is_sent(self):
+        queue_file_deletion(['a', 'b'], send_task=False)
+
+        self.assertEqual(2, StoredFileDeletion.objects.count())
+        self.assertEqual([], tasks_on_commit())
+
+    def test_task_cannot_be_sent___error_is_logged(self):
+        with patch('src.server.oasisapi.files.tasks.delete_stored_files.delay', side_effect=ConnectionError()) as delay_mock:
+            _send_task()
+
+        delay_mock.assert_called_once_with()
+
+
+class DeleteQueuedFiles(TestCase):
+    def test_queued_files_are_deleted_and_dequeued(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                f = fake_related_file()
+                name = f.file.name
+                f.delete()
+
+                retry_in = delete_queued_files()
+
+                self.assertIsNone(retry_in)
+                self.assertFalse(os.path.exists(stored_path(d, name)))
+                self.assertFalse(StoredFileDeletion.objects.exists())
+
+    def test_file_is_referenced_by_another_related_file___file_is_not_deleted(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                f = fake_related_file()
+                name = f.file.name
+                RelatedFile.objects.create(file=name, filename='copy', content_type='text/csv')
+                f.delete()
+
+                delete_queued_files()
+
+                self.assertTrue(os.path.exists(stored_path(d, name)))
+                self.assertFalse(StoredFileDeletion.objects.exists())
+
+    def test_deletion_fails___deletion_is_retried_later(self):
+        queue_file_deletion(['a', 'b'], send_task=False)
+
+        with override_settings(FILE_DELETE_RETRY_DELAY=30):
+            with patch('src.server.oasisapi.files.deletion.delete_from_storage', return_value={'a': 'denied'}):
+                retry_in = delete_queued_files()
+
+        failed = StoredFileDeletion.objects.get()
+        self.assertEqual('a', failed.name)
+        self.assertEqual(1, failed.attempts)
+        self.assertEqual('denied', failed.last_error)
+        self.assertGreater(failed.next_attempt, timezone.now() + timedelta(seconds=20))
+        self.assertAlmostEqual(30, retry_in, delta=5)
+
+    def test_deletion_is_not_due___deletion_is_skipped(self):
+        StoredFileDeletion.objects.create(name='a', next_attempt=timezone.now() + timedelta(hours=1))
+
+        with patch('src.server.oasisapi.files.deletion.delete_from_storage', return_value={}) as delete_mock:
+            delete_queued_files()
+
+        delete_mock.assert_not_called()
+        self.assertTrue(StoredFileDeletion.objects.exists())
+
+
+class DeleteFromStorage(TestCase):
+    def test_s3_storage___files_are_deleted_in_batches(self):
+        storage = Mock(spec=['bucket', '_normalize_name', '_clean_name'])
+        storage._clean_name.side_effect = lambda name: name
+        storage._normalize_name.side_effect = lambda name: 'location/' + name
+        storage.bucket.delete_objects.return_value = {'Errors': [{'Key': 'location/b', 'Code': 'AccessDenied', 'Message': 'denied'}]}
+
+        with override_settings(FILE_DELETE_BATCH_SIZE=2):
+            errors = delete_from_storage(['a', 'b', 'c'], storage=storage)
+
+        self.assertEqual(2, storage.bucket.delete_objects.call_count)
+        self.assertEqual(
+            [{'Key': 'location/a'}, {'Key': 'location/b'}],
+            storage.bucket.delete_objects.call_args_list[0][1]['Delete']['Objects'],
+        )
+        self.assertEqual({'b': 'AccessDenied: denied'}, errors)
+
+    def test_file_system_storage___files_are_deleted(self):
+        with TemporaryDirectory() as d:
+            for name in ['a', 'b']:
+                with open(stored_path(d, name), 'w') as f:
+                    f.write('content')
+
+            errors = delete_from_storage(['a', 'b', 'missing'], storage=FileSystemStorage(location=d))
+
+            self.assertEqual({}, errors)
+            self.assertEqual([], os.listdir(d))
+
+
+class FindOrphanedFiles(TestCase):
+    def test_only_old_unreferenced_files_are_orphaned(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                referenced = fake_related_file()
+                for name in ['orphan', 'queued', 'recent']:
+                    with open(stored_path(d, name), 'w') as f:
+                        f.write('content')
+                old = (timezone.now() - timedelta(days=2)).timestamp()
+                for name in ['orphan', 'queued', referenced.file.name]:
+                    os.utime(stored_path(d, name), (old, old))
+                queue_file_deletion(['queued'], send_task=False)
+
+                orphaned = find_orphaned_files(timedelta(days=1))
+
+                self.assertEqual(['orphan'], orphaned)
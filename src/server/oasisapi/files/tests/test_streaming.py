@@ -0,0 +1,276 @@
+import gzip
+import json
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from backports.tempfile import TemporaryDirectory
+from django.test import override_settings
+from django_webtest import WebTestMixin
+from hypothesis.extra.django import TransactionTestCase
+from mock import Mock, patch
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ...asgi import application
+from ...auth.tests.fakes import fake_user
+from ...portfolios.models import Portfolio
+from ...portfolios.tests.fakes import fake_portfolio, fake_location_csv
+from ..models import RelatedFile
+from ..streaming import RelatedFileConsumer
+from .fakes import fake_related_file
+
+
+class HttpClient(ApplicationCommunicator):
+    """ Minimal HTTP client for the ASGI application, `channels.testing`
+    imports daphne which the server tests do not need
+    """
+    def __init__(self, method, path, user=None, headers=None):
+        headers = dict(headers or {})
+        if user is not None:
+            headers['Authorization'] = 'Bearer {}'.format(AccessToken.for_user(user))
+
+        super(HttpClient, self).__init__(application, {
+            'type': 'http',
+            'http_version': '1.1',
+            'method': method,
+            'path': path,
+            'raw_path': path.encode(),
+            'root_path': '',
+            'scheme': 'http',
+            'query_string': b'',
+            'headers': [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+            'client': ['127.0.0.1', 1234],
+            'server': ['testserver', 80],
+        })
+
+    async def request(self, body=b'', chunk_size=None):
+        chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] if chunk_size else [body]
+        for i, chunk in enumerate(chunks):
+            await self.send_input({'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1})
+
+    async def receive_start(self):
+        start = await self.receive_output(5)
+        assert start['type'] == 'http.response.start'
+        return start['status'], {k.decode().lower(): v.decode() for k, v in start['headers']}
+
+    async def receive_body(self):
+        chunks = []
+        while True:
+            message = await self.receive_output(5)
+            chunks.append(message['body'])
+            if not message.get('more_body'):
+                return chunks
+
+
+def fetch(method, path, user=None, headers=None, body=b'', chunk_size=None):
+    async def run():
+        client = HttpClient(method, path, user=user, headers=headers)
+        await client.request(body, chunk_size=chunk_size)
+        status, response_headers = await client.receive_start()
+        chunks = await client.receive_body()
+        return status, response_headers, chunks
+
+    return async_to_sync(run)()
+
+
+@override_settings(FILE_STREAM_CHUNK_SIZE=4)
+class RelatedFileStreaming(WebTestMixin, TransactionTestCase):
+    def test_user_is_not_authenticated___request_is_passed_to_the_rest_view(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                portfolio = fake_portfolio(location_file=fake_related_file(file='content'))
+
+                status, _, _ = fetch('GET', portfolio.get_absolute_location_file_url())
+
+                self.assertIn(status, [401, 403])
+
+    def test_file_is_present___content_is_streamed_in_chunks_with_the_rest_view_headers(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio(location_file=fake_related_file(
+                    file='long enough to chunk', filename='location.csv', content_type='text/csv'))
+
+                status, headers, chunks = fetch('GET', portfolio.get_absolute_location_file_url(), user=user)
+                rest_response = self.app.get(
+                    portfolio.get_absolute_location_file_url(),
+                    headers={'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))},
+                )
+
+                self.assertEqual(200, status)
+                self.assertEqual(b'long enough to chunk', b''.join(chunks))
+                self.assertGreater(len(chunks), 2)
+                self.assertEqual('text/csv', headers['content-type'])
+                self.assertEqual('20', headers['content-length'])
+                self.assertEqual(rest_response.headers['Content-Disposition'], headers['content-disposition'])
+                self.assertEqual(rest_response.headers['ETag'], headers['etag'])
+                self.assertEqual(rest_response.headers['Last-Modified'], headers['last-modified'])
+
+    @override_settings(DO_GZIP_RESPONSE=True, COMPRESS_MIN_SIZE=0)
+    def test_gzip_is_accepted___content_is_compressed_as_it_is_streamed(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio(location_file=fake_related_file(
+                    file='LocNumber,AccNumber\n1,1\n', filename='location.csv', content_type='text/csv'))
+
+                _, uncompressed_headers, _ = fetch('GET', portfolio.get_absolute_location_file_url(), user=user)
+                status, headers, chunks = fetch(
+                    'GET', portfolio.get_absolute_location_file_url(), user=user, headers={'Accept-Encoding': 'gzip'})
+
+                self.assertEqual(200, status)
+                self.assertEqual(b'LocNumber,AccNumber\n1,1\n', gzip.decompress(b''.join(chunks)))
+                self.assertEqual('gzip', headers['content-encoding'])
+                self.assertEqual('Accept-Encoding', headers['vary'])
+                self.assertNotIn('content-length', headers)
+                self.assertEqual('W/' + uncompressed_headers['etag'], headers['etag'])
+                self.assertNotIn('content-encoding', uncompressed_headers)
+
+    def test_storage_read_fails_mid_stream___response_is_not_ended(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio(location_file=fake_related_file(
+                    file='long enough to chunk', filename='location.csv', content_type='text/csv'))
+                f = Mock(read=Mock(side_effect=[b'long', OSError('storage is unavailable')]))
+
+                async def run():
+                    client = HttpClient('GET', portfolio.get_absolute_location_file_url(), user=user)
+                    await client.request()
+                    await client.receive_start()
+                    first = await client.receive_output(5)
+                    with self.assertRaises(OSError):
+                        await client.receive_output(5)
+                    return first
+
+                with patch.object(RelatedFileConsumer, 'open_file', return_value=(f, 20)):
+                    first = async_to_sync(run)()
+
+                self.assertEqual(b'long', first['body'])
+                self.assertTrue(first['more_body'])
+                f.close.assert_called_once_with()
+
+    def test_file_is_not_present___response_is_404(self):
+        user = fake_user()
+        portfolio = fake_portfolio()
+
+        status, headers, chunks = fetch('GET', portfolio.get_absolute_location_file_url(), user=user)
+
+        self.assertEqual(404, status)
+        self.assertEqual({'detail': 'Not found.'}, json.loads(b''.join(chunks)))
+
+    def test_etag_matches___request_is_passed_to_the_rest_view_and_is_not_modified(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio(location_file=fake_related_file(file='content'))
+                _, headers, _ = fetch('GET', portfolio.get_absolute_location_file_url(), user=user)
+
+                status, _, chunks = fetch(
+                    'GET', portfolio.get_absolute_location_file_url(), user=user, headers={'If-None-Match': headers['etag']})
+
+                self.assertEqual(304, status)
+                self.assertEqual(b'', b''.join(chunks))
+
+    def test_downloads_are_in_flight_together___chunks_are_interleaved(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio(location_file=fake_related_file(file='a' * 64))
+
+                async def run():
+                    clients = [HttpClient('GET', portfolio.get_absolute_location_file_url(), user=user) for _ in range(2)]
+                    for client in clients:
+                        await client.request()
+                    for client in clients:
+                        await client.receive_start()
+
+                    # Both responses have started before either has finished
+                    first_chunks = [(await client.receive_output(5))['more_body'] for client in clients]
+                    bodies = [await client.receive_body() for client in clients]
+                    return first_chunks, bodies
+
+                first_chunks, bodies = async_to_sync(run)()
+
+                self.assertEqual([True, True], first_chunks)
+                self.assertEqual([b'a' * 60] * 2, [b''.join(b) for b in bodies])
+
+    def test_raw_exposure_upload___file_is_stored_and_attached(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio()
+
+                status, _, chunks = fetch(
+                    'POST',
+                    portfolio.get_absolute_location_file_url(),
+                    user=user,
+                    headers={'Content-Type': 'text/csv', 'Content-Disposition': 'attachment; filename="location.csv"'},
+                    body=fake_location_csv(),
+                    chunk_size=5,
+                )
+
+                self.assertEqual(200, status)
+                portfolio = Portfolio.objects.get(pk=portfolio.pk)
+                self.assertEqual(json.loads(b''.join(chunks))['file'], portfolio.location_file.file.name)
+                self.assertEqual('location.csv', portfolio.location_file.filename)
+                self.assertEqual('text/csv', portfolio.location_file.content_type)
+                self.assertEqual(user, portfolio.location_file.creator)
+                self.assertEqual(fake_location_csv(), portfolio.location_file.read())
+                self.assertEqual(1, portfolio.exposure_statistics['location_file']['rows'])
+
+    def test_raw_exposure_upload_replaces_a_file___previous_file_is_deleted(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                previous = fake_related_file(file='previous')
+                portfolio = fake_portfolio(location_file=previous)
+
+                status, _, _ = fetch(
+                    'POST',
+                    portfolio.get_absolute_location_file_url(),
+                    user=user,
+                    headers={'Content-Type': 'text/csv', 'Content-Disposition': 'attachment; filename="location.csv"'},
+                    body=fake_location_csv(),
+                )
+
+                self.assertEqual(200, status)
+                self.assertFalse(RelatedFile.objects.filter(pk=previous.pk).exists())
+
+    def test_raw_exposure_upload_is_not_a_valid_location_file___response_is_400(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio()
+
+                status, _, chunks = fetch(
+                    'POST',
+                    portfolio.get_absolute_location_file_url(),
+                    user=user,
+                    headers={'Content-Type': 'text/csv', 'Content-Disposition': 'attachment; filename="location.csv"'},
+                    body=b'LocNumber,AccNumber\n1,1\n',
+                    chunk_size=5,
+                )
+
+                self.assertEqual(400, status)
+                self.assertIn('Missing required columns', json.loads(b''.join(chunks))['file'][0])
+                self.assertIsNone(Portfolio.objects.get(pk=portfolio.pk).location_file)
+                self.assertFalse(RelatedFile.objects.exists())
+
+    def test_raw_exposure_upload_content_type_is_not_supported___response_is_400(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio()
+
+                status, _, chunks = fetch(
+                    'POST',
+                    portfolio.get_absolute_location_file_url(),
+                    user=user,
+                    headers={'Content-Type': 'image/png', 'Content-Disposition': 'attachment; filename="location.png"'},
+                    body=b'content',
+                )
+
+                self.assertEqual(400, status)
+                self.assertIn('file', json.loads(b''.join(chunks)))
+                self.assertIsNone(Portfolio.objects.get(pk=portfolio.pk).location_file)
+                self.assertFalse(RelatedFile.objects.exists())
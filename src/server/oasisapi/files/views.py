@@ -1,11 +1,23 @@
 import json
-
-from django.core.files.uploadedfile import UploadedFile
-from django.http import StreamingHttpResponse, Http404, QueryDict
+import mimetypes
+import os
+import tarfile
+
+from botocore.exceptions import ClientError as S3_ClientError
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import StreamingHttpResponse, Http404
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
-from .serializers import RelatedFileSerializer
+from .archive import get_archive_index, find_archive_member, iter_archive_member
+from .models import RelatedFile, random_file_name
+from .serializers import RelatedFileSerializer, PresignedUploadSerializer, PresignedUploadConfirmSerializer, CONTENT_TYPE_MAPPING
 
+PRESIGNED_UPLOAD_SALT = 'oasisapi.files.presigned_upload'
 
 
 def _delete_related_file(parent, field):
@@ -18,13 +30,18 @@ def _delete_related_file(parent, field):
         parent.save(update_fields=[field])
         current.delete()
 
-def _get_chunked_content(f, chunk_size=1024):
+def _get_chunked_content(f, chunk_size=None):
+    chunk_size = chunk_size or settings.FILE_STREAM_CHUNK_SIZE
     content = f.read(chunk_size)
     while content:
         yield content
         content = f.read(chunk_size)
 
 
+def _get_content_disposition(f):
+    return 'attachment; filename="{}"'.format(f.filename or f.file.name)
+
+
 def _handle_get_related_file(parent, field):
     f = getattr(parent, field)
 
@@ -32,28 +49,35 @@ def _handle_get_related_file(parent, field):
         raise Http404()
 
     response = StreamingHttpResponse(_get_chunked_content(f.file), content_type=f.content_type)
-    if f.filename:
-        response['Content-Disposition'] = 'attachment; filename="{}"'.format(f.filename)
-    else:
-        response['Content-Disposition'] = 'attachment; filename="{}"'.format(f.file.name)
+    response['Content-Disposition'] = _get_content_disposition(f)
     return response
 
 
-def _handle_post_related_file(parent, field, request, content_types):
-    serializer = RelatedFileSerializer(data=request.data, content_types=content_types, context={'request': request})
+def _save_related_file(parent, field, request, content_types, data, validate=None):
+    serializer = RelatedFileSerializer(data=data, content_types=content_types, context={'request': request})
     serializer.is_valid(raise_exception=True)
+
+    # Checks the content before it is stored, returns the other fields of the parent it has set
+    update_fields = [field]
+    if validate is not None:
+        update_fields += validate(parent, field, serializer.validated_data['file'], serializer.validated_data['content_type'])
+
     instance = serializer.create(serializer.validated_data)
 
     # Check for exisiting file and delete
     _delete_related_file(parent, field)
 
     setattr(parent, field, instance)
-    parent.save(update_fields=[field])
+    parent.save(update_fields=update_fields)
 
     # Override 'file' return to hide storage details with stored filename
-    response = Response(RelatedFileSerializer(instance=instance, content_types=content_types).data)
-    response.data['file'] = instance.file.name
-    return response
+    data = RelatedFileSerializer(instance=instance, content_types=content_types).data
+    data['file'] = instance.file.name
+    return data
+
+
+def _handle_post_related_file(parent, field, request, content_types, validate=None):
+    return Response(_save_related_file(parent, field, request, content_types, request.data, validate=validate))
 
 
 def _handle_delete_related_file(parent, field):
@@ -64,36 +88,29 @@ def _handle_delete_related_file(parent, field):
     return Response()
 
 
+def _get_json_cache_key(related_file):
+    """ Keyed on the file id and modified time so a replaced file is never served
+    from the cache, whichever process cached it
+    """
+    return 'oasisapi.files.json_data:{}:{}'.format(related_file.pk, related_file.modified.timestamp())
+
+
 def _json_write_to_file(parent, field, request, serializer):
     json_serializer = serializer()
     data = json_serializer.validate(request.data)
 
-    # create file object
-    with open(json_serializer.filenmame, 'wb+') as f:
-        in_memory_file = UploadedFile(
-            file=f,
-            name=json_serializer.filenmame,
-            content_type='application/json',
-            size=len(data.encode('utf-8')),
-            charset=None
-        )
-
-    # wrap and re-open file
-    file_obj = QueryDict('', mutable=True)
-    file_obj.update({'file': in_memory_file})
-    file_obj['file'].open()
-    file_obj['file'].seek(0)
-    file_obj['file'].write(data.encode('utf-8'))
-    serializer = RelatedFileSerializer(
-        data=file_obj,
-        content_types='application/json',
-        context={'request': request}
+    instance = RelatedFile.objects.create(
+        file=ContentFile(data.encode('utf-8'), name=json_serializer.filenmame),
+        filename=json_serializer.filenmame,
+        content_type='application/json',
+        creator=request.user,
     )
-
-    serializer.is_valid(raise_exception=True)
-    instance = serializer.create(serializer.validated_data)
+    cache.set(_get_json_cache_key(instance), json.loads(data))
 
     # Check for exisiting file and delete
+    current = getattr(parent, field)
+    if current is not None:
+        cache.delete(_get_json_cache_key(current))
     _delete_related_file(parent, field)
 
     setattr(parent, field, instance)
@@ -104,24 +121,173 @@ def _json_write_to_file(parent, field, request, serializer):
     response.data['file'] = instance.file.name
     return response
 
+
+def _get_json_data(related_file):
+    key = _get_json_cache_key(related_file)
+    data = cache.get(key)
+    if data is None:
+        data = json.load(related_file)
+        cache.set(key, data)
+    return data
+
+
 def _json_read_from_file(parent, field):
     f = getattr(parent, field)
     if not f:
         raise Http404()
-    else:
-        return Response(json.load(f))
 
-def handle_related_file(parent, field, request, content_types):
+    return Response(_get_json_data(f))
+
+
+def _json_delete_file(parent, field):
+    f = getattr(parent, field)
+    if f:
+        cache.delete(_get_json_cache_key(f))
+    return _handle_delete_related_file(parent, field)
+
+
+def handle_related_file(parent, field, request, content_types, validate=None):
     method = request.method.lower()
 
     if method == 'get':
         return _handle_get_related_file(parent, field)
     elif method == 'post':
-        return _handle_post_related_file(parent, field, request, content_types)
+        return _handle_post_related_file(parent, field, request, content_types, validate=validate)
     elif method == 'delete':
         return _handle_delete_related_file(parent, field)
 
 
+def _get_upload_bucket():
+    """ Presigned uploads are only possible when files are stored in an S3 bucket
+    """
+    if not hasattr(default_storage, 'bucket'):
+        raise ValidationError({'detail': 'Presigned uploads are only available when STORAGE_TYPE is set to S3'})
+    return default_storage.bucket
+
+
+def handle_presigned_upload(parent, request, field_content_types):
+    """ Issue a presigned URL so the client can upload a file directly to the S3 bucket
+
+    The returned `upload_token` is signed and ties the object key to `parent` and the
+    requested field, it must be sent to `handle_presigned_upload_confirm` once the
+    upload has completed to attach the object as a `RelatedFile`
+    """
+    serializer = PresignedUploadSerializer(data=request.data, field_content_types=field_content_types)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+
+    bucket = _get_upload_bucket()
+    client = bucket.meta.client
+    expire = settings.AWS_PRESIGNED_UPLOAD_EXPIRE
+    name = random_file_name(RelatedFile(store_as_filename=False), data['filename'])
+    key = os.path.join(default_storage.location, name)
+
+    if data['method'] == 'post':
+        fields = {'Content-Type': data['content_type']}
+        conditions = [
+            {'Content-Type': data['content_type']},
+            ['content-length-range', 1, settings.AWS_PRESIGNED_UPLOAD_MAX_SIZE],
+        ]
+        if default_storage.default_acl:
+            fields['acl'] = default_storage.default_acl
+            conditions.append({'acl': default_storage.default_acl})
+
+        presigned_post = client.generate_presigned_post(
+            Bucket=bucket.name,
+            Key=key,
+            Fields=fields,
+            Conditions=conditions,
+            ExpiresIn=expire,
+        )
+        upload = {'url': presigned_post['url'], 'fields': presigned_post['fields']}
+    else:
+        params = {'Bucket': bucket.name, 'Key': key, 'ContentType': data['content_type']}
+        if default_storage.default_acl:
+            params['ACL'] = default_storage.default_acl
+
+        upload = {
+            'url': client.generate_presigned_url('put_object', Params=params, ExpiresIn=expire, HttpMethod='PUT'),
+            'headers': {'Content-Type': data['content_type']},
+        }
+
+    upload['method'] = data['method']
+    upload['expires_in'] = expire
+    upload['upload_token'] = signing.dumps({
+        'model': parent._meta.label_lower,
+        'pk': parent.pk,
+        'field': data['field'],
+        'name': name,
+        'filename': data['filename'],
+    }, salt=PRESIGNED_UPLOAD_SALT)
+    return Response(upload)
+
+
+def handle_presigned_upload_confirm(parent, request, field_content_types, validate=None):
+    """ Validate a completed presigned upload and attach it to `parent` as a `RelatedFile`
+
+    `validate` (as for `handle_related_file`) reads the object back from the bucket
+    """
+    serializer = PresignedUploadConfirmSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    try:
+        upload = signing.loads(serializer.validated_data['upload_token'], salt=PRESIGNED_UPLOAD_SALT)
+    except signing.BadSignature:
+        raise ValidationError({'upload_token': 'Invalid upload token'})
+
+    field = upload['field']
+    if upload['model'] != parent._meta.label_lower or upload['pk'] != parent.pk or field not in field_content_types:
+        raise ValidationError({'upload_token': 'Upload token was not issued for this object'})
+    content_types = field_content_types[field]
+
+    # Confirming the same upload twice returns the attached file
+    current = getattr(parent, field)
+    if current and current.file.name == upload['name']:
+        response = Response(RelatedFileSerializer(instance=current, content_types=content_types).data)
+        response.data['file'] = current.file.name
+        return response
+
+    bucket = _get_upload_bucket()
+    try:
+        head = bucket.meta.client.head_object(
+            Bucket=bucket.name,
+            Key=os.path.join(default_storage.location, upload['name']),
+        )
+    except S3_ClientError as e:
+        if e.response['Error']['Code'] in ['404', 'NoSuchKey']:
+            raise ValidationError({'upload_token': 'No object has been uploaded for this token'})
+        raise e
+
+    content_type = CONTENT_TYPE_MAPPING.get(head.get('ContentType'), head.get('ContentType'))
+    if content_types and content_type not in content_types:
+        raise ValidationError({'upload_token': 'File should be one of [{}]'.format(', '.join(content_types))})
+    if not 0 < head.get('ContentLength', 0) <= settings.AWS_PRESIGNED_UPLOAD_MAX_SIZE:
+        raise ValidationError({'upload_token': 'Uploaded object size {} is not valid'.format(head.get('ContentLength', 0))})
+
+    update_fields = [field]
+    if validate is not None:
+        with default_storage.open(upload['name'], 'rb') as f:
+            update_fields += validate(parent, field, f, content_type)
+
+    instance = RelatedFile.objects.create(
+        file=upload['name'],
+        filename=upload['filename'],
+        content_type=content_type,
+        creator=request.user,
+        store_as_filename=True,
+    )
+
+    # Check for exisiting file and delete
+    _delete_related_file(parent, field)
+
+    setattr(parent, field, instance)
+    parent.save(update_fields=update_fields)
+
+    # Override 'file' return to hide storage details with stored filename
+    response = Response(RelatedFileSerializer(instance=instance, content_types=content_types).data)
+    response.data['file'] = instance.file.name
+    return response
+
+
 def handle_json_data(parent, field, request, serializer):
     method = request.method.lower()
 
@@ -130,4 +296,71 @@ def handle_json_data(parent, field, request, serializer):
     elif method == 'post':
         return _json_write_to_file(parent, field, request, serializer)
     elif method == 'delete':
-        return _handle_delete_related_file(parent, field)
+        return _json_delete_file(parent, field)
+
+
+def _scan_archive_members(archive_file):
+    """ Fallback for archives without an index, reads through the whole archive
+    """
+    with archive_file.file.open('rb') as f, tarfile.open(fileobj=f, mode='r|*') as tar:
+        return [{'name': m.name, 'size': m.size, 'md5': None} for m in tar if m.isreg()]
+
+
+def _get_scanned_member_content(archive_file, name, chunk_size=64 * 1024):
+    with archive_file.file.open('rb') as f, tarfile.open(fileobj=f, mode='r|*') as tar:
+        for member in tar:
+            if member.isreg() and member.name == name:
+                yield from _get_chunked_content(tar.extractfile(member), chunk_size)
+                return
+
+
+def handle_archive_index(parent, field, index_field):
+    """ List the regular file members of an archive
+    """
+    archive_file = getattr(parent, field)
+    if not archive_file:
+        raise Http404()
+
+    index = get_archive_index(getattr(parent, index_field))
+    indexed = index is not None
+    members = index['members'] if indexed else _scan_archive_members(archive_file)
+
+    return Response({
+        'indexed': indexed,
+        'members': [{'name': m['name'], 'size': m['size'], 'md5': m['md5']} for m in members],
+    })
+
+
+def handle_archive_member(parent, field, index_field, request):
+    """ Stream a single member of an archive selected by the `member` query param
+
+    (`name` is not used as it would be picked up by the list filters in `get_object`)
+
+    Archives with an index only read the byte range of the requested member,
+    older archives are read through until the member is found.
+    """
+    archive_file = getattr(parent, field)
+    if not archive_file:
+        raise Http404()
+
+    name = request.query_params.get('member')
+    if not name:
+        raise ValidationError({'member': 'This query parameter is required'})
+
+    index = get_archive_index(getattr(parent, index_field))
+    if index is not None:
+        member = find_archive_member(index['members'], name)
+        if not member:
+            raise Http404()
+        content = iter_archive_member(archive_file, index, member)
+    else:
+        member = find_archive_member(_scan_archive_members(archive_file), name)
+        if not member:
+            raise Http404()
+        content = _get_scanned_member_content(archive_file, member['name'])
+
+    filename = os.path.basename(member['name'])
+    response = StreamingHttpResponse(content, content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+    response['Content-Length'] = member['size']
+    return response
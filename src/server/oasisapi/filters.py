@@ -83,6 +83,10 @@ class Backend(DjangoFilterBackend):
             return coreschema.String(description=description)
 
 
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
+
+
 class CsvMultipleChoiceMixin(object):
     def to_python(self, value):
         if value and len(value) == 1 and ',' in value[0]:
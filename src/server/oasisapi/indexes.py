@@ -0,0 +1,107 @@
+""" Indexes for the case insensitive `iexact` and `icontains` filters of the list endpoints
+
+PostgreSQL compares these lookups on `UPPER(column::text)`, which a plain index on
+the column does not serve, and Django 3.1 can not declare indexes on expressions.
+`CaseInsensitiveIndex` migration operations create them for the backend the
+migration runs on:
+
+* PostgreSQL, a b-tree index on `UPPER(column::text)` for `iexact`, and with
+  `trigram` a `pg_trgm` GIN index on the same expression for `icontains`, when the
+  extension is installed or the database user may create it
+* MySQL, a plain index on the column, its default collations are case insensitive
+* other backends (sqlite), nothing
+
+The indexes are not part of the model state, `makemigrations` does not see them.
+"""
+import logging
+
+from django.db import DatabaseError, models, transaction
+from django.db.migrations.operations.base import Operation
+
+logger = logging.getLogger(__name__)
+
+
+def has_trigram_extension(schema_editor):
+    """ Whether `pg_trgm` is installed, it is created when the database user is allowed to
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cursor.fetchone():
+            return True
+
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        return True
+    except DatabaseError as e:
+        logger.warning('pg_trgm is not available, the `icontains` filters are not indexed: {}'.format(e))
+        return False
+
+
+class CaseInsensitiveIndex(Operation):
+    reduces_to_sql = False
+    reversible = True
+
+    def __init__(self, model_name, field_name, trigram=True, app_label=None):
+        """
+        :param model_name: The model of the indexed field
+        :param field_name: The indexed field
+        :param trigram: Whether `icontains` is also indexed (PostgreSQL only)
+        :param app_label: The app of the model, when it is not the app of the migration
+        """
+        self.model_name = model_name
+        self.field_name = field_name
+        self.trigram = trigram
+        self.app_label = app_label
+
+    def deconstruct(self):
+        kwargs = {'model_name': self.model_name, 'field_name': self.field_name}
+        if not self.trigram:
+            kwargs['trigram'] = self.trigram
+        if self.app_label:
+            kwargs['app_label'] = self.app_label
+        return self.__class__.__name__, [], kwargs
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def _get_model_field(self, app_label, state):
+        model = state.apps.get_model(self.app_label or app_label, self.model_name)
+        return model, model._meta.get_field(self.field_name)
+
+    def _get_index_names(self, schema_editor, model, field):
+        table = model._meta.db_table
+        return (
+            schema_editor._create_index_name(table, [field.column], suffix='_upper'),
+            schema_editor._create_index_name(table, [field.column], suffix='_trgm'),
+        )
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model, field = self._get_model_field(app_label, to_state)
+        upper_name, trigram_name = self._get_index_names(schema_editor, model, field)
+        vendor = schema_editor.connection.vendor
+
+        if vendor == 'postgresql':
+            table = schema_editor.quote_name(model._meta.db_table)
+            expression = 'UPPER({}::text)'.format(schema_editor.quote_name(field.column))
+            schema_editor.execute('CREATE INDEX {} ON {} ({})'.format(schema_editor.quote_name(upper_name), table, expression))
+            if self.trigram and has_trigram_extension(schema_editor):
+                schema_editor.execute('CREATE INDEX {} ON {} USING gin ({} gin_trgm_ops)'.format(
+                    schema_editor.quote_name(trigram_name), table, expression,
+                ))
+        elif vendor == 'mysql':
+            schema_editor.add_index(model, models.Index(fields=[field.name], name=upper_name))
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model, field = self._get_model_field(app_label, from_state)
+        upper_name, trigram_name = self._get_index_names(schema_editor, model, field)
+        vendor = schema_editor.connection.vendor
+
+        if vendor == 'postgresql':
+            for name in [upper_name, trigram_name]:
+                schema_editor.execute('DROP INDEX IF EXISTS {}'.format(schema_editor.quote_name(name)))
+        elif vendor == 'mysql':
+            schema_editor.remove_index(model, models.Index(fields=[field.name], name=upper_name))
+
+    def describe(self):
+        return 'Create case insensitive indexes on {}.{}'.format(self.model_name, self.field_name)
@@ -0,0 +1,33 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, _positive_int
+
+
+class TimeStampedCursorPagination(CursorPagination):
+    """ Cursor pagination over `TimeStampedModel` querysets, most recently modified first
+
+    The cursor is keyed on `modified` with `id` breaking ties, so pages stay
+    stable while objects are created or updated and fetching a page does not
+    need a count or an offset scan over the whole table.
+
+    Pagination is only applied when the `cursor` or `page_size` query params
+    are sent, unless `API_PAGINATE_BY_DEFAULT` is set, so existing clients
+    reading the full list keep working.
+    """
+    ordering = ('-modified', '-id')
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=settings.API_MAX_PAGE_SIZE,
+            )
+        except (KeyError, ValueError):
+            return settings.API_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        requested = self.cursor_query_param in request.query_params or self.page_size_query_param in request.query_params
+        if not (requested or settings.API_PAGINATE_BY_DEFAULT):
+            return None
+        return super(TimeStampedCursorPagination, self).paginate_queryset(queryset, request, view=view)
@@ -0,0 +1,224 @@
+import bz2
+import csv
+import gzip
+import io
+import zipfile
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+
+# Errors reported for a rejected file, parsing stops once this many are found
+MAX_ERRORS = 20
+
+# The OED fields checked on upload, column names are matched case insensitively
+EXPOSURE_FILE_SPECS = {
+    'location_file': {
+        'required': [
+            'PortNumber', 'AccNumber', 'LocNumber', 'CountryCode', 'LocPerilsCovered',
+            'BuildingTIV', 'OtherTIV', 'ContentsTIV', 'BITIV', 'LocCurrency',
+        ],
+        'numeric': ['BuildingTIV', 'OtherTIV', 'ContentsTIV', 'BITIV', 'Latitude', 'Longitude'],
+        'tiv': ['BuildingTIV', 'OtherTIV', 'ContentsTIV', 'BITIV'],
+        'perils': 'LocPerilsCovered',
+        'country': 'CountryCode',
+        'currency': 'LocCurrency',
+    },
+    'accounts_file': {
+        'required': ['PortNumber', 'AccNumber', 'PolNumber', 'PolPerilsCovered', 'AccCurrency'],
+        'numeric': ['LayerParticipation', 'LayerLimit', 'LayerAttachment'],
+        'tiv': [],
+        'perils': 'PolPerilsCovered',
+        'country': None,
+        'currency': 'AccCurrency',
+    },
+}
+
+
+@contextmanager
+def _open_csv(f, content_type):
+    """ The rows of an uploaded CSV, decompressed and decoded as they are read
+
+    Only the buffers of the decompressor and the text wrapper are held in
+    memory, `f` is left open and rewound for the storage.
+    """
+    f.seek(0)
+    if content_type == 'application/gzip':
+        raw = gzip.GzipFile(fileobj=f, mode='rb')
+    elif content_type == 'application/x-bzip2':
+        raw = bz2.BZ2File(f, mode='rb')
+    elif content_type == 'application/zip':
+        archive = zipfile.ZipFile(f)
+        members = [m for m in archive.infolist() if not m.is_dir()]
+        if len(members) != 1:
+            raise ValidationError({'file': ['Zip archives should contain a single CSV file']})
+        raw = archive.open(members[0])
+    else:
+        raw = f
+
+    text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+    try:
+        yield csv.reader(text)
+    finally:
+        # Detach so closing the wrapper does not close the uploaded file
+        text.detach()
+        if raw is not f:
+            raw.close()
+        f.seek(0)
+
+
+class _Errors(list):
+    def add(self, message):
+        self.append(message)
+        if len(self) >= MAX_ERRORS:
+            raise ValidationError({'file': list(self)})
+
+
+def _to_number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _parse(rows, spec):
+    errors = _Errors()
+
+    header = next(rows, None)
+    if not header:
+        raise ValidationError({'file': ['File is empty']})
+
+    columns = {name.strip().lower(): i for i, name in enumerate(header)}
+    missing = [name for name in spec['required'] if name.lower() not in columns]
+    if missing:
+        raise ValidationError({'file': ['Missing required columns: {}'.format(', '.join(missing))]})
+
+    def index(name):
+        return columns.get(name.lower()) if name else None
+
+    numeric = [(name, index(name)) for name in spec['numeric'] if index(name) is not None]
+    tiv_columns = set(spec['tiv'])
+    required = [(name, index(name)) for name in spec['required'] if name not in spec['numeric']]
+    perils_index, country_index, currency_index = index(spec['perils']), index(spec['country']), index(spec['currency'])
+
+    row_count = 0
+    tiv = dict.fromkeys(spec['tiv'], 0.0)
+    perils, countries, currencies = Counter(), Counter(), Counter()
+
+    for line, row in enumerate(rows, start=2):
+        if not any(row):
+            continue
+        row_count += 1
+        if len(row) != len(header):
+            errors.add('Row {}: expected {} values, found {}'.format(line, len(header), len(row)))
+            continue
+
+        for name, i in required:
+            if not row[i].strip():
+                errors.add('Row {}: {} is required'.format(line, name))
+
+        for name, i in numeric:
+            value = row[i].strip()
+            if not value:
+                if name in tiv_columns:
+                    errors.add('Row {}: {} is required'.format(line, name))
+                continue
+            number = _to_number(value)
+            if number is None:
+                errors.add('Row {}: {} "{}" is not a number'.format(line, name, value))
+            elif name in tiv_columns:
+                if number < 0:
+                    errors.add('Row {}: {} should not be negative'.format(line, name))
+                else:
+                    tiv[name] += number
+
+        if perils_index is not None:
+            for code in filter(None, (c.strip() for c in row[perils_index].split(';'))):
+                if len(code) != 3 or not code.isalnum():
+                    errors.add('Row {}: "{}" is not a peril code'.format(line, code))
+                else:
+                    perils[code.upper()] += 1
+
+        if country_index is not None:
+            country = row[country_index].strip()
+            if country and (len(country) != 2 or not country.isalpha()):
+                errors.add('Row {}: CountryCode "{}" is not an ISO 3166 alpha-2 code'.format(line, country))
+            elif country:
+                countries[country.upper()] += 1
+
+        if currency_index is not None:
+            currency = row[currency_index].strip()
+            if currency and (len(currency) != 3 or not currency.isalpha()):
+                errors.add('Row {}: "{}" is not an ISO 4217 currency code'.format(line, currency))
+            elif currency:
+                currencies[currency.upper()] += 1
+
+    if row_count == 0:
+        errors.add('File has no rows')
+    if errors:
+        raise ValidationError({'file': list(errors)})
+
+    statistics = {
+        'rows': row_count,
+        'perils': dict(perils.most_common()),
+        'currencies': dict(currencies.most_common()),
+    }
+    if spec['tiv']:
+        statistics['tiv'] = dict(tiv, total=sum(tiv.values()))
+    if spec['country']:
+        statistics['countries'] = dict(countries.most_common())
+    return statistics
+
+
+def get_exposure_statistics(field, f, content_type):
+    """ Validates an uploaded OED exposure file in a single streaming pass and
+    summarises it
+
+    Files of the fields in `EXPOSURE_FILE_SPECS` are checked for the required
+    columns, the numeric and code values. JSON uploads are not OED CSVs and are
+    accepted without statistics.
+
+    :raises ValidationError: With the first `MAX_ERRORS` problems of the file
+    :return: The row count, TIV totals, peril, country and currency
+        distributions, or `None` when the file is not validated
+    """
+    spec = EXPOSURE_FILE_SPECS.get(field)
+    if spec is None or content_type == 'application/json':
+        return None
+
+    try:
+        with _open_csv(f, content_type) as rows:
+            return _parse(rows, spec)
+    except UnicodeDecodeError:
+        raise ValidationError({'file': ['File is not UTF-8 encoded text']})
+    except csv.Error as e:
+        raise ValidationError({'file': ['File is not a valid CSV: {}'.format(e)]})
+    except (OSError, EOFError, zipfile.BadZipFile):
+        raise ValidationError({'file': ['File could not be decompressed as {}'.format(content_type)]})
+
+
+def validate_exposure_file(parent, field, f, content_type):
+    """ `validate` hook of the portfolio file uploads, rejects malformed OED files
+    before they are stored and keeps their statistics on the portfolio
+
+    :return: The portfolio fields to save with the file
+    """
+    statistics = None
+    if settings.PORTFOLIO_UPLOAD_VALIDATION:
+        statistics = get_exposure_statistics(field, f, content_type)
+
+    # The statistics of a replaced file are dropped
+    exposure_statistics = {k: v for k, v in (parent.exposure_statistics or {}).items() if k != field}
+    if statistics is not None:
+        exposure_statistics[field] = statistics
+    parent.exposure_statistics = exposure_statistics
+    return ['exposure_statistics']
+
+
+def drop_exposure_statistics(parent, field):
+    """ Removes the statistics of a deleted exposure file from the portfolio
+    """
+    if parent.exposure_statistics and field in parent.exposure_statistics:
+        parent.exposure_statistics = {k: v for k, v in parent.exposure_statistics.items() if k != field}
+        parent.save(update_fields=['exposure_statistics'])
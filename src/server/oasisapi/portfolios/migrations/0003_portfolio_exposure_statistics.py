@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-19 14:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolios', '0002_auto_20190619_1226'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portfolio',
+            name='exposure_statistics',
+            field=models.JSONField(blank=True, default=None, editable=False, help_text='Statistics of the validated exposure files, keyed by file field', null=True),
+        ),
+    ]
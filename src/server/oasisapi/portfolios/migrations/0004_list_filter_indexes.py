@@ -0,0 +1,27 @@
+# Generated by Django 3.1.7 on 2026-10-19 15:11
+
+from django.db import migrations, models
+
+import src.server.oasisapi.indexes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolios', '0003_portfolio_exposure_statistics'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='portfolio',
+            index=models.Index(fields=['modified'], name='portfolios__modifie_dc4369_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='portfolio',
+            index=models.Index(fields=['created'], name='portfolios__created_b22bec_idx'),
+        ),
+        src.server.oasisapi.indexes.CaseInsensitiveIndex(
+            model_name='portfolio',
+            field_name='name',
+        ),
+    ]
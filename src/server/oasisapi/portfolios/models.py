@@ -7,9 +7,19 @@ from django.db import models
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
 from model_utils.models import TimeStampedModel
-from rest_framework.reverse import reverse
 
-from ..files.models import RelatedFile
+from ..files.models import RelatedFile, delete_related_files
+from ..reverse import reverse
+
+# Content types accepted for the location, accounts and reinsurance files
+EXPOSURE_FILE_CONTENT_TYPES = [
+    'application/json',
+    'text/csv',
+    'application/gzip',
+    'application/x-bzip2',
+    'application/zip',
+    'application/x-bzip2',
+]
 
 
 class Portfolio(TimeStampedModel):
@@ -20,6 +30,13 @@ class Portfolio(TimeStampedModel):
     location_file = models.ForeignKey(RelatedFile, on_delete=models.CASCADE, blank=True, null=True, default=None, related_name='location_file_portfolios')
     reinsurance_info_file = models.ForeignKey(RelatedFile, on_delete=models.CASCADE, blank=True, null=True, default=None, related_name='reinsurance_info_file_portfolios')
     reinsurance_scope_file = models.ForeignKey(RelatedFile, on_delete=models.CASCADE, blank=True, null=True, default=None, related_name='reinsurance_scope_file_portfolios')
+    exposure_statistics = models.JSONField(blank=True, null=True, default=None, editable=False, help_text=_('Statistics of the validated exposure files, keyed by file field'))
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['modified']),
+            models.Index(fields=['created']),
+        ]
 
     def __str__(self):
         return self.name
@@ -42,6 +59,15 @@ class Portfolio(TimeStampedModel):
     def get_absolute_reinsurance_scope_file_url(self, request=None):
         return reverse('portfolio-reinsurance-scope-file', kwargs={'version': 'v1', 'pk': self.pk}, request=request)
 
+    def get_absolute_presigned_upload_url(self, request=None):
+        return reverse('portfolio-presigned-upload', kwargs={'version': 'v1', 'pk': self.pk}, request=request)
+
+    def get_absolute_presigned_upload_confirm_url(self, request=None):
+        return reverse('portfolio-presigned-upload-confirm', kwargs={'version': 'v1', 'pk': self.pk}, request=request)
+
+    def get_absolute_exposure_statistics_url(self, request=None):
+        return reverse('portfolio-exposure-statistics', kwargs={'version': 'v1', 'pk': self.pk}, request=request)
+
     def get_absolute_storage_url(self, request=None):                                                                                                                                                                                                                                                                           
         return reverse('portfolio-storage-links', kwargs={'version': 'v1', 'pk': self.pk}, request=request)
 
@@ -60,8 +86,5 @@ def delete_connected_files(sender, instance, **kwargs):
          'location_file',
          'reinsurance_info_file',
          'reinsurance_scope_file',
-    ]   
-    for ref in files_for_removal:
-        file_ref = getattr(instance, ref)
-        if file_ref:
-            file_ref.delete()
+    ]
+    delete_related_files(instance, files_for_removal)
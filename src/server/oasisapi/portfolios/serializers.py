@@ -8,6 +8,7 @@ from django.core.files.base import ContentFile
 from botocore.exceptions import ClientError as S3_ClientError
 
 from ..analyses.serializers import AnalysisSerializer
+from ..serializers import SparseFieldsMixin
 from ..files.models import file_storage_link
 from ..files.models import RelatedFile
 from .models import Portfolio
@@ -21,7 +22,7 @@ from ..schemas.serializers import (
 )
 
 
-class PortfolioSerializer(serializers.ModelSerializer):
+class PortfolioSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     accounts_file = serializers.SerializerMethodField()
     location_file = serializers.SerializerMethodField()
     reinsurance_info_file = serializers.SerializerMethodField()
@@ -41,6 +42,12 @@ class PortfolioSerializer(serializers.ModelSerializer):
             'reinsurance_scope_file',
             'storage_links',
         )
+        slim_fields = (
+            'id',
+            'name',
+            'created',
+            'modified',
+        )
 
     def create(self, validated_data):
         data = dict(validated_data)
@@ -221,8 +228,14 @@ class PortfolioStorageSerializer(serializers.ModelSerializer):
             # Set new file ref
             setattr(instance, field, new_related_file)
 
+        # Linked files are not validated, drop the statistics of the replaced files
+        update_fields = [k for k in validated_data]
+        if instance.exposure_statistics:
+            instance.exposure_statistics = {k: v for k, v in instance.exposure_statistics.items() if k not in validated_data}
+            update_fields.append('exposure_statistics')
+
         # Update & Delete prev linked files
-        instance.save(update_fields=[k for k in validated_data])
+        instance.save(update_fields=update_fields)
         for f in files_for_removal:
             f.delete()
         return instance
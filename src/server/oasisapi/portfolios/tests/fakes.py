@@ -2,6 +2,14 @@ from model_mommy import mommy
 
 from ..models import Portfolio
 
+LOCATION_FILE_HEADER = 'PortNumber,AccNumber,LocNumber,CountryCode,LocPerilsCovered,BuildingTIV,OtherTIV,ContentsTIV,BITIV,LocCurrency'
+
 
 def fake_portfolio(**kwargs):
     return mommy.make(Portfolio, **kwargs)
+
+
+def fake_location_csv(rows=(('1', '1', '1', 'US', 'WTC;WSS', '100', '0', '50', '10', 'USD'),), header=LOCATION_FILE_HEADER):
+    """ An OED location file, as bytes
+    """
+    return '\n'.join([header] + [','.join(row) for row in rows] + ['']).encode()
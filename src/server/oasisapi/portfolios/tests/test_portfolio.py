@@ -1,9 +1,18 @@
+import bz2
+import gzip
+import io
 import json
 import mimetypes
 import string
+import zipfile
 
+import brotli
 from backports.tempfile import TemporaryDirectory
+from django.conf import settings as django_settings
+from django.core.files.storage import default_storage
+from django.db import connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django_webtest import WebTestMixin
 from hypothesis import given, settings
@@ -11,13 +20,16 @@ from hypothesis.extra.django import TestCase
 from hypothesis.strategies import text, binary, sampled_from
 from mock import patch
 from rest_framework_simplejwt.tokens import AccessToken
+import zstandard
 
 from ...files.tests.fakes import fake_related_file
 from ...analysis_models.tests.fakes import fake_analysis_model
 from ...analyses.models import Analysis
 from ...auth.tests.fakes import fake_user
+from ...files.models import RelatedFile
+from ...tests.queries import ListQueriesMixin
 from ..models import Portfolio
-from .fakes import fake_portfolio
+from .fakes import fake_portfolio, fake_location_csv
 
 # Override default deadline for all tests to 8s
 settings.register_profile("ci", deadline=800.0)
@@ -137,6 +149,271 @@ class PortfolioApi(WebTestMixin, TestCase):
                 }, response.json)
 
 
+class PortfolioList(WebTestMixin, TestCase):
+    def test_slim_page_is_requested___slim_portfolios_are_returned_newest_first(self):
+        user = fake_user()
+        portfolios = [fake_portfolio(location_file=fake_related_file()) for _ in range(3)]
+
+        response = self.app.get(
+            reverse('portfolio-list', kwargs={'version': 'v1'}),
+            params={'slim': 'true', 'page_size': '2'},
+            headers={
+                'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+            },
+        )
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            [p.pk for p in reversed(portfolios)][:2],
+            [p['id'] for p in response.json['results']],
+        )
+        self.assertEqual(['created', 'id', 'modified', 'name'], sorted(response.json['results'][0]))
+        self.assertIsNotNone(response.json['next'])
+
+
+class PortfolioListQueries(ListQueriesMixin, WebTestMixin, TestCase):
+    def fake_full_portfolio(self):
+        fake_portfolio(
+            location_file=fake_related_file(),
+            accounts_file=fake_related_file(),
+            reinsurance_info_file=fake_related_file(),
+            reinsurance_scope_file=fake_related_file(),
+        )
+
+    def test_number_of_portfolios_grows___number_of_queries_is_constant(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                self.assert_list_queries_are_constant(
+                    reverse('portfolio-list', kwargs={'version': 'v1'}),
+                    self.fake_full_portfolio,
+                )
+
+
+class PortfolioConditionalGet(WebTestMixin, TestCase):
+    def get(self, url, user, headers=None):
+        headers = dict(headers or {}, Authorization='Bearer {}'.format(AccessToken.for_user(user)))
+        return self.app.get(url, headers=headers, expect_errors=True)
+
+    def test_user_is_not_authenticated___response_is_forbidden_not_304(self):
+        user = fake_user()
+        portfolio = fake_portfolio()
+        etag = self.get(portfolio.get_absolute_url(), user).headers['ETag']
+
+        response = self.app.get(portfolio.get_absolute_url(), headers={'If-None-Match': etag}, expect_errors=True)
+
+        self.assertIn(response.status_code, [401, 403])
+
+    def test_etag_matches___response_is_304_without_serializing_the_portfolio(self):
+        user = fake_user()
+        portfolio = fake_portfolio()
+
+        response = self.get(portfolio.get_absolute_url(), user)
+        self.assertEqual(200, response.status_code)
+        self.assertIn('Last-Modified', response.headers)
+        etag = response.headers['ETag']
+
+        with patch('src.server.oasisapi.portfolios.viewsets.PortfolioViewSet.get_serializer') as get_serializer:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.get(portfolio.get_absolute_url(), user, {'If-None-Match': etag})
+
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(etag, response.headers['ETag'])
+        self.assertEqual(b'', response.body)
+        get_serializer.assert_not_called()
+        self.assertEqual(1, len([q for q in queries if 'portfolios_portfolio' in q['sql']]))
+
+    def test_modified_since_last_modified___response_is_304(self):
+        user = fake_user()
+        portfolio = fake_portfolio()
+        last_modified = self.get(portfolio.get_absolute_url(), user).headers['Last-Modified']
+
+        response = self.get(portfolio.get_absolute_url(), user, {'If-Modified-Since': last_modified})
+
+        self.assertEqual(304, response.status_code)
+
+    def test_portfolio_is_modified___response_is_200_with_new_etag(self):
+        user = fake_user()
+        portfolio = fake_portfolio(name='before')
+        etag = self.get(portfolio.get_absolute_url(), user).headers['ETag']
+
+        portfolio.name = 'after'
+        portfolio.save()
+        response = self.get(portfolio.get_absolute_url(), user, {'If-None-Match': etag})
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('after', response.json['name'])
+        self.assertNotEqual(etag, response.headers['ETag'])
+
+    def test_list_etag_changes_when_a_portfolio_is_added_or_deleted(self):
+        user = fake_user()
+        portfolio = fake_portfolio()
+        url = reverse('portfolio-list', kwargs={'version': 'v1'})
+
+        response = self.get(url, user)
+        self.assertNotIn('Last-Modified', response.headers)
+        etag = response.headers['ETag']
+        self.assertEqual(304, self.get(url, user, {'If-None-Match': etag}).status_code)
+        self.assertNotEqual(etag, self.get(url + '?name=other', user).headers['ETag'])
+
+        fake_portfolio()
+        response = self.get(url, user, {'If-None-Match': etag})
+        self.assertEqual(200, response.status_code)
+        etag = response.headers['ETag']
+
+        portfolio.delete()
+        response = self.get(url, user, {'If-None-Match': etag})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, len(response.json))
+
+    def test_portfolio_is_modified___file_etag_is_kept_until_the_file_is_replaced(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio(location_file=fake_related_file())
+                url = portfolio.get_absolute_location_file_url()
+                etag = self.get(url, user).headers['ETag']
+
+                portfolio.name = 'renamed'
+                portfolio.save()
+                self.assertEqual(304, self.get(url, user, {'If-None-Match': etag}).status_code)
+
+                portfolio.location_file = fake_related_file(file=b'new content')
+                portfolio.save()
+                response = self.get(url, user, {'If-None-Match': etag})
+                self.assertEqual(200, response.status_code)
+                self.assertEqual(b'new content', response.body)
+
+
+COMPRESSION_MIDDLEWARE = 'src.server.oasisapi.compression.CompressionMiddleware'
+
+
+def compression_settings(**kwargs):
+    middleware = [m for m in django_settings.MIDDLEWARE if m != COMPRESSION_MIDDLEWARE]
+    middleware.insert(1, COMPRESSION_MIDDLEWARE)
+    return override_settings(DO_GZIP_RESPONSE=True, MIDDLEWARE=middleware, **kwargs)
+
+
+def get_content(response):
+    return b''.join(response.streaming_content) if response.streaming else response.content
+
+
+@compression_settings(COMPRESS_MIN_SIZE=100)
+class PortfolioCompression(TestCase):
+    # webtest decodes gzip responses, the encoded body is read from the django test client
+    def get(self, url, user, accept_encoding=None, **headers):
+        headers['HTTP_AUTHORIZATION'] = 'Bearer {}'.format(AccessToken.for_user(user))
+        if accept_encoding is not None:
+            headers['HTTP_ACCEPT_ENCODING'] = accept_encoding
+        return self.client.get(url, **headers)
+
+    def test_list_is_requested_with_gzip___response_is_compressed(self):
+        user = fake_user()
+        for i in range(10):
+            fake_portfolio(name='portfolio {}'.format(i))
+
+        response = self.get(reverse('portfolio-list', kwargs={'version': 'v1'}), user, 'gzip, deflate')
+        uncompressed = self.get(reverse('portfolio-list', kwargs={'version': 'v1'}), user)
+
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(str(len(response.content)), response['Content-Length'])
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertEqual(uncompressed.content, gzip.decompress(response.content))
+
+    def test_no_accept_encoding___response_is_not_compressed_and_varies(self):
+        user = fake_user()
+        for i in range(10):
+            fake_portfolio(name='portfolio {}'.format(i))
+
+        response = self.get(reverse('portfolio-list', kwargs={'version': 'v1'}), user)
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(10, len(json.loads(response.content)))
+
+    def test_response_is_smaller_than_the_min_size___response_is_not_compressed(self):
+        user = fake_user()
+        portfolio = fake_portfolio()
+
+        with override_settings(COMPRESS_MIN_SIZE=100000):
+            response = self.get(portfolio.get_absolute_url(), user, 'gzip')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_gzip_is_refused___response_is_not_compressed(self):
+        user = fake_user()
+        for i in range(10):
+            fake_portfolio(name='portfolio {}'.format(i))
+
+        for accept_encoding in ['identity', 'gzip;q=0', '*;q=0', 'compress']:
+            response = self.get(reverse('portfolio-list', kwargs={'version': 'v1'}), user, accept_encoding)
+            self.assertFalse(response.has_header('Content-Encoding'), accept_encoding)
+
+    def test_any_encoding_is_accepted___response_is_compressed(self):
+        user = fake_user()
+        for i in range(10):
+            fake_portfolio(name='portfolio {}'.format(i))
+
+        response = self.get(reverse('portfolio-list', kwargs={'version': 'v1'}), user, '*;q=0.5')
+
+        self.assertEqual('br', response['Content-Encoding'])
+
+    def test_brotli_and_gzip_are_accepted___brotli_is_preferred(self):
+        user = fake_user()
+        for i in range(10):
+            fake_portfolio(name='portfolio {}'.format(i))
+
+        response = self.get(reverse('portfolio-list', kwargs={'version': 'v1'}), user, 'gzip, br')
+        uncompressed = self.get(reverse('portfolio-list', kwargs={'version': 'v1'}), user)
+
+        self.assertEqual('br', response['Content-Encoding'])
+        self.assertEqual(uncompressed.content, brotli.decompress(response.content))
+
+    def test_zstd_and_gzip_are_accepted___zstd_is_preferred(self):
+        user = fake_user()
+        for i in range(10):
+            fake_portfolio(name='portfolio {}'.format(i))
+
+        response = self.get(reverse('portfolio-list', kwargs={'version': 'v1'}), user, 'gzip, zstd')
+        uncompressed = self.get(reverse('portfolio-list', kwargs={'version': 'v1'}), user)
+
+        self.assertEqual('zstd', response['Content-Encoding'])
+        self.assertEqual(str(len(response.content)), response['Content-Length'])
+        # the streamed frames do not record the content size, so decompress with a stream reader
+        self.assertEqual(uncompressed.content, zstandard.ZstdDecompressor().decompressobj().decompress(response.content))
+
+    def test_csv_file_is_downloaded___stream_is_compressed_with_a_weak_etag(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                content = b'LocNumber,AccNumber\n' + b''.join(b'%d,1\n' % i for i in range(1000))
+                portfolio = fake_portfolio(location_file=fake_related_file(file=content, content_type='text/csv'))
+
+                response = self.get(portfolio.get_absolute_location_file_url(), user, 'gzip')
+                body = get_content(response)
+                not_modified = self.get(
+                    portfolio.get_absolute_location_file_url(), user, 'gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+
+                self.assertTrue(response.streaming)
+                self.assertEqual('gzip', response['Content-Encoding'])
+                self.assertFalse(response.has_header('Content-Length'))
+                self.assertTrue(response['ETag'].startswith('W/"'))
+                self.assertEqual(content, gzip.decompress(body))
+                self.assertEqual(304, not_modified.status_code)
+
+    def test_gzip_file_is_downloaded___response_is_not_compressed_again(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                content = gzip.compress(b'LocNumber,AccNumber\n' * 1000)
+                portfolio = fake_portfolio(location_file=fake_related_file(file=content, content_type='application/gzip'))
+
+                response = self.get(portfolio.get_absolute_location_file_url(), user, 'gzip')
+
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertEqual(content, get_content(response))
+
+
 class PortfolioApiCreateAnalysis(WebTestMixin, TestCase):
     def test_user_is_not_authenticated___response_is_forbidden(self):
         portfolio = fake_portfolio()
@@ -355,6 +632,7 @@ class PortfolioAccountsFile(WebTestMixin, TestCase):
 
                 self.assertEqual(400, response.status_code)
 
+    @override_settings(PORTFOLIO_UPLOAD_VALIDATION=False)
     @given(file_content=binary(min_size=1), content_type=sampled_from(['text/csv', 'application/json']))
     def test_accounts_file_is_uploaded___file_can_be_retrieved(self, file_content, content_type):
         with TemporaryDirectory() as d:
@@ -437,6 +715,7 @@ class PortfolioLocationFile(WebTestMixin, TestCase):
 
                 self.assertEqual(400, response.status_code)
 
+    @override_settings(PORTFOLIO_UPLOAD_VALIDATION=False)
     @given(file_content=binary(min_size=1), content_type=sampled_from(['text/csv', 'application/json']))
     def test_location_file_is_uploaded___file_can_be_retrieved(self, file_content, content_type):
         with TemporaryDirectory() as d:
@@ -464,6 +743,280 @@ class PortfolioLocationFile(WebTestMixin, TestCase):
                 self.assertEqual(response.body, file_content)
                 self.assertEqual(response.content_type, content_type)
 
+    def test_location_file_is_uploaded_as_the_raw_body___file_can_be_retrieved(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio()
+
+                self.app.post(
+                    portfolio.get_absolute_location_file_url(),
+                    params=fake_location_csv(),
+                    content_type='text/csv',
+                    headers={
+                        'Authorization': 'Bearer {}'.format(AccessToken.for_user(user)),
+                        'Content-Disposition': 'attachment; filename="location.csv"',
+                    },
+                )
+
+                response = self.app.get(
+                    portfolio.get_absolute_location_file_url(),
+                    headers={
+                        'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                    },
+                )
+
+                self.assertEqual(response.body, fake_location_csv())
+                self.assertEqual(response.content_type, 'text/csv')
+                self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename="location.csv"')
+
+
+class PortfolioExposureValidation(WebTestMixin, TestCase):
+    def upload(self, portfolio, user, content, field='location_file', filename='location.csv', content_type='text/csv'):
+        return self.app.post(
+            reverse('portfolio-{}'.format(field.replace('_', '-')), kwargs={'version': 'v1', 'pk': portfolio.pk}),
+            params=content,
+            content_type=content_type,
+            headers={
+                'Authorization': 'Bearer {}'.format(AccessToken.for_user(user)),
+                'Content-Disposition': 'attachment; filename="{}"'.format(filename),
+            },
+            expect_errors=True,
+        )
+
+    def test_location_file_is_valid___statistics_are_stored_on_the_portfolio(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio()
+                content = fake_location_csv(rows=[
+                    ('1', '1', '1', 'US', 'WTC;WSS', '100', '0', '50', '10', 'USD'),
+                    ('1', '1', '2', 'gb', 'QEQ', '200.5', '1', '0', '0', 'GBP'),
+                    ('1', '2', '1', 'US', 'WTC', '300', '0', '0', '0', 'USD'),
+                ])
+
+                response = self.upload(portfolio, user, content)
+                statistics = self.app.get(
+                    portfolio.get_absolute_exposure_statistics_url(),
+                    headers={'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))},
+                )
+
+                self.assertEqual(200, response.status_code)
+                self.assertEqual({
+                    'location_file': {
+                        'rows': 3,
+                        'tiv': {'BuildingTIV': 600.5, 'OtherTIV': 1.0, 'ContentsTIV': 50.0, 'BITIV': 10.0, 'total': 661.5},
+                        'perils': {'WTC': 2, 'WSS': 1, 'QEQ': 1},
+                        'countries': {'US': 2, 'GB': 1},
+                        'currencies': {'USD': 2, 'GBP': 1},
+                    },
+                }, statistics.json)
+
+    def test_no_file_has_been_validated___statistics_response_is_404(self):
+        user = fake_user()
+        portfolio = fake_portfolio()
+
+        response = self.app.get(
+            portfolio.get_absolute_exposure_statistics_url(),
+            headers={'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))},
+            expect_errors=True,
+        )
+
+        self.assertEqual(404, response.status_code)
+
+    def test_columns_are_in_any_case_and_order___file_is_accepted(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio()
+                content = fake_location_csv(
+                    header='bitiv,locnumber,accnumber,portnumber,countrycode,locperilscovered,buildingtiv,othertiv,contentstiv,loccurrency,Latitude',
+                    rows=[('1', '1', '1', '1', 'FR', 'WW1', '10', '0', '0', 'EUR', '48.8')],
+                )
+
+                response = self.upload(portfolio, user, content)
+
+                self.assertEqual(200, response.status_code)
+                portfolio.refresh_from_db()
+                self.assertEqual(11.0, portfolio.exposure_statistics['location_file']['tiv']['total'])
+
+    def test_required_columns_are_missing___response_is_400_and_file_is_not_stored(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio()
+
+                response = self.upload(portfolio, user, b'LocNumber,AccNumber\n1,1\n')
+
+                self.assertEqual(400, response.status_code)
+                self.assertEqual(
+                    ['Missing required columns: PortNumber, CountryCode, LocPerilsCovered, BuildingTIV, OtherTIV, ContentsTIV, BITIV, LocCurrency'],
+                    response.json['file'],
+                )
+                portfolio.refresh_from_db()
+                self.assertIsNone(portfolio.location_file)
+                self.assertIsNone(portfolio.exposure_statistics)
+                self.assertFalse(RelatedFile.objects.exists())
+
+    def test_values_are_invalid___errors_are_reported_by_row(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio()
+                content = fake_location_csv(rows=[
+                    ('1', '1', '1', 'US', 'WTC', '100', '0', '0', '0', 'USD'),
+                    ('1', '1', '', 'USA', 'WTC;X', 'abc', '-1', '', '0', 'USD'),
+                    ('1', '1', '3', 'US'),
+                ])
+
+                response = self.upload(portfolio, user, content)
+
+                self.assertEqual(400, response.status_code)
+                self.assertEqual([
+                    'Row 3: LocNumber is required',
+                    'Row 3: BuildingTIV "abc" is not a number',
+                    'Row 3: OtherTIV should not be negative',
+                    'Row 3: ContentsTIV is required',
+                    'Row 3: "X" is not a peril code',
+                    'Row 3: CountryCode "USA" is not an ISO 3166 alpha-2 code',
+                    'Row 4: expected 10 values, found 4',
+                ], response.json['file'])
+
+    def test_file_has_many_errors___parsing_stops_at_the_error_limit(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio()
+                content = fake_location_csv(rows=[('1', '1', str(i), 'US', 'WTC', 'x', '0', '0', '0', 'USD') for i in range(1000)])
+
+                response = self.upload(portfolio, user, content)
+
+                self.assertEqual(400, response.status_code)
+                self.assertEqual(20, len(response.json['file']))
+
+    def test_file_has_no_rows___response_is_400(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio()
+
+                response = self.upload(portfolio, user, fake_location_csv(rows=[]))
+
+                self.assertEqual(400, response.status_code)
+                self.assertEqual(['File has no rows'], response.json['file'])
+
+    def test_file_is_not_text___response_is_400(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio()
+
+                response = self.upload(portfolio, user, b'\xff\xfe\x00\x01')
+
+                self.assertEqual(400, response.status_code)
+                self.assertEqual(['File is not UTF-8 encoded text'], response.json['file'])
+
+    def test_compressed_files_are_valid___statistics_are_read_from_the_decompressed_csv(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio()
+                zipped = io.BytesIO()
+                with zipfile.ZipFile(zipped, 'w') as archive:
+                    archive.writestr('location.csv', fake_location_csv())
+
+                for content, filename, content_type in [
+                    (gzip.compress(fake_location_csv()), 'location.csv.gz', 'application/gzip'),
+                    (bz2.compress(fake_location_csv()), 'location.csv.bz2', 'application/x-bzip2'),
+                    (zipped.getvalue(), 'location.zip', 'application/zip'),
+                ]:
+                    response = self.upload(portfolio, user, content, filename=filename, content_type=content_type)
+
+                    self.assertEqual(200, response.status_code, content_type)
+                    portfolio.refresh_from_db()
+                    self.assertEqual(1, portfolio.exposure_statistics['location_file']['rows'])
+                    self.assertEqual(content, portfolio.location_file.read())
+
+    def test_compressed_file_is_corrupt___response_is_400(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio()
+
+                response = self.upload(portfolio, user, b'not gzip', filename='location.csv.gz', content_type='application/gzip')
+
+                self.assertEqual(400, response.status_code)
+                self.assertEqual(['File could not be decompressed as application/gzip'], response.json['file'])
+
+    def test_accounts_file_is_valid___statistics_are_kept_with_the_location_file_statistics(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio()
+                accounts = b'PortNumber,AccNumber,PolNumber,PolPerilsCovered,AccCurrency,LayerLimit\n1,1,1,WTC,USD,1000\n1,2,1,QQ1,USD,\n'
+
+                self.upload(portfolio, user, fake_location_csv())
+                response = self.upload(portfolio, user, accounts, field='accounts_file', filename='account.csv')
+
+                self.assertEqual(200, response.status_code)
+                portfolio.refresh_from_db()
+                self.assertEqual({'location_file', 'accounts_file'}, set(portfolio.exposure_statistics))
+                self.assertEqual(
+                    {'rows': 2, 'perils': {'WTC': 1, 'QQ1': 1}, 'currencies': {'USD': 2}},
+                    portfolio.exposure_statistics['accounts_file'],
+                )
+
+    def test_location_file_is_deleted___its_statistics_are_dropped(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio()
+                accounts = b'PortNumber,AccNumber,PolNumber,PolPerilsCovered,AccCurrency,LayerLimit\n1,1,1,WTC,USD,1000\n'
+                self.upload(portfolio, user, fake_location_csv())
+                self.upload(portfolio, user, accounts, field='accounts_file', filename='account.csv')
+
+                response = self.app.delete(
+                    portfolio.get_absolute_location_file_url(),
+                    headers={'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))},
+                )
+                statistics = self.app.get(
+                    portfolio.get_absolute_exposure_statistics_url(),
+                    headers={'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))},
+                )
+
+                self.assertEqual(200, response.status_code)
+                self.assertEqual({'accounts_file'}, set(statistics.json))
+                portfolio.refresh_from_db()
+                self.assertIsNone(portfolio.location_file)
+                self.assertNotIn('location_file', portfolio.exposure_statistics)
+
+    def test_json_and_reinsurance_files___files_are_not_validated(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio()
+
+                json_response = self.upload(portfolio, user, b'{}', filename='location.json', content_type='application/json')
+                reinsurance_response = self.upload(portfolio, user, b'a,b\n', field='reinsurance_info_file', filename='ri.csv')
+
+                self.assertEqual(200, json_response.status_code)
+                self.assertEqual(200, reinsurance_response.status_code)
+                portfolio.refresh_from_db()
+                self.assertEqual({}, portfolio.exposure_statistics)
+
+    @override_settings(PORTFOLIO_UPLOAD_VALIDATION=False)
+    def test_validation_is_disabled___invalid_file_is_accepted_without_statistics(self):
+        with TemporaryDirectory() as d:
+            with override_settings(MEDIA_ROOT=d):
+                user = fake_user()
+                portfolio = fake_portfolio(exposure_statistics={'location_file': {'rows': 1}})
+
+                response = self.upload(portfolio, user, b'LocNumber\n1\n')
+
+                self.assertEqual(200, response.status_code)
+                portfolio.refresh_from_db()
+                self.assertEqual({}, portfolio.exposure_statistics)
+
 
 class PortfolioReinsuranceSourceFile(WebTestMixin, TestCase):
     def test_user_is_not_authenticated___response_is_forbidden(self):
@@ -627,3 +1180,210 @@ class PortfolioReinsuranceInfoFile(WebTestMixin, TestCase):
 
                 self.assertEqual(response.body, file_content)
                 self.assertEqual(response.content_type, content_type)
+
+
+S3_STORAGE_SETTINGS = {
+    'DEFAULT_FILE_STORAGE': 'storages.backends.s3boto3.S3Boto3Storage',
+    'AWS_ACCESS_KEY_ID': 'foo',
+    'AWS_SECRET_ACCESS_KEY': 'bar',
+    'AWS_STORAGE_BUCKET_NAME': 'test-bucket',
+    'AWS_S3_REGION_NAME': 'eu-west-1',
+    'AWS_LOCATION': '',
+    'AWS_DEFAULT_ACL': None,
+}
+
+
+class PortfolioPresignedUpload(WebTestMixin, TestCase):
+    def test_user_is_not_authenticated___response_is_forbidden(self):
+        portfolio = fake_portfolio()
+
+        response = self.app.post(portfolio.get_absolute_presigned_upload_url(), expect_errors=True)
+        self.assertIn(response.status_code, [401,403])
+
+    def test_storage_is_not_s3___response_is_400(self):
+        user = fake_user()
+        portfolio = fake_portfolio()
+
+        response = self.app.post_json(
+            portfolio.get_absolute_presigned_upload_url(),
+            {'field': 'location_file', 'filename': 'loc.csv', 'content_type': 'text/csv'},
+            headers={
+                'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+            },
+            expect_errors=True,
+        )
+
+        self.assertEqual(400, response.status_code)
+
+    def test_content_type_is_not_supported___response_is_400(self):
+        with override_settings(**S3_STORAGE_SETTINGS):
+            user = fake_user()
+            portfolio = fake_portfolio()
+
+            response = self.app.post_json(
+                portfolio.get_absolute_presigned_upload_url(),
+                {'field': 'location_file', 'filename': 'loc.tar', 'content_type': 'application/x-tar'},
+                headers={
+                    'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                },
+                expect_errors=True,
+            )
+
+            self.assertEqual(400, response.status_code)
+            self.assertIn('content_type', response.json)
+
+    @given(method=sampled_from(['post', 'put']))
+    def test_storage_is_s3___presigned_url_and_token_are_returned(self, method):
+        with override_settings(**S3_STORAGE_SETTINGS):
+            user = fake_user()
+            portfolio = fake_portfolio()
+
+            response = self.app.post_json(
+                portfolio.get_absolute_presigned_upload_url(),
+                {'field': 'location_file', 'filename': 'loc.csv', 'content_type': 'text/csv', 'method': method},
+                headers={
+                    'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                },
+            )
+
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(method, response.json['method'])
+            self.assertIn('test-bucket', response.json['url'])
+            self.assertIn('upload_token', response.json)
+            if method == 'post':
+                self.assertEqual('text/csv', response.json['fields']['Content-Type'])
+                self.assertTrue(response.json['fields']['key'].endswith('.csv'))
+            else:
+                self.assertEqual({'Content-Type': 'text/csv'}, response.json['headers'])
+
+    def test_upload_is_confirmed___file_is_attached_to_portfolio(self):
+        with override_settings(**S3_STORAGE_SETTINGS):
+            user = fake_user()
+            portfolio = fake_portfolio()
+            headers = {'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))}
+
+            upload = self.app.post_json(
+                portfolio.get_absolute_presigned_upload_url(),
+                {'field': 'location_file', 'filename': 'loc.csv', 'content_type': 'text/csv'},
+                headers=headers,
+            ).json
+
+            with patch.object(default_storage.bucket.meta.client, 'head_object') as head_object, \
+                    patch.object(default_storage, 'open', return_value=io.BytesIO(fake_location_csv())):
+                head_object.return_value = {'ContentType': 'text/csv', 'ContentLength': 10}
+
+                response = self.app.post_json(
+                    portfolio.get_absolute_presigned_upload_confirm_url(),
+                    {'upload_token': upload['upload_token']},
+                    headers=headers,
+                )
+                head_key = head_object.call_args[1]['Key']
+
+                # Confirming twice is a no-op
+                repeat = self.app.post_json(
+                    portfolio.get_absolute_presigned_upload_confirm_url(),
+                    {'upload_token': upload['upload_token']},
+                    headers=headers,
+                )
+
+            portfolio.refresh_from_db()
+            self.assertEqual(200, response.status_code)
+            self.assertEqual('loc.csv', response.json['filename'])
+            self.assertEqual(upload['fields']['key'], head_key)
+            self.assertEqual(head_key, portfolio.location_file.file.name)
+            self.assertEqual('text/csv', portfolio.location_file.content_type)
+            self.assertEqual(response.json, repeat.json)
+            self.assertEqual(1, head_object.call_count)
+            self.assertEqual(1, portfolio.exposure_statistics['location_file']['rows'])
+
+    def test_uploaded_object_is_not_a_valid_location_file___response_is_400_and_file_is_not_attached(self):
+        with override_settings(**S3_STORAGE_SETTINGS):
+            user = fake_user()
+            portfolio = fake_portfolio()
+            headers = {'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))}
+
+            upload = self.app.post_json(
+                portfolio.get_absolute_presigned_upload_url(),
+                {'field': 'location_file', 'filename': 'loc.csv', 'content_type': 'text/csv'},
+                headers=headers,
+            ).json
+
+            with patch.object(default_storage.bucket.meta.client, 'head_object') as head_object, \
+                    patch.object(default_storage, 'open', return_value=io.BytesIO(b'LocNumber\n1\n')):
+                head_object.return_value = {'ContentType': 'text/csv', 'ContentLength': 10}
+
+                response = self.app.post_json(
+                    portfolio.get_absolute_presigned_upload_confirm_url(),
+                    {'upload_token': upload['upload_token']},
+                    headers=headers,
+                    expect_errors=True,
+                )
+
+            portfolio.refresh_from_db()
+            self.assertEqual(400, response.status_code)
+            self.assertIn('file', response.json)
+            self.assertIsNone(portfolio.location_file)
+
+    def test_uploaded_object_has_wrong_content_type___response_is_400(self):
+        with override_settings(**S3_STORAGE_SETTINGS):
+            user = fake_user()
+            portfolio = fake_portfolio()
+            headers = {'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))}
+
+            upload = self.app.post_json(
+                portfolio.get_absolute_presigned_upload_url(),
+                {'field': 'location_file', 'filename': 'loc.csv', 'content_type': 'text/csv'},
+                headers=headers,
+            ).json
+
+            with patch.object(default_storage.bucket.meta.client, 'head_object') as head_object:
+                head_object.return_value = {'ContentType': 'application/x-tar', 'ContentLength': 10}
+
+                response = self.app.post_json(
+                    portfolio.get_absolute_presigned_upload_confirm_url(),
+                    {'upload_token': upload['upload_token']},
+                    headers=headers,
+                    expect_errors=True,
+                )
+
+            portfolio.refresh_from_db()
+            self.assertEqual(400, response.status_code)
+            self.assertIsNone(portfolio.location_file)
+
+    def test_upload_token_is_for_another_portfolio___response_is_400(self):
+        with override_settings(**S3_STORAGE_SETTINGS):
+            user = fake_user()
+            portfolio = fake_portfolio()
+            other = fake_portfolio()
+            headers = {'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))}
+
+            upload = self.app.post_json(
+                other.get_absolute_presigned_upload_url(),
+                {'field': 'location_file', 'filename': 'loc.csv', 'content_type': 'text/csv'},
+                headers=headers,
+            ).json
+
+            response = self.app.post_json(
+                portfolio.get_absolute_presigned_upload_confirm_url(),
+                {'upload_token': upload['upload_token']},
+                headers=headers,
+                expect_errors=True,
+            )
+
+            self.assertEqual(400, response.status_code)
+
+    def test_upload_token_is_invalid___response_is_400(self):
+        with override_settings(**S3_STORAGE_SETTINGS):
+            user = fake_user()
+            portfolio = fake_portfolio()
+
+            response = self.app.post_json(
+                portfolio.get_absolute_presigned_upload_confirm_url(),
+                {'upload_token': 'not-a-token'},
+                headers={
+                    'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                },
+                expect_errors=True,
+            )
+
+            self.assertEqual(400, response.status_code)
@@ -1,22 +1,26 @@
 from __future__ import absolute_import
 
+from django.http import Http404
+from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
 from django_filters import rest_framework as filters
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import viewsets
 from rest_framework.decorators import action
-from rest_framework.parsers import MultiPartParser
+from rest_framework.parsers import MultiPartParser, FileUploadParser
 from rest_framework.response import Response
 from rest_framework.settings import api_settings
 from rest_framework.status import HTTP_201_CREATED
 
+from ..conditional import ConditionalGetMixin
 from ..filters import TimeStampedFilter
 from ..analyses.serializers import AnalysisSerializer
-from ..files.views import handle_related_file
-from ..files.serializers import RelatedFileSerializer
-from .models import Portfolio
-from ..schemas.custom_swagger import FILE_RESPONSE
-from ..schemas.serializers import StorageLinkSerializer
+from ..files.views import handle_related_file, handle_presigned_upload, handle_presigned_upload_confirm
+from ..files.serializers import RelatedFileSerializer, PresignedUploadSerializer, PresignedUploadConfirmSerializer
+from .exposure import drop_exposure_statistics, validate_exposure_file
+from .models import Portfolio, EXPOSURE_FILE_CONTENT_TYPES
+from ..schemas.custom_swagger import FILE_RESPONSE, SPARSE_FIELDS, SLIM
+from ..schemas.serializers import StorageLinkSerializer, PresignedUploadResponseSerializer, ExposureStatisticsSerializer
 from .serializers import PortfolioSerializer, CreateAnalysisSerializer, PortfolioStorageSerializer
 
 
@@ -38,7 +42,8 @@ class PortfolioFilter(TimeStampedFilter):
         ]
 
 
-class PortfolioViewSet(viewsets.ModelViewSet):
+@method_decorator(name='list', decorator=swagger_auto_schema(manual_parameters=[SPARSE_FIELDS, SLIM]))
+class PortfolioViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     list:
     Returns a list of Portfolio objects.
@@ -57,6 +62,30 @@ class PortfolioViewSet(viewsets.ModelViewSet):
 
         /portfolio/?modified__lt=2000-01-01
 
+    To page through the portfolios 100 at a time, most recently modified first
+    (follow the `next` link of the response for the following page)
+
+        /portfolios/?page_size=100
+
+    To get only the `id,name` fields of each portfolio
+
+        /portfolios/?fields=id,name
+
+    To get the portfolios without their file links
+
+        /portfolios/?slim
+
+    The exposure files can be uploaded as a multipart form with a `file` field, or
+    as the raw request body typed by its `Content-Type` and named by a header like
+    `Content-Disposition: attachment; filename="location.csv"`. Raw uploads are
+    streamed to the storage when the server runs under ASGI.
+
+    Location and accounts CSV files (plain or compressed) are validated against the
+    required OED columns and value types as they are uploaded, a malformed file is
+    rejected with a `400` listing its problems. The row count, TIV totals, peril,
+    country and currency distributions of the accepted files are kept, see
+    `exposure_statistics`.
+
     retrieve:
     Returns the specific portfolio entry.
 
@@ -74,18 +103,35 @@ class PortfolioViewSet(viewsets.ModelViewSet):
     serializer_class = PortfolioSerializer
     filterset_class = PortfolioFilter
 
-    supported_mime_types = [
-        'application/json',
-        'text/csv',
-        'application/gzip',
-        'application/x-bzip2',
-        'application/zip',
-        'application/x-bzip2',
+    def get_queryset(self):
+        queryset = super(PortfolioViewSet, self).get_queryset()
+        if self.action in ['list', 'retrieve']:
+            queryset = queryset.select_related('location_file', 'accounts_file', 'reinsurance_info_file', 'reinsurance_scope_file')
+        return queryset
+
+    supported_mime_types = EXPOSURE_FILE_CONTENT_TYPES
+
+    presigned_upload_fields = [
+        'accounts_file',
+        'location_file',
+        'reinsurance_info_file',
+        'reinsurance_scope_file',
     ]
 
+    conditional_file_actions = {
+        'accounts_file': 'accounts_file',
+        'location_file': 'location_file',
+        'reinsurance_info_file': 'reinsurance_info_file',
+        'reinsurance_scope_file': 'reinsurance_scope_file',
+    }
+
     def get_serializer_class(self):
         if self.action == 'create_analysis':
             return CreateAnalysisSerializer
+        elif self.action == 'presigned_upload':
+            return PresignedUploadSerializer
+        elif self.action == 'presigned_upload_confirm':
+            return PresignedUploadConfirmSerializer
         elif self.action in ['set_storage_links', 'storage_links']:
             return PortfolioStorageSerializer
         elif self.action in [
@@ -98,8 +144,14 @@ class PortfolioViewSet(viewsets.ModelViewSet):
 
     @property
     def parser_classes(self):
-        if getattr(self, 'action', None) in ['set_accounts_file', 'set_location_file', 'set_reinsurance_info_file', 'set_reinsurance_scope_file']:
-            return [MultiPartParser]
+        # The parsers are picked before `action` is set, so look the action up from the method
+        action = getattr(self, 'action', None)
+        if action is None and getattr(self, 'request', None) is not None:
+            action = getattr(self, 'action_map', {}).get(self.request.method.lower())
+
+        if action in ['set_accounts_file', 'set_location_file', 'set_reinsurance_info_file', 'set_reinsurance_scope_file']:
+            # Raw uploads take the file name from the `Content-Disposition` header
+            return [MultiPartParser, FileUploadParser]
         else:
             return api_settings.DEFAULT_PARSER_CLASSES
 
@@ -120,6 +172,38 @@ class PortfolioViewSet(viewsets.ModelViewSet):
             status=HTTP_201_CREATED,
         )
 
+    @swagger_auto_schema(request_body=PresignedUploadSerializer, responses={200: PresignedUploadResponseSerializer})
+    @action(methods=['post'], detail=True)
+    def presigned_upload(self, request, pk=None, version=None):
+        """
+        Issues a presigned S3 `post` or `put` URL for one of the portfolio files, so the file
+        is uploaded directly to the bucket instead of through the API server.
+        Once the upload completes send the returned `upload_token` to `presigned_upload_confirm`.
+        """
+        field_content_types = {f: self.supported_mime_types for f in self.presigned_upload_fields}
+        return handle_presigned_upload(self.get_object(), request, field_content_types)
+
+    @swagger_auto_schema(request_body=PresignedUploadConfirmSerializer, responses={200: RelatedFileSerializer})
+    @action(methods=['post'], detail=True)
+    def presigned_upload_confirm(self, request, pk=None, version=None):
+        """
+        Validates an object uploaded with a presigned URL and attaches it to the portfolio
+        """
+        field_content_types = {f: self.supported_mime_types for f in self.presigned_upload_fields}
+        return handle_presigned_upload_confirm(self.get_object(), request, field_content_types, validate=validate_exposure_file)
+
+    @swagger_auto_schema(responses={200: ExposureStatisticsSerializer})
+    @action(methods=['get'], detail=True)
+    def exposure_statistics(self, request, pk=None, version=None):
+        """
+        Gets the statistics of the `location_file` and `accounts_file` computed when they were uploaded,
+        the row count, TIV totals and the peril, country and currency distributions
+        """
+        portfolio = self.get_object()
+        if portfolio.exposure_statistics is None:
+            raise Http404()
+        return Response(portfolio.exposure_statistics)
+
     @swagger_auto_schema(methods=['post'], request_body=StorageLinkSerializer)
     @action(methods=['get', 'post'], detail=True)
     def storage_links(self, request, pk=None, version=None):
@@ -147,7 +231,11 @@ class PortfolioViewSet(viewsets.ModelViewSet):
         delete:
         Disassociates the portfolios `accounts_file` with the portfolio
         """
-        return handle_related_file(self.get_object(), 'accounts_file', request, self.supported_mime_types)
+        portfolio = self.get_object()
+        response = handle_related_file(portfolio, 'accounts_file', request, self.supported_mime_types)
+        if request.method == 'DELETE':
+            drop_exposure_statistics(portfolio, 'accounts_file')
+        return response
 
     @accounts_file.mapping.post
     def set_accounts_file(self, request, pk=None, version=None):
@@ -155,7 +243,7 @@ class PortfolioViewSet(viewsets.ModelViewSet):
         post:
         Sets the portfolios `accounts_file` contents
         """
-        return handle_related_file(self.get_object(), 'accounts_file', request, self.supported_mime_types)
+        return handle_related_file(self.get_object(), 'accounts_file', request, self.supported_mime_types, validate=validate_exposure_file)
 
     @swagger_auto_schema(methods=['get'], responses={200: FILE_RESPONSE})
     @action(methods=['get', 'delete'], detail=True)
@@ -167,7 +255,11 @@ class PortfolioViewSet(viewsets.ModelViewSet):
         delete:
         Disassociates the portfolios `location_file` contents
         """
-        return handle_related_file(self.get_object(), 'location_file', request, self.supported_mime_types)
+        portfolio = self.get_object()
+        response = handle_related_file(portfolio, 'location_file', request, self.supported_mime_types)
+        if request.method == 'DELETE':
+            drop_exposure_statistics(portfolio, 'location_file')
+        return response
 
     @location_file.mapping.post
     def set_location_file(self, request, pk=None, version=None):
@@ -175,7 +267,7 @@ class PortfolioViewSet(viewsets.ModelViewSet):
         post:
         Sets the portfolios `location_file` contents
         """
-        return handle_related_file(self.get_object(), 'location_file', request, self.supported_mime_types)
+        return handle_related_file(self.get_object(), 'location_file', request, self.supported_mime_types, validate=validate_exposure_file)
 
     @swagger_auto_schema(methods=['get'], responses={200: FILE_RESPONSE})
     @action(methods=['get', 'delete'], detail=True)
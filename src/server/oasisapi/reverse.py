@@ -0,0 +1,47 @@
+from functools import lru_cache
+
+from django.urls import get_script_prefix, reverse as django_reverse
+from rest_framework.reverse import reverse as drf_reverse
+
+# Numeric so it matches both the `[^/.]+` and `\d+` pk patterns
+PK_PLACEHOLDER = '9876543210123'
+
+
+@lru_cache(maxsize=None)
+def _get_url_template(viewname, version, script_prefix):
+    """ Resolve the route of a detail view once, split around the `pk`
+    """
+    path = django_reverse(viewname, kwargs={'version': version, 'pk': PK_PLACEHOLDER})
+    prefix, suffix = path.split(PK_PLACEHOLDER, 1)
+    return prefix, suffix
+
+
+def _get_request_prefix(request):
+    """ The scheme, host and script prefix of the request, computed once per request
+    """
+    prefix = getattr(request, '_absolute_url_prefix', None)
+    if prefix is None:
+        prefix = (request.build_absolute_uri('/')[:-1], get_script_prefix())
+        request._absolute_url_prefix = prefix
+    return prefix
+
+
+def reverse(viewname, args=None, kwargs=None, request=None, format=None, **extra):
+    """ Drop in replacement for `rest_framework.reverse.reverse` for detail routes
+
+    URLs with only `version` and `pk` kwargs are built from a template resolved
+    once per route, with the `pk` substituted per object, rather than matching
+    the url patterns on every call. Anything else falls back to the DRF reverse.
+    """
+    if args or format or extra or not kwargs or set(kwargs) != {'version', 'pk'}:
+        return drf_reverse(viewname, args=args, kwargs=kwargs, request=request, format=format, **extra)
+
+    if request is None:
+        base_url, script_prefix = '', get_script_prefix()
+    else:
+        base_url, script_prefix = _get_request_prefix(request)
+
+    # Matches `URLPathVersioning`, the version of the request takes precedence
+    version = getattr(request, 'version', None) or kwargs['version']
+    prefix, suffix = _get_url_template(viewname, version, script_prefix)
+    return '{}{}{}{}'.format(base_url, prefix, kwargs['pk'], suffix)
@@ -0,0 +1,96 @@
+""" Routing of the reads of safe requests to the read replicas of the database
+
+`ReplicaRoutingMiddleware` lets GET, HEAD and OPTIONS requests read from one of
+the `DATABASE_REPLICAS`, picked at random for the whole request. Everything else
+uses the primary (`default`) database:
+
+* writes, and the reads after a write in the same request
+* reads inside a transaction on the primary
+* requests made within `DB_REPLICA_STICKY_SECONDS` of a write by the same
+  client, so clients read their own writes while the replicas catch up. The
+  client is pinned to the primary by a cookie set on the response of the write
+* queries outside a request, such as those of the celery tasks, and code run
+  under `use_primary`
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY_COOKIE = 'oasis_db_primary'
+
+
+class RoutingState(object):
+    def __init__(self, replica=None):
+        self.replica = replica
+        self.written = False
+
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+@contextmanager
+def use_primary():
+    """ Route every query to the primary database, usable as a decorator
+    """
+    outer = _state.get()
+    token = _state.set(RoutingState())
+    try:
+        yield
+    finally:
+        if outer is not None and _state.get().written:
+            outer.written = True
+        _state.reset(token)
+
+
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or state.written:
+            return DEFAULT_DB_ALIAS
+
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.written = True
+
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware(object):
+    """ Sets the database routing of each request, see `ReplicaRouter`.
+    Enabled when `DB_REPLICA_HOSTS` is set.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replica = None
+        if settings.DATABASE_REPLICAS and request.method in SAFE_METHODS and PRIMARY_COOKIE not in request.COOKIES:
+            replica = random.choice(settings.DATABASE_REPLICAS)
+
+        state = RoutingState(replica)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.written or request.method not in SAFE_METHODS:
+            response.set_cookie(PRIMARY_COOKIE, '1', max_age=settings.DB_REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax')
+        return response
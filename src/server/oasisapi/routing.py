@@ -0,0 +1,58 @@
+from django.conf.urls import url
+
+from .analyses.consumers import AnalysisStatusConsumer
+from .analyses.models import Analysis
+from .data_files.models import DataFile
+from .files.streaming import RelatedFileConsumer
+from .portfolios.exposure import validate_exposure_file
+from .portfolios.models import Portfolio, EXPOSURE_FILE_CONTENT_TYPES
+
+websocket_urlpatterns = [
+    url(r'^ws/(?P<version>[^/]+)/analyses/status/$', AnalysisStatusConsumer.as_asgi(), name='analysis-status-user'),
+    url(r'^ws/(?P<version>[^/]+)/analyses/(?P<analysis_pk>\d+)/status/$', AnalysisStatusConsumer.as_asgi(), name='analysis-status'),
+    url(r'^ws/(?P<version>[^/]+)/portfolios/(?P<portfolio_pk>\d+)/status/$', AnalysisStatusConsumer.as_asgi(), name='portfolio-status'),
+]
+
+PORTFOLIO_FILES = [
+    'accounts_file',
+    'location_file',
+    'reinsurance_info_file',
+    'reinsurance_scope_file',
+]
+
+ANALYSIS_FILES = [
+    'input_file',
+    'lookup_errors_file',
+    'lookup_success_file',
+    'lookup_validation_file',
+    'summary_levels_file',
+    'input_generation_traceback_file',
+    'output_file',
+    'run_traceback_file',
+    'run_log_file',
+]
+
+# File downloads and exposure uploads served by async consumers, the other
+# requests to these urls are served by the REST views
+http_urlpatterns = [
+    url(
+        r'^(?P<version>[^/]+)/portfolios/(?P<pk>\d+)/{}/$'.format(field),
+        RelatedFileConsumer.as_asgi(
+            model=Portfolio,
+            field=field,
+            action=field,
+            upload=True,
+            content_types=EXPOSURE_FILE_CONTENT_TYPES,
+            validate=validate_exposure_file if field in ['accounts_file', 'location_file'] else None,
+        ),
+    )
+    for field in PORTFOLIO_FILES
+] + [
+    url(
+        r'^(?P<version>[^/]+)/analyses/(?P<pk>\d+)/{}/$'.format(field),
+        RelatedFileConsumer.as_asgi(model=Analysis, field=field, action=field),
+    )
+    for field in ANALYSIS_FILES
+] + [
+    url(r'^(?P<version>[^/]+)/data_files/(?P<pk>\d+)/content/$', RelatedFileConsumer.as_asgi(model=DataFile, field='file', action='content')),
+]
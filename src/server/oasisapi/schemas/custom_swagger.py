@@ -2,6 +2,10 @@ __all__ = [
     'FILE_RESPONSE',
     'HEALTHCHECK',
     'TOKEN_REFRESH_HEADER',
+    'ARCHIVE_MEMBER_NAME',
+    'SPARSE_FIELDS',
+    'SLIM',
+    'STATUS_SINCE',
 ]
 
 from drf_yasg import openapi
@@ -59,3 +63,33 @@ TOKEN_REFRESH_HEADER = openapi.Parameter(
     type='string',
     default='Bearer <refresh_token>'
 )
+
+ARCHIVE_MEMBER_NAME = openapi.Parameter(
+    'member',
+    'query',
+    description="Name of the archive member, e.g. `output/gul_S1_aalcalc.csv` or `gul_S1_aalcalc.csv`",
+    type='string',
+    required=True,
+)
+
+SPARSE_FIELDS = openapi.Parameter(
+    'fields',
+    'query',
+    description="Comma separated list of the fields to return, e.g. `id,name`",
+    type='string',
+)
+
+SLIM = openapi.Parameter(
+    'slim',
+    'query',
+    description="Only return the fields stored on the object, leaving out the file links",
+    type='boolean',
+)
+
+STATUS_SINCE = openapi.Parameter(
+    'since',
+    'query',
+    description="Only return analyses modified after the given time, pass the `cursor` of the previous response",
+    type='string',
+    format='date-time',
+)
@@ -6,11 +6,17 @@ __all__ = [
     'ReinsScopeFileSerializer',
     'AnalysisSettingsSerializer',
     'ModelParametersSerializer',
+    'PresignedUploadResponseSerializer',
+    'ArchiveIndexSerializer',
+    'OutputTableSerializer',
+    'AnalysisMetricsSerializer',
 ]
 
 import io
 import os
 import json
+import threading
+from functools import lru_cache
 
 from rest_framework import serializers
 
@@ -55,6 +61,139 @@ class StorageLinkSerializer(serializers.Serializer):
     def update(self, instance, validated_data):
         raise NotImplementedError()
 
+class PresignedUploadResponseSerializer(serializers.Serializer):
+    method = serializers.CharField()
+    url = serializers.URLField()
+    fields = serializers.DictField(required=False, help_text='Form fields to include with a `post` upload')
+    headers = serializers.DictField(required=False, help_text='Headers to send with a `put` upload')
+    expires_in = serializers.IntegerField()
+    upload_token = serializers.CharField()
+
+    def create(self, validated_data):
+        raise NotImplementedError()
+
+    def update(self, instance, validated_data):
+        raise NotImplementedError()
+
+
+class ArchiveMemberSerializer(serializers.Serializer):
+    name = serializers.CharField()
+    size = serializers.IntegerField()
+    md5 = serializers.CharField(allow_null=True)
+
+    def create(self, validated_data):
+        raise NotImplementedError()
+
+    def update(self, instance, validated_data):
+        raise NotImplementedError()
+
+
+class ArchiveIndexSerializer(serializers.Serializer):
+    indexed = serializers.BooleanField(help_text='`false` when the archive was stored without a member index and had to be scanned')
+    members = ArchiveMemberSerializer(many=True)
+
+    def create(self, validated_data):
+        raise NotImplementedError()
+
+    def update(self, instance, validated_data):
+        raise NotImplementedError()
+
+
+class OutputTableSerializer(serializers.Serializer):
+    table = serializers.CharField(help_text='Table name to pass to `output_query`')
+    num_rows = serializers.IntegerField()
+    columns = serializers.ListField(child=serializers.DictField(), help_text='Column `name` and `type` pairs')
+
+    def create(self, validated_data):
+        raise NotImplementedError()
+
+    def update(self, instance, validated_data):
+        raise NotImplementedError()
+
+
+class SummaryLevelMetricsSerializer(serializers.Serializer):
+    tiv = serializers.FloatField(allow_null=True, help_text='Total insured value from the summary info file')
+    aal = serializers.DictField(child=serializers.FloatField(), help_text='Total AAL over the summary ids, by result type')
+    ep = serializers.DictField(
+        allow_null=True,
+        help_text='EP curve losses keyed by curve, summary id, (result type) and return period. '
+                  '`null` for summary levels with too many summary ids',
+    )
+
+    def create(self, validated_data):
+        raise NotImplementedError()
+
+    def update(self, instance, validated_data):
+        raise NotImplementedError()
+
+
+class AnalysisMetricsSerializer(serializers.Serializer):
+    total_tiv = serializers.FloatField(allow_null=True)
+    return_periods = serializers.ListField(child=serializers.FloatField())
+    summary_levels = serializers.DictField(child=SummaryLevelMetricsSerializer(), help_text='Metrics keyed by summary level, e.g. `gul_S1`')
+
+    def create(self, validated_data):
+        raise NotImplementedError()
+
+    def update(self, instance, validated_data):
+        raise NotImplementedError()
+
+
+class ExposureFileStatisticsSerializer(serializers.Serializer):
+    rows = serializers.IntegerField()
+    tiv = serializers.DictField(child=serializers.FloatField(), required=False, help_text='TIV totals by column and their `total`, location files only')
+    perils = serializers.DictField(child=serializers.IntegerField(), help_text='Rows covering each peril code')
+    countries = serializers.DictField(child=serializers.IntegerField(), required=False, help_text='Rows by country code, location files only')
+    currencies = serializers.DictField(child=serializers.IntegerField(), help_text='Rows by currency code')
+
+    def create(self, validated_data):
+        raise NotImplementedError()
+
+    def update(self, instance, validated_data):
+        raise NotImplementedError()
+
+
+class ExposureStatisticsSerializer(serializers.Serializer):
+    location_file = ExposureFileStatisticsSerializer(required=False)
+    accounts_file = ExposureFileStatisticsSerializer(required=False)
+
+    def create(self, validated_data):
+        raise NotImplementedError()
+
+    def update(self, instance, validated_data):
+        raise NotImplementedError()
+
+
+class AnalysisRuntimeEstimateSerializer(serializers.Serializer):
+    phase = serializers.ChoiceField(choices=['GENERATE_INPUTS', 'RUN'], help_text='The running or queued task, or the next task of an idle analysis')
+    duration = serializers.FloatField(allow_null=True, help_text='Predicted duration of the task in seconds, `null` until the model has completed a task')
+    queue_wait = serializers.FloatField(allow_null=True, help_text='Predicted seconds until the task starts, `0` once started')
+    remaining = serializers.FloatField(allow_null=True, help_text='Predicted seconds until the task completes')
+    eta = serializers.DateTimeField(allow_null=True, help_text='Predicted completion time')
+    samples = serializers.IntegerField(help_text='Completed tasks the prediction is fitted from')
+
+    def create(self, validated_data):
+        raise NotImplementedError()
+
+    def update(self, instance, validated_data):
+        raise NotImplementedError()
+
+
+class AnalysisStatusBatchSerializer(serializers.Serializer):
+    cursor = serializers.DateTimeField(allow_null=True, help_text='Latest `modified` of the returned analyses, pass as `since` to get the later changes')
+    id = serializers.ListField(child=serializers.IntegerField())
+    status = serializers.ListField(child=serializers.CharField())
+    task_started = serializers.ListField(child=serializers.DateTimeField(allow_null=True))
+    task_finished = serializers.ListField(child=serializers.DateTimeField(allow_null=True))
+    modified = serializers.ListField(child=serializers.DateTimeField())
+
+    def create(self, validated_data):
+        raise NotImplementedError()
+
+    def update(self, instance, validated_data):
+        raise NotImplementedError()
+
+
 class LocFileSerializer(serializers.Serializer):
     url = serializers.URLField()
     name = serializers.CharField()
@@ -136,6 +275,29 @@ def load_json_schema(json_schema_file, link_prefix=None):
     return schema
 
 
+@lru_cache(maxsize=None)
+def _load_checked_json_schema(json_schema_file):
+    schema = load_json_schema(json_schema_file)
+    jsonschema.Draft4Validator.check_schema(schema)
+    return schema
+
+
+_schema_validators = threading.local()
+
+
+def get_json_schema_validator(json_schema_file):
+    """
+        Return a `Draft4Validator` for a schema in the .schema dir
+
+        The schema is read and checked once per process, the validator is
+        built once per thread as its `$ref` resolver is not thread safe
+    """
+    validators = _schema_validators.__dict__.setdefault('validators', {})
+    if json_schema_file not in validators:
+        validators[json_schema_file] = jsonschema.Draft4Validator(_load_checked_json_schema(json_schema_file))
+    return validators[json_schema_file]
+
+
 class JsonSettingsSerializer(serializers.Serializer):
 
     def to_internal_value(self, data):
@@ -143,7 +305,7 @@ class JsonSettingsSerializer(serializers.Serializer):
 
     def validate_json(self, data):
         try:
-            validator = jsonschema.Draft4Validator(self.schema)
+            validator = get_json_schema_validator(self.schema_file)
             validation_errors = [e for e in validator.iter_errors(data)]
 
             # Iteratre over all errors and raise as single exception
@@ -178,7 +340,7 @@ class ModelParametersSerializer(JsonSettingsSerializer):
     def __init__(self, *args, **kwargs):
         super(ModelParametersSerializer, self).__init__(*args, **kwargs)
         self.filenmame = 'model_settings.json'
-        self.schema = load_json_schema('model_settings.json')
+        self.schema_file = 'model_settings.json'
     
     def validate(self, data):
         return super(ModelParametersSerializer, self).validate_json(data)
@@ -194,7 +356,7 @@ class AnalysisSettingsSerializer(JsonSettingsSerializer):
     def __init__(self, *args, **kwargs):
         super(AnalysisSettingsSerializer, self).__init__(*args, **kwargs)
         self.filenmame = 'analysis_settings.json'
-        self.schema = load_json_schema('analysis_settings.json')
+        self.schema_file = 'analysis_settings.json'
 
     def validate(self, data):
         if 'analysis_settings' in data:
@@ -0,0 +1,43 @@
+from rest_framework.exceptions import ValidationError
+
+FIELDS_QUERY_PARAM = 'fields'
+SLIM_QUERY_PARAM = 'slim'
+
+
+class SparseFieldsMixin(object):
+    """ Lets GET requests choose which fields are serialized
+
+    `?fields=id,name` returns only the listed fields, `?slim` returns the fields
+    in `Meta.slim_fields`. The fields left out are never evaluated, so the slim
+    representation skips the file and url lookups of the full one.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(SparseFieldsMixin, self).__init__(*args, **kwargs)
+
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+
+        requested = self.get_requested_fields(request.query_params)
+        if requested is None:
+            return
+
+        unknown = [f for f in requested if f not in self.fields]
+        if unknown:
+            raise ValidationError({FIELDS_QUERY_PARAM: 'Unknown fields [{}], available fields are [{}]'.format(
+                ', '.join(unknown), ', '.join(self.fields))})
+
+        for name in set(self.fields) - set(requested):
+            self.fields.pop(name)
+
+    def get_requested_fields(self, query_params):
+        fields = query_params.get(FIELDS_QUERY_PARAM)
+        if fields:
+            return [f.strip() for f in fields.split(',') if f.strip()]
+
+        slim = query_params.get(SLIM_QUERY_PARAM)
+        if slim is not None and slim.lower() not in ['false', '0']:
+            return list(getattr(self.Meta, 'slim_fields', self.fields))
+
+        return None
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.0/ref/settings/
 """
 
+import logging
 import os
 import sys
 
@@ -78,6 +79,20 @@ MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware',
 ]
 
+# Negotiated response compression, the preferred coding of `COMPRESS_ENCODINGS`
+# (`br`, `zstd` or `gzip`) accepted by the client is used
+DO_GZIP_RESPONSE = iniconf.settings.getboolean('server', 'DO_GZIP_RESPONSE', fallback=False)
+COMPRESS_ENCODINGS = [e.strip() for e in iniconf.settings.get('server', 'COMPRESS_ENCODINGS', fallback='br,zstd,gzip').split(',')]
+COMPRESS_MIN_SIZE = iniconf.settings.getint('server', 'COMPRESS_MIN_SIZE', fallback=1024)
+COMPRESS_CONTENT_TYPES = [t.strip() for t in iniconf.settings.get(
+    'server',
+    'COMPRESS_CONTENT_TYPES',
+    fallback='application/json,text/csv,text/plain,text/html,text/css,application/javascript,application/xml,application/yaml',
+).split(',')]
+if DO_GZIP_RESPONSE:
+    # Before the other middleware so it sees the final response body
+    MIDDLEWARE.insert(1, 'src.server.oasisapi.compression.CompressionMiddleware')
+
 ROOT_URLCONF = 'src.server.oasisapi.urls'
 
 TEMPLATES = [
@@ -124,6 +139,26 @@ else:
         }
     }
 
+# Read replicas of the default database as `host` or `host:port`, read by the safe
+# requests (see `routers.py`), clients read from the primary for
+# `DB_REPLICA_STICKY_SECONDS` after a write
+DB_REPLICA_HOSTS = [h.strip() for h in iniconf.settings.get('server', 'db_replica_hosts', fallback='').split(',') if h.strip()]
+DB_REPLICA_STICKY_SECONDS = iniconf.settings.getint('server', 'db_replica_sticky_seconds', fallback=10)
+DATABASE_REPLICAS = []
+for i, replica_host in enumerate(DB_REPLICA_HOSTS):
+    replica_hostname, _, replica_port = replica_host.partition(':')
+    DATABASES['replica_{}'.format(i)] = dict(
+        DATABASES['default'],
+        HOST=replica_hostname,
+        PORT=replica_port or DATABASES['default'].get('PORT'),
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append('replica_{}'.format(i))
+
+DATABASE_ROUTERS = ['src.server.oasisapi.routers.ReplicaRouter']
+if DATABASE_REPLICAS:
+    MIDDLEWARE.insert(1, 'src.server.oasisapi.routers.ReplicaRoutingMiddleware')
+
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
 
@@ -168,6 +203,10 @@ AWS_LOG_EVEL = iniconf.settings.get('server', 'aws_log_level', fallback="")
 AWS_QUERYSTRING_AUTH = iniconf.settings.getboolean('server', 'AWS_QUERYSTRING_AUTH', fallback=False)
 AWS_QUERYSTRING_EXPIRE = iniconf.settings.get('server', 'AWS_QUERYSTRING_EXPIRE', fallback=604800)
 
+# Presigned URLs issued for direct to bucket uploads (expiry in seconds, max object size in bytes)
+AWS_PRESIGNED_UPLOAD_EXPIRE = iniconf.settings.getint('server', 'AWS_PRESIGNED_UPLOAD_EXPIRE', fallback=3600)
+AWS_PRESIGNED_UPLOAD_MAX_SIZE = iniconf.settings.getint('server', 'AWS_PRESIGNED_UPLOAD_MAX_SIZE', fallback=5368709120)
+
 # When 'True' return the bucket object key instead of URL, this assumes a shared bucket between workers and server
 AWS_SHARED_BUCKET = iniconf.settings.getboolean('server', 'AWS_SHARED_BUCKET', fallback=False)
 
@@ -196,6 +235,61 @@ else:
     raise ImproperlyConfigured('Invalid value for STORAGE_TYPE: {}'.format(STORAGE_TYPE))
 
 
+# Row limits for queries on the columnar analysis outputs
+OUTPUT_QUERY_DEFAULT_LIMIT = iniconf.settings.getint('server', 'OUTPUT_QUERY_DEFAULT_LIMIT', fallback=1000)
+OUTPUT_QUERY_MAX_LIMIT = iniconf.settings.getint('server', 'OUTPUT_QUERY_MAX_LIMIT', fallback=10000)
+
+# List endpoint pagination, see `pagination.TimeStampedCursorPagination`
+API_PAGINATE_BY_DEFAULT = iniconf.settings.getboolean('server', 'API_PAGINATE_BY_DEFAULT', fallback=False)
+API_PAGE_SIZE = iniconf.settings.getint('server', 'API_PAGE_SIZE', fallback=100)
+API_MAX_PAGE_SIZE = iniconf.settings.getint('server', 'API_MAX_PAGE_SIZE', fallback=1000)
+
+# Size of the chunks read from the storage by the file downloads
+FILE_STREAM_CHUNK_SIZE = iniconf.settings.getint('server', 'FILE_STREAM_CHUNK_SIZE', fallback=64 * 1024)
+
+# Background deletion of the stored files, see `files.deletion`. Files deleted
+# by a single S3 `DeleteObjects` request (at most 1000) or task batch, parallel
+# deletes on a shared filesystem and seconds before the first retry of a failure
+FILE_DELETE_BATCH_SIZE = min(iniconf.settings.getint('server', 'FILE_DELETE_BATCH_SIZE', fallback=1000), 1000)
+FILE_DELETE_THREADS = iniconf.settings.getint('server', 'FILE_DELETE_THREADS', fallback=8)
+FILE_DELETE_RETRY_DELAY = iniconf.settings.getint('server', 'FILE_DELETE_RETRY_DELAY', fallback=60)
+
+# Validate the OED location and accounts files as they are uploaded, see `portfolios.exposure`
+PORTFOLIO_UPLOAD_VALIDATION = iniconf.settings.getboolean('server', 'PORTFOLIO_UPLOAD_VALIDATION', fallback=True)
+
+# Most analyses accepted by a single bulk request
+API_BULK_MAX_SIZE = iniconf.settings.getint('server', 'API_BULK_MAX_SIZE', fallback=1000)
+
+# Fair-share dispatch of the analysis tasks, see `analyses.dispatch`. Most tasks
+# released to a model queue at a time, and by a single user (or group share
+# without its own limit), 0 for no limit
+ANALYSIS_DISPATCH_MODEL_CONCURRENCY = iniconf.settings.getint('server', 'ANALYSIS_DISPATCH_MODEL_CONCURRENCY', fallback=0)
+ANALYSIS_DISPATCH_USER_CONCURRENCY = iniconf.settings.getint('server', 'ANALYSIS_DISPATCH_USER_CONCURRENCY', fallback=0)
+
+# Seconds the worker-monitor buffers the task started events before writing them,
+# one update for each status, see `analyses.transitions`. 0 writes each event as it arrives
+ANALYSIS_STATUS_FLUSH_INTERVAL = iniconf.settings.getfloat('server', 'ANALYSIS_STATUS_FLUSH_INTERVAL', fallback=0.25)
+
+# Channel layer pushing analysis status updates to WebSocket subscribers. The
+# status is written by the worker monitor, a separate process from the server, so
+# the default in memory layer only reaches subscribers connected to the process
+# writing the status. Set `channels_redis.core.RedisChannelLayer` and the redis
+# `CHANNEL_LAYER_HOSTS` to share the layer between the processes.
+ASGI_APPLICATION = 'src.server.oasisapi.asgi.application'
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': iniconf.settings.get('server', 'CHANNEL_LAYER_BACKEND', fallback='channels.layers.InMemoryChannelLayer'),
+    },
+}
+_channel_layer_hosts = iniconf.settings.get('server', 'CHANNEL_LAYER_HOSTS', fallback='')
+if _channel_layer_hosts:
+    CHANNEL_LAYERS['default']['CONFIG'] = {'hosts': [h.strip() for h in _channel_layer_hosts.split(',')]}
+if CHANNEL_LAYERS['default']['BACKEND'] == 'channels.layers.InMemoryChannelLayer' and not IN_TEST:
+    logging.getLogger(__name__).warning(
+        'CHANNEL_LAYER_BACKEND is the in memory layer, analysis status updates written by the '
+        'worker monitor will not reach WebSocket subscribers'
+    )
+
 # https://github.com/davesque/django-rest-framework-simplejwt
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME':  iniconf.settings.get_timedelta('server', 'TOKEN_ACCESS_LIFETIME', fallback='hours=1'),
@@ -205,6 +299,25 @@ SIMPLE_JWT = {
     'SIGNING_KEY': iniconf.settings.get('server', 'token_sigining_key', fallback=SECRET_KEY),
 }
 
+# Cache shared by the server processes, it holds the invalidations of the cached
+# users and the parsed JSON files. The default in memory cache is local to each
+# process, use e.g. `django_redis.cache.RedisCache` with several server processes
+CACHES = {
+    'default': {
+        'BACKEND': iniconf.settings.get('server', 'CACHE_BACKEND', fallback='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': iniconf.settings.get('server', 'CACHE_LOCATION', fallback=''),
+    },
+}
+
+# Users resolved from the access tokens are cached by each process, see
+# `auth.authentication`. Seconds a user is cached (0 disables the cache) and the
+# most users cached. Invalidations reach the other processes through `CACHES`.
+# With `JWT_TOKEN_USER_SAFE_METHODS` read only requests are authenticated from
+# the token claims alone, without loading the user
+JWT_USER_CACHE_TTL = iniconf.settings.getint('server', 'JWT_USER_CACHE_TTL', fallback=60)
+JWT_USER_CACHE_SIZE = iniconf.settings.getint('server', 'JWT_USER_CACHE_SIZE', fallback=1024)
+JWT_TOKEN_USER_SAFE_METHODS = iniconf.settings.getboolean('server', 'JWT_TOKEN_USER_SAFE_METHODS', fallback=False)
+
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
@@ -213,12 +326,13 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'src.server.oasisapi.auth.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': (
         'src.server.oasisapi.filters.Backend',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'src.server.oasisapi.pagination.TimeStampedCursorPagination',
     'DATETIME_FORMAT': '%Y-%m-%dT%H:%M:%S.%fZ',
     'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.URLPathVersioning',
     'DEFAULT_VERSION': 'v1',
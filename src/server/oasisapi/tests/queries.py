@@ -0,0 +1,38 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ..auth.tests.fakes import fake_user
+
+
+class ListQueriesMixin(object):
+    """ Checks the number of queries a list endpoint makes does not grow
+    with the number of objects it lists. Mixed into a ``WebTestMixin`` test case.
+    """
+    def count_list_queries(self, url, user, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.app.get(
+                url,
+                params=params,
+                headers={
+                    'Authorization': 'Bearer {}'.format(AccessToken.for_user(user))
+                },
+            )
+        self.assertEqual(200, response.status_code)
+        return len(queries)
+
+    def assert_list_queries_are_constant(self, url, fake_object, *params, n=5):
+        """ Lists ``url`` with 1 then ``n`` objects made by ``fake_object``
+        and asserts both make the same number of queries, once for each set
+        of query ``params`` (no params when none are given).
+        """
+        params = params or ({},)
+        user = fake_user()
+
+        fake_object()
+        expected = [self.count_list_queries(url, user, p) for p in params]
+
+        for _ in range(n - 1):
+            fake_object()
+
+        self.assertEqual(expected, [self.count_list_queries(url, user, p) for p in params])
@@ -43,7 +43,18 @@ The general workflow is as follows
    for the analysis.
 6. Add analysis settings file to the analysis (post to `/analyses/<pk>/analysis_settings/`).
 7. Run the analysis (post to `/analyses/<pk>/run/`)
-8. Get the outputs (get `/analyses/<pk>/output_file/`)""",
+8. Get the outputs (get `/analyses/<pk>/output_file/`)
+
+# Status updates
+Rather than polling `/analyses/<pk>/`, status changes can be pushed over a WebSocket.
+Connect with the access token in the `token` query param (or the `Authorization` header) to
+
+* `ws/v1/analyses/<pk>/status/` for a single analysis, its current status is sent on connect
+* `ws/v1/portfolios/<pk>/status/` for all analyses of a portfolio
+* `ws/v1/analyses/status/` for all analyses created by the user
+
+Each message holds the `id`, `portfolio`, `status`, `task_started`, `task_finished`
+and `modified` fields of the analysis.""",
 )
 
 schema_view = get_schema_view(
@@ -0,0 +1,156 @@
+"""
+Load test of concurrent portfolio file downloads through the ASGI application,
+comparing the async `RelatedFileConsumer` with the Django REST view.
+
+All clients request the same `location_file` at once, with a small thread
+pool and a simulated storage latency on every chunk read (as with a remote
+storage). The REST view holds a worker for the whole transfer while the
+consumer only borrows one per chunk, so the number of downloads in flight
+is not capped by the thread pool.
+
+A temporary sqlite database and media root are used.
+
+    python tests/benchmarks/bench_async_downloads.py --clients 200 --threads 8
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+_db_dir = tempfile.mkdtemp()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'src.server.oasisapi.settings')
+os.environ['OASIS_SERVER_DB_NAME'] = os.path.join(_db_dir, 'bench.sqlite3')
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db.models.fields.files import FieldFile
+from django.test import override_settings
+from mock import patch
+from rest_framework_simplejwt.tokens import AccessToken
+
+from src.server.oasisapi.asgi import application
+from src.server.oasisapi.files.models import RelatedFile
+from src.server.oasisapi.portfolios.models import Portfolio
+
+
+class Stats(object):
+    def __init__(self):
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.first_byte = []
+
+    def start(self, elapsed):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        self.first_byte.append(elapsed)
+
+    def finish(self):
+        self.in_flight -= 1
+
+
+async def download(app, path, token, stats):
+    requests = asyncio.Queue()
+    await requests.put({'type': 'http.request', 'body': b'', 'more_body': False})
+    started = time.perf_counter()
+    size = 0
+
+    async def send(message):
+        nonlocal size
+        if message['type'] == 'http.response.start':
+            assert message['status'] == 200, message['status']
+            stats.start(time.perf_counter() - started)
+        elif message['type'] == 'http.response.body':
+            size += len(message.get('body', b''))
+            if not message.get('more_body'):
+                stats.finish()
+
+    await app({
+        'type': 'http',
+        'http_version': '1.1',
+        'method': 'GET',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'scheme': 'http',
+        'query_string': b'',
+        'headers': [(b'authorization', 'Bearer {}'.format(token).encode())],
+        'client': ['127.0.0.1', 1234],
+        'server': ['testserver', 80],
+    }, requests.get, send)
+    return size
+
+
+def run(app, path, token, clients, threads):
+    stats = Stats()
+
+    async def download_all():
+        return await asyncio.gather(*(download(app, path, token, stats) for _ in range(clients)))
+
+    loop = asyncio.new_event_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=threads))
+    started = time.perf_counter()
+    sizes = loop.run_until_complete(download_all())
+    elapsed = time.perf_counter() - started
+    loop.close()
+    return elapsed, stats, sizes
+
+
+def slow_reads(latency):
+    def read(self, *args):
+        time.sleep(latency)
+        return self.file.read(*args)
+    return patch.object(FieldFile, 'read', read)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=200, help='Number of concurrent downloads')
+    parser.add_argument('--threads', type=int, default=8, help='Size of the thread pool')
+    parser.add_argument('--size', type=int, default=1024 * 1024, help='Size of the downloaded file in bytes')
+    parser.add_argument('--chunk-size', type=int, default=64 * 1024, help='FILE_STREAM_CHUNK_SIZE')
+    parser.add_argument('--read-latency', type=float, default=0.002, help='Simulated storage latency of each chunk read, in seconds')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as media_root, \
+            override_settings(MEDIA_ROOT=media_root, FILE_STREAM_CHUNK_SIZE=args.chunk_size):
+        call_command('migrate', verbosity=0)
+        user = get_user_model().objects.create_user('bench', password='bench')
+        location_file = RelatedFile.objects.create(
+            file=ContentFile(os.urandom(args.size), name='location.csv'),
+            filename='location.csv',
+            content_type='text/csv',
+            creator=user,
+        )
+        portfolio = Portfolio.objects.create(name='bench', creator=user, location_file=location_file)
+        path = portfolio.get_absolute_location_file_url()
+        token = str(AccessToken.for_user(user))
+
+        cases = [
+            ('rest view', application.application_mapping['http'].application),
+            ('async consumer', application),
+        ]
+        print('{} clients x {} bytes, {} threads, {:.1f}ms per chunk read'.format(
+            args.clients, args.size, args.threads, args.read_latency * 1000))
+        with slow_reads(args.read_latency):
+            for name, app in cases:
+                elapsed, stats, sizes = run(app, path, token, args.clients, args.threads)
+                assert all(size == args.size for size in sizes)
+                first_byte = sorted(stats.first_byte)
+                print('  {}'.format(name))
+                print('    total:           {:.2f}s ({:.1f} MB/s)'.format(elapsed, args.clients * args.size / elapsed / 1e6))
+                print('    peak in flight:  {}'.format(stats.peak_in_flight))
+                print('    first byte p50:  {:.3f}s'.format(statistics.median(first_byte)))
+                print('    first byte p95:  {:.3f}s'.format(first_byte[int(len(first_byte) * 0.95) - 1]))
+
+
+if __name__ == '__main__':
+    main()
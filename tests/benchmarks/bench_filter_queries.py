@@ -0,0 +1,250 @@
+"""
+Latency of the list endpoint filters against a seeded database.
+
+Seeds `--rows` analyses (a tenth as many portfolios, data files and related
+files, and a thousandth as many models), then times the first page of each
+filter of `AnalysisFilter`, `PortfolioFilter`, `AnalysisModelFilter` and
+`DataFileFilter`, as it is read by the cursor pagination of the list endpoints.
+
+With `--compare` the filters are also timed with the list filter index
+migrations reverted. With `--explain` the query plan of each filter is printed.
+
+A temporary sqlite database is used unless `OASIS_SERVER_DB_ENGINE` is set, in
+which case the configured database is migrated and seeded, so point it at a
+scratch database. The case insensitive indexes are only created on PostgreSQL
+and MySQL.
+
+    python tests/benchmarks/bench_filter_queries.py --rows 1000000 --compare
+    OASIS_SERVER_DB_ENGINE=django.db.backends.postgresql OASIS_SERVER_DB_NAME=bench \\
+        python tests/benchmarks/bench_filter_queries.py --rows 1000000 --compare
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import timedelta
+from urllib.parse import urlencode
+
+import django
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'src.server.oasisapi.settings')
+if 'OASIS_SERVER_DB_ENGINE' not in os.environ:
+    os.environ['OASIS_SERVER_DB_NAME'] = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+django.setup()
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.http import QueryDict
+from django.utils import timezone
+
+from src.server.oasisapi.analyses.models import Analysis
+from src.server.oasisapi.analyses.viewsets import AnalysisFilter
+from src.server.oasisapi.analysis_models.models import AnalysisModel
+from src.server.oasisapi.analysis_models.viewsets import AnalysisModelFilter
+from src.server.oasisapi.data_files.models import DataFile
+from src.server.oasisapi.data_files.viewsets import DataFileFilter
+from src.server.oasisapi.files.models import RelatedFile
+from src.server.oasisapi.portfolios.models import Portfolio
+from src.server.oasisapi.portfolios.viewsets import PortfolioFilter
+
+# The migrations reverted by `--compare`, with the migration each app is reverted to
+INDEX_MIGRATIONS = [
+    ('analyses', '0016_analysis_fair_share_dispatch'),
+    ('portfolios', '0003_portfolio_exposure_statistics'),
+    ('analysis_models', '0004_analysismodel_deleted'),
+    ('data_files', '0006_datafile_file_category'),
+    ('files', '0004_remove_relatedfile_aws_location'),
+]
+
+WORDS = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliet']
+CATEGORIES = ['hazard', 'vulnerability', 'footprint', 'events', 'damage']
+CONTENT_TYPES = ['text/csv', 'application/json', 'application/gzip', 'application/octet-stream']
+USERS = 100
+
+
+def seed(rows, batch_size):
+    rng = random.Random(42)
+    now = timezone.now()
+    n_files = max(rows // 10, 1)
+    n_models = max(rows // 1000, 1)
+
+    def created(i, n):
+        return now - timedelta(days=365) + timedelta(days=365) * i / n
+
+    def bulk(model, objs):
+        model.objects.bulk_create(objs, batch_size=batch_size)
+        # `modified` is set on save, spread it like `created`
+        model.objects.update(modified=F('created'))
+
+    get_user_model().objects.bulk_create([get_user_model()(username='user{}'.format(i)) for i in range(USERS)])
+    user_ids = list(get_user_model().objects.values_list('pk', flat=True))
+
+    bulk(RelatedFile, (
+        RelatedFile(
+            file='file{:07d}'.format(i),
+            filename='{}_{:07d}.csv'.format(rng.choice(WORDS), i),
+            content_type=rng.choice(CONTENT_TYPES),
+            creator_id=rng.choice(user_ids),
+            created=created(i, n_files),
+        ) for i in range(n_files)
+    ))
+    file_ids = list(RelatedFile.objects.values_list('pk', flat=True))
+
+    bulk(DataFile, (
+        DataFile(
+            file_description='{} data {:07d}'.format(rng.choice(WORDS), i),
+            file_category=rng.choice(CATEGORIES),
+            file_id=file_ids[i],
+            creator_id=rng.choice(user_ids),
+            created=created(i, n_files),
+        ) for i in range(n_files)
+    ))
+
+    bulk(AnalysisModel, (
+        AnalysisModel(
+            supplier_id='supplier{:03d}'.format(i % 50),
+            model_id='{}{:05d}'.format(rng.choice(WORDS), i),
+            version_id=str(i % 7),
+            creator_id=rng.choice(user_ids),
+            created=created(i, n_models),
+        ) for i in range(n_models)
+    ))
+    model_ids = list(AnalysisModel.objects.values_list('pk', flat=True))
+
+    bulk(Portfolio, (
+        Portfolio(
+            name='portfolio {} {:07d}'.format(rng.choice(WORDS), i),
+            creator_id=rng.choice(user_ids),
+            created=created(i, n_files),
+        ) for i in range(n_files)
+    ))
+    portfolio_ids = list(Portfolio.objects.values_list('pk', flat=True))
+
+    statuses = sorted(Analysis.status_choices._db_values)
+    bulk(Analysis, (
+        Analysis(
+            name='analysis {} {:07d}'.format(rng.choice(WORDS), i),
+            status=rng.choice(statuses),
+            portfolio_id=rng.choice(portfolio_ids),
+            model_id=rng.choice(model_ids),
+            creator_id=rng.choice(user_ids),
+            created=created(i, rows),
+        ) for i in range(rows)
+    ))
+
+    if connection.vendor in ['postgresql', 'sqlite']:
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+
+def middle_value(model, field):
+    count = model.objects.count()
+    return model.objects.order_by('pk').values_list(field, flat=True)[count // 2]
+
+
+def get_cases(rows):
+    n_files = max(rows // 10, 1)
+    recent = (timezone.now() - timedelta(days=3)).date().isoformat()
+    day = (timezone.now() - timedelta(days=180)).date().isoformat()
+
+    return [
+        ('analyses', AnalysisFilter, Analysis.objects.all(), [
+            {'name': middle_value(Analysis, 'name').upper()},
+            {'name__contains': '{:07d}'.format(rows // 3)},
+            {'status': 'RUN_STARTED'},
+            {'status__in': 'RUN_QUEUED,RUN_STARTED'},
+            {'user': 'USER7'},
+            {'created__gte': recent},
+            {'created__date': day},
+            {'modified__gte': recent},
+        ]),
+        ('portfolios', PortfolioFilter, Portfolio.objects.all(), [
+            {'name': middle_value(Portfolio, 'name').upper()},
+            {'name__contains': '{:07d}'.format(n_files // 3)},
+            {'user': 'USER7'},
+            {'created__gte': recent},
+        ]),
+        ('models', AnalysisModelFilter, AnalysisModel.objects.all(), [
+            {'supplier_id': 'SUPPLIER007'},
+            {'supplier_id__contains': 'lier00'},
+            {'model_id__contains': '{:05d}'.format(max(rows // 1000, 1) // 2)},
+            {'version_id': '3'},
+        ]),
+        ('data files', DataFileFilter, DataFile.objects.all(), [
+            {'filename__contains': '{:07d}'.format(n_files // 3)},
+            {'content_type': 'TEXT/CSV'},
+            {'file_description__contains': 'data {:07d}'.format(n_files // 2)},
+            {'file_category': 'Hazard'},
+            {'created__gte': recent},
+        ]),
+    ]
+
+
+def first_page(filterset_class, queryset, params):
+    filterset = filterset_class(QueryDict(urlencode(params)), queryset=queryset)
+    assert filterset.is_valid(), filterset.errors
+    return filterset.qs.order_by('-modified', '-id')[:settings.API_PAGE_SIZE]
+
+
+def time_cases(cases, repeat, explain):
+    timings = {}
+    for endpoint, filterset_class, queryset, params_list in cases:
+        for params in params_list:
+            page = first_page(filterset_class, queryset, params)
+            if explain:
+                print('{} {}\n{}\n'.format(endpoint, params, page.explain()))
+
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(page.all())
+                samples.append(time.perf_counter() - started)
+            timings[(endpoint, str(params))] = (statistics.median(samples), len(page.all()))
+    return timings
+
+
+def main():
+    # The date filters compare the datetime fields with naive dates
+    warnings.filterwarnings('ignore', message='DateTimeField .* received a naive datetime', category=RuntimeWarning)
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000, help='Number of seeded analyses')
+    parser.add_argument('--batch-size', type=int, default=10000, help='Batch size of the seeding inserts')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timed queries of each filter, the median is reported')
+    parser.add_argument('--compare', action='store_true', help='Also time the filters with the list filter indexes reverted')
+    parser.add_argument('--explain', action='store_true', help='Print the query plan of each filter')
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    print('seeding {} analyses on {}'.format(args.rows, connection.vendor))
+    started = time.perf_counter()
+    seed(args.rows, args.batch_size)
+    print('  seeded in {:.1f}s'.format(time.perf_counter() - started))
+
+    cases = get_cases(args.rows)
+    without = {}
+    if args.compare:
+        for app, migration in INDEX_MIGRATIONS:
+            call_command('migrate', app, migration, verbosity=0)
+        without = time_cases(cases, args.repeat, args.explain)
+        started = time.perf_counter()
+        call_command('migrate', verbosity=0)
+        print('  indexes built in {:.1f}s'.format(time.perf_counter() - started))
+    with_indexes = time_cases(cases, args.repeat, args.explain)
+
+    print('{:<12} {:<60} {:>6} {:>12} {:>12}'.format('endpoint', 'filter', 'rows', 'no index ms', 'indexed ms'))
+    for (endpoint, params), (elapsed, count) in with_indexes.items():
+        before = '{:.2f}'.format(without[(endpoint, params)][0] * 1000) if without else '-'
+        print('{:<12} {:<60} {:>6} {:>12} {:>12.2f}'.format(endpoint, params, count, before, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark of the JWT authentication of API requests and of the token refresh.
+
+Authentication is timed for the simplejwt `JWTAuthentication` (the user is
+loaded on every request), `CachedJWTAuthentication` with its user cache, and
+`CachedJWTAuthentication` authenticating read only requests from the token
+claims (`JWT_TOKEN_USER_SAFE_METHODS`). The token refresh endpoint is timed
+with rotated refresh tokens, with and without `BLACKLIST_AFTER_ROTATION`.
+
+A temporary sqlite database is used, so the database round trips are cheaper
+than with a database server and the speed-ups are a lower bound.
+
+    python tests/benchmarks/bench_jwt_auth.py --requests 5000 --refreshes 500
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import django
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+_db_dir = tempfile.mkdtemp()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'src.server.oasisapi.settings')
+os.environ['OASIS_SERVER_DB_NAME'] = os.path.join(_db_dir, 'bench.sqlite3')
+django.setup()
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, reset_queries
+from django.test import RequestFactory, override_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from src.server.oasisapi.auth.authentication import CachedJWTAuthentication, user_cache
+from src.server.oasisapi.auth.views import TokenRefreshView
+
+
+def time_authentication(authentication, requests):
+    user_cache.clear()
+    reset_queries()
+    started = time.perf_counter()
+    for request in requests:
+        authentication.authenticate(request)
+    return time.perf_counter() - started, len(connection.queries)
+
+
+def time_refresh(user, refreshes, blacklist):
+    view = TokenRefreshView.as_view()
+    factory = RequestFactory()
+    token = str(RefreshToken.for_user(user))
+
+    with override_settings(SIMPLE_JWT=dict(settings.SIMPLE_JWT, ROTATE_REFRESH_TOKENS=True, BLACKLIST_AFTER_ROTATION=blacklist)):
+        started = time.perf_counter()
+        for _ in range(refreshes):
+            response = view(factory.post('/refresh_token/', HTTP_AUTHORIZATION='Bearer {}'.format(token)))
+            assert response.status_code == 200, response.data
+            token = response.data['refresh_token']
+        return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000, help='Number of authenticated requests')
+    parser.add_argument('--users', type=int, default=10, help='Number of users making the requests')
+    parser.add_argument('--refreshes', type=int, default=500, help='Number of chained token refreshes')
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    users = [get_user_model().objects.create_user('bench-{}'.format(i), password='bench') for i in range(args.users)]
+    tokens = [str(AccessToken.for_user(user)) for user in users]
+    factory = RequestFactory()
+    requests = [
+        factory.get('/v1/analyses/', HTTP_AUTHORIZATION='Bearer {}'.format(tokens[i % len(tokens)]))
+        for i in range(args.requests)
+    ]
+
+    cases = [
+        ('JWTAuthentication', JWTAuthentication(), {}),
+        ('cached users', CachedJWTAuthentication(), {}),
+        ('token claims (GET)', CachedJWTAuthentication(), {'JWT_TOKEN_USER_SAFE_METHODS': True}),
+    ]
+    print('{} requests from {} users'.format(args.requests, args.users))
+    with override_settings(DEBUG=True):
+        for name, authentication, overrides in cases:
+            with override_settings(**overrides):
+                elapsed, queries = time_authentication(authentication, requests)
+            print('  {:<20} {:>9.0f} req/s {:>7} queries'.format(name, args.requests / elapsed, queries))
+
+    print('{} token refreshes with rotation'.format(args.refreshes))
+    for blacklist in [False, True]:
+        elapsed = time_refresh(users[0], args.refreshes, blacklist)
+        print('  BLACKLIST_AFTER_ROTATION={:<6} {:>7.0f} refresh/s'.format(str(blacklist), args.refreshes / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark of the `iniconf.Settings` lookups, comparing the lookups served from
+memory with the previous behaviour, which scanned the environment twice and
+built a new `ChainMap` on every lookup.
+
+The lookups are those made by a worker task, with a number of unrelated
+environment variables as found in a container.
+
+    python tests/benchmarks/bench_settings_lookup.py --lookups 100000 --env-vars 200
+"""
+import argparse
+import os
+import sys
+import timeit
+from collections import ChainMap
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from src.conf.iniconf import Settings
+
+LOOKUPS = [
+    ('get', 'worker', 'MODEL_DATA_DIRECTORY', '/home/worker/model'),
+    ('get', 'worker', 'STORAGE_TYPE', ''),
+    ('get', 'worker', 'MEDIA_ROOT', None),
+    ('getboolean', 'worker', 'KEEP_RUN_DIR', False),
+    ('get', 'worker', 'BASE_RUN_DIR', None),
+    ('getboolean', 'worker', 'DISABLE_WORKER_REG', False),
+    ('getint', 'worker', 'LOCK_RETRY_COUNTDOWN_IN_SECS', 10),
+    ('getfloat', 'worker', 'LOCK_TIMEOUT_IN_SECS', 180),
+]
+
+
+def legacy_env_vars(section):
+    section_env_prefix = 'OASIS_{}_'.format(section.upper())
+    global_env_prefix = 'OASIS_'
+
+    return ChainMap(
+        {k.replace(section_env_prefix, ''):
+            v for k, v in os.environ.items() if k.startswith(section_env_prefix)},
+        {k.replace(global_env_prefix, ''):
+            v for k, v in os.environ.items() if k.startswith(global_env_prefix)},
+    )
+
+
+def run_lookups(settings, count, legacy):
+    for i in range(count):
+        method, section, option, fallback = LOOKUPS[i % len(LOOKUPS)]
+        kwargs = {'fallback': fallback}
+        if legacy:
+            kwargs['vars'] = legacy_env_vars(section)
+        getattr(settings, method)(section, option, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lookups', type=int, default=100000, help='Number of lookups')
+    parser.add_argument('--env-vars', type=int, default=200, help='Number of unrelated environment variables')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs, the best is reported')
+    args = parser.parse_args()
+
+    for i in range(args.env_vars):
+        os.environ.setdefault('BENCH_ENV_{}'.format(i), 'value')
+    os.environ.setdefault('OASIS_WORKER_STORAGE_TYPE', 'shared-fs')
+    settings = Settings()
+
+    legacy = min(timeit.repeat(lambda: run_lookups(settings, args.lookups, True), number=1, repeat=args.repeat))
+    cached = min(timeit.repeat(lambda: run_lookups(settings, args.lookups, False), number=1, repeat=args.repeat))
+
+    print('{} lookups, {} environment variables'.format(args.lookups, len(os.environ)))
+    print('environment scan per lookup: {:.3f}s ({:.1f}us per lookup)'.format(legacy, legacy / args.lookups * 1e6))
+    print('snapshot:                    {:.3f}s ({:.1f}us per lookup)'.format(cached, cached / args.lookups * 1e6))
+    print('speed-up:                    {:.1f}x'.format(legacy / cached))
+
+
+if __name__ == '__main__':
+    main()
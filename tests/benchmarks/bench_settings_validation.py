@@ -0,0 +1,87 @@
+"""
+Benchmark of the settings validation throughput, comparing the cached
+validators of `AnalysisSettingsSerializer` / `ModelParametersSerializer`
+with loading the schema and building a validator for every payload.
+
+No database is needed.
+
+    python tests/benchmarks/bench_settings_validation.py --payloads 2000
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import django
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'src.server.oasisapi.settings')
+django.setup()
+
+import jsonschema
+
+from src.server.oasisapi.schemas.serializers import AnalysisSettingsSerializer, ModelParametersSerializer, load_json_schema
+
+ANALYSIS_SETTINGS = {
+    'source_tag': 'benchmark',
+    'analysis_tag': 'benchmark',
+    'module_supplier_id': 'OasisIM',
+    'model_version_id': '1',
+    'number_of_samples': 10,
+    'gul_threshold': 0,
+    'model_settings': {
+        'use_random_number_file': True,
+        'event_occurrence_file_id': '1',
+    },
+    'gul_output': True,
+    'gul_summaries': [
+        {'id': 1, 'summarycalc': True, 'eltcalc': True, 'aalcalc': True, 'pltcalc': True, 'lec_output': False},
+    ],
+    'il_output': False,
+}
+
+MODEL_SETTINGS = {
+    'model_settings': {
+        'event_set': {
+            'name': 'Event Set',
+            'desc': 'Either Probablistic or Historic',
+            'default': 'P',
+            'options': [{'id': 'P', 'desc': 'Proabilistic'}],
+        },
+    },
+    'lookup_settings': {
+        'supported_perils': [{'id': 'WSS', 'desc': 'Single Peril: Storm Surge'}],
+    },
+}
+
+
+def validate_uncached(schema_file, data):
+    # The validation before schemas and validators were cached
+    validator = jsonschema.Draft4Validator(load_json_schema(schema_file))
+    return list(validator.iter_errors(data))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--payloads', type=int, default=2000, help='Number of payloads validated per run')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs, the best is reported')
+    args = parser.parse_args()
+
+    cases = [
+        ('analysis settings', 'analysis_settings.json', AnalysisSettingsSerializer, ANALYSIS_SETTINGS),
+        ('model settings', 'model_settings.json', ModelParametersSerializer, MODEL_SETTINGS),
+    ]
+    for name, schema_file, serializer, data in cases:
+        baseline = min(timeit.repeat(
+            lambda: validate_uncached(schema_file, data), number=args.payloads, repeat=args.repeat))
+        cached = min(timeit.repeat(
+            lambda: serializer().validate(data), number=args.payloads, repeat=args.repeat))
+
+        print('{} x {}'.format(args.payloads, name))
+        print('  uncached:  {:.0f} payloads/s'.format(args.payloads / baseline))
+        print('  cached:    {:.0f} payloads/s'.format(args.payloads / cached))
+        print('  speed-up:  {:.1f}x'.format(baseline / cached))
+
+
+if __name__ == '__main__':
+    main()
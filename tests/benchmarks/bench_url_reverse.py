@@ -0,0 +1,67 @@
+"""
+Benchmark of the url generation for an analysis list, comparing the url
+templates of `oasisapi.reverse` with `rest_framework.reverse.reverse`.
+
+Every `get_absolute_*_url` method of `Analysis` is called for each row, as
+the serializer does, no database is needed.
+
+    python tests/benchmarks/bench_url_reverse.py --rows 10000
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import django
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'src.server.oasisapi.settings')
+django.setup()
+
+from django.test import RequestFactory
+from mock import patch
+from rest_framework.request import Request
+from rest_framework.reverse import reverse as drf_reverse
+
+from src.server.oasisapi.analyses.models import Analysis
+
+
+def fake_request():
+    request = Request(RequestFactory().get('/v1/analyses/'))
+    request.version = 'v1'
+    return request
+
+
+def url_methods():
+    return [name for name in dir(Analysis) if name.startswith('get_absolute_') and name.endswith('_url')]
+
+
+def build_urls(analyses, methods):
+    # A new request per run, so the cached base url is included in the timing
+    request = fake_request()
+    for analysis in analyses:
+        for name in methods:
+            getattr(analysis, name)(request=request)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000, help='Number of analyses in the list')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs, the best is reported')
+    args = parser.parse_args()
+
+    analyses = [Analysis(pk=pk) for pk in range(1, args.rows + 1)]
+    methods = url_methods()
+
+    with patch('src.server.oasisapi.analyses.models.reverse', drf_reverse):
+        baseline = min(timeit.repeat(lambda: build_urls(analyses, methods), number=1, repeat=args.repeat))
+    templated = min(timeit.repeat(lambda: build_urls(analyses, methods), number=1, repeat=args.repeat))
+
+    print('{} rows x {} urls'.format(args.rows, len(methods)))
+    print('rest_framework reverse: {:.3f}s'.format(baseline))
+    print('url templates:          {:.3f}s'.format(templated))
+    print('speed-up:               {:.1f}x'.format(baseline / templated))
+
+
+if __name__ == '__main__':
+    main()
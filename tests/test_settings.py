@@ -5,6 +5,7 @@ from tempfile import NamedTemporaryFile
 from unittest import TestCase
 
 import os
+from configparser import NoOptionError
 from hypothesis import given, settings
 from hypothesis.strategies import text, integers
 from mock import patch
@@ -117,3 +118,83 @@ class SettingsSetupLogging(TestCase):
                 'LOG_MAX_SIZE_IN_BYTES': size,
                 'LOG_BACKUP_COUNT': count,
             })
+
+
+class SettingsSnapshot(TestCase):
+    def setUp(self):
+        self.init_env = os.environ.copy()
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.init_env)
+
+    @given(setting_text(), setting_text())
+    def test_env_is_changed_after_creation___value_is_changed_after_reload(self, first, second):
+        os.environ['OASIS_SECTION_foo'] = first
+        settings = Settings()
+        settings.read_dict({'section': {}})
+
+        os.environ['OASIS_SECTION_foo'] = second
+        self.assertEqual(settings.get('section', 'foo'), first)
+
+        settings.reload()
+        settings.read_dict({'section': {}})
+        self.assertEqual(settings.get('section', 'foo'), second)
+
+    @given(setting_text(), setting_text())
+    def test_value_is_set_after_lookup___new_value_is_returned(self, first, second):
+        settings = Settings()
+        settings.read_dict({'section': {'foo': first}})
+        settings.get('section', 'foo')
+
+        settings.set('section', 'foo', second)
+
+        self.assertEqual(settings.get('section', 'foo'), second)
+
+    def test_option_is_missing___fallback_or_error_is_returned(self):
+        settings = Settings()
+        settings.read_dict({'section': {}})
+
+        self.assertEqual(settings.getint('section', 'missing', fallback=5), 5)
+        with self.assertRaises(NoOptionError):
+            settings.get('section', 'missing')
+
+
+    def test_missing_option_is_looked_up_again___fallback_is_served_from_memory(self):
+        settings = Settings()
+        settings.read_dict({'section': {}})
+        settings.getint('section', 'missing', fallback=5)
+
+        with patch('configparser.ConfigParser.get') as get_mock:
+            self.assertEqual(settings.getint('section', 'missing', fallback=5), 5)
+            self.assertEqual(settings.getboolean('section', 'missing', fallback=True), True)
+            self.assertEqual(settings.get('section', 'missing', fallback='a'), 'a')
+
+        get_mock.assert_not_called()
+
+class SettingsValidate(TestCase):
+    def setUp(self):
+        self.init_env = os.environ.copy()
+        for k in list(os.environ):
+            if k.startswith('OASIS_'):
+                del os.environ[k]
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.init_env)
+
+    def test_repo_config_is_valid(self):
+        self.assertEqual([], Settings().validate())
+
+    def test_option_is_unknown___error_is_reported(self):
+        settings = Settings()
+        settings.read_dict({'server': {'NOT_AN_OPTION': 'value'}})
+
+        self.assertEqual(['[server] NOT_AN_OPTION: unknown option'], settings.validate())
+
+    def test_option_has_the_wrong_type___error_is_reported(self):
+        os.environ['OASIS_SERVER_API_PAGE_SIZE'] = 'ten'
+
+        settings = Settings()
+
+        self.assertEqual(["OASIS_SERVER_API_PAGE_SIZE: 'ten' is not a valid int"], settings.validate())
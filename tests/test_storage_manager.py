@@ -0,0 +1,62 @@
+import gzip
+import json
+import os
+import tarfile
+from unittest import TestCase
+
+from backports.tempfile import TemporaryDirectory
+from hypothesis import given
+from hypothesis import settings as hypothesis_settings
+from hypothesis.strategies import binary, dictionaries, sampled_from
+from pathlib2 import Path
+
+from src.conf.iniconf import SettingsPatcher, settings
+from src.common.data import ARCHIVE_INDEX_FORMAT
+from src.model_execution_worker.storage_manager import BaseStorageConnector
+
+# Override default deadline for all tests to 8s
+hypothesis_settings.register_profile("ci", deadline=800.0)
+hypothesis_settings.load_profile("ci")
+
+
+class PutIndexed(TestCase):
+    @given(files=dictionaries(
+        sampled_from(['gul_S1_aalcalc.csv', 'il_S1_eltcalc.csv', 'analysis_settings.json', 'ri_S1_summary-info.csv']),
+        binary(max_size=2048),
+        min_size=1,
+    ))
+    def test_directory_is_stored___archive_is_valid_tar_and_members_can_be_read_from_index(self, files):
+        with TemporaryDirectory() as media_root, TemporaryDirectory() as run_dir:
+            with SettingsPatcher(MEDIA_ROOT=media_root):
+                output_dir = Path(run_dir, 'output')
+                output_dir.mkdir()
+                for name, content in files.items():
+                    Path(output_dir, name).write_bytes(content)
+
+                archive_location, index_location = BaseStorageConnector(settings).put_indexed(
+                    str(output_dir), suffix='tar.gz', arcname='output')
+
+                with tarfile.open(archive_location) as tar:
+                    self.assertEqual(
+                        sorted('output/{}'.format(name) for name in files),
+                        sorted(m.name for m in tar.getmembers() if m.isfile()),
+                    )
+
+                with open(index_location) as f:
+                    index = json.load(f)
+                self.assertEqual(ARCHIVE_INDEX_FORMAT, index['format'])
+
+                with open(archive_location, 'rb') as archive:
+                    for entry in index['members']:
+                        archive.seek(entry['offset'])
+                        member = gzip.decompress(archive.read(entry['length']))
+                        data = member[entry['data_offset']:entry['data_offset'] + entry['size']]
+                        self.assertEqual(files[os.path.basename(entry['name'])], data)
+
+    def test_directory_does_not_exist___nothing_is_stored(self):
+        with TemporaryDirectory() as media_root:
+            with SettingsPatcher(MEDIA_ROOT=media_root):
+                self.assertEqual(
+                    (None, None),
+                    BaseStorageConnector(settings).put_indexed(os.path.join(media_root, 'output')),
+                )
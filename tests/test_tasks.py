@@ -1,5 +1,7 @@
 import os
 import subprocess
+
+import pyarrow.parquet
 import tarfile
 from unittest import TestCase
 from contextlib import contextmanager
@@ -15,7 +17,7 @@ from pathlib2 import Path
 from src.conf.iniconf import SettingsPatcher, settings
 from src.model_execution_worker.storage_manager import MissingInputsException
 from src.model_execution_worker.tasks import start_analysis, InvalidInputsException, \
-    start_analysis_task, get_oasislmf_config_path
+    start_analysis_task, get_oasislmf_config_path, write_columnar_outputs, compute_output_metrics
 
 
 #from oasislmf.utils.status import OASIS_TASK_STATUS
@@ -107,7 +109,7 @@ class StartAnalysis(TestCase):
                         patch('src.model_execution_worker.tasks.filestore.compress') as tarfile, \
                         patch('src.model_execution_worker.tasks.TemporaryDir', fake_run_dir):
 
-                    output_location, log_location, error_location, returncode = start_analysis(
+                    output_location, log_location, error_location, returncode, output_index_location, columnar_location, columnar_index_location, metrics = start_analysis(
                         os.path.join(media_root, 'analysis_settings.json'),
                         os.path.join(media_root, 'location.tar'),
                     )
@@ -120,7 +122,7 @@ class StartAnalysis(TestCase):
                         '--ktools-fifo-relative',
                         '--verbose',
                     ], stderr=subprocess.PIPE, stdout=subprocess.PIPE, env=test_env, preexec_fn=os.setsid)
-                    tarfile.assert_called_once_with(output_location, os.path.join(run_dir, 'output'), 'output')
+                    tarfile.assert_called_once_with(ANY, os.path.join(run_dir, 'output'), 'output', index_fp=ANY, gzip_members=True)
 
 
 class StartAnalysisTask(TestCase):
@@ -149,3 +151,94 @@ class StartAnalysisTask(TestCase):
                 location,
                 complex_data_files=None
             )
+
+
+class WriteColumnarOutputs(TestCase):
+    def test_csv_outputs_are_converted___parquet_files_are_written_with_row_groups(self):
+        with TemporaryDirectory() as output_dir, TemporaryDirectory() as columnar_dir:
+            with SettingsPatcher(COLUMNAR_ROW_GROUP_SIZE='2'):
+                Path(output_dir, 'gul_S1_eltcalc.csv').write_text(
+                    'summary_id,type,event_id,mean,standard_deviation,exposure_value\n'
+                    '1,1,1,10.5,0,100\n'
+                    '1,1,2,20.5,0,100\n'
+                    '2,1,1,30.5,0,100\n'
+                )
+                Path(output_dir, 'empty.csv').touch()
+                Path(output_dir, 'analysis_settings.json').write_text('{}')
+
+                converted = write_columnar_outputs(output_dir, columnar_dir)
+
+                self.assertEqual(1, converted)
+                self.assertEqual(['gul_S1_eltcalc.parquet'], os.listdir(columnar_dir))
+
+                parquet_file = pyarrow.parquet.ParquetFile(os.path.join(columnar_dir, 'gul_S1_eltcalc.parquet'))
+                self.assertEqual(2, parquet_file.num_row_groups)
+                self.assertEqual([1, 2, 1], parquet_file.read(columns=['event_id']).column('event_id').to_pylist())
+
+
+class ComputeOutputMetrics(TestCase):
+    def test_no_ktools_outputs___metrics_are_none(self):
+        with TemporaryDirectory() as output_dir:
+            Path(output_dir, 'analysis_settings.json').write_text('{}')
+
+            self.assertIsNone(compute_output_metrics(output_dir))
+
+    def test_ktools_outputs_are_present___aal_ep_and_tiv_are_summarised(self):
+        with TemporaryDirectory() as output_dir:
+            with SettingsPatcher(METRICS_RETURN_PERIODS='10,100'):
+                Path(output_dir, 'gul_S1_summary-info.csv').write_text(
+                    'summary_id,tiv\n'
+                    '1,1000.5\n'
+                    '2,2000\n'
+                )
+                Path(output_dir, 'gul_S1_aalcalc.csv').write_text(
+                    'summary_id,type,mean,standard_deviation\n'
+                    '1,1,10,1\n'
+                    '2,1,20,1\n'
+                    '1,2,11,1\n'
+                    '2,2,21,1\n'
+                )
+                Path(output_dir, 'gul_S1_leccalc_full_uncertainty_aep.csv').write_text(
+                    'summary_id,type,return_period,loss\n'
+                    '1,1,250,300\n'
+                    '1,1,100,200\n'
+                    '1,1,10,100\n'
+                    '2,2,10,50\n'
+                )
+                Path(output_dir, 'il_S2_leccalc_full_uncertainty_oep.csv').write_text(
+                    'summary_id,return_period,loss\n'
+                    '1,100,80\n'
+                )
+
+                metrics = compute_output_metrics(output_dir)
+
+                self.assertEqual(3000.5, metrics['total_tiv'])
+                self.assertEqual([10, 100], metrics['return_periods'])
+                self.assertEqual({
+                    'gul_S1': {
+                        'tiv': 3000.5,
+                        'aal': {'analytical': 30.0, 'sample': 32.0},
+                        'ep': {'full_uncertainty_aep': {
+                            '1': {'analytical': {'10': 100.0, '100': 200.0}},
+                            '2': {'sample': {'10': 50.0}},
+                        }},
+                    },
+                    'il_S2': {
+                        'tiv': None,
+                        'aal': {},
+                        'ep': {'full_uncertainty_oep': {'1': {'100': 80.0}}},
+                    },
+                }, metrics['summary_levels'])
+
+    def test_summary_level_has_too_many_summary_ids___ep_curve_is_left_out(self):
+        with TemporaryDirectory() as output_dir:
+            with SettingsPatcher(METRICS_MAX_SUMMARY_IDS='1'):
+                Path(output_dir, 'gul_S2_leccalc_full_uncertainty_aep.csv').write_text(
+                    'summary_id,return_period,loss\n'
+                    '1,100,80\n'
+                    '2,100,90\n'
+                )
+
+                metrics = compute_output_metrics(output_dir)
+
+                self.assertEqual({'full_uncertainty_aep': None}, metrics['summary_levels']['gul_S2']['ep'])